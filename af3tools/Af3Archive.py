@@ -0,0 +1,416 @@
+import collections
+import concurrent.futures
+import csv
+import gzip
+import logging
+import lzma
+import os
+import re
+import tarfile
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from af3tools import Af3Files
+
+# Extensions of tar archives, archives compressed with zstd need the zstandard package.
+ARCHIVE_EXTENSIONS = [".tar", ".tar.gz", ".tgz", ".tar.zst", ".tar.xz"]
+SEED_PATTERN = re.compile(r"seed-\d+_sample-\d+")
+# Size of uncompressed blocks compressed in parallel by ArchiveWriter.
+BLOCK_SIZE = 4 * 1024 * 1024
+INDEX_HEADER = ["Volume", "Name", "Size", "Offset", "Block offset", "Block skip"]
+# Compressors of this thread, zstandard compressors cannot be shared between threads.
+_compressors = threading.local()
+
+logger = logging.getLogger("Af3Archive")
+
+
+def is_archive(path: str) -> bool:
+  """
+  Returns True if path is a tar archive, based on its extension.
+
+  :param path: file or directory
+  :return: True if path is a tar archive
+  """
+  return bool(path) and any(path.endswith(extension) for extension in ARCHIVE_EXTENSIONS)
+
+
+@contextmanager
+def open_archive(archive: str):
+  """
+  Open tar archive for a single sequential pass over its members.
+
+  Uncompressed archives are opened in random access mode, so data of members that are not read is skipped
+  by seeking forward. Compressed archives are decompressed as a stream, which may contain many concatenated
+  compressed blocks, see :class:`ArchiveWriter`.
+
+  :param archive: tar archive, see ARCHIVE_EXTENSIONS
+  :return: tar file
+  """
+  if archive.endswith(".tar"):
+    with tarfile.open(archive, "r:") as tar:
+      yield tar
+  else:
+    with open_compressed(archive) as archive_in, tarfile.open(fileobj=archive_in, mode="r|") as tar:
+      yield tar
+
+
+def archive_extension(archive: str) -> str:
+  """
+  Returns extension of tar archive.
+
+  :param archive: tar archive
+  :return: longest extension of ARCHIVE_EXTENSIONS matching archive
+  """
+  extensions = [extension for extension in ARCHIVE_EXTENSIONS if archive.endswith(extension)]
+  if not extensions:
+    raise AssertionError(f"archive extension must be one of {ARCHIVE_EXTENSIONS}")
+  return max(extensions, key=len)
+
+
+@contextmanager
+def open_compressed(archive: str, offset: int = 0):
+  """
+  Open tar archive for reading, decompressing it while reading.
+
+  :param archive: tar archive, see ARCHIVE_EXTENSIONS
+  :param offset: position in archive where reading starts, must be the start of a compressed block for
+                 compressed archives
+  :return: file object returning the uncompressed tar stream
+  """
+  extension = archive_extension(archive)
+  with open(archive, "rb") as archive_in:
+    archive_in.seek(offset)
+    if extension in [".tar.gz", ".tgz"]:
+      with gzip.GzipFile(fileobj=archive_in, mode="rb") as decompressed_in:
+        yield decompressed_in
+    elif extension == ".tar.xz":
+      with lzma.LZMAFile(archive_in, mode="rb") as decompressed_in:
+        yield decompressed_in
+    elif extension == ".tar.zst":
+      with Af3Files.import_zstandard().ZstdDecompressor().stream_reader(
+          archive_in, read_across_frames=True, closefd=False) as decompressed_in:
+        yield decompressed_in
+    else:
+      yield archive_in
+
+
+def iter_members(tar: tarfile.TarFile) -> Iterator[tarfile.TarInfo]:
+  """
+  Returns members of tar archive in archive order.
+
+  Unlike iterating over tar, members are not kept in the tar file, so memory does not grow with
+  the number of members.
+
+  :param tar: tar file
+  :return: regular file members of tar archive
+  """
+  while True:
+    member = tar.next()
+    if member is None:
+      return
+    tar.members.clear()
+    if member.isfile():
+      yield member
+
+
+def prediction_directory(member_name: str) -> str:
+  """
+  Returns directory of prediction containing member, files of samples belong to the prediction of their parent
+  directory.
+
+  :param member_name: name of member in archive
+  :return: directory of prediction
+  """
+  directory = os.path.dirname(member_name)
+  if SEED_PATTERN.fullmatch(os.path.basename(directory)):
+    directory = os.path.dirname(directory)
+  return directory
+
+
+def iter_predictions(archive: str, needed: Callable[[str], bool]) -> Iterator[tuple[str, dict[str, bytes]]]:
+  """
+  Returns files of predictions present in archive, reading archive in a single sequential pass.
+
+  Files of a prediction must be stored together in the archive, like in archives created by tar from
+  AlphaFold 3 output directories. Only the content of members accepted by needed is read.
+
+  :param archive: tar archive, see ARCHIVE_EXTENSIONS
+  :param needed: function returning True if a member, without compression extension, must be read
+  :return: tuple containing (confidence_file, files) for each prediction, in archive order,
+           where confidence_file is the summary confidence file of the prediction, without compression extension,
+           and files is the content of needed files of the prediction, by member name
+  """
+  seen = set()
+  directory = None
+  files = {}
+  with open_archive(archive) as tar:
+    for member in iter_members(tar):
+      member_directory = prediction_directory(member.name)
+      if member_directory != directory:
+        yield from _prediction(directory, files)
+        if member_directory in seen:
+          logger.warning(f"Files of prediction {member_directory} are not stored together in archive {archive}")
+        seen.add(member_directory)
+        directory = member_directory
+        files = {}
+      if needed(Af3Files.strip_compression(member.name)):
+        with tar.extractfile(member) as member_in:
+          files[member.name] = member_in.read()
+    yield from _prediction(directory, files)
+
+
+def _prediction(directory: str | None, files: dict[str, bytes]) -> Iterator[tuple[str, dict[str, bytes]]]:
+  confidence_files = [Af3Files.strip_compression(name) for name in files if
+                      os.path.dirname(name) == directory and
+                      Af3Files.strip_compression(name).endswith("_summary_confidences.json")]
+  for confidence_file in sorted(confidence_files):
+    yield confidence_file, files
+
+
+def compress_block(block: bytes, extension: str) -> bytes:
+  """
+  Compress block of a tar archive independently of other blocks.
+
+  Compressed blocks are complete gzip members, xz streams or zstd frames, so concatenated blocks form a valid
+  compressed archive and decompression can start at any block.
+
+  :param block: uncompressed block
+  :param extension: extension of archive, see ARCHIVE_EXTENSIONS
+  :return: compressed block, block if archive is not compressed
+  """
+  if extension in [".tar.gz", ".tgz"]:
+    return gzip.compress(block, mtime=0)
+  if extension == ".tar.xz":
+    return lzma.compress(block)
+  if extension == ".tar.zst":
+    if not hasattr(_compressors, "zstd"):
+      _compressors.zstd = Af3Files.import_zstandard().ZstdCompressor()
+    return _compressors.zstd.compress(block)
+  return block
+
+
+def volume_path(archive: str, volume: int) -> str:
+  """
+  Returns path of a volume of archive.
+
+  :param archive: tar archive, see ARCHIVE_EXTENSIONS
+  :param volume: number of volume, starting at 0
+  :return: path of volume, like 'out.001.tar.zst' for the second volume of 'out.tar.zst'
+  """
+  extension = archive_extension(archive)
+  return f"{archive[:-len(extension)]}.{volume:03d}{extension}"
+
+
+class BlockWriter:
+  """
+  Write-only file compressing fixed-size blocks in parallel, in the order they are written.
+  """
+
+  def __init__(self, file_out, extension: str, executor: concurrent.futures.Executor, window: int,
+      block_size: int = BLOCK_SIZE):
+    """
+    :param file_out: output file, opened in binary mode
+    :param extension: extension of archive, see ARCHIVE_EXTENSIONS
+    :param executor: executor used to compress blocks
+    :param window: maximum number of blocks compressed ahead of the block written to file_out
+    :param block_size: size of uncompressed blocks
+    """
+    self.file_out = file_out
+    self.extension = extension
+    self.executor = executor
+    self.window = window
+    self.block_size = block_size
+    self.buffer = bytearray()
+    self.position = 0
+    self.pending = collections.deque()
+    # Offset of each block in file_out, in block order.
+    self.block_offsets = []
+    self.written = 0
+
+  def write(self, data) -> int:
+    self.buffer.extend(data)
+    self.position += len(data)
+    while len(self.buffer) >= self.block_size:
+      self._submit(bytes(self.buffer[:self.block_size]))
+      del self.buffer[:self.block_size]
+    return len(data)
+
+  def tell(self) -> int:
+    return self.position
+
+  def close(self):
+    """
+    Compress remaining data and wait until all blocks are written.
+    """
+    if self.buffer:
+      self._submit(bytes(self.buffer))
+      self.buffer = bytearray()
+    while self.pending:
+      self._write_block()
+
+  def block_offset(self, position: int) -> tuple[int, int]:
+    """
+    Returns location of uncompressed position, once the block containing position is written.
+
+    :param position: position in the uncompressed stream
+    :return: tuple containing (block_offset, skip), where block_offset is the offset of the block
+             in file_out and skip is the number of uncompressed bytes of the block before position
+    """
+    block = position // self.block_size
+    return self.block_offsets[block], position - block * self.block_size
+
+  def _submit(self, block: bytes):
+    self.pending.append(self.executor.submit(compress_block, block, self.extension))
+    if len(self.pending) > self.window:
+      self._write_block()
+
+  def _write_block(self):
+    compressed = self.pending.popleft().result()
+    self.block_offsets.append(self.written)
+    self.file_out.write(compressed)
+    self.written += len(compressed)
+
+
+class ArchiveWriter:
+  """
+  Write files into a tar archive, compressing blocks of the archive in parallel threads.
+
+  The archive is optionally split into volumes, each volume being a complete tar archive.
+  An index containing the location of every member is written next to the archive, see :func:`read_member`.
+  """
+
+  def __init__(self, archive: str, threads: int = 1, volume_size: int = None, block_size: int = BLOCK_SIZE):
+    """
+    :param archive: tar archive, see ARCHIVE_EXTENSIONS
+    :param threads: number of threads compressing blocks
+    :param volume_size: if not None, start a new volume before a file when the uncompressed size of the
+                        current volume would exceed volume_size bytes, see :func:`volume_path`
+    :param block_size: size of uncompressed blocks compressed independently
+    """
+    if threads < 1:
+      raise AssertionError("threads value must be at least 1")
+    if volume_size is not None and volume_size < 1:
+      raise AssertionError("volume_size value must be at least 1")
+    self.archive = archive
+    self.extension = archive_extension(archive)
+    if self.extension == ".tar.zst":
+      Af3Files.import_zstandard()
+    self.volume_size = volume_size
+    self.block_size = block_size
+    self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+    self.window = 2 * threads
+    self.volume = -1
+    self.volume_out = None
+    self.writer = None
+    self.tar = None
+    # Name, size and data offset of members of the current volume.
+    self.members = []
+    self.volumes = []
+    self.index_out = open(f"{archive}.index", "w")
+    self.index_out.write("\t".join(INDEX_HEADER))
+    self.index_out.write("\n")
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    self.close()
+
+  def add(self, file: str, algorithm: str = None) -> str | None:
+    """
+    Add file to archive.
+
+    :param file: file, its path is the name of the member
+    :param algorithm: if not None, algorithm of the checksum of file computed while file is read,
+                      see Checksums.CHECKSUM_ALGORITHMS
+    :return: hexadecimal checksum of file if algorithm is not None
+    """
+    from af3tools import Checksums
+    size = os.path.getsize(file)
+    if self.tar is not None and self.volume_size is not None and self.members and \
+        self.writer.tell() + size + 2 * tarfile.BLOCKSIZE > self.volume_size:
+      self._close_volume()
+    if self.tar is None:
+      self._open_volume()
+    with open(file, "rb") as file_in:
+      member = self.tar.gettarinfo(file, fileobj=file_in)
+      # Like tar, avoids an extended header for sub-second modification times.
+      member.mtime = int(member.mtime)
+      reader = Checksums.HashingReader(file_in, algorithm) if algorithm else file_in
+      self.tar.addfile(member, reader)
+    padded_size = -(-member.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+    self.members.append((member.name, member.size, self.writer.tell() - padded_size))
+    return reader.hexdigest() if algorithm else None
+
+  def close(self):
+    """
+    Finish last volume and index.
+    """
+    if self.index_out is None:
+      return
+    if self.tar is None and not self.volumes:
+      self._open_volume()
+    if self.tar is not None:
+      self._close_volume()
+    self.executor.shutdown()
+    self.index_out.close()
+    self.index_out = None
+
+  def _open_volume(self):
+    self.volume += 1
+    path = volume_path(self.archive, self.volume) if self.volume_size is not None else self.archive
+    self.volumes.append(path)
+    self.volume_out = open(path, "wb")
+    self.writer = BlockWriter(self.volume_out, self.extension, self.executor, self.window, self.block_size)
+    self.tar = tarfile.open(fileobj=self.writer, mode="w")
+
+  def _close_volume(self):
+    self.tar.close()
+    self.writer.close()
+    self.volume_out.close()
+    volume = os.path.basename(self.volumes[-1])
+    for name, size, offset in self.members:
+      block_offset, skip = self.writer.block_offset(offset)
+      self.index_out.write("\t".join([volume, name, str(size), str(offset), str(block_offset), str(skip)]))
+      self.index_out.write("\n")
+    self.members = []
+    self.tar = None
+
+
+def read_index(index_file: str) -> dict[str, tuple[str, int, int, int, int]]:
+  """
+  Parse index of archive written by :class:`ArchiveWriter`.
+
+  :param index_file: tab delimited index, see INDEX_HEADER
+  :return: location of members, by name, see :func:`read_member`
+  """
+  index = {}
+  directory = os.path.dirname(index_file)
+  with open(index_file, "r") as index_in:
+    reader = csv.reader(index_in, delimiter="\t")
+    next(reader, None)
+    for row in reader:
+      index[row[1]] = (os.path.join(directory, row[0]), int(row[2]), int(row[3]), int(row[4]), int(row[5]))
+  return index
+
+
+def read_member(location: tuple[str, int, int, int, int]) -> bytes:
+  """
+  Returns content of a member of archive without reading the archive from the start.
+
+  Only the compressed blocks from the block containing the start of member are decompressed.
+
+  :param location: location of member, see :func:`read_index`
+  :return: content of member
+  """
+  volume, size, offset, block_offset, skip = location
+  if archive_extension(volume) == ".tar":
+    block_offset, skip = offset, 0
+  with open_compressed(volume, block_offset) as archive_in:
+    while skip > 0:
+      data = archive_in.read(min(skip, BLOCK_SIZE))
+      if not data:
+        raise EOFError(f"Archive {volume} ends before member at offset {offset}")
+      skip -= len(data)
+    return archive_in.read(size)
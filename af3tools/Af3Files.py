@@ -0,0 +1,345 @@
+import glob
+import gzip
+import io
+import json
+import logging
+import lzma
+import os
+import re
+import threading
+from contextlib import contextmanager
+from fnmatch import fnmatch
+
+JSON_BACKENDS = ["auto", "orjson", "json"]
+# Extensions of compressed files, checked in this order when the uncompressed file does not exist.
+COMPRESSIONS = [".gz", ".zst", ".xz"]
+
+logger = logging.getLogger("Af3Files")
+json_backend = "auto"
+# Content of files read from an archive, used instead of the file system by this thread, see memory_files.
+_memory = threading.local()
+# Names of files that can be stored in a compact container, see CompactOutputs.
+COMPACT_NAMES = ["confidences.json", "model.cif", "name_confidences.json", "name_model.cif"]
+COMPACT_SUFFIXES = ("confidences.json", "model.cif")
+
+
+def import_orjson():
+  """
+  Returns orjson module, or None if orjson is not installed.
+
+  :return: orjson module or None
+  """
+  try:
+    import orjson
+  except ImportError:
+    return None
+  return orjson
+
+
+def import_zstandard():
+  """
+  Returns zstandard module, which is only needed for .zst files.
+
+  :return: zstandard module
+  """
+  try:
+    import zstandard
+  except ImportError as e:
+    raise ImportError(
+        "zstandard is required for .zst files, install it using 'pip install af3-tools[zstd]'") from e
+  return zstandard
+
+
+def compression(path: str) -> str | None:
+  """
+  Returns compression extension of file.
+
+  :param path: file
+  :return: one of COMPRESSIONS, None if file is not compressed
+  """
+  for extension in COMPRESSIONS:
+    if path.endswith(extension):
+      return extension
+  return None
+
+
+def strip_compression(path: str) -> str:
+  """
+  Returns path of file without compression extension.
+
+  :param path: file
+  :return: path of file without compression extension
+  """
+  extension = compression(path)
+  return path[:-len(extension)] if extension else path
+
+
+@contextmanager
+def memory_files(files: dict[str, bytes]):
+  """
+  Read files from memory instead of the file system while in context.
+
+  Used to score predictions read from an archive, see :mod:`Af3Archive`.
+
+  :param files: content of files, by path
+  """
+  _memory.files = files
+  try:
+    yield
+  finally:
+    _memory.files = {}
+
+
+def memory() -> dict[str, bytes]:
+  """
+  Returns content of files read from memory by this thread, see :func:`memory_files`.
+
+  :return: content of files, by path, empty if files are read from the file system
+  """
+  return getattr(_memory, "files", {})
+
+
+def resolve(path: str) -> str:
+  """
+  Returns path of file or of a compressed variant of file if only the compressed variant exists.
+
+  :param path: file, without compression extension
+  :return: path of file that exists, path if neither file nor compressed variants exist
+  """
+  files = memory()
+  if files:
+    for extension in [""] + COMPRESSIONS:
+      if path + extension in files:
+        return path + extension
+    return path
+  if os.path.exists(path):
+    return path
+  for extension in COMPRESSIONS:
+    if os.path.exists(path + extension):
+      return path + extension
+  return path
+
+
+def exists(path: str) -> bool:
+  """
+  Returns True if file or a compressed variant of file exists.
+
+  :param path: file, without compression extension
+  :return: True if file or a compressed variant of file exists
+  """
+  path = resolve(path)
+  files = memory()
+  if files:
+    return path in files
+  return os.path.isfile(path) or compact_member(path) is not None
+
+
+def compact_member(path: str):
+  """
+  Returns container of file, if file was converted to a compact container and does not exist anymore.
+
+  :param path: file, without compression extension
+  :return: tuple containing (container, member), None if file is not in a container,
+           see :func:`CompactOutputs.find_member`
+  """
+  if not path.endswith(COMPACT_SUFFIXES) or path.endswith("_summary_confidences.json"):
+    return None
+  from af3tools import CompactOutputs
+  return CompactOutputs.find_member(path)
+
+
+def open_file(path: str, mode: str = "rb"):
+  """
+  Open file for reading, compressed variants are decompressed while reading.
+
+  :param path: file, with or without compression extension, see :func:`resolve`
+  :param mode: either 'rb' or 'rt'
+  :return: file object
+  """
+  if mode not in ["rb", "rt"]:
+    raise AssertionError("mode must be either 'rb' or 'rt'")
+  path = resolve(path)
+  if memory():
+    return open_memory_file(path, mode)
+  if not os.path.exists(path):
+    member = compact_member(path)
+    if member is not None:
+      compact, name = member
+      file_in = io.BytesIO(compact.read_bytes(name))
+      return io.TextIOWrapper(file_in) if mode == "rt" else file_in
+  extension = compression(path)
+  if extension == ".gz":
+    return gzip.open(path, mode)
+  if extension == ".xz":
+    return lzma.open(path, mode)
+  if extension == ".zst":
+    return import_zstandard().open(path, mode)
+  return open(path, mode)
+
+
+def open_memory_file(path: str, mode: str = "rb"):
+  """
+  Open file read from an archive, see :func:`memory_files`.
+
+  :param path: file, with compression extension if file is compressed
+  :param mode: either 'rb' or 'rt'
+  :return: file object
+  """
+  files = memory()
+  if path not in files:
+    raise FileNotFoundError(f"No such file in archive: '{path}'")
+  file_in = io.BytesIO(files[path])
+  extension = compression(path)
+  if extension == ".gz":
+    file_in = gzip.GzipFile(fileobj=file_in, mode="rb")
+  elif extension == ".xz":
+    file_in = lzma.LZMAFile(file_in, mode="rb")
+  elif extension == ".zst":
+    file_in = import_zstandard().ZstdDecompressor().stream_reader(file_in)
+  return io.TextIOWrapper(file_in) if mode == "rt" else file_in
+
+
+def pattern_regex(pattern: str) -> re.Pattern:
+  """
+  Returns regular expression matching paths like recursive glob pattern.
+
+  :param pattern: glob pattern, '**/' matches any number of directories and '*' matches within a directory
+  :return: regular expression matching paths like pattern
+  """
+  regex = ""
+  for part in re.split(r"(\*\*/|\*|\?)", pattern):
+    if part == "**/":
+      regex += "(?:.*/)?"
+    elif part == "*":
+      regex += "[^/]*"
+    elif part == "?":
+      regex += "[^/]"
+    else:
+      regex += re.escape(part)
+  return re.compile(regex)
+
+
+def glob_files(pattern: str, root_dir: str = None) -> list[str]:
+  """
+  Returns files matching pattern, including compressed variants, recursively.
+
+  Compressed files are returned without their compression extension, see :func:`resolve`.
+
+  :param pattern: pattern of uncompressed files
+  :param root_dir: directory where files are searched
+  :return: sorted files matching pattern, without compression extension
+  """
+  files = memory()
+  if files:
+    regex = pattern_regex(pattern)
+    prefix = os.path.join(root_dir, "") if root_dir else ""
+    names = [strip_compression(path)[len(prefix):] for path in files if path.startswith(prefix)]
+    return sorted({name for name in names if regex.fullmatch(name)})
+  files = set(glob.glob(pattern, root_dir=root_dir, recursive=True))
+  for extension in COMPRESSIONS:
+    files.update(strip_compression(file) for file in
+                 glob.glob(pattern + extension, root_dir=root_dir, recursive=True))
+  basename_pattern = pattern.split("/")[-1]
+  if [name for name in COMPACT_NAMES if fnmatch(name, basename_pattern)]:
+    files.update(compact_files(pattern, root_dir))
+  return sorted(files)
+
+
+def compact_files(pattern: str, root_dir: str = None) -> list[str]:
+  """
+  Returns files stored in compact containers matching pattern, see :mod:`CompactOutputs`.
+
+  :param pattern: pattern of uncompressed files
+  :param root_dir: directory where containers are searched
+  :return: files matching pattern
+  """
+  from af3tools import CompactOutputs
+  regex = pattern_regex(pattern)
+  files = []
+  for container in glob.glob(f"**/{CompactOutputs.COMPACT_FILE}", root_dir=root_dir, recursive=True):
+    directory = os.path.dirname(container)
+    path = os.path.join(root_dir, container) if root_dir else container
+    compact = CompactOutputs.open_compact(path, os.stat(path).st_mtime_ns)
+    files.extend(file for file in (os.path.join(directory, member) for member in compact.members)
+                 if regex.fullmatch(file))
+  return files
+
+
+def set_json_backend(backend: str = "auto"):
+  """
+  Select parser used to load JSON files in this process.
+
+  'auto' uses orjson when it is installed and the standard json module otherwise.
+
+  :param backend: one of JSON_BACKENDS
+  """
+  global json_backend
+  if backend not in JSON_BACKENDS:
+    raise AssertionError(f"backend must be one of {JSON_BACKENDS}")
+  if backend == "orjson" and import_orjson() is None:
+    raise ImportError("orjson is required for orjson backend, install it using 'pip install af3-tools[fastjson]'")
+  json_backend = backend
+
+
+def resolved_json_backend() -> str:
+  """
+  Returns parser used to load JSON files, 'auto' resolved to the parser that is installed.
+
+  :return: either 'orjson' or 'json'
+  """
+  if json_backend == "auto":
+    return "orjson" if import_orjson() is not None else "json"
+  return json_backend
+
+
+def loads(data: bytes, backend: str = None):
+  """
+  Parse JSON document.
+
+  With 'auto' backend, documents rejected by orjson, like documents containing NaN, are parsed again
+  using the json module.
+
+  :param data: JSON document
+  :param backend: one of JSON_BACKENDS, defaults to backend selected by :func:`set_json_backend`
+  :return: parsed document
+  """
+  backend = backend if backend else json_backend
+  if backend == "json":
+    return json.loads(data)
+  orjson = import_orjson()
+  if orjson is None:
+    if backend == "orjson":
+      raise ImportError("orjson is required for orjson backend, install it using 'pip install af3-tools[fastjson]'")
+    return json.loads(data)
+  try:
+    return orjson.loads(data)
+  except orjson.JSONDecodeError:
+    if backend == "orjson":
+      raise
+    return json.loads(data)
+
+
+def load_json(file: str, backend: str = None):
+  """
+  Load JSON file.
+
+  The file is read in a single call, which is faster than incremental reads on network file systems.
+  Compressed variants of file are decompressed while reading, see :func:`open_file`.
+
+  :param file: JSON file
+  :param backend: one of JSON_BACKENDS, defaults to backend selected by :func:`set_json_backend`
+  :return: parsed document, lists are memory-mapped arrays for files stored in a compact container
+  """
+  path = resolve(file)
+  if not memory() and not os.path.exists(path):
+    member = compact_member(path)
+    if member is not None:
+      compact, name = member
+      return compact.load_json(name)
+  with open_file(file, "rb") as file_in:
+    data = file_in.read()
+  try:
+    return loads(data, backend)
+  except ValueError as e:
+    logger.error(f"Error loading JSON file {file}")
+    raise e
@@ -2,7 +2,6 @@
 Code of this file was copied from https://github.com/flyark/AFM-LIS.
 """
 
-import json
 import logging
 from collections import Counter
 
@@ -10,6 +9,7 @@ import numpy as np
 import pandas as pd
 from scipy.spatial.distance import pdist, squareform
 
+from af3tools import Af3Files, Profiler
 
 logger = logging.getLogger("Af3LocalInteractionScore")
 
@@ -58,7 +58,7 @@ def calculate_mean_lis(transformed_pae, subunit_number):
 
 def calculate_contact_map(cif_file, distance_threshold: float = 8):
   def read_cif_lines(cif_path):
-    with open(cif_path, 'r') as file:
+    with Af3Files.open_file(cif_path, 'rt') as file:
       lines = file.readlines()
 
     residue_lines = []
@@ -97,26 +97,28 @@ def calculate_contact_map(cif_file, distance_threshold: float = 8):
 
     return df
 
-  # Read lines from CIF file
-  residue_lines = read_cif_lines(cif_file)
+  with Profiler.stage("parse_cif"):
+    # Read lines from CIF file
+    residue_lines = read_cif_lines(cif_file)
 
-  # Convert lines to DataFrame
-  df = lines_to_dataframe(residue_lines)
+    # Convert lines to DataFrame
+    df = lines_to_dataframe(residue_lines)
 
-  # Assuming the columns for x, y, z coordinates are at indices 11, 12, 13 after insertion
-  coordinates = df.iloc[:, 11:14].to_numpy()
+  with Profiler.stage("contacts"):
+    # Assuming the columns for x, y, z coordinates are at indices 11, 12, 13 after insertion
+    coordinates = df.iloc[:, 11:14].to_numpy()
 
-  distances = squareform(pdist(coordinates))
+    distances = squareform(pdist(coordinates))
 
-  # Assuming the column for atom names is at index 3 after insertion
-  has_phosphorus = df.iloc[:, 3].apply(lambda x: 'P' in str(x)).to_numpy()
+    # Assuming the column for atom names is at index 3 after insertion
+    has_phosphorus = df.iloc[:, 3].apply(lambda x: 'P' in str(x)).to_numpy()
 
-  # Adjust the threshold for phosphorus-containing residues
-  adjusted_distances = np.where(
-      has_phosphorus[:, np.newaxis] | has_phosphorus[np.newaxis, :],
-      distances - 4, distances)
+    # Adjust the threshold for phosphorus-containing residues
+    adjusted_distances = np.where(
+        has_phosphorus[:, np.newaxis] | has_phosphorus[np.newaxis, :],
+        distances - 4, distances)
 
-  contact_map = np.where(adjusted_distances < distance_threshold, 1, 0)
+    contact_map = np.where(adjusted_distances < distance_threshold, 1, 0)
   return contact_map
 
 
@@ -137,74 +139,72 @@ def local_interaction_score(af3_json: str, af3_structure: str,
   :param subunit_two: identifier of second subunit
   :return: local interaction score between first subunit and second subunit
   """
-  with open(af3_json, 'rb') as file:
-    try:
-      json_data = json.load(file)
-    except json.decoder.JSONDecodeError as e:
-      logger.error(f"Error loading JSON file {file}")
-      raise e
+  with Profiler.stage("load_confidences"):
+    json_data = Af3Files.load_json(af3_json)
 
-  token_chain_ids = json_data['token_chain_ids']
-  chain_residue_counts = Counter(token_chain_ids)
-  subunit_number = list(chain_residue_counts.values())
-  pae_matrix = np.array(json_data['pae'], dtype=float)
-  pae_matrix = np.nan_to_num(pae_matrix)
+  with Profiler.stage("lis_reduce"):
+    token_chain_ids = json_data['token_chain_ids']
+    chain_residue_counts = Counter(token_chain_ids)
+    subunit_number = list(chain_residue_counts.values())
+    pae_matrix = np.array(json_data['pae'], dtype=float)
+    pae_matrix = np.nan_to_num(pae_matrix)
 
-  # ----------------------------------------------
-  # 2) Transform PAE matrix => LIS
-  # ----------------------------------------------
-  transformed_pae_matrix = transform_pae_matrix(pae_matrix, pae_cutoff)
-  transformed_pae_matrix = np.nan_to_num(transformed_pae_matrix)
+    # ----------------------------------------------
+    # 2) Transform PAE matrix => LIS
+    # ----------------------------------------------
+    transformed_pae_matrix = transform_pae_matrix(pae_matrix, pae_cutoff)
+    transformed_pae_matrix = np.nan_to_num(transformed_pae_matrix)
 
-  # A binary map (1 where LIS>0, else 0)
-  lia_map = np.where(transformed_pae_matrix > 0, 1, 0)
+    # A binary map (1 where LIS>0, else 0)
+    lia_map = np.where(transformed_pae_matrix > 0, 1, 0)
 
-  mean_lis_matrix = calculate_mean_lis(transformed_pae_matrix, subunit_number)
-  mean_lis_matrix = np.nan_to_num(mean_lis_matrix)
+    mean_lis_matrix = calculate_mean_lis(transformed_pae_matrix, subunit_number)
+    mean_lis_matrix = np.nan_to_num(mean_lis_matrix)
 
   # ----------------------------------------------
   # 3) Contact map => cLIA
   # ----------------------------------------------
   contact_map = calculate_contact_map(af3_structure, distance_cutoff)
 
-  try:
-    combined_map = np.where(
-        (transformed_pae_matrix > 0) & (contact_map == 1),
-        transformed_pae_matrix,
-        0
-    )
-  except ValueError:
-    combined_map = np.empty(transformed_pae_matrix.shape)
-  mean_clis_matrix = calculate_mean_lis(combined_map, subunit_number)
-  mean_clis_matrix = np.nan_to_num(mean_clis_matrix)
-
-  # ----------------------------------------------
-  # 4) Count-based metrics: LIA, LIR, cLIA, cLIR
-  #    plus local (per-subunit) residue indices
-  # ----------------------------------------------
-  subunit_count = len(subunit_number)
-  lia_matrix = np.zeros((subunit_count, subunit_count), dtype=int)
-
-  # For extracting submatrices
-  cum_lengths = np.cumsum(subunit_number)
-  starts = np.concatenate(([0], cum_lengths[:-1]))
-
-  i_lis = []
-  lis = []
-  lia = []
-  for i, j in [[subunit_one, subunit_two], [subunit_two, subunit_one]]:
-    # subunit one spans [start_one, end_one), subunit two spans [start_two, end_two)
-    start_one, end_one = starts[i], cum_lengths[i]
-    start_two, end_two = starts[j], cum_lengths[j]
-
-    lis.append(mean_lis_matrix[i, j])
-
-    # Submatrix for LIS-based local interactions (binary)
-    interaction_submatrix = lia_map[start_one:end_one, start_two:end_two]
-    lia.append(np.count_nonzero(interaction_submatrix))
-
-    i_lis.append(np.sqrt(
-        mean_lis_matrix[i, j] * mean_clis_matrix[
-          i, j]))
+  with Profiler.stage("lis_reduce"):
+    try:
+      combined_map = np.where(
+          (transformed_pae_matrix > 0) & (contact_map == 1),
+          transformed_pae_matrix,
+          0
+      )
+    except ValueError:
+      combined_map = np.empty(transformed_pae_matrix.shape)
+    mean_clis_matrix = calculate_mean_lis(combined_map, subunit_number)
+    mean_clis_matrix = np.nan_to_num(mean_clis_matrix)
+
+    # ----------------------------------------------
+    # 4) Count-based metrics: LIA, LIR, cLIA, cLIR
+    #    plus local (per-subunit) residue indices
+    # ----------------------------------------------
+    subunit_count = len(subunit_number)
+    lia_matrix = np.zeros((subunit_count, subunit_count), dtype=int)
+
+    # For extracting submatrices
+    cum_lengths = np.cumsum(subunit_number)
+    starts = np.concatenate(([0], cum_lengths[:-1]))
+
+    i_lis = []
+    lis = []
+    lia = []
+    for i, j in [[subunit_one, subunit_two], [subunit_two, subunit_one]]:
+      # subunit one spans [start_one, end_one), subunit two spans [start_two, end_two)
+      start_one, end_one = starts[i], cum_lengths[i]
+      start_two, end_two = starts[j], cum_lengths[j]
+
+      lis.append(mean_lis_matrix[i, j])
+
+      # Submatrix for LIS-based local interactions (binary)
+      interaction_submatrix = lia_map[start_one:end_one, start_two:end_two]
+      lia.append(np.count_nonzero(interaction_submatrix))
+
+      i_lis.append(np.sqrt(
+          mean_lis_matrix[i, j] * mean_clis_matrix[
+            i, j]))
 
   return np.mean(i_lis), np.mean(lis), np.mean(lia)
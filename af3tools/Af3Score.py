@@ -1,17 +1,27 @@
 import argparse
-import glob
-import json
+import csv
+import inspect
 import os
 import re
 import logging
-import statistics
+import shutil
 import sys
 import concurrent.futures
-from typing import Tuple
+import contextlib
+import functools
+import hashlib
+import json
+import operator
+import tempfile
+import time
+from typing import TextIO, Tuple
 
+import numpy as np
+import pandas as pd
 import tqdm
 
-from af3tools import Af3LocalInteractionScore
+from af3tools import Af3Archive, Af3Files, Af3LocalInteractionScore, Prefetch, Profiler, ScoreOutput, StatusFile, WorkerLogging, \
+  WorkQueue
 
 
 def readable_file(filepath: str):
@@ -49,19 +59,69 @@ def dir_path(string: str):
     raise NotADirectoryError(string)
 
 
+def input_path(string: str):
+  """Checks if input is a directory or a tar archive, see :func:`Af3Archive.is_archive`."""
+  if Af3Archive.is_archive(string) and os.path.isfile(string):
+    return string
+  return dir_path(string)
+
+
 logger = logging.getLogger("Af3Score")
-METRICS = ["iptm", "ptm", "ranking_score", "lis", "best_lis"]
+METRICS = ["iptm", "ptm", "ranking_score", "lis", "best_lis",
+           "chain_pair_iptm", "chain_pair_pae_min", "chain_iptm",
+           "fraction_disordered"]
+# Metrics read from the summary confidence file, cheap to compute.
+# Chain metrics also need the index of sequences, which reads the *_data.json file, see get_sequence_index.
+SUMMARY_METRICS = ["iptm", "ptm", "ranking_score", "chain_pair_iptm",
+                   "chain_pair_pae_min", "chain_iptm", "fraction_disordered"]
+# Metrics that need the index of sequences in the model files.
+SEQUENCE_INDEX_METRICS = ["lis", "best_lis", "chain_pair_iptm",
+                          "chain_pair_pae_min", "chain_iptm"]
+METRIC_HEADERS = {
+  "iptm": ["ipTM"],
+  "ptm": ["pTM"],
+  "ranking_score": ["Ranking score"],
+  "lis": ["iLIS", "LIS", "LIA"],
+  "best_lis": ["Best iLIS", "Best LIS", "Best LIA"],
+  "chain_pair_iptm": ["Chain pair ipTM"],
+  "chain_pair_pae_min": ["Chain pair PAE min 1-2", "Chain pair PAE min 2-1"],
+  "chain_iptm": ["Chain ipTM 1", "Chain ipTM 2"],
+  "fraction_disordered": ["Fraction disordered"],
+}
+GATE_OPERATORS = {">=": operator.ge, ">": operator.gt, "<=": operator.le,
+                  "<": operator.lt, "==": operator.eq, "!=": operator.ne}
+NA = "NA"
+# Metrics that can be computed for each sample, best_lis is only computed for the top ranked sample.
+SAMPLE_METRICS = [metric for metric in METRICS if metric != "best_lis"]
+AGGREGATES = ["Mean", "Max", "SD", "Best"]
 
 
-def main(argv: list[str] = None):
-  logging.basicConfig(filename='af3score.log', level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+class ScoringError(Exception):
+  """Error raised when scores cannot be computed for a prediction."""
 
+  def __init__(self, confidence_file: str, stage: str, error: str):
+    super().__init__(confidence_file, stage, error)
+    self.confidence_file = confidence_file
+    self.stage = stage
+    self.error = error
+
+  def __str__(self):
+    return f"{self.stage} failed for {self.confidence_file}: {self.error}"
+
+
+def main(argv: list[str] = None):
   parser = argparse.ArgumentParser(
       description="Extract ipTM score (or other) from summary confidence JSON files generated by AlphaFold 3.")
-  parser.add_argument("-i", "--input", type=dir_path, default="",
-                      help="Base directory to look for summary confidence JSON files  (default: current directory)")
+  parser.add_argument("-i", "--input", type=input_path, default="",
+                      help="Base directory to look for summary confidence JSON files, or tar archive "
+                           "(.tar, .tar.gz, .tgz, .tar.zst or .tar.xz) read without extracting it "
+                           " (default: current directory)")
   parser.add_argument("-o", "--output", type=writable_path, default="-",
                       help="Tab delimited output file containing scores  (default: standard output '-')")
+  parser.add_argument("-f", "--format", choices=ScoreOutput.FORMATS, default=ScoreOutput.FORMATS[0],
+                      help="Format of output file, parquet and arrow outputs are typed and contain "
+                           "scoring parameters as metadata - matrix, samples and aggregate files are always "
+                           "tab delimited  (default: %(default)s)")
   parser.add_argument("-m", "--metrics", nargs="+", choices=METRICS,
                       default=[METRICS[0]],
                       help="Metrics to output  (default: %(default)s)")
@@ -85,19 +145,86 @@ def main(argv: list[str] = None):
   parser.add_argument("-C", "--converted_column", type=int, default="2",
                       help="Column index of converted names in mapping file - 1 means first column of file" +
                            "   (default: %(default)s)")
+  parser.add_argument("-x", "--matrix", type=writable_path,
+                      help="Tab delimited output file containing chain pair ipTM and PAE min "
+                           "of all chain pairs - reads summary files and the header of *_model.cif files")
+  parser.add_argument("-s", "--samples", type=writable_path,
+                      help="Tab delimited output file containing scores of every seed and sample")
+  parser.add_argument("-a", "--aggregate", type=writable_path,
+                      help="Tab delimited output file containing mean, max, standard deviation and "
+                           "best (by ranking score) of scores over all seeds and samples")
+  parser.add_argument("-g", "--gate",
+                      help="Only compute expensive metrics (lis, best_lis) for pairs passing this condition on "
+                           "a summary metric, for example 'iptm>=0.4' - other pairs get NA")
+  parser.add_argument("-k", "--top", type=int,
+                      help="Only compute expensive metrics (lis, best_lis) for the best K targets of each bait "
+                           "according to the gate metric, ipTM if no gate is used - other pairs get NA")
+  parser.add_argument("-e", "--errors", type=writable_path,
+                      help="Tab delimited file where predictions that could not be scored are written "
+                           " (default: standard error)")
+  parser.add_argument("-r", "--retry-failed", type=readable_file,
+                      help="Only score predictions listed in this errors file - created using '--errors'")
+  parser.add_argument("-Q", "--queue", type=str,
+                      help="Shared queue directory - many af3-score jobs using the same queue split the work")
+  parser.add_argument("--batch-size", type=int, default=50,
+                      help="Number of predictions per queue batch (default: %(default)s)")
+  parser.add_argument("--lease", type=float, default=3600,
+                      help="Seconds after which a batch claimed by a job that stopped responding "
+                           "is given to another job (default: %(default)s)")
+  parser.add_argument("-l", "--log", type=writable_path, default="af3score.log",
+                      help="Log file, only written by the main process - use '-' for standard error "
+                           " (default: %(default)s)")
+  parser.add_argument("--log-level", choices=WorkerLogging.LEVELS, default="INFO",
+                      help="Minimum level of logged messages (default: %(default)s)")
+  parser.add_argument("-P", "--profile",
+                      help="Record wall time, CPU time and bytes read of each stage, writes a report to "
+                           "PROFILE-profile.txt and a Chrome trace to PROFILE-trace.json")
+  parser.add_argument("--status", type=writable_path,
+                      help="Status file periodically updated with tasks done, failed and in flight, throughput, "
+                           "ETA, worker memory and read rate - JSON, or Prometheus textfile format "
+                           "if filename ends with '.prom'")
+  parser.add_argument("--status-interval", type=float, default=30,
+                      help="Seconds between updates of status file (default: %(default)s)")
+  parser.add_argument("--prefetch", type=int, default=0,
+                      help="Read files of upcoming predictions ahead of workers, up to this many megabytes, "
+                           "so workers read them from memory - 0 disables prefetch (default: %(default)s)")
+  parser.add_argument("--json-backend", choices=Af3Files.JSON_BACKENDS, default="auto",
+                      help="Parser used to load JSON files, auto uses orjson when it is installed "
+                           " (default: %(default)s)")
+  parser.add_argument("--strict", action="store_true", default=False,
+                      help="Exit with status 1 when some predictions could not be scored")
 
   args = parser.parse_args(argv)
+  WorkerLogging.configure(args.log, args.log_level)
 
-  af3_score(input_dir=args.input, output_file=args.output,
-            name=args.name,
-            metrics=args.metrics,
-            sequence_one=args.sequence1 - 1,
-            sequence_two=args.sequence2 - 1,
-            progress=args.progress,
-            mapping_file=args.mapping,
-            source_column=args.source_column - 1,
-            converted_column=args.converted_column - 1,
-            threads=args.threads)
+  failures = af3_score(input_dir=args.input, output_file=args.output,
+                       name=args.name,
+                       metrics=args.metrics,
+                       sequence_one=args.sequence1 - 1,
+                       sequence_two=args.sequence2 - 1,
+                       progress=args.progress,
+                       mapping_file=args.mapping,
+                       source_column=args.source_column - 1,
+                       converted_column=args.converted_column - 1,
+                       threads=args.threads,
+                       queue_dir=args.queue,
+                       batch_size=args.batch_size,
+                       lease=args.lease,
+                       errors_file=args.errors,
+                       retry_failed=args.retry_failed,
+                       gate=args.gate,
+                       top=args.top,
+                       matrix_file=args.matrix,
+                       samples_file=args.samples,
+                       aggregate_file=args.aggregate,
+                       output_format=args.format,
+                       profile=args.profile,
+                       status_file=args.status,
+                       status_interval=args.status_interval,
+                       prefetch=args.prefetch,
+                       json_backend=args.json_backend)
+  if args.strict and failures:
+    parser.exit(1, f"{failures} predictions could not be scored\n")
 
 
 def af3_score(input_dir: str = "",
@@ -107,11 +234,19 @@ def af3_score(input_dir: str = "",
     progress: bool = False,
     mapping_file: str = None, source_column: int = 0,
     converted_column: int = 1,
-    threads: int = 1):
+    threads: int = 1,
+    queue_dir: str = None, batch_size: int = 50, lease: float = 3600,
+    errors_file: str = None, retry_failed: str = None,
+    gate: str = None, top: int = None,
+    matrix_file: str = None,
+    samples_file: str = None, aggregate_file: str = None,
+    output_format: str = "tsv", profile: str = None,
+    status_file: str = None, status_interval: float = 30,
+    prefetch: int = 0, json_backend: str = "auto"):
   """
   Extract ipTM score (or other) from summary confidence JSON files generated by AlphaFold 3.
 
-  :param input_dir: input directory
+  :param input_dir: input directory, or tar archive read in a single sequential pass, see :func:`score_archive`
   :param output_file: output file
   :param name: regular expression to obtain protein/gene names based on confidence filename
   :param metrics: metrics to output
@@ -122,6 +257,31 @@ def af3_score(input_dir: str = "",
   :param source_column: column index of source names in mapping file
   :param converted_column: column index of converted names in mapping file
   :param threads: number of threads to compute score in parallel (default: 1)
+  :param queue_dir: shared queue directory, if not None, predictions are claimed in batches from the queue
+  :param batch_size: number of predictions per queue batch
+  :param lease: seconds after which a claimed batch that was not renewed is reclaimed
+  :param errors_file: tab delimited file where predictions that could not be scored are written,
+                      standard error if None
+  :param retry_failed: errors file of a previous run, if not None, only predictions present in this file are scored
+  :param gate: condition on a summary metric, like 'iptm>=0.4', expensive metrics are only computed for pairs
+               passing the condition
+  :param top: expensive metrics are only computed for the best top targets of each bait according to the
+              gate metric, ipTM if gate is None
+  :param matrix_file: tab delimited output file containing chain pair ipTM and PAE min of all chain pairs
+  :param samples_file: tab delimited output file containing scores of every seed and sample
+  :param aggregate_file: tab delimited output file containing mean, max, standard deviation and best
+                         (by ranking score) of scores over all seeds and samples
+  :param output_format: format of output file, one of ScoreOutput.FORMATS,
+                        matrix, samples and aggregate files are always tab delimited
+  :param profile: if not None, write time spent in each stage to '{profile}-profile.txt'
+                  and a Chrome trace to '{profile}-trace.json'
+  :param status_file: status file periodically updated with progress and resource usage,
+                      see :class:`StatusFile.StatusReporter`
+  :param status_interval: seconds between updates of status file
+  :param prefetch: megabytes of files of upcoming predictions read ahead of workers, 0 disables prefetch,
+                   see :class:`Prefetch.Prefetcher`, not used for archives that are already read ahead of workers
+  :param json_backend: parser used to load JSON files, one of Af3Files.JSON_BACKENDS
+  :return: number of predictions that could not be scored, by this job when queue_dir is not None
   """
   if metrics is None:
     metrics = [METRICS[0]]
@@ -132,54 +292,985 @@ def af3_score(input_dir: str = "",
         f"metrics values must all be present in {METRICS}")
   if threads < 1:
     raise AssertionError("threads value must be at least 1")
-  confidence_files = sorted(
-      glob.glob("**/*_summary_confidences.json", root_dir=input_dir,
-                recursive=True))
-  seed_pattern = re.compile(r"seed-\d+_sample-\d+")
-  confidence_files = [confidence_file for confidence_file in confidence_files if not seed_pattern.search(confidence_file)]
-  confidence_files = [os.path.join(input_dir, confidence_file) for
-                      confidence_file in confidence_files]
+  if prefetch < 0:
+    raise AssertionError("prefetch value must be at least 0")
+  Af3Files.set_json_backend(json_backend)
+  if output_format not in ScoreOutput.FORMATS:
+    raise AssertionError(f"output_format must be one of {ScoreOutput.FORMATS}")
+  if gate:
+    parse_gate(gate)
+  if top is not None and top < 1:
+    raise AssertionError("top value must be at least 1")
+  if top is not None and queue_dir:
+    raise AssertionError("top cannot be used with a queue, batches only contain some of the pairs of a bait")
+  if (matrix_file or samples_file or aggregate_file) and queue_dir:
+    raise AssertionError("matrix_file, samples_file and aggregate_file cannot be used with a queue")
+  archive = Af3Archive.is_archive(input_dir)
+  if archive and (queue_dir or top is not None or matrix_file or samples_file or aggregate_file):
+    raise AssertionError("queue_dir, top, matrix_file, samples_file and aggregate_file cannot be used with "
+                         "an archive")
   mappings = {}
   if mapping_file:
     mappings = parse_mapping(mapping_file, source_column, converted_column)
-  futures = []
-  with concurrent.futures.ProcessPoolExecutor(max_workers=threads) as executor:
-    futures += [executor.submit(executor_get_confidence_scores, confidence_file, metrics, sequence_one, sequence_two) for confidence_file in confidence_files]
-    # Let tasks complete.
-    if progress:
-      with tqdm.tqdm(total=len(confidence_files)) as pbar:
-        for future in concurrent.futures.as_completed(futures):
-          pbar.update(1)
+  confidence_files = parse_errors(retry_failed) if retry_failed else None
+  with profiling(profile):
+    if queue_dir:
+      return af3_score_queue(queue_dir=queue_dir, input_dir=input_dir,
+                             output_file=output_file, name=name, metrics=metrics,
+                             sequence_one=sequence_one, sequence_two=sequence_two,
+                             progress=progress, mappings=mappings, threads=threads,
+                             batch_size=batch_size, lease=lease,
+                             errors_file=errors_file, confidence_files=confidence_files,
+                             gate=gate, output_format=output_format,
+                             status_file=status_file, status_interval=status_interval,
+                             prefetch=prefetch)
+    if confidence_files is None and not archive:
+      with Profiler.stage("discover"):
+        confidence_files = find_confidence_files(input_dir)
+    sample_metrics = [metric for metric in metrics if metric in SAMPLE_METRICS]
+    score_samples = bool(samples_file or aggregate_file)
+    # Mean LIS of a prediction is the mean of the LIS of its samples, so it is not computed twice.
+    sample_lis = score_samples and "lis" in metrics
+    score_metrics = [metric for metric in metrics if not (sample_lis and metric == "lis")]
+    with status_reporter(status_file, status_interval) as status, prefetcher(prefetch) as prefetch_reader, \
+        WorkerLogging.process_pool(threads, *worker_initializer()) as executor:
+      matrix_futures = [executor.submit(get_chain_pair_matrix, confidence_file) for confidence_file in
+                        confidence_files] if matrix_file else []
+      if status:
+        status.track(matrix_futures)
+      sample_files = confidence_files if score_samples else []
+      sample_futures = submit_samples(executor, sample_files, sample_metrics, sequence_one, sequence_two,
+                                      status) if not (gate or top) else []
+      passing = []
+      if archive:
+        all_scores, errors = score_archive(executor, input_dir, score_metrics, sequence_one, sequence_two,
+                                           progress, gate=gate, status=status, confidence_files=confidence_files,
+                                           max_pending=4 * threads)
+      else:
+        all_scores, errors = score_files(executor, confidence_files, score_metrics,
+                                         sequence_one, sequence_two, progress,
+                                         gate=gate, top=top, name=name, status=status, passing=passing,
+                                         prefetcher=prefetch_reader)
+      if score_samples and (gate or top):
+        # Samples are scored like other expensive metrics, only for predictions passing the gate.
+        sample_files = passing
+        sample_futures = submit_samples(executor, sample_files, sample_metrics, sequence_one, sequence_two,
+                                        status)
+    samples = sample_frame(collect_results(sample_files, sample_futures, "samples", errors),
+                           sample_metrics, name, mappings) if score_samples else None
+    if sample_lis:
+      all_scores = add_sample_lis(all_scores, samples, metrics, errors)
+    with Profiler.stage("write"), ScoreOutput.ScoreWriter(
+        output_file, header_columns(metrics), output_format,
+        score_metadata(metrics, sequence_one, sequence_two, name, gate, top)) as writer:
+      for row in score_rows(all_scores, name, mappings):
+        writer.write(row)
+    if matrix_file:
+      matrices = collect_results(confidence_files, matrix_futures, "matrix", errors)
+      with open(matrix_file, "w") if matrix_file != "-" else sys.stdout as matrix_file_out:
+        write_matrix(matrix_file_out, matrices, name, mappings)
+    if score_samples:
+      if samples_file:
+        with open(samples_file, "w") if samples_file != "-" else sys.stdout as samples_file_out:
+          write_frame(samples_file_out, samples.drop(columns=["File", "Ranking"]))
+      if aggregate_file:
+        with open(aggregate_file, "w") if aggregate_file != "-" else sys.stdout as aggregate_file_out:
+          write_frame(aggregate_file_out, aggregate_samples(samples))
+    if errors or errors_file:
+      with open(errors_file, "w") if errors_file and errors_file != "-" else contextlib.nullcontext(sys.stderr) as errors_file_out:
+        write_errors_header(errors_file_out)
+        write_errors(errors_file_out, errors)
+  return failed_predictions(errors)
+
+
+def af3_score_queue(queue_dir: str, input_dir: str = "",
+    output_file: str = "-", name: str = r"([\w-]+)__([\w-]+)",
+    metrics: list[str] = None,
+    sequence_one: int = 0, sequence_two: int = 1,
+    progress: bool = False,
+    mappings: dict[str, str] = None,
+    threads: int = 1,
+    batch_size: int = 50, lease: float = 3600, wait: float = 10,
+    errors_file: str = None, confidence_files: list[str] = None,
+    gate: str = None, output_format: str = "tsv",
+    status_file: str = None, status_interval: float = 30,
+    prefetch: int = 0):
+  """
+  Compute scores of predictions claimed in batches from a shared queue directory.
+
+  Any number of jobs can use the same queue. The first job creates the queue from the predictions
+  found in input directory. The job that sees the queue drained merges the results into output file.
+
+  :param queue_dir: shared queue directory
+  :param input_dir: input directory
+  :param output_file: output file
+  :param name: regular expression to obtain protein/gene names based on confidence filename
+  :param metrics: metrics to output
+  :param sequence_one: index of sequence one in the *_data.json file
+  :param sequence_two: index of sequence two in the *_data.json file
+  :param progress: if True, show progress bar for each batch
+  :param mappings: dictionary of source id to converted id
+  :param threads: number of threads to compute score in parallel
+  :param batch_size: number of predictions per queue batch
+  :param lease: seconds after which a claimed batch that was not renewed is reclaimed
+  :param wait: seconds to wait before checking queue again when other jobs have claimed all batches
+  :param errors_file: tab delimited file where predictions that could not be scored are written,
+                      standard error if None
+  :param confidence_files: confidence files to add to the queue, if None, confidence files are searched in input_dir
+  :param gate: condition on a summary metric, like 'iptm>=0.4', expensive metrics are only computed for pairs
+               passing the condition
+  :param output_format: format of output file, one of ScoreOutput.FORMATS, batch results are always tab delimited
+  :param status_file: status file periodically updated with progress and resource usage of this job,
+                      see :class:`StatusFile.StatusReporter`
+  :param status_interval: seconds between updates of status file
+  :param prefetch: megabytes of files of upcoming predictions read ahead of workers, 0 disables prefetch
+  :return: number of predictions of the batches processed by this job that could not be scored
+  """
+  if mappings is None:
+    mappings = {}
+  parameters = {"metrics": metrics, "sequence_one": sequence_one, "sequence_two": sequence_two,
+                "name": name, "gate": gate, "mappings": mappings_digest(mappings)}
+  if not WorkQueue.exists(queue_dir):
+    with Profiler.stage("discover"):
+      WorkQueue.init_queue(queue_dir, confidence_files if confidence_files is not None
+                           else find_confidence_files(input_dir),
+                           batch_size, parameters=parameters)
+  WorkQueue.check_parameters(queue_dir, parameters)
+  if WorkQueue.is_merged(queue_dir):
+    raise AssertionError(f"results of queue {queue_dir} were already merged, remove queue directory to score again")
+  worker = WorkQueue.worker_id()
+  failures = 0
+  with status_reporter(status_file, status_interval) as status, prefetcher(prefetch) as prefetch_reader, \
+      WorkerLogging.process_pool(threads, *worker_initializer()) as executor:
+    while True:
+      batch = WorkQueue.claim_batch(queue_dir, worker, lease)
+      if batch is None:
+        if WorkQueue.is_drained(queue_dir):
+          break
+        # Other jobs are working on remaining batches or a batch was just reclaimed,
+        # wait in case one of them is killed.
+        time.sleep(wait)
+        continue
+      logger.info(f"Processing batch {batch.name} with {len(batch.items)} predictions")
+      with WorkQueue.heartbeat(batch, lease / 3):
+        all_scores, errors = score_files(executor, batch.items, metrics,
+                                         sequence_one, sequence_two, progress,
+                                         gate=gate, name=name, status=status,
+                                         prefetcher=prefetch_reader)
+        with Profiler.stage("write"), tempfile.NamedTemporaryFile("w", dir=queue_dir, prefix=".result-",
+                                                                  delete=False) as result_out:
+          write_scores(result_out, all_scores, name, mappings)
+        with tempfile.NamedTemporaryFile("w", dir=queue_dir, prefix=".errors-",
+                                         delete=False) as errors_out:
+          write_errors(errors_out, errors)
+      WorkQueue.complete_batch(batch, result_out.name, errors_out.name)
+      failures += failed_predictions(errors)
+  if WorkQueue.claim_merge(queue_dir):
+    merge_queue(queue_dir, output_file, metrics, sequence_one, sequence_two, name,
+                errors_file, gate, output_format)
+  return failures
+
+
+def merge_queue(queue_dir: str, output_file: str = "-", metrics: list[str] = None,
+    sequence_one: int = 0, sequence_two: int = 1,
+    name: str = r"([\w-]+)__([\w-]+)", errors_file: str = None,
+    gate: str = None, output_format: str = "tsv"):
+  """
+  Merge results and errors of all batches of a drained queue.
+
+  :param queue_dir: shared queue directory
+  :param output_file: output file
+  :param metrics: metrics to output
+  :param sequence_one: index of sequence one in the *_data.json file
+  :param sequence_two: index of sequence two in the *_data.json file
+  :param name: regular expression to obtain protein/gene names based on confidence filename
+  :param errors_file: tab delimited file where predictions that could not be scored are written,
+                      standard error if None
+  :param gate: condition on a summary metric used to compute scores
+  :param output_format: format of output file, one of ScoreOutput.FORMATS
+  """
+  with Profiler.stage("write"):
+    if output_format == "tsv":
+      with open(output_file, "w") if output_file != "-" else sys.stdout as output_file_out:
+        write_header(output_file_out, metrics)
+        WorkQueue.merge_results(queue_dir, output_file_out)
     else:
+      with ScoreOutput.ScoreWriter(output_file, header_columns(metrics), output_format,
+                                   score_metadata(metrics, sequence_one, sequence_two, name, gate)) as writer:
+        for result_file in WorkQueue.results(queue_dir):
+          with open(result_file, "r") as result_in:
+            for line in result_in:
+              writer.write(line.rstrip("\r\n").split("\t"))
+    error_files = WorkQueue.results(queue_dir, WorkQueue.ERRORS)
+    if errors_file or [error_file for error_file in error_files if os.path.getsize(error_file) > 0]:
+      with open(errors_file, "w") if errors_file and errors_file != "-" else contextlib.nullcontext(sys.stderr) as errors_file_out:
+        write_errors_header(errors_file_out)
+        WorkQueue.merge_results(queue_dir, errors_file_out, directory=WorkQueue.ERRORS)
+
+
+def status_reporter(status_file: str = None, status_interval: float = 30):
+  """
+  Returns status reporter writing to status file, or a context returning None if status_file is None.
+
+  :param status_file: status file
+  :param status_interval: seconds between updates of status file
+  :return: status reporter context
+  """
+  if status_file:
+    return StatusFile.StatusReporter(status_file, status_interval)
+  return contextlib.nullcontext()
+
+
+def prefetcher(prefetch: int = 0):
+  """
+  Returns prefetcher reading files of upcoming predictions, or a context returning None if prefetch is 0.
+
+  :param prefetch: megabytes of files of upcoming predictions read ahead of workers
+  :return: prefetcher context
+  """
+  if prefetch:
+    return Prefetch.Prefetcher(prefetch * Prefetch.MEGABYTE)
+  return contextlib.nullcontext()
+
+
+def worker_initializer() -> tuple:
+  """
+  Returns initializer and arguments that configure worker processes like this process.
+
+  Workers use the same JSON backend and record stages if profiling is enabled.
+
+  :return: tuple containing (initializer, initargs) to pass to :func:`WorkerLogging.process_pool`
+  """
+  return init_worker, (Af3Files.json_backend, Profiler.trace_dir if Profiler.enabled else None)
+
+
+def init_worker(json_backend: str = "auto", trace_dir: str = None):
+  """
+  Configure worker process, see :func:`worker_initializer`.
+
+  :param json_backend: parser used to load JSON files, one of Af3Files.JSON_BACKENDS
+  :param trace_dir: if not None, record stages and write events to this directory
+  """
+  Af3Files.set_json_backend(json_backend)
+  if trace_dir:
+    Profiler.enable(trace_dir)
+
+
+@contextlib.contextmanager
+def profiling(profile: str = None):
+  """
+  Profile stages of this process and its workers while in context, then write profiling report and trace.
+
+  Profiling is disabled and events of workers are removed even if scoring fails.
+
+  :param profile: prefix of report and trace, see :func:`write_profile`, if None, profiling is disabled
+  """
+  if not profile:
+    yield
+    return
+  trace_dir = tempfile.mkdtemp(prefix="af3score-profile-")
+  Profiler.enable(trace_dir)
+  try:
+    yield
+    write_profile(profile)
+  finally:
+    Profiler.disable()
+    shutil.rmtree(trace_dir, ignore_errors=True)
+
+
+def write_profile(profile: str):
+  """
+  Writes profiling report and trace of this process and its workers.
+
+  :param profile: prefix of report '{profile}-profile.txt' and trace '{profile}-trace.json'
+  """
+  collected = Profiler.collect()
+  with open(f"{profile}-profile.txt", "w") as report_out:
+    Profiler.write_report(report_out, collected)
+  with open(f"{profile}-trace.json", "w") as trace_out:
+    Profiler.write_trace(trace_out, collected)
+
+
+def find_confidence_files(input_dir: str = "") -> list[str]:
+  """
+  Returns summary confidence files of all predictions present in input directory.
+
+  :param input_dir: input directory
+  :return: summary confidence files of all predictions, excluding files of individual samples,
+           compressed files are returned without compression extension, see :func:`Af3Files.glob_files`
+  """
+  confidence_files = Af3Files.glob_files("**/*_summary_confidences.json", root_dir=input_dir)
+  seed_pattern = re.compile(r"seed-\d+_sample-\d+")
+  confidence_files = [confidence_file for confidence_file in confidence_files if not seed_pattern.search(confidence_file)]
+  return [os.path.join(input_dir, confidence_file) for
+          confidence_file in confidence_files]
+
+
+def score_files(executor: concurrent.futures.Executor,
+    confidence_files: list[str], metrics: list[str],
+    sequence_one: int = 0, sequence_two: int = 1,
+    progress: bool = False,
+    gate: str = None, top: int = None,
+    name: str = r"([\w-]+)__([\w-]+)",
+    status: StatusFile.StatusReporter = None, passing: list[str] = None,
+    prefetcher: Prefetch.Prefetcher = None) \
+    -> tuple[list[tuple[str, list[float]]], list[ScoringError]]:
+  """
+  Compute confidence scores of confidence files in parallel.
+
+  A prediction that cannot be scored does not stop other predictions from being scored,
+  the error is returned instead.
+
+  If gate or top is not None, summary metrics are computed first for all predictions
+  and other metrics are only computed for the predictions passing the gate, see :func:`score_cascade`.
+
+  :param executor: executor used to compute scores
+  :param confidence_files: confidence JSON files
+  :param metrics: metrics to obtain confidence scores
+  :param sequence_one: index of sequence one in the *_data.json file
+  :param sequence_two: index of sequence two in the *_data.json file
+  :param progress: if True, show progress bar
+  :param gate: condition on a summary metric, like 'iptm>=0.4'
+  :param top: number of best targets per bait for which other metrics are computed
+  :param name: regular expression to obtain protein/gene names based on confidence filename
+  :param status: if not None, tasks are counted in status file
+  :param passing: if not None, confidence files passing the gate are appended to it,
+                  all confidence files that could be scored if gate and top are None
+  :param prefetcher: if not None, files of predictions are read ahead of workers
+  :return: tuple containing (all_scores, errors)
+  where all_scores is a list of tuple containing (confidence_file, confidence_scores) of successfully scored
+  predictions, in the same order as confidence_files,
+  and errors is a list of errors of predictions that could not be scored
+  """
+  if gate or top:
+    return score_cascade(executor, confidence_files, metrics, sequence_one,
+                         sequence_two, progress, gate, top, name, status, passing, prefetcher)
+  futures = [executor.submit(executor_get_confidence_scores, confidence_file, metrics, sequence_one, sequence_two) for confidence_file in confidence_files]
+  if status:
+    status.track(futures)
+  if prefetcher:
+    prefetcher.prefetch(confidence_files, futures, functools.partial(prediction_files, metrics=metrics))
+  # Let tasks complete.
+  if progress:
+    with tqdm.tqdm(total=len(confidence_files)) as pbar:
       for future in concurrent.futures.as_completed(futures):
+        pbar.update(1)
+  else:
+    for future in concurrent.futures.as_completed(futures):
+      continue
+  all_scores = []
+  errors = []
+  for confidence_file, future in zip(confidence_files, futures):
+    error = future.exception()
+    if error is None:
+      all_scores.append(future.result())
+    elif isinstance(error, ScoringError):
+      errors.append(error)
+    else:
+      errors.append(ScoringError(confidence_file, "worker", format_error(error)))
+  if passing is not None:
+    passing.extend(confidence_file for confidence_file, scores in all_scores)
+  return all_scores, errors
+
+
+def score_cascade(executor: concurrent.futures.Executor,
+    confidence_files: list[str], metrics: list[str],
+    sequence_one: int = 0, sequence_two: int = 1,
+    progress: bool = False,
+    gate: str = None, top: int = None,
+    name: str = r"([\w-]+)__([\w-]+)",
+    status: StatusFile.StatusReporter = None, passing: list[str] = None,
+    prefetcher: Prefetch.Prefetcher = None) \
+    -> tuple[list[tuple[str, list[float]]], list[ScoringError]]:
+  """
+  Compute summary metrics for all predictions, then other metrics only for predictions passing the gate.
+
+  Scores of metrics that are not computed are NA.
+
+  :param executor: executor used to compute scores
+  :param confidence_files: confidence JSON files
+  :param metrics: metrics to obtain confidence scores
+  :param sequence_one: index of sequence one in the *_data.json file
+  :param sequence_two: index of sequence two in the *_data.json file
+  :param progress: if True, show progress bar
+  :param gate: condition on a summary metric, like 'iptm>=0.4'
+  :param top: number of best targets per bait for which other metrics are computed
+  :param name: regular expression to obtain protein/gene names based on confidence filename
+  :param status: if not None, tasks are counted in status file
+  :param passing: if not None, confidence files passing the gate are appended to it
+  :param prefetcher: if not None, files of predictions are read ahead of workers
+  :return: tuple containing (all_scores, errors), see :func:`score_files`
+  """
+  gate_metric, gate_operator, gate_value = parse_gate(gate) if gate else ("iptm", None, None)
+  screen_metrics = [metric for metric in metrics if metric in SUMMARY_METRICS]
+  if gate_metric not in screen_metrics:
+    screen_metrics.append(gate_metric)
+  expensive_metrics = [metric for metric in metrics if metric not in SUMMARY_METRICS]
+
+  screen_scores, errors = score_files(executor, confidence_files, screen_metrics,
+                                      sequence_one, sequence_two, progress, status=status,
+                                      prefetcher=prefetcher)
+  gate_index = metric_offset(screen_metrics, gate_metric)
+  gate_scores = {confidence_file: scores[gate_index] for confidence_file, scores in screen_scores}
+  gate_passing = [confidence_file for confidence_file in gate_scores
+                  if gate_operator is None or GATE_OPERATORS[gate_operator](gate_scores[confidence_file], gate_value)]
+  if top:
+    gate_passing = top_per_bait(gate_passing, gate_scores, top, name)
+  logger.info(f"{len(gate_passing)} of {len(gate_scores)} predictions passed gate")
+  if passing is not None:
+    passing.extend(gate_passing)
+
+  expensive_scores = {}
+  if expensive_metrics and gate_passing:
+    passing_scores, passing_errors = score_files(executor, gate_passing, expensive_metrics,
+                                                 sequence_one, sequence_two, progress, status=status,
+                                                 prefetcher=prefetcher)
+    expensive_scores = dict(passing_scores)
+    errors.extend(passing_errors)
+  failed = {error.confidence_file for error in errors}
+
+  all_scores = []
+  for confidence_file, scores in screen_scores:
+    if confidence_file in failed:
+      continue
+    all_scores.append((confidence_file, cascade_scores(metrics, screen_metrics, scores, expensive_metrics,
+                                                       expensive_scores.get(confidence_file))))
+  return all_scores, errors
+
+
+def cascade_scores(metrics: list[str], screen_metrics: list[str], screen_scores: list[float],
+    expensive_metrics: list[str], expensive_scores: list[float] | None) -> list[float]:
+  """
+  Returns scores of metrics from scores of summary metrics and scores of other metrics.
+
+  :param metrics: metrics to obtain confidence scores
+  :param screen_metrics: summary metrics
+  :param screen_scores: scores of summary metrics
+  :param expensive_metrics: other metrics
+  :param expensive_scores: scores of other metrics, None if prediction did not pass the gate
+  :return: scores of metrics, NA for other metrics if expensive_scores is None
+  """
+  scores = []
+  for metric in metrics:
+    if metric in SUMMARY_METRICS:
+      offset = metric_offset(screen_metrics, metric)
+      scores.extend(screen_scores[offset:offset + metric_width(metric)])
+    elif expensive_scores is not None:
+      offset = metric_offset(expensive_metrics, metric)
+      scores.extend(expensive_scores[offset:offset + metric_width(metric)])
+    else:
+      scores.extend([NA] * metric_width(metric))
+  return scores
+
+
+def score_archive(executor: concurrent.futures.Executor,
+    archive: str, metrics: list[str],
+    sequence_one: int = 0, sequence_two: int = 1,
+    progress: bool = False, gate: str = None,
+    status: StatusFile.StatusReporter = None,
+    confidence_files: list[str] = None, max_pending: int = 4) \
+    -> tuple[list[tuple[str, list[float]]], list[ScoringError]]:
+  """
+  Compute confidence scores of predictions stored in a tar archive in parallel, without extracting the archive.
+
+  The archive is read in a single sequential pass and only files needed to compute metrics are read,
+  see :func:`archive_member_needed`. Files of a prediction are sent to the worker scoring the prediction.
+  At most max_pending predictions are held in memory, reading the archive waits for workers to complete.
+
+  If gate is not None, the worker only computes other metrics when summary metrics pass the gate.
+  Scores and errors are sorted by confidence file, like predictions of a directory, see :func:`find_confidence_files`.
+
+  :param executor: executor used to compute scores
+  :param archive: tar archive, see :data:`Af3Archive.ARCHIVE_EXTENSIONS`
+  :param metrics: metrics to obtain confidence scores
+  :param sequence_one: index of sequence one in the *_data.json file
+  :param sequence_two: index of sequence two in the *_data.json file
+  :param progress: if True, show progress bar
+  :param gate: condition on a summary metric, like 'iptm>=0.4'
+  :param status: if not None, tasks are counted in status file
+  :param confidence_files: if not None, only these predictions are scored
+  :param max_pending: maximum number of predictions sent to workers that are not completed
+  :return: tuple containing (all_scores, errors), see :func:`score_files`
+  """
+  if max_pending < 1:
+    raise AssertionError("max_pending value must be at least 1")
+  selected = set(confidence_files) if confidence_files is not None else None
+  needed = functools.partial(archive_member_needed, metrics=metrics)
+  archive_files = []
+  futures = []
+  pending = set()
+  with tqdm.tqdm(disable=not progress) as pbar:
+    for confidence_file, files in Af3Archive.iter_predictions(archive, needed):
+      if selected is not None and confidence_file not in selected:
         continue
-  all_scores = [future.result() for future in futures]
-  with open(output_file, "w") if output_file != "-" else sys.stdout as output_file_out:
-    output_file_out.write("Bait\tTarget")
-    for metric in metrics:
-      if "iptm" == metric:
-        output_file_out.write("\tipTM")
-      elif "ptm" == metric:
-        output_file_out.write("\tpTM")
-      elif "ranking_score" == metric:
-        output_file_out.write("\tRanking score")
-      elif "lis" == metric:
-        output_file_out.write("\tiLIS\tLIS\tLIA")
-      elif "best_lis" == metric:
-        output_file_out.write("\tBest iLIS\tBest LIS\tBest LIA")
+      while len(pending) >= max_pending:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        pbar.update(len(done))
+      future = executor.submit(executor_get_archive_scores, files, confidence_file, metrics,
+                               sequence_one, sequence_two, gate)
+      if status:
+        status.track([future])
+      archive_files.append(confidence_file)
+      futures.append(future)
+      pending.add(future)
+    for future in concurrent.futures.as_completed(pending):
+      pbar.update(1)
+  errors = []
+  all_scores = collect_results(archive_files, futures, "worker", errors)
+  all_scores.sort(key=operator.itemgetter(0))
+  errors.sort(key=lambda error: error.confidence_file)
+  return all_scores, errors
+
+
+def archive_member_needed(name: str, metrics: list[str]) -> bool:
+  """
+  Returns True if member of an archive is read by :func:`executor_get_confidence_scores` to compute metrics.
+
+  :param name: name of member, without compression extension
+  :param metrics: metrics to obtain confidence scores
+  :return: True if member must be read
+  """
+  basename = os.path.basename(name)
+  if Af3Archive.SEED_PATTERN.fullmatch(os.path.basename(os.path.dirname(name))):
+    return "lis" in metrics and basename in ["confidences.json", "model.cif"]
+  sequence_index = bool([metric for metric in metrics if metric in SEQUENCE_INDEX_METRICS])
+  if basename.endswith("_summary_confidences.json"):
+    return True
+  if basename.endswith("_data.json"):
+    return sequence_index
+  if basename.endswith("_model.cif"):
+    return sequence_index
+  if basename.endswith("_confidences.json"):
+    return "best_lis" in metrics
+  return False
+
+
+def executor_get_archive_scores(files: dict[str, bytes], confidence_file: str, metrics: list[str],
+    sequence_one: int = 0, sequence_two: int = 1, gate: str = None) -> list[float]:
+  """
+  Returns confidence scores of a prediction read from an archive.
+
+  If gate is not None, summary metrics are computed first and scores of other metrics are NA
+  when the prediction does not pass the gate.
+
+  :param files: content of files of prediction, by member name
+  :param confidence_file: confidence JSON file
+  :param metrics: metrics to obtain confidence scores
+  :param sequence_one: index of sequence one in the *_data.json file
+  :param sequence_two: index of sequence two in the *_data.json file
+  :param gate: condition on a summary metric, like 'iptm>=0.4'
+  :return: confidence scores for the different metrics
+  :raises ScoringError: if scores cannot be computed
+  """
+  with Af3Files.memory_files(files):
+    if not gate:
+      return executor_get_confidence_scores(confidence_file, metrics, sequence_one, sequence_two)[1]
+    gate_metric, gate_operator, gate_value = parse_gate(gate)
+    screen_metrics = [metric for metric in metrics if metric in SUMMARY_METRICS]
+    if gate_metric not in screen_metrics:
+      screen_metrics.append(gate_metric)
+    expensive_metrics = [metric for metric in metrics if metric not in SUMMARY_METRICS]
+    screen_scores = executor_get_confidence_scores(confidence_file, screen_metrics, sequence_one, sequence_two)[1]
+    gate_score = screen_scores[metric_offset(screen_metrics, gate_metric)]
+    expensive_scores = None
+    if gate_operator is None or GATE_OPERATORS[gate_operator](gate_score, gate_value):
+      expensive_scores = executor_get_confidence_scores(confidence_file, expensive_metrics, sequence_one,
+                                                        sequence_two)[1] if expensive_metrics else []
+    return cascade_scores(metrics, screen_metrics, screen_scores, expensive_metrics, expensive_scores)
+
+
+def parse_gate(gate: str) -> tuple[str, str | None, float | None]:
+  """
+  Parse gate condition.
+
+  :param gate: condition on a summary metric, like 'iptm>=0.4', or only a summary metric
+  :return: tuple containing (metric, operator, value), operator and value are None if gate is only a metric
+  """
+  re_match = re.fullmatch(r"\s*(\w+)\s*(?:(>=|<=|==|!=|>|<)\s*([-+]?[\d.]+(?:[eE][-+]?\d+)?))?\s*", gate)
+  if not re_match:
+    raise AssertionError(f"gate {gate} must be a condition like 'iptm>=0.4'")
+  metric, gate_operator, value = re_match.group(1, 2, 3)
+  gate_metrics = [summary_metric for summary_metric in SUMMARY_METRICS if metric_width(summary_metric) == 1]
+  if metric not in gate_metrics:
+    raise AssertionError(f"gate metric must be one of {gate_metrics}")
+  return metric, gate_operator, float(value) if value is not None else None
+
+
+def top_per_bait(confidence_files: list[str], gate_scores: dict[str, float],
+    top: int, name: str = r"([\w-]+)__([\w-]+)") -> list[str]:
+  """
+  Returns confidence files of the top targets with the highest score for each bait.
+
+  :param confidence_files: confidence JSON files
+  :param gate_scores: score of each confidence file
+  :param top: number of targets to keep for each bait
+  :param name: regular expression to obtain protein/gene names based on confidence filename
+  :return: confidence files of the top targets of each bait, in the same order as confidence_files
+  """
+  baits = {}
+  for confidence_file in confidence_files:
+    re_match = re.search(name, confidence_file)
+    if not re_match:
+      raise AssertionError(
+          f"Expression {name} cannot be found in filename {confidence_file}")
+    baits.setdefault(re_match.group(1), []).append(confidence_file)
+  keep = set()
+  for bait_files in baits.values():
+    keep.update(sorted(bait_files, key=lambda file: gate_scores[file], reverse=True)[:top])
+  return [confidence_file for confidence_file in confidence_files if confidence_file in keep]
+
+
+def metric_width(metric: str) -> int:
+  """
+  Returns number of scores of metric.
+
+  :param metric: metric
+  :return: number of scores of metric
+  """
+  return len(METRIC_HEADERS[metric])
+
+
+def metric_offset(metrics: list[str], metric: str) -> int:
+  """
+  Returns index of the first score of metric in the scores returned by :func:`get_confidence_scores`.
+
+  :param metrics: metrics used to obtain scores
+  :param metric: metric
+  :return: index of the first score of metric
+  """
+  return sum(metric_width(previous) for previous in metrics[:metrics.index(metric)])
+
+
+def header_columns(metrics: list[str]) -> list[str]:
+  """
+  Returns columns of the output.
+
+  :param metrics: metrics to output
+  :return: columns of the output
+  """
+  return ["Bait", "Target"] + [header for metric in metrics for header in METRIC_HEADERS[metric]]
+
+
+def score_metadata(metrics: list[str], sequence_one: int = 0, sequence_two: int = 1,
+    name: str = r"([\w-]+)__([\w-]+)", gate: str = None, top: int = None) -> dict:
+  """
+  Returns parameters used to compute scores, written as metadata in parquet and arrow outputs.
+
+  :param metrics: metrics to output
+  :param sequence_one: index of sequence one in the *_data.json file
+  :param sequence_two: index of sequence two in the *_data.json file
+  :param name: regular expression to obtain protein/gene names based on confidence filename
+  :param gate: condition on a summary metric
+  :param top: number of best targets per bait for which expensive metrics are computed
+  :return: parameters used to compute scores
+  """
+  lis_defaults = inspect.signature(Af3LocalInteractionScore.local_interaction_score).parameters
+  return {"tool": "af3-score", "metrics": metrics,
+          "sequence1": sequence_one + 1, "sequence2": sequence_two + 1,
+          "name": name, "gate": gate, "top": top,
+          "pae_cutoff": lis_defaults["pae_cutoff"].default,
+          "distance_cutoff": lis_defaults["distance_cutoff"].default}
+
+
+def write_header(output_file_out: TextIO, metrics: list[str]):
+  """
+  Writes header of the tab delimited output.
+
+  :param output_file_out: output file
+  :param metrics: metrics to output
+  """
+  output_file_out.write("\t".join(header_columns(metrics)))
+  output_file_out.write("\n")
+
+
+def score_rows(all_scores: list[tuple[str, list[float]]],
+    name: str = r"([\w-]+)__([\w-]+)", mappings: dict[str, str] = None):
+  """
+  Yields rows of the output, bait and target followed by scores.
+
+  :param all_scores: list of tuple containing (confidence_file, confidence_scores)
+  :param name: regular expression to obtain protein/gene names based on confidence filename
+  :param mappings: dictionary of source id to converted id
+  """
+  if mappings is None:
+    mappings = {}
+  for confidence_file, scores in all_scores:
+    re_match = re.search(name, confidence_file)
+    if not re_match:
+      raise AssertionError(
+          f"Expression {name} cannot be found in filename {confidence_file}")
+    bait, target = re_match.group(1, 2)
+    bait = mappings[bait] if bait in mappings else bait
+    target = mappings[target] if target in mappings else target
+    yield [bait, target, *scores]
+
+
+def write_scores(output_file_out: TextIO,
+    all_scores: list[tuple[str, list[float]]],
+    name: str = r"([\w-]+)__([\w-]+)", mappings: dict[str, str] = None):
+  """
+  Writes scores in tab delimited output.
+
+  :param output_file_out: output file
+  :param all_scores: list of tuple containing (confidence_file, confidence_scores)
+  :param name: regular expression to obtain protein/gene names based on confidence filename
+  :param mappings: dictionary of source id to converted id
+  """
+  for row in score_rows(all_scores, name, mappings):
+    output_file_out.write("\t".join(str(value) for value in row))
+    output_file_out.write("\n")
+
+
+def collect_results(confidence_files: list[str],
+    futures: list[concurrent.futures.Future], stage: str,
+    errors: list[ScoringError]) -> list[tuple[str, object]]:
+  """
+  Returns results of futures that completed successfully and adds an error to errors for other futures.
+
+  :param confidence_files: confidence JSON files, one per future
+  :param futures: futures
+  :param stage: stage to use for errors that are not a ScoringError
+  :param errors: errors of predictions that could not be scored, modified by this function
+  :return: list of tuple containing (confidence_file, result)
+  """
+  results = []
+  for confidence_file, future in zip(confidence_files, futures):
+    error = future.exception()
+    if error is None:
+      results.append((confidence_file, future.result()))
+    elif isinstance(error, ScoringError):
+      errors.append(error)
+    else:
+      errors.append(ScoringError(confidence_file, stage, format_error(error)))
+  return results
+
+
+def submit_samples(executor: concurrent.futures.Executor,
+    confidence_files: list[str], metrics: list[str],
+    sequence_one: int = 0, sequence_two: int = 1,
+    status: StatusFile.StatusReporter = None) -> list[concurrent.futures.Future]:
+  """
+  Submit tasks computing scores of every sample of confidence files.
+
+  :param executor: executor used to compute scores
+  :param confidence_files: confidence JSON files
+  :param metrics: metrics to obtain confidence scores, must be present in SAMPLE_METRICS
+  :param sequence_one: index of sequence one in the *_data.json file
+  :param sequence_two: index of sequence two in the *_data.json file
+  :param status: if not None, tasks are counted in status file
+  :return: futures of submitted tasks, in the same order as confidence_files
+  """
+  futures = [executor.submit(executor_get_sample_scores, confidence_file, metrics,
+                             sequence_one, sequence_two) for confidence_file in confidence_files]
+  if status:
+    status.track(futures)
+  return futures
+
+
+def add_sample_lis(all_scores: list[tuple[str, list[float]]], samples: pd.DataFrame,
+    metrics: list[str], errors: list[ScoringError]) -> list[tuple[str, list[float]]]:
+  """
+  Returns scores with the mean LIS of each prediction computed from the LIS of its samples.
+
+  Predictions whose samples could not be scored are removed, scores are NA for predictions without samples,
+  like predictions that did not pass the gate.
+
+  :param all_scores: list of tuple containing (confidence_file, confidence_scores) of all metrics except lis
+  :param samples: table returned by :func:`sample_frame`
+  :param metrics: metrics to output, including lis
+  :param errors: errors of predictions that could not be scored
+  :return: list of tuple containing (confidence_file, confidence_scores) of all metrics
+  """
+  columns = METRIC_HEADERS["lis"]
+  means = samples.groupby("File", sort=False)[columns].mean()
+  failed = {error.confidence_file for error in errors}
+  offset = metric_offset(metrics, "lis")
+  lis_scores = []
+  for confidence_file, scores in all_scores:
+    if confidence_file in failed:
+      continue
+    lis = means.loc[confidence_file].tolist() if confidence_file in means.index else [NA] * len(columns)
+    lis_scores.append((confidence_file, scores[:offset] + lis + scores[offset:]))
+  return lis_scores
+
+
+def sample_frame(sample_scores: list[tuple[str, list[tuple[int, int, float, list[float]]]]],
+    metrics: list[str], name: str = r"([\w-]+)__([\w-]+)",
+    mappings: dict[str, str] = None) -> pd.DataFrame:
+  """
+  Returns scores of all samples as a single table.
+
+  :param sample_scores: list of tuple containing (confidence_file, scores)
+                        where scores is returned by :func:`get_sample_scores`
+  :param metrics: metrics used to obtain scores
+  :param name: regular expression to obtain protein/gene names based on confidence filename
+  :param mappings: dictionary of source id to converted id
+  :return: table with columns File, Bait, Target, Seed, Sample, Ranking followed by metric columns
+  """
+  if mappings is None:
+    mappings = {}
+  columns = [header for metric in metrics for header in METRIC_HEADERS[metric]]
+  rows = []
+  for confidence_file, scores in sample_scores:
+    re_match = re.search(name, confidence_file)
+    if not re_match:
+      raise AssertionError(
+          f"Expression {name} cannot be found in filename {confidence_file}")
+    bait, target = re_match.group(1, 2)
+    bait = mappings[bait] if bait in mappings else bait
+    target = mappings[target] if target in mappings else target
+    for seed, sample, ranking_score, sample_scores_values in scores:
+      rows.append([confidence_file, bait, target, seed, sample, ranking_score] + sample_scores_values)
+  samples = pd.DataFrame(rows, columns=["File", "Bait", "Target", "Seed", "Sample", "Ranking"] + columns)
+  samples[columns] = samples[columns].astype(float)
+  return samples
+
+
+def aggregate_samples(samples: pd.DataFrame) -> pd.DataFrame:
+  """
+  Returns mean, max, standard deviation and best (by ranking score) of scores over all samples of each prediction.
+
+  All predictions are aggregated at once using a group by on the samples table.
+
+  :param samples: table returned by :func:`sample_frame`
+  :return: table with columns Bait, Target followed by aggregated columns of each metric column
+  """
+  columns = [column for column in samples.columns if column not in
+             ["File", "Bait", "Target", "Seed", "Sample", "Ranking"]]
+  grouped = samples.groupby("File", sort=False)
+  best = samples.loc[grouped["Ranking"].idxmax()].set_index("File")
+  aggregates = {"Mean": grouped[columns].mean(), "Max": grouped[columns].max(),
+                "SD": grouped[columns].std(), "Best": best[columns]}
+  aggregate = grouped[["Bait", "Target"]].first()
+  for column in columns:
+    for name in AGGREGATES:
+      aggregate[f"{name} {column}"] = aggregates[name][column]
+  return aggregate.reset_index(drop=True)
+
+
+def write_frame(output_file_out: TextIO, frame: pd.DataFrame):
+  """
+  Writes table in tab delimited output, missing values are written as NA.
+
+  :param output_file_out: output file
+  :param frame: table
+  """
+  output_file_out.write("\t".join(frame.columns))
+  output_file_out.write("\n")
+  for row in frame.itertuples(index=False):
+    output_file_out.write("\t".join(NA if isinstance(value, float) and np.isnan(value) else str(value)
+                                    for value in row))
     output_file_out.write("\n")
-    for confidence_file, scores in all_scores:
-      re_match = re.search(name, confidence_file)
-      if not re_match:
-        raise AssertionError(
-            f"Expression {name} cannot be found in filename {confidence_file}")
-      bait, target = re_match.group(1, 2)
-      bait = mappings[bait] if bait in mappings else bait
-      target = mappings[target] if target in mappings else target
-      output_file_out.write(f"{bait}\t{target}")
-      for score in scores:
-        output_file_out.write(f"\t{score}")
-      output_file_out.write("\n")
+
+
+def write_matrix(matrix_file_out: TextIO,
+    matrices: list[tuple[str, list[tuple[str, str, float, float]]]],
+    name: str = r"([\w-]+)__([\w-]+)", mappings: dict[str, str] = None):
+  """
+  Writes chain pair matrices in tab delimited output, one line per chain pair.
+
+  :param matrix_file_out: output file
+  :param matrices: list of tuple containing (confidence_file, chain_pairs)
+                   where chain_pairs is returned by :func:`get_chain_pair_matrix`
+  :param name: regular expression to obtain protein/gene names based on confidence filename
+  :param mappings: dictionary of source id to converted id
+  """
+  if mappings is None:
+    mappings = {}
+  matrix_file_out.write("Bait\tTarget\tChain 1\tChain 2\tipTM\tPAE min\n")
+  for confidence_file, chain_pairs in matrices:
+    re_match = re.search(name, confidence_file)
+    if not re_match:
+      raise AssertionError(
+          f"Expression {name} cannot be found in filename {confidence_file}")
+    bait, target = re_match.group(1, 2)
+    bait = mappings[bait] if bait in mappings else bait
+    target = mappings[target] if target in mappings else target
+    for chain_one, chain_two, iptm, pae_min in chain_pairs:
+      matrix_file_out.write(f"{bait}\t{target}\t{chain_one}\t{chain_two}\t{iptm}\t{pae_min}\n")
+
+
+def write_errors_header(errors_file_out: TextIO):
+  """
+  Writes header of the tab delimited errors file.
+
+  :param errors_file_out: errors file
+  """
+  errors_file_out.write("File\tStage\tError\n")
+
+
+def write_errors(errors_file_out: TextIO, errors: list[ScoringError]):
+  """
+  Writes errors in tab delimited errors file.
+
+  :param errors_file_out: errors file
+  :param errors: errors of predictions that could not be scored
+  """
+  for error in errors:
+    errors_file_out.write(f"{error.confidence_file}\t{error.stage}\t{error.error}\n")
+
+
+def failed_predictions(errors: list[ScoringError]) -> int:
+  """
+  Returns number of predictions that could not be scored, a prediction can fail in many stages.
+
+  :param errors: errors of predictions that could not be scored
+  :return: number of predictions that could not be scored
+  """
+  return len({error.confidence_file for error in errors})
+
+
+def parse_errors(errors_file: str) -> list[str]:
+  """
+  Parse errors file.
+
+  :param errors_file: tab delimited errors file - created using errors_file parameter of :func:`af3_score`
+  :return: confidence files present in errors file
+  """
+  confidence_files = []
+  with open(errors_file, "r") if errors_file != "-" else sys.stdin as errors_file_in:
+    for line in errors_file_in:
+      columns = line.rstrip("\r\n").split("\t")
+      if not columns[0] or columns[0] == "File":
+        continue
+      if columns[0] not in confidence_files:
+        confidence_files.append(columns[0])
+  return confidence_files
+
+
+def format_error(error: BaseException) -> str:
+  """
+  Returns a single line description of error.
+
+  :param error: error
+  :return: single line description of error
+  """
+  return " ".join(f"{type(error).__name__}: {error}".split())
+
+
+def prediction_files(confidence_file: str, metrics: list[str]) -> list[str]:
+  """
+  Returns files read by :func:`executor_get_confidence_scores` to compute metrics of a prediction.
+
+  The header of the *_model.cif file read to find the index of sequences is not included.
+
+  :param confidence_file: confidence JSON file
+  :param metrics: metrics to obtain confidence scores
+  :return: files read to compute metrics of prediction, compressed variants if only they exist
+  """
+  files = [confidence_file]
+  if [metric for metric in metrics if metric in SEQUENCE_INDEX_METRICS]:
+    files.append(confidence_file.replace("_summary_confidences.json", "_data.json"))
+  if "lis" in metrics:
+    directory = os.path.dirname(confidence_file)
+    for model_confidence_file in Af3Files.glob_files("**/confidences.json", root_dir=directory):
+      model_confidence_file = os.path.join(directory, model_confidence_file)
+      files.append(model_confidence_file)
+      files.append(model_confidence_file.replace("confidences.json", "model.cif"))
+  if "best_lis" in metrics:
+    files.append(confidence_file.replace("_summary_confidences.json", "_confidences.json"))
+    files.append(confidence_file.replace("_summary_confidences.json", "_model.cif"))
+  return list(dict.fromkeys(Af3Files.resolve(file) for file in files))
 
 
 def executor_get_confidence_scores(confidence_file: str, metrics: list[str] = None,
@@ -187,6 +1278,8 @@ def executor_get_confidence_scores(confidence_file: str, metrics: list[str] = No
   """
   Calls get_sequence_index than get_confidence_scores and returns confidence scores
 
+  get_sequence_index is only called when a metric needs the index of sequences in the model files.
+
   :param confidence_file: confidence JSON file
   :param metrics: metrics to obtain confidence scores
   :param sequence_one: index of sequence one in the *_data.json file
@@ -194,15 +1287,22 @@ def executor_get_confidence_scores(confidence_file: str, metrics: list[str] = No
   :return: tuple containing (confidence_file, confidence_scores)
   where confidence_file is the confidence_file input parameter
   and confidence_scores is a list of confidence scores for the different metrics
+  :raises ScoringError: if scores cannot be computed
   """
-  logging.basicConfig(filename='af3score.log', level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+  stage = "sequence_index"
   try:
-    sequence_one_index, sequence_two_index = get_sequence_index(confidence_file, sequence_one, sequence_two)
-    scores = get_confidence_scores(confidence_file, metrics, sequence_one_index, sequence_two_index)
+    with Profiler.task(confidence_file):
+      sequence_one_index, sequence_two_index = sequence_one, sequence_two
+      if [metric for metric in metrics if metric in SEQUENCE_INDEX_METRICS]:
+        sequence_one_index, sequence_two_index = get_sequence_index(confidence_file, sequence_one, sequence_two)
+      stage = "scores"
+      scores = get_confidence_scores(confidence_file, metrics, sequence_one_index, sequence_two_index)
     return confidence_file, scores
   except Exception as e:
     logger.exception(f"Error processing confidence file {confidence_file}", exc_info=e)
-    raise e
+    if isinstance(e, ScoringError):
+      raise
+    raise ScoringError(confidence_file, stage, format_error(e)) from e
 
 
 def get_confidence_scores(confidence_file: str, metrics: list[str] = None,
@@ -215,6 +1315,7 @@ def get_confidence_scores(confidence_file: str, metrics: list[str] = None,
   :param sequence_one: index of sequence one
   :param sequence_two: index of sequence two
   :return: list of confidence scores for the different metrics
+  :raises ScoringError: if the LIS metric is requested and prediction has no sample confidence files
   """
   if metrics is None:
     metrics = [METRICS[0]]
@@ -222,7 +1323,8 @@ def get_confidence_scores(confidence_file: str, metrics: list[str] = None,
     raise AssertionError(
         f"metrics values must all be present in {METRICS}")
 
-  confidences = load_json(confidence_file)
+  with Profiler.stage("load_summary"):
+    confidences = load_json(confidence_file)
 
   scores = []
   for metric in metrics:
@@ -233,9 +1335,11 @@ def get_confidence_scores(confidence_file: str, metrics: list[str] = None,
     elif "ranking_score" == metric:
       scores.append(confidences["ranking_score"])
     elif "lis" == metric:
-      model_confidence_files = (
-        glob.glob("**/confidences.json",
-                  root_dir=os.path.dirname(confidence_file), recursive=True))
+      model_confidence_files = Af3Files.glob_files("**/confidences.json",
+                                                   root_dir=os.path.dirname(confidence_file))
+      if not model_confidence_files:
+        raise ScoringError(confidence_file, "scores", f"no sample confidence files found in prediction directory "
+                                                      f"{os.path.dirname(confidence_file) or '.'}")
       model_confidence_files = [
         os.path.join(os.path.dirname(confidence_file), model_confidence_file)
         for model_confidence_file in model_confidence_files]
@@ -246,10 +1350,7 @@ def get_confidence_scores(confidence_file: str, metrics: list[str] = None,
           model_confidence_files[i], structure_files[i],
           subunit_one=sequence_one, subunit_two=sequence_two) for i in
         range(0, len(model_confidence_files))]
-      i_lis = statistics.mean([m_lis[0] for m_lis in model_lis])
-      lis = statistics.mean([m_lis[1] for m_lis in model_lis])
-      lia = statistics.mean([m_lis[2] for m_lis in model_lis])
-      scores.extend([i_lis, lis, lia])
+      scores.extend(np.mean(np.array(model_lis, dtype=float), axis=0).tolist())
     elif "best_lis" == metric:
       lis_json = confidence_file.replace("_summary_confidences.json",
                                          "_confidences.json")
@@ -258,15 +1359,157 @@ def get_confidence_scores(confidence_file: str, metrics: list[str] = None,
       i_lis, lis, lia = Af3LocalInteractionScore.local_interaction_score(
           lis_json, structure, subunit_one=sequence_one, subunit_two=sequence_two)
       scores.extend([i_lis, lis, lia])
+    elif "chain_pair_iptm" == metric:
+      scores.append(confidences["chain_pair_iptm"][sequence_one][sequence_two])
+    elif "chain_pair_pae_min" == metric:
+      scores.append(confidences["chain_pair_pae_min"][sequence_one][sequence_two])
+      scores.append(confidences["chain_pair_pae_min"][sequence_two][sequence_one])
+    elif "chain_iptm" == metric:
+      scores.append(confidences["chain_iptm"][sequence_one])
+      scores.append(confidences["chain_iptm"][sequence_two])
+    elif "fraction_disordered" == metric:
+      scores.append(confidences["fraction_disordered"])
   return scores
 
 
+def executor_get_sample_scores(confidence_file: str, metrics: list[str] = None,
+    sequence_one: int = 0, sequence_two: int = 1) -> list[tuple[int, int, float, list[float]]]:
+  """
+  Calls get_sequence_index than get_sample_scores and returns scores of every sample
+
+  get_sequence_index is only called when a metric needs the index of sequences in the model files.
+
+  :param confidence_file: confidence JSON file
+  :param metrics: metrics to obtain confidence scores
+  :param sequence_one: index of sequence one in the *_data.json file
+  :param sequence_two: index of sequence two in the *_data.json file
+  :return: scores of every sample, see :func:`get_sample_scores`
+  :raises ScoringError: if scores cannot be computed
+  """
+  stage = "sequence_index"
+  try:
+    with Profiler.task(confidence_file):
+      sequence_one_index, sequence_two_index = sequence_one, sequence_two
+      if [metric for metric in metrics if metric in SEQUENCE_INDEX_METRICS]:
+        sequence_one_index, sequence_two_index = get_sequence_index(confidence_file, sequence_one, sequence_two)
+      stage = "samples"
+      return get_sample_scores(confidence_file, metrics, sequence_one_index, sequence_two_index)
+  except Exception as e:
+    logger.exception(f"Error processing samples of confidence file {confidence_file}", exc_info=e)
+    raise ScoringError(confidence_file, stage, format_error(e)) from e
+
+
+def get_sample_scores(confidence_file: str, metrics: list[str] = None,
+    sequence_one: int = 0, sequence_two: int = 1) -> list[tuple[int, int, float, list[float]]]:
+  """
+  Returns confidence scores of every seed and sample listed in the ranking scores file.
+
+  :param confidence_file: confidence JSON file
+  :param metrics: metrics to obtain confidence scores, must be present in SAMPLE_METRICS
+  :param sequence_one: index of sequence one
+  :param sequence_two: index of sequence two
+  :return: list of tuple containing (seed, sample, ranking_score, scores)
+  where scores is a list of confidence scores of the sample for the different metrics
+  """
+  if metrics is None:
+    metrics = [METRICS[0]]
+  if len([metric for metric in metrics if metric not in SAMPLE_METRICS]) > 0:
+    raise AssertionError(
+        f"metrics values must all be present in {SAMPLE_METRICS}")
+  directory = os.path.dirname(confidence_file)
+  ranking_file = confidence_file.replace("_summary_confidences.json", "_ranking_scores.csv")
+  if not Af3Files.exists(ranking_file):
+    ranking_file = os.path.join(directory, "ranking_scores.csv")
+  summary_metrics = [metric for metric in metrics if metric in SUMMARY_METRICS and metric != "ranking_score"]
+
+  sample_scores = []
+  with Af3Files.open_file(ranking_file, "rt") as ranking_file_in:
+    for row in csv.DictReader(ranking_file_in):
+      seed, sample, ranking_score = int(row["seed"]), int(row["sample"]), float(row["ranking_score"])
+      sample_dir = os.path.join(directory, f"seed-{seed}_sample-{sample}")
+      summary_scores = get_confidence_scores(
+          os.path.join(sample_dir, "summary_confidences.json"), summary_metrics,
+          sequence_one, sequence_two) if summary_metrics else []
+      scores = []
+      for metric in metrics:
+        if "ranking_score" == metric:
+          scores.append(ranking_score)
+        elif "lis" == metric:
+          scores.extend(Af3LocalInteractionScore.local_interaction_score(
+              os.path.join(sample_dir, "confidences.json"), os.path.join(sample_dir, "model.cif"),
+              subunit_one=sequence_one, subunit_two=sequence_two))
+        else:
+          offset = metric_offset(summary_metrics, metric)
+          scores.extend(summary_scores[offset:offset + metric_width(metric)])
+      sample_scores.append((seed, sample, ranking_score, scores))
+  return sample_scores
+
+
+def get_chain_pair_matrix(confidence_file: str) \
+    -> list[tuple[str, str, float, float]]:
+  """
+  Returns chain pair ipTM and PAE min of all chain pairs from summary confidence file.
+
+  :param confidence_file: confidence JSON file
+  :return: list of tuple containing (chain_one, chain_two, chain_pair_iptm, chain_pair_pae_min)
+  """
+  with Profiler.stage("load_summary"):
+    confidences = load_json(confidence_file)
+  structure = confidence_file.replace("_summary_confidences.json",
+                                      "_model.cif")
+  chain_ids = get_chain_ids(structure)
+  chain_pair_iptm = confidences["chain_pair_iptm"]
+  if len(chain_ids) != len(chain_pair_iptm):
+    raise AssertionError(
+        f"Found {len(chain_ids)} chains in {structure}, but {len(chain_pair_iptm)} in {confidence_file}")
+  return [(chain_ids[i], chain_ids[j], chain_pair_iptm[i][j],
+           confidences["chain_pair_pae_min"][i][j])
+          for i in range(len(chain_ids)) for j in range(len(chain_ids))]
+
+
+def get_chain_ids(structure_file: str) -> list[str]:
+  """
+  Returns chain ids in the order they appear in the model files.
+
+  Only the header of the mmCIF file is read, reading stops at the first atom.
+
+  :param structure_file: mmCIF file
+  :return: chain ids in the order they appear in the model files
+  """
+  chain_ids = []
+  columns = []
+  in_loop = False
+  with Af3Files.open_file(structure_file, "rt") as structure_in:
+    for line in structure_in:
+      if line.startswith("_atom_site.") or line.startswith("ATOM") or line.startswith("HETATM"):
+        break
+      if line.startswith("loop_"):
+        in_loop = True
+        columns = []
+      elif line.startswith("#"):
+        in_loop = False
+        columns = []
+      elif line.startswith("_struct_asym."):
+        if in_loop:
+          columns.append(line.strip())
+        elif line.startswith("_struct_asym.id "):
+          chain_ids.append(line.split()[1])
+      elif line.startswith("_"):
+        columns = []
+      elif in_loop and "_struct_asym.id" in columns:
+        chain_ids.append(line.split()[columns.index("_struct_asym.id")])
+  return chain_ids
+
+
 def get_sequence_index(confidence_file: str,
     sequence_one: int = 0, sequence_two: int = 1) -> Tuple[int, int]:
   """
   Returns index of sequence one and two from the *_data.json file for the *_confidences.json and *_model.cif
   files because the order of elements can differ between them.
 
+  The order of chains is read from the header of the *_model.cif file, see :func:`get_chain_ids`.
+  The *_confidences.json file is only loaded if the *_model.cif file does not list chains.
+
   :param confidence_file: confidence JSON file
   :param sequence_one: index of sequence one in the *_data.json file
   :param sequence_two: index of sequence two in the *_data.json file
@@ -276,11 +1519,18 @@ def get_sequence_index(confidence_file: str,
   """
   data_json = confidence_file.replace("_summary_confidences.json",
                                      "_data.json")
-  confidences_json = confidence_file.replace("_summary_confidences.json",
-                                      "_confidences.json")
-  data = load_json(data_json)
-  confidences = load_json(confidences_json)
-  sequence_ids = list(dict.fromkeys(confidences["atom_chain_ids"]))
+  structure = confidence_file.replace("_summary_confidences.json",
+                                      "_model.cif")
+  with Profiler.stage("load_data_json"):
+    data = load_json(data_json)
+  with Profiler.stage("parse_cif"):
+    sequence_ids = get_chain_ids(structure) if Af3Files.exists(structure) else []
+  if not sequence_ids:
+    confidences_json = confidence_file.replace("_summary_confidences.json",
+                                               "_confidences.json")
+    with Profiler.stage("load_confidences"):
+      confidences = load_json(confidences_json)
+    sequence_ids = list(dict.fromkeys(confidences["atom_chain_ids"]))
   sequence_type = list(data["sequences"][sequence_one].keys())[0]
   sequence_id = data["sequences"][sequence_one][sequence_type]["id"]
   sequence_one_index = sequence_ids.index(sequence_id)
@@ -290,6 +1540,18 @@ def get_sequence_index(confidence_file: str,
   return sequence_one_index, sequence_two_index
 
 
+def mappings_digest(mappings: dict[str, str]) -> str | None:
+  """
+  Returns digest of mappings, so jobs sharing a queue can check that they convert names the same way.
+
+  :param mappings: dictionary of source id to converted id
+  :return: SHA-256 digest of mappings, None if there are no mappings
+  """
+  if not mappings:
+    return None
+  return hashlib.sha256(json.dumps(sorted(mappings.items())).encode()).hexdigest()
+
+
 def parse_mapping(mapping_file: str, source_column: int = 0,
     converted_column: int = 1) \
     -> dict[str, str]:
@@ -315,12 +1577,7 @@ def parse_mapping(mapping_file: str, source_column: int = 0,
 
 
 def load_json(file) -> dict:
-  with open(file, "r") as file_in:
-    try:
-      return json.load(file_in)
-    except json.decoder.JSONDecodeError as e:
-      logger.error(f"Error loading JSON file {file}")
-      raise e
+  return Af3Files.load_json(file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,199 @@
+import concurrent.futures
+import hashlib
+import logging
+import os
+from typing import Iterator
+
+from af3tools import Af3Archive
+
+# Algorithms of checksums, xxh64 needs the xxhash package.
+CHECKSUM_ALGORITHMS = ["blake2b", "sha256", "xxh64"]
+# Length of hexadecimal digests, used to find the algorithm of a checksum manifest.
+DIGEST_LENGTHS = {128: "blake2b", 64: "sha256", 16: "xxh64"}
+READ_SIZE = 1024 * 1024
+
+logger = logging.getLogger("Checksums")
+
+
+def import_xxhash():
+  """
+  Returns xxhash module, which is only needed for xxh64 checksums.
+
+  :return: xxhash module
+  """
+  try:
+    import xxhash
+  except ImportError as e:
+    raise ImportError(
+        "xxhash is required for xxh64 checksums, install it using 'pip install af3-tools[xxhash]'") from e
+  return xxhash
+
+
+def new_hash(algorithm: str = "blake2b"):
+  """
+  Returns a new hash object.
+
+  :param algorithm: one of CHECKSUM_ALGORITHMS
+  :return: hash object, with update and hexdigest methods
+  """
+  if algorithm not in CHECKSUM_ALGORITHMS:
+    raise AssertionError(f"algorithm must be one of {CHECKSUM_ALGORITHMS}")
+  if algorithm == "xxh64":
+    return import_xxhash().xxh64()
+  return hashlib.new(algorithm)
+
+
+def hash_stream(stream, algorithm: str = "blake2b") -> str:
+  """
+  Returns checksum of the content of a file object, read until its end.
+
+  :param stream: file object opened in binary mode
+  :param algorithm: one of CHECKSUM_ALGORITHMS
+  :return: hexadecimal digest
+  """
+  digest = new_hash(algorithm)
+  while data := stream.read(READ_SIZE):
+    digest.update(data)
+  return digest.hexdigest()
+
+
+def hash_file(file: str, algorithm: str = "blake2b") -> str:
+  """
+  Returns checksum of file.
+
+  :param file: file
+  :param algorithm: one of CHECKSUM_ALGORITHMS
+  :return: hexadecimal digest
+  """
+  with open(file, "rb") as file_in:
+    return hash_stream(file_in, algorithm)
+
+
+class HashingReader:
+  """
+  File object computing the checksum of data read from another file object.
+  """
+
+  def __init__(self, file_in, algorithm: str = "blake2b"):
+    """
+    :param file_in: file object opened in binary mode
+    :param algorithm: one of CHECKSUM_ALGORITHMS
+    """
+    self.file_in = file_in
+    self.digest = new_hash(algorithm)
+
+  def read(self, size: int = -1) -> bytes:
+    data = self.file_in.read(size)
+    self.digest.update(data)
+    return data
+
+  def hexdigest(self) -> str:
+    return self.digest.hexdigest()
+
+
+def checksum_line(digest: str, file: str) -> str:
+  """
+  Returns line of checksum manifest, in the format of sha256sum, b2sum and xxhsum.
+
+  :param digest: hexadecimal digest
+  :param file: file
+  :return: line of checksum manifest
+  """
+  return f"{digest}  {file}\n"
+
+
+def read_checksums(manifest_file: str) -> Iterator[tuple[str, str]]:
+  """
+  Parse checksum manifest, see :func:`checksum_line`.
+
+  :param manifest_file: checksum manifest
+  :return: tuple containing (file, digest) for each file of manifest, in manifest order
+  """
+  with open(manifest_file, "r") as manifest_in:
+    for line in manifest_in:
+      line = line.rstrip("\n")
+      if line:
+        digest, file = line.split("  ", 1)
+        yield file, digest
+
+
+def digest_algorithm(digest: str) -> str:
+  """
+  Returns algorithm of checksum, based on its length.
+
+  :param digest: hexadecimal digest
+  :return: one of CHECKSUM_ALGORITHMS
+  """
+  if len(digest) not in DIGEST_LENGTHS:
+    raise AssertionError(f"Unknown checksum algorithm for digest {digest}")
+  return DIGEST_LENGTHS[len(digest)]
+
+
+def verify_checksums(manifest_file: str, archive: str = None, threads: int = 4) -> int:
+  """
+  Verify checksums of files or of members of an archive.
+
+  Files are read by a pool of threads. The members of archive are read in a single sequential pass
+  over each volume, volumes are read in parallel.
+  Files that differ or are missing are logged.
+
+  :param manifest_file: checksum manifest, see :func:`checksum_line`
+  :param archive: if not None, verify members of this tar archive instead of files, see :mod:`Af3Archive`
+  :param threads: number of files or volumes read in parallel
+  :return: number of files that differ or are missing
+  """
+  if threads < 1:
+    raise AssertionError("threads value must be at least 1")
+  checksums = dict(read_checksums(manifest_file))
+  if archive:
+    # Like tar, member names do not start with '/'.
+    digests = archive_checksums(archive, {file.lstrip("/"): digest_algorithm(digest)
+                                          for file, digest in checksums.items()}, threads)
+    digests = {file: digests.get(file.lstrip("/")) for file in checksums}
+  else:
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+      digests = dict(zip(checksums, executor.map(
+          lambda item: hash_file(item[0], digest_algorithm(item[1])) if os.path.isfile(item[0]) else None,
+          checksums.items())))
+  failures = 0
+  for file, digest in checksums.items():
+    if digests.get(file) is None:
+      logger.error(f"{file}: missing")
+      failures += 1
+    elif digests[file] != digest:
+      logger.error(f"{file}: checksum differs")
+      failures += 1
+  return failures
+
+
+def archive_checksums(archive: str, algorithms: dict[str, str], threads: int = 4) -> dict[str, str]:
+  """
+  Returns checksums of members of archive.
+
+  The volumes of archive are found in the index written by :class:`Af3Archive.ArchiveWriter`,
+  archive is read as a single volume if its index does not exist.
+
+  :param archive: tar archive, see Af3Archive.ARCHIVE_EXTENSIONS
+  :param algorithms: algorithm of members, by name, other members are not read
+  :param threads: number of volumes read in parallel
+  :return: checksums of members, by name
+  """
+  volumes = [archive]
+  if os.path.exists(f"{archive}.index"):
+    index = Af3Archive.read_index(f"{archive}.index")
+    volumes = list(dict.fromkeys(location[0] for location in index.values())) or volumes
+
+  def volume_checksums(volume: str) -> dict[str, str]:
+    digests = {}
+    with Af3Archive.open_archive(volume) as tar:
+      for member in Af3Archive.iter_members(tar):
+        if member.name in algorithms:
+          with tar.extractfile(member) as member_in:
+            digests[member.name] = hash_stream(member_in, algorithms[member.name])
+    return digests
+
+  digests = {}
+  with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+    for volume_digests in executor.map(volume_checksums, volumes):
+      digests.update(volume_digests)
+  return digests
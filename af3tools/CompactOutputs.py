@@ -0,0 +1,395 @@
+import argparse
+import concurrent.futures
+import functools
+import gzip
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+
+import numpy as np
+import tqdm
+
+from af3tools import Af3Files, WorkerLogging
+
+# Container replacing model confidence and structure files of a prediction directory.
+COMPACT_FILE = "compact.af3c"
+MAGIC = b"AF3C\x00\x00\x00\x01"
+# Arrays are aligned so they can be memory-mapped with any dtype.
+ALIGNMENT = 64
+# Smallest data types of matrices, like PAE and contact probabilities, used when they store values without loss.
+DTYPES = ["float16", "float32"]
+FLOAT16_MAX = float(np.finfo(np.float16).max)
+# Decimals of floats written by AlphaFold 3, used when files are restored.
+DECIMALS = 2
+SEED_PATTERN = re.compile(r"seed-\d+_sample-\d+")
+
+logger = logging.getLogger("CompactOutputs")
+
+
+def dir_path(string: str):
+  if not string or os.path.isdir(string):
+    return string
+  else:
+    raise NotADirectoryError(string)
+
+
+def main(argv: list[str] = None):
+  parser = argparse.ArgumentParser(
+      description="Convert model confidence and structure files of AlphaFold 3 predictions into a compact "
+                  "binary container that scoring tools read directly, or restore them.")
+  parser.add_argument("input", nargs="?", type=dir_path, default="",
+                      help="Directory containing one or many AlphaFold's output directories  "
+                           "(default: current directory)")
+  parser.add_argument("-r", "--restore", action="store_true", default=False,
+                      help="Restore AlphaFold 3 files from containers")
+  parser.add_argument("-k", "--keep", action="store_true", default=False,
+                      help="Keep converted files instead of deleting them")
+  parser.add_argument("-d", "--dtype", choices=DTYPES, default=DTYPES[0],
+                      help="Smallest data type of matrices like PAE and contact probabilities, a larger type is used "
+                           "when values would change once restored  (default: %(default)s)")
+  parser.add_argument("-t", "--threads", type=int, default=1,
+                      help="Number of predictions converted in parallel (default: %(default)s)")
+  parser.add_argument("-p", "--progress", action="store_true", default=False,
+                      help="Show progress bar")
+
+  args = parser.parse_args(argv)
+
+  compact_outputs(input_dir=args.input, restore=args.restore, keep=args.keep,
+                  dtype=args.dtype, threads=args.threads, progress=args.progress)
+
+
+def compact_outputs(input_dir: str = "", restore: bool = False, keep: bool = False,
+    dtype: str = "float16", threads: int = 1, progress: bool = False) -> tuple[int, int]:
+  """
+  Convert model confidence and structure files of AlphaFold 3 predictions into a compact container,
+  see :func:`compact_directory`, or restore them, see :func:`restore_directory`.
+
+  :param input_dir: directory containing one or many AlphaFold's output directories
+  :param restore: if True, restore AlphaFold 3 files from containers
+  :param keep: if True, keep converted files instead of deleting them
+  :param dtype: data type of matrices, one of DTYPES
+  :param threads: number of predictions converted in parallel
+  :param progress: show progress bar
+  :return: tuple containing (bytes_before, bytes_after), size of files before and after conversion
+  """
+  if dtype not in DTYPES:
+    raise AssertionError(f"dtype must be one of {DTYPES}")
+  if threads < 1:
+    raise AssertionError("threads value must be at least 1")
+  directories = find_prediction_directories(input_dir)
+  task = functools.partial(restore_directory, keep=keep) if restore \
+    else functools.partial(compact_directory, dtype=dtype, keep=keep)
+  bytes_before, bytes_after = 0, 0
+  with WorkerLogging.process_pool(threads) as executor:
+    futures = [executor.submit(task, directory) for directory in directories]
+    for future in tqdm.tqdm(concurrent.futures.as_completed(futures), total=len(futures), disable=not progress):
+      before, after = future.result()
+      bytes_before += before
+      bytes_after += after
+  print(f"{'Restored' if restore else 'Compacted'} {len(directories)} predictions, "
+        f"{bytes_before} bytes before, {bytes_after} bytes after", file=sys.stderr)
+  return bytes_before, bytes_after
+
+
+def find_prediction_directories(input_dir: str = "") -> list[str]:
+  """
+  Returns directories of all predictions present in input directory.
+
+  :param input_dir: directory containing one or many AlphaFold's output directories
+  :return: sorted directories containing a summary confidence file, excluding sample directories
+  """
+  confidence_files = Af3Files.glob_files("**/*_summary_confidences.json", root_dir=input_dir)
+  directories = {os.path.dirname(os.path.join(input_dir, confidence_file)) for confidence_file in confidence_files
+                 if not SEED_PATTERN.search(confidence_file)}
+  return sorted(directories)
+
+
+def compact_members(directory: str) -> list[str]:
+  """
+  Returns files of prediction that are stored in the container.
+
+  :param directory: prediction directory
+  :return: model confidence and structure files, relative to directory, without compression extension
+  """
+  files = Af3Files.glob_files("*_confidences.json", root_dir=directory)
+  files.extend(Af3Files.glob_files("*_model.cif", root_dir=directory))
+  files.extend(Af3Files.glob_files("seed-*_sample-*/confidences.json", root_dir=directory))
+  files.extend(Af3Files.glob_files("seed-*_sample-*/model.cif", root_dir=directory))
+  return sorted(file for file in files if not file.endswith("_summary_confidences.json"))
+
+
+def compact_directory(directory: str, dtype: str = "float16", keep: bool = False) -> tuple[int, int]:
+  """
+  Convert model confidence and structure files of a prediction into a container.
+
+  Numeric lists of confidence files are stored as typed arrays, see :func:`encode_array`,
+  structure files are compressed with gzip.
+  Converted files are deleted unless keep is True, and only after checking that the container restores them
+  without changes.
+
+  :param directory: prediction directory
+  :param dtype: data type of matrices, one of DTYPES
+  :param keep: if True, keep converted files
+  :return: tuple containing (bytes_before, bytes_after), size of converted files and size of container
+  """
+  container = os.path.join(directory, COMPACT_FILE)
+  if os.path.exists(container):
+    logger.info(f"Prediction {directory} is already compacted")
+    return 0, 0
+  members = {}
+  files = []
+  for member in compact_members(directory):
+    file = Af3Files.resolve(os.path.join(directory, member))
+    files.append(file)
+    if member.endswith(".json"):
+      members[member] = Af3Files.load_json(file)
+    else:
+      with Af3Files.open_file(file, "rb") as file_in:
+        members[member] = file_in.read()
+  if not members:
+    return 0, 0
+  write_container(container, members, dtype)
+  compact = CompactFile(container)
+  if set(compact.members) != set(members):
+    raise AssertionError(f"Container {container} does not contain all files")
+  for name, member in members.items():
+    restored = compact.read_bytes(name)
+    if (restored if isinstance(member, bytes) else json.loads(restored)) != member:
+      raise AssertionError(f"Member {name} of container {container} differs from the original file")
+  bytes_before = sum(os.path.getsize(file) for file in files)
+  if not keep:
+    for file in files:
+      os.remove(file)
+  return bytes_before, os.path.getsize(container)
+
+
+def restore_directory(directory: str, keep: bool = False) -> tuple[int, int]:
+  """
+  Restore AlphaFold 3 files of a prediction from its container.
+
+  Files that exist are not overwritten. The container is deleted unless keep is True.
+
+  :param directory: prediction directory
+  :param keep: if True, keep the container
+  :return: tuple containing (bytes_before, bytes_after), size of container and size of restored files
+  """
+  container = os.path.join(directory, COMPACT_FILE)
+  if not os.path.exists(container):
+    return 0, 0
+  compact = CompactFile(container)
+  bytes_after = 0
+  for member in compact.members:
+    file = os.path.join(directory, member)
+    if os.path.exists(Af3Files.resolve(file)):
+      continue
+    with open(file, "wb") as file_out:
+      bytes_after += file_out.write(compact.read_bytes(member))
+  bytes_before = os.path.getsize(container)
+  if not keep:
+    os.remove(container)
+  return bytes_before, bytes_after
+
+
+def encode_array(value, dtype: str = "float16") -> np.ndarray | None:
+  """
+  Returns list as a typed array.
+
+  Floats use the smallest type from which :func:`decode_floats` restores every value: float16 for matrices
+  if dtype is float16, then float32, then float64.
+
+  :param value: value of a field of a JSON document
+  :param dtype: smallest data type of matrices, one of DTYPES
+  :return: typed array, None if value is not a non-empty list of numbers or strings of the same shape
+  """
+  if not isinstance(value, list) or not value:
+    return None
+  try:
+    array = np.asarray(value)
+  except ValueError:
+    return None
+  if array.dtype.kind == "f":
+    float_dtypes = ["<f4"]
+    if array.ndim == 2 and dtype == "float16" and np.nanmax(np.abs(array), initial=0) <= FLOAT16_MAX:
+      float_dtypes.insert(0, "<f2")
+    for float_dtype in float_dtypes:
+      encoded = array.astype(float_dtype)
+      if np.array_equal(decode_floats(encoded), array, equal_nan=True):
+        return encoded
+    return array.astype("<f8")
+  if array.dtype.kind in "iu":
+    if np.iinfo(np.int32).min <= array.min() and array.max() <= np.iinfo(np.int32).max:
+      return array.astype("<i4")
+    return array.astype("<i8")
+  if array.dtype.kind == "U":
+    return array
+  return None
+
+
+def decode_floats(array: np.ndarray) -> np.ndarray:
+  """
+  Returns floats as written by AlphaFold 3, float16 and float32 values are rounded to DECIMALS.
+
+  :param array: floats
+  :return: float64 values
+  """
+  if array.dtype.itemsize < 8:
+    return np.round(array.astype(float), DECIMALS)
+  return array.astype(float)
+
+
+def write_container(container: str, members: dict[str, object], dtype: str = "float16"):
+  """
+  Write container file.
+
+  The container starts with MAGIC, the size of the header and a JSON header describing members,
+  followed by the data of arrays and files, aligned on ALIGNMENT bytes.
+  The container is written to a temporary file that replaces container when complete.
+
+  :param container: container file
+  :param members: members by name, either a parsed JSON document or the content of a file
+  :param dtype: data type of matrices, one of DTYPES
+  """
+  chunks = []
+  offset = 0
+
+  def add_chunk(data: bytes) -> int:
+    nonlocal offset
+    chunk_offset = offset
+    padding = -len(data) % ALIGNMENT
+    chunks.append(data + b"\0" * padding)
+    offset += len(data) + padding
+    return chunk_offset
+
+  header = {"members": {}}
+  for name, member in members.items():
+    if isinstance(member, bytes):
+      data = gzip.compress(member, compresslevel=6)
+      header["members"][name] = {"type": "file", "offset": add_chunk(data), "size": len(data)}
+      continue
+    fields = {}
+    for field, value in member.items():
+      array = encode_array(value, dtype)
+      if array is None:
+        fields[field] = {"value": value}
+      else:
+        fields[field] = {"dtype": array.dtype.str, "shape": list(array.shape),
+                         "offset": add_chunk(np.ascontiguousarray(array).tobytes())}
+    header["members"][name] = {"type": "json", "fields": fields}
+  header_bytes = json.dumps(header).encode()
+  header_bytes += b" " * (-(len(MAGIC) + 8 + len(header_bytes)) % ALIGNMENT)
+  directory = os.path.dirname(container)
+  with tempfile.NamedTemporaryFile("wb", dir=directory if directory else ".", prefix=".compact-",
+                                   delete=False) as container_out:
+    try:
+      container_out.write(MAGIC)
+      container_out.write(len(header_bytes).to_bytes(8, "little"))
+      container_out.write(header_bytes)
+      for chunk in chunks:
+        container_out.write(chunk)
+    except BaseException:
+      os.remove(container_out.name)
+      raise
+  os.replace(container_out.name, container)
+
+
+class CompactFile:
+  """
+  Container of model confidence and structure files of a prediction, see :func:`write_container`.
+
+  Arrays are memory-mapped, so only the parts of arrays that are used are read.
+  """
+
+  def __init__(self, container: str):
+    """
+    :param container: container file
+    """
+    self.container = container
+    with open(container, "rb") as container_in:
+      if container_in.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"File {container} is not a compact container")
+      header_size = int.from_bytes(container_in.read(8), "little")
+      header = json.loads(container_in.read(header_size))
+    self.data_offset = len(MAGIC) + 8 + header_size
+    self.members = header["members"]
+
+  def load_json(self, name: str) -> dict:
+    """
+    Returns JSON document of member, arrays are memory-mapped.
+
+    :param name: member
+    :return: JSON document, lists are replaced by read-only arrays
+    """
+    member = self.members[name]
+    if member["type"] != "json":
+      raise AssertionError(f"Member {name} of {self.container} is not a JSON document")
+    document = {}
+    for field, value in member["fields"].items():
+      if "value" in value:
+        document[field] = value["value"]
+      else:
+        document[field] = np.memmap(self.container, dtype=np.dtype(value["dtype"]), mode="r",
+                                    offset=self.data_offset + value["offset"], shape=tuple(value["shape"]))
+    return document
+
+  def read_bytes(self, name: str) -> bytes:
+    """
+    Returns content of member as written by AlphaFold 3.
+
+    JSON documents are serialized again, floats are decoded by :func:`decode_floats`.
+
+    :param name: member
+    :return: content of member
+    """
+    member = self.members[name]
+    if member["type"] == "file":
+      with open(self.container, "rb") as container_in:
+        container_in.seek(self.data_offset + member["offset"])
+        return gzip.decompress(container_in.read(member["size"]))
+    document = {}
+    for field, value in self.load_json(name).items():
+      if isinstance(value, np.ndarray):
+        value = decode_floats(value) if value.dtype.kind == "f" else value
+        value = value.tolist()
+      document[field] = value
+    return json.dumps(document).encode()
+
+
+@functools.lru_cache(maxsize=16)
+def open_compact(container: str, modified: int) -> CompactFile:
+  """
+  Returns container, containers are cached until they are modified.
+
+  :param container: container file
+  :param modified: modification time of container, in nanoseconds
+  :return: container
+  """
+  return CompactFile(container)
+
+
+def find_member(path: str) -> tuple[CompactFile, str] | None:
+  """
+  Returns container containing file, if file was converted by :func:`compact_directory`.
+
+  :param path: model confidence or structure file, without compression extension
+  :return: tuple containing (container, member), None if file is not in a container
+  """
+  directory, basename = os.path.split(path)
+  candidates = [(os.path.join(directory, COMPACT_FILE), basename)]
+  if SEED_PATTERN.fullmatch(os.path.basename(directory)):
+    candidates.append((os.path.join(os.path.dirname(directory), COMPACT_FILE),
+                       f"{os.path.basename(directory)}/{basename}"))
+  for container, member in candidates:
+    try:
+      compact = open_compact(container, os.stat(container).st_mtime_ns)
+    except FileNotFoundError:
+      continue
+    if member in compact.members:
+      return compact, member
+  return None
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,70 @@
+import argparse
+import json
+import os
+import tarfile
+from typing import Iterator
+
+from af3tools import JsonPairs
+
+
+def dir_path(string: str):
+  if not string or os.path.isdir(string):
+    return string
+  else:
+    raise NotADirectoryError(string)
+
+
+def main(argv: list[str] = None):
+  parser = argparse.ArgumentParser(
+      description="Write JSON files for AlphaFold 3 of a bundle created by json-pairs, one file per job.")
+  parser.add_argument('bundle', type=JsonPairs.readable_file,
+                      help="Bundle created by json-pairs, either a .jsonl or a .tar file")
+  parser.add_argument('-o', '--output', type=dir_path, default="",
+                      help="Directory where to write JSON files.  (default: current directory)")
+
+  args = parser.parse_args(argv)
+
+  extract_bundle(bundle=args.bundle, output=args.output)
+
+
+def extract_bundle(bundle: str, output: str = "") -> list[str]:
+  """
+  Write JSON files of a bundle created by :func:`JsonPairs.write_bundles`, one file per job.
+
+  Files are identical to the files json-pairs writes without bundles.
+
+  :param bundle: bundle, either a .jsonl or a .tar file
+  :param output: where to write JSON files
+  :return: JSON files that were written
+  """
+  files = []
+  for json_data in bundle_jobs(bundle):
+    file = os.path.join(output, f"{json_data['name']}.json")
+    with open(file, 'w') as output_file:
+      output_file.write(json.dumps(json_data, indent=4))
+    files.append(file)
+  return files
+
+
+def bundle_jobs(bundle: str) -> Iterator[dict]:
+  """
+  Returns AlphaFold 3 jobs of a bundle, one at a time.
+
+  :param bundle: bundle, either a .jsonl or a .tar file
+  :return: AlphaFold 3 jobs, in bundle order
+  """
+  if bundle.endswith(".tar"):
+    with tarfile.open(bundle, "r:") as bundle_in:
+      for member in bundle_in:
+        if member.isfile():
+          with bundle_in.extractfile(member) as member_in:
+            yield json.load(member_in)
+  else:
+    with open(bundle, "r") as bundle_in:
+      for line in bundle_in:
+        if line.strip():
+          yield json.loads(line)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,85 @@
+import functools
+
+from af3tools import FastaId
+
+# Number of sequences kept in memory by each index, pair lists often contain many pairs of the same protein.
+CACHE_SIZE = 4096
+
+
+class FastaIndex:
+  """
+  Index of the sequences of a FASTA file, sequences are read from the file when they are needed.
+
+  The index only holds the position and length of each sequence, so memory does not depend on the
+  length of sequences.
+  """
+
+  def __init__(self, fasta_file: str):
+    """
+    Reads FASTA file once to find the position of each sequence.
+
+    The ID of each sequence is found using :func:`FastaId.fasta_id`, like :func:`JsonPairs.parse_fasta`.
+
+    :param fasta_file: FASTA file
+    """
+    self.fasta_file = fasta_file
+    # Offset, size in bytes and number of residues of each sequence, by ID.
+    self.records = {}
+    self._fasta_in = None
+    self._cached_sequence = functools.lru_cache(maxsize=CACHE_SIZE)(self._read_sequence)
+    record = None
+    offset = 0
+    with open(fasta_file, "rb") as fasta_in:
+      for line in fasta_in:
+        if line.startswith(b">"):
+          record = [offset + len(line), 0, 0]
+          self.records[FastaId.fasta_id(line[1:].decode().rstrip())] = record
+        elif record is not None:
+          record[1] += len(line)
+          record[2] += len(b"".join(line.split()))
+        offset += len(line)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def __contains__(self, sequence_id: str) -> bool:
+    return sequence_id in self.records
+
+  def __len__(self) -> int:
+    return len(self.records)
+
+  def sequence(self, sequence_id: str) -> str:
+    """
+    Returns sequence, read from the FASTA file unless it was read recently.
+
+    :param sequence_id: ID of sequence
+    :return: sequence, without whitespace
+    """
+    return self._cached_sequence(sequence_id)
+
+  def length(self, sequence_id: str) -> int:
+    """
+    Returns number of residues of sequence, without reading the sequence.
+
+    :param sequence_id: ID of sequence
+    :return: number of residues of sequence
+    """
+    return self.records[sequence_id][2]
+
+  def close(self):
+    """
+    Close FASTA file, if a sequence was read.
+    """
+    if self._fasta_in is not None:
+      self._fasta_in.close()
+      self._fasta_in = None
+
+  def _read_sequence(self, sequence_id: str) -> str:
+    offset, size, _ = self.records[sequence_id]
+    if self._fasta_in is None:
+      self._fasta_in = open(self.fasta_file, "rb")
+    self._fasta_in.seek(offset)
+    return "".join(self._fasta_in.read(size).decode().split())
@@ -0,0 +1,118 @@
+import collections
+import concurrent.futures
+import hashlib
+import os
+
+
+def fan_out_directory(name: str, fan_out: int) -> str:
+  """
+  Returns subdirectory of a file when files are spread over fan_out subdirectories.
+
+  The subdirectory only depends on the name of the file, so it can be found again without listing directories.
+
+  :param name: name of file
+  :param fan_out: number of subdirectories
+  :return: subdirectory, like '07' when fan_out is 100
+  """
+  digest = int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), "big")
+  return _directory_name(digest % fan_out, fan_out)
+
+
+def _directory_name(index: int, fan_out: int) -> str:
+  return f"{index:0{len(str(fan_out - 1))}d}"
+
+
+class FileWriter:
+  """
+  Writes files with a thread pool, so the latency of creating files on network file systems, like Lustre,
+  overlaps instead of adding up.
+
+  Files are optionally spread over hashed subdirectories, see :func:`fan_out_directory`.
+  Directories are created the first time a file is written in them.
+  """
+
+  def __init__(self, output: str = "", threads: int = 8, fan_out: int = None):
+    """
+    :param output: directory where files are written
+    :param threads: number of files written in parallel
+    :param fan_out: if not None, number of subdirectories of output where files are spread
+    """
+    if threads < 1:
+      raise AssertionError("threads value must be at least 1")
+    if fan_out is not None and fan_out < 1:
+      raise AssertionError("fan_out value must be at least 1")
+    self.output = output
+    self.threads = threads
+    self.fan_out = fan_out
+    self.written = 0
+    self._pending = collections.deque()
+    self._directories = set()
+    self._executor = None
+
+  def __enter__(self):
+    self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.threads,
+                                                           thread_name_prefix="writer")
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    try:
+      if exc_type is None:
+        while self._pending:
+          self._complete()
+    finally:
+      self._executor.shutdown(cancel_futures=True)
+      self._executor = None
+
+  def path(self, name: str, directory: str = "") -> str:
+    """
+    Returns path where file is written.
+
+    :param name: name of file
+    :param directory: subdirectory of output where file is written
+    :return: path of file
+    """
+    if self.fan_out is None:
+      return os.path.join(self.output, directory, name)
+    return os.path.join(self.output, directory, fan_out_directory(name, self.fan_out), name)
+
+  def write(self, name: str, content: str, directory: str = "") -> str:
+    """
+    Write file in background, waits if too many files are pending.
+
+    Errors of previous writes are raised by this method or when leaving context.
+
+    :param name: name of file
+    :param content: content of file
+    :param directory: subdirectory of output where file is written
+    :return: path of file
+    """
+    if directory not in self._directories:
+      self._create_directory(directory)
+    path = self.path(name, directory)
+    self._pending.append(self._executor.submit(write_file, path, content))
+    if len(self._pending) >= 4 * self.threads:
+      self._complete()
+    return path
+
+  def _create_directory(self, directory: str):
+    if directory:
+      os.makedirs(os.path.join(self.output, directory), exist_ok=True)
+    if self.fan_out is not None:
+      for index in range(self.fan_out):
+        os.makedirs(os.path.join(self.output, directory, _directory_name(index, self.fan_out)), exist_ok=True)
+    self._directories.add(directory)
+
+  def _complete(self):
+    self._pending.popleft().result()
+    self.written += 1
+
+
+def write_file(path: str, content: str):
+  """
+  Write file, replacing it if it exists.
+
+  :param path: file
+  :param content: content of file
+  """
+  with open(path, 'w') as output_file:
+    output_file.write(content)
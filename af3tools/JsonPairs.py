@@ -1,13 +1,20 @@
 import argparse
+import contextlib
+import io
 import json
 import os
 import random
 import re
-from typing import TextIO
+import tarfile
+import time
+from typing import Iterator, TextIO
 
 from Bio import SeqIO, SeqRecord
 
-from af3tools import FastaId
+from af3tools import FastaId, FastaIndex, FileWriter, Pairs
+
+BUNDLE_FORMATS = ["jsonl", "tar"]
+BUNDLE_PREFIX = "pairs"
 
 
 def readable_file(filepath: str):
@@ -55,21 +62,54 @@ def main(argv: list[str] = None):
                            "- same protein is present in both baits and targets.")
   parser.add_argument('-o', '--output', type=dir_path, default="",
                       help="Directory where to write JSON files.  (default: current directory)")
+  parser.add_argument('-B', '--bundle-size', type=int,
+                      help="Write bundles containing this many pairs instead of one JSON file per pair, "
+                           "use extract-bundle to write the JSON files of a bundle.  (default: one file per pair)")
+  parser.add_argument('-f', '--bundle-format', choices=BUNDLE_FORMATS, default=BUNDLE_FORMATS[0],
+                      help="Format of bundles, jsonl writes one compact JSON per line, "
+                           "tar writes one JSON file per member.  (default: %(default)s)")
+  parser.add_argument('-p', '--pairs', type=readable_file,
+                      help="Tab delimited file of bait and target IDs, only these pairs are created, "
+                           "sequences are read from baits and targets files.  (default: all pairs)")
+  parser.add_argument('-z', '--size-buckets', action='store_true',
+                      help="Write each pair in a subdirectory named after the token bucket of the pair, "
+                           "like tokens-1024, so that each bucket can use its own resources.")
+  parser.add_argument('--buckets', type=int, nargs="+", default=Pairs.BUCKETS,
+                      help="Token counts of buckets used by --size-buckets.  (default: AlphaFold 3 buckets)")
+  parser.add_argument('-w', '--writers', type=int, default=8,
+                      help="Number of JSON files written in parallel, "
+                           "which hides the latency of creating files on network file systems.  (default: %(default)s)")
+  parser.add_argument('-F', '--fan-out', type=int,
+                      help="Spread JSON files over this many subdirectories of output, "
+                           "chosen from a hash of the file name.  (default: no subdirectories)")
 
   args = parser.parse_args(argv)
 
   json_pairs(baits_file=args.baits, targets_file=args.targets, sequence_file=args.sequence,
              seeds=args.seed, random_seeds=args.rseed,
              unique=args.unique, skip_identity=args.identity,
-             output=args.output)
+             output=args.output, bundle_size=args.bundle_size,
+             bundle_format=args.bundle_format, writers=args.writers,
+             fan_out=args.fan_out, pairs_file=args.pairs,
+             buckets=args.buckets if args.size_buckets else None)
 
 
 def json_pairs(baits_file: str, targets_file: str, sequence_file: str = None,
     seeds: list[int] = None, random_seeds: int = 1, unique: bool = False,
-    skip_identity: bool = False, output: str = ""):
+    skip_identity: bool = False, output: str = "", bundle_size: int = None,
+    bundle_format: str = BUNDLE_FORMATS[0], writers: int = 8, fan_out: int = None,
+    pairs_file: str = None, buckets: list[int] = None):
   """
   Create JSON files, each one containing a protein pair, one protein from baits and one protein from targets file.
 
+  JSON files are written by a pool of threads, see :class:`FileWriter.FileWriter`.
+  If bundle_size is not None, pairs are written in bundles instead, see :func:`write_bundles`.
+
+  If pairs_file is not None, only the pairs of pairs_file are created, in file order, see :func:`listed_pair_jobs`.
+
+  If buckets is not None, each pair is written in a subdirectory of output named after its token bucket,
+  see :func:`Pairs.bucket_name`.
+
   :param baits_file: FASTA file containing baits
   :param targets_file: FASTA file containing targets
   :param sequence_file: Additional sequence element to add in JSON format
@@ -80,14 +120,27 @@ def json_pairs(baits_file: str, targets_file: str, sequence_file: str = None,
   :param skip_identity: don't save JSON file of a protein with itself -
                         if the same protein is present in both baits and targets
   :param output: where to write JSON files
+  :param bundle_size: if not None, number of pairs written in each bundle
+  :param bundle_format: format of bundles, one of BUNDLE_FORMATS
+  :param writers: number of JSON files written in parallel
+  :param fan_out: if not None, number of subdirectories of output where JSON files are spread,
+                  see :func:`FileWriter.fan_out_directory`
+  :param pairs_file: if not None, tab delimited file of bait and target IDs, see :func:`Pairs.read_pairs`
+  :param buckets: if not None, sorted token counts of buckets, see Pairs.BUCKETS
   """
+  if bundle_size is not None and bundle_size < 1:
+    raise AssertionError("bundle_size value must be at least 1")
+  if bundle_format not in BUNDLE_FORMATS:
+    raise AssertionError(f"bundle_format must be one of {BUNDLE_FORMATS}")
+  if fan_out is not None and bundle_size is not None:
+    raise AssertionError("fan_out cannot be used with bundle_size")
+  if pairs_file and unique:
+    raise AssertionError("unique cannot be used with pairs_file")
+  if buckets is not None:
+    Pairs.validate_buckets(buckets)
   if not seeds:
     seeds = [random.randint(1,2147483647) for i in range(random_seeds)]
 
-  with open(baits_file, "r") as baits_file_in:
-    baits = parse_fasta(baits_file_in)
-  with open(targets_file, "r") as targets_file_in:
-    targets = parse_fasta(targets_file_in)
   sequence = ""
   sequence_id = ""
   if sequence_file:
@@ -95,35 +148,266 @@ def json_pairs(baits_file: str, targets_file: str, sequence_file: str = None,
       sequence = json.load(sequence_file_in)
       sequence_id = next(iter(sequence.values()))["id"]
 
-  processed_ids = set()
-  for bait in baits:
-    bait_id = re.sub(r"[^A-Za-z]", "", bait.split("_")[0])
-    if bait_id == sequence_id:
-      bait_id = bait_id + "B"
-    bait_data = {"protein": {"id": bait_id, "sequence": str(baits[bait].seq)}}
-    for target in targets:
-      if skip_identity and bait == target:
-        continue
-      reverse_id = f"{target}__{bait}"
-      if unique and reverse_id in processed_ids:
-        continue
-      target_id = re.sub(r"[^A-Za-z]", "", target.split("_")[0])
-      while target_id in [bait_id, sequence_id]:
-        target_id = target_id + "T"
-      target_data = {
-        "protein": {"id": target_id, "sequence": str(targets[target].seq)}}
-      merge_id = f"{bait}__{target}"
-      processed_ids.add(merge_id)
-      sequences = [bait_data, target_data]
-      if sequence:
-        sequences.append(sequence)
-        merge_id = f"{merge_id}__{sequence_id}"
-      json_data = {"name": merge_id,
-                   "modelSeeds": seeds,
-                   "dialect": "alphafold3", "version": 1,
-                   "sequences": sequences}
-      with open(os.path.join(output, f"{merge_id}.json"), 'w') as output_file:
-        output_file.write(json.dumps(json_data, indent=4))
+  if pairs_file:
+    with FastaIndex.FastaIndex(baits_file) as baits, FastaIndex.FastaIndex(targets_file) as targets, \
+        open(pairs_file, "r") as pairs_in:
+      write_jobs(listed_pair_jobs(Pairs.read_pairs(pairs_in), baits, targets, seeds, sequence, sequence_id,
+                                  skip_identity), output, bundle_size, bundle_format, writers, fan_out, buckets)
+    return
+  with open(baits_file, "r") as baits_file_in:
+    baits = parse_fasta(baits_file_in)
+  with open(targets_file, "r") as targets_file_in:
+    targets = parse_fasta(targets_file_in)
+  write_jobs(pair_jobs(baits, targets, seeds, sequence, sequence_id, unique, skip_identity),
+             output, bundle_size, bundle_format, writers, fan_out, buckets)
+
+
+def write_jobs(jobs: Iterator[dict], output: str = "", bundle_size: int = None,
+    bundle_format: str = BUNDLE_FORMATS[0], writers: int = 8, fan_out: int = None,
+    buckets: list[int] = None):
+  """
+  Write AlphaFold 3 jobs, one JSON file per job or in bundles.
+
+  :param jobs: AlphaFold 3 jobs
+  :param output: where to write JSON files
+  :param bundle_size: if not None, number of jobs written in each bundle, see :func:`write_bundles`
+  :param bundle_format: format of bundles, one of BUNDLE_FORMATS
+  :param writers: number of JSON files written in parallel
+  :param fan_out: if not None, number of subdirectories of output where JSON files are spread
+  :param buckets: if not None, jobs are written in a subdirectory of output named after their token bucket,
+                  see :func:`Pairs.bucket_name`
+  """
+  def directory(json_data: dict) -> str:
+    return Pairs.bucket_name(job_size(json_data), buckets) if buckets is not None else ""
+
+  if bundle_size is not None:
+    bundle_writers = {}
+    with contextlib.ExitStack() as stack:
+      for json_data in jobs:
+        bucket = directory(json_data)
+        if bucket not in bundle_writers:
+          if bucket:
+            os.makedirs(os.path.join(output, bucket), exist_ok=True)
+          bundle_writers[bucket] = stack.enter_context(
+              BundleWriter(os.path.join(output, bucket), bundle_size, bundle_format))
+        bundle_writers[bucket].write(json_data)
+    return
+  with FileWriter.FileWriter(output, threads=writers, fan_out=fan_out) as writer:
+    for json_data in jobs:
+      writer.write(f"{json_data['name']}.json", json.dumps(json_data, indent=4), directory(json_data))
+
+
+def job_size(json_data: dict) -> int:
+  """
+  Returns number of tokens of AlphaFold 3 job, see :func:`Pairs.entity_tokens`.
+
+  :param json_data: AlphaFold 3 job
+  :return: number of tokens of all sequences of job
+  """
+  return sum(Pairs.entity_tokens(entity) for entity in json_data["sequences"])
+
+
+def pair_jobs(baits: dict[str, SeqRecord], targets: dict[str, SeqRecord], seeds: list[int],
+    sequence: dict = None, sequence_id: str = "", unique: bool = False,
+    skip_identity: bool = False) -> Iterator[dict]:
+  """
+  Returns AlphaFold 3 jobs of protein pairs, one protein from baits and one protein from targets, as they are generated.
+
+  Pairs are enumerated by :func:`Pairs.enumerate_pairs`, so memory does not depend on the number of pairs.
+
+  :param baits: baits mapped by ID
+  :param targets: targets mapped by ID
+  :param seeds: seeds to use for model inference
+  :param sequence: additional sequence element to add to each job
+  :param sequence_id: ID of additional sequence
+  :param unique: only return one job per unique pair -
+                 do not return POLR2B-POLR2A pair if POLR2A-POLR2B is also present
+  :param skip_identity: don't return job of a protein with itself
+  :return: AlphaFold 3 jobs, in the order of baits then targets
+  """
+  bait_names = list(baits)
+  target_names = list(targets)
+  bait_data = [bait_protein(bait, str(baits[bait].seq), sequence_id) for bait in bait_names]
+  target_ids = [chain_id(target) for target in target_names]
+  target_sequences = [str(targets[target].seq) for target in target_names]
+  for bait_index, target_index in Pairs.enumerate_pairs(bait_names, target_names, unique, skip_identity):
+    target_data = target_protein(target_ids[target_index], target_sequences[target_index],
+                                 bait_data[bait_index]["protein"]["id"], sequence_id)
+    yield job(bait_names[bait_index], target_names[target_index], bait_data[bait_index], target_data,
+              seeds, sequence, sequence_id)
+
+
+def listed_pair_jobs(pairs: Iterator[tuple[str, str]], baits: FastaIndex.FastaIndex,
+    targets: FastaIndex.FastaIndex, seeds: list[int], sequence: dict = None, sequence_id: str = "",
+    skip_identity: bool = False) -> Iterator[dict]:
+  """
+  Returns AlphaFold 3 jobs of listed protein pairs, as they are read.
+
+  Sequences are read from FASTA files through their index, so work is proportional to the number of pairs.
+
+  :param pairs: tuple containing (bait, target) IDs for each pair
+  :param baits: index of baits
+  :param targets: index of targets
+  :param seeds: seeds to use for model inference
+  :param sequence: additional sequence element to add to each job
+  :param sequence_id: ID of additional sequence
+  :param skip_identity: don't return job of a protein with itself
+  :return: AlphaFold 3 jobs, in the order of pairs
+  """
+  for bait, target in pairs:
+    if skip_identity and bait == target:
+      continue
+    if bait not in baits:
+      raise AssertionError(f"Bait {bait} is not present in baits file {baits.fasta_file}")
+    if target not in targets:
+      raise AssertionError(f"Target {target} is not present in targets file {targets.fasta_file}")
+    bait_data = bait_protein(bait, baits.sequence(bait), sequence_id)
+    target_data = target_protein(chain_id(target), targets.sequence(target), bait_data["protein"]["id"],
+                                 sequence_id)
+    yield job(bait, target, bait_data, target_data, seeds, sequence, sequence_id)
+
+
+def bait_protein(bait: str, bait_sequence: str, sequence_id: str = "") -> dict:
+  """
+  Returns protein element of bait in AlphaFold 3 job.
+
+  :param bait: bait ID
+  :param bait_sequence: sequence of bait
+  :param sequence_id: ID of additional sequence
+  :return: protein element, its chain ID is different from sequence_id
+  """
+  bait_id = chain_id(bait)
+  if bait_id == sequence_id:
+    bait_id = bait_id + "B"
+  return {"protein": {"id": bait_id, "sequence": bait_sequence}}
+
+
+def target_protein(target_id: str, target_sequence: str, bait_id: str, sequence_id: str = "") -> dict:
+  """
+  Returns protein element of target in AlphaFold 3 job.
+
+  :param target_id: chain ID of target, see :func:`chain_id`
+  :param target_sequence: sequence of target
+  :param bait_id: chain ID of bait
+  :param sequence_id: ID of additional sequence
+  :return: protein element, its chain ID is different from bait_id and sequence_id
+  """
+  while target_id in [bait_id, sequence_id]:
+    target_id = target_id + "T"
+  return {"protein": {"id": target_id, "sequence": target_sequence}}
+
+
+def job(bait: str, target: str, bait_data: dict, target_data: dict, seeds: list[int],
+    sequence: dict = None, sequence_id: str = "") -> dict:
+  """
+  Returns AlphaFold 3 job of a protein pair.
+
+  :param bait: bait ID
+  :param target: target ID
+  :param bait_data: protein element of bait, see :func:`bait_protein`
+  :param target_data: protein element of target, see :func:`target_protein`
+  :param seeds: seeds to use for model inference
+  :param sequence: additional sequence element to add to job
+  :param sequence_id: ID of additional sequence
+  :return: AlphaFold 3 job
+  """
+  merge_id = f"{bait}__{target}"
+  sequences = [bait_data, target_data]
+  if sequence:
+    sequences.append(sequence)
+    merge_id = f"{merge_id}__{sequence_id}"
+  return {"name": merge_id,
+          "modelSeeds": seeds,
+          "dialect": "alphafold3", "version": 1,
+          "sequences": sequences}
+
+
+def chain_id(protein: str) -> str:
+  """
+  Returns ID of protein chain in AlphaFold 3 job, the letters of the first part of the protein ID.
+
+  :param protein: protein ID, like RPB1_HUMAN
+  :return: ID of protein chain, like RPB
+  """
+  return re.sub(r"[^A-Za-z]", "", protein.split("_")[0])
+
+
+def write_bundles(jobs: Iterator[dict], output: str, bundle_size: int,
+    bundle_format: str = BUNDLE_FORMATS[0]) -> list[str]:
+  """
+  Write AlphaFold 3 jobs in bundles, so that many jobs use a single file, see :class:`BundleWriter`.
+
+  :param jobs: AlphaFold 3 jobs
+  :param output: where to write bundles
+  :param bundle_size: maximum number of jobs in each bundle
+  :param bundle_format: jsonl for one compact JSON per line, tar for one JSON file per member named after the job
+  :return: bundles that were written
+  """
+  with BundleWriter(output, bundle_size, bundle_format) as writer:
+    for json_data in jobs:
+      writer.write(json_data)
+  return writer.bundles
+
+
+class BundleWriter:
+  """
+  Writes AlphaFold 3 jobs in bundles, so that many jobs use a single file.
+
+  Bundles are named pairs-000000.jsonl, pairs-000001.jsonl and so on. Jobs are written as they are generated,
+  only the jobs of one bundle are held in memory.
+  """
+
+  def __init__(self, output: str, bundle_size: int, bundle_format: str = BUNDLE_FORMATS[0]):
+    """
+    :param output: where to write bundles
+    :param bundle_size: maximum number of jobs in each bundle
+    :param bundle_format: jsonl for one compact JSON per line, tar for one JSON file per member named after the job
+    """
+    self.output = output
+    self.bundle_size = bundle_size
+    self.bundle_format = bundle_format
+    self.bundles = []
+    self._jobs = []
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    if exc_type is None:
+      self.flush()
+
+  def write(self, json_data: dict):
+    """
+    Add job to current bundle, the bundle is written once it contains bundle_size jobs.
+
+    :param json_data: AlphaFold 3 job
+    """
+    self._jobs.append(json_data)
+    if len(self._jobs) >= self.bundle_size:
+      self.flush()
+
+  def flush(self):
+    """
+    Write current bundle, if it contains any job.
+    """
+    if not self._jobs:
+      return
+    bundle = os.path.join(self.output, f"{BUNDLE_PREFIX}-{len(self.bundles):06d}.{self.bundle_format}")
+    if self.bundle_format == "tar":
+      with tarfile.open(bundle, "w") as bundle_out:
+        for json_data in self._jobs:
+          content = json.dumps(json_data, separators=(",", ":")).encode()
+          member = tarfile.TarInfo(f"{json_data['name']}.json")
+          member.size = len(content)
+          member.mtime = int(time.time())
+          bundle_out.addfile(member, io.BytesIO(content))
+    else:
+      with open(bundle, 'w') as bundle_out:
+        for json_data in self._jobs:
+          bundle_out.write(json.dumps(json_data, separators=(",", ":")))
+          bundle_out.write("\n")
+    self.bundles.append(bundle)
+    self._jobs = []
 
 
 def parse_fasta(fasta: TextIO) -> dict[str, SeqRecord]:
@@ -1,13 +1,21 @@
 import argparse
+import collections
+import concurrent.futures
+import contextlib
+import csv
+import functools
 import glob
 import os
 import sys
-from typing import TextIO
+import tempfile
+from typing import Callable, Iterable, Iterator, TextIO
 
 import tqdm
 
+from af3tools import Af3Archive, Af3Files, Af3Score, Checksums, CompactOutputs
 
 RANKING_FILES = ["ranking_scores.csv"]
+MANIFEST_HEADER = ["Directory", "Directory mtime", "Size", "Mtime"]
 
 
 def dir_path(string: str):
@@ -17,6 +25,13 @@ def dir_path(string: str):
     raise NotADirectoryError(string)
 
 
+def archive_path(string: str):
+  if Af3Archive.is_archive(string):
+    return string
+  else:
+    raise argparse.ArgumentTypeError(f"archive extension must be one of {Af3Archive.ARCHIVE_EXTENSIONS}")
+
+
 def main(argv: list[str] = None):
   parser = argparse.ArgumentParser(
       description="List files from AlphaFold 3's output that need to be archived.")
@@ -28,43 +43,328 @@ def main(argv: list[str] = None):
                       help="Output file  (default: standard output)")
   parser.add_argument('-p', '--progress', action="store_true", default=False,
                       help="Show progress bar")
+  parser.add_argument('-m', '--metrics', nargs="+", choices=Af3Score.METRICS,
+                      help="Only list files needed to score these metrics with af3-score, "
+                           "including summary files of every sample, and report bytes saved")
+  parser.add_argument('-k', '--top-samples', type=int,
+                      help="With --metrics, only list model confidence and structure files of the "
+                           "best samples by ranking score, lis is then the mean over these samples")
+  parser.add_argument('-t', '--threads', type=int, default=4,
+                      help="Number of output directories listed in parallel  (default: %(default)s)")
+  parser.add_argument('-0', '--null', action="store_true", default=False,
+                      help="Separate files by a NUL character instead of a new line, like find -print0")
+  parser.add_argument('-s', '--since',
+                      help="Manifest of output directories listed by previous runs, only output directories "
+                           "that are new or changed since are listed and the manifest is updated")
+  parser.add_argument('-a', '--archive', type=archive_path,
+                      help="Also write listed files into this tar archive, compressed in parallel by --threads "
+                           "threads according to its extension, and write an index of members to ARCHIVE.index")
+  parser.add_argument('--volume-size', type=int,
+                      help="With --archive, split archive into volumes of at most this many megabytes "
+                           "before compression, named like out.000.tar.zst")
+  parser.add_argument('-c', '--checksums',
+                      help="Write checksums of listed files to this manifest, computed while files are "
+                           "listed or archived, in the format of b2sum/sha256sum/xxhsum")
+  parser.add_argument('--checksum-algorithm', choices=Checksums.CHECKSUM_ALGORITHMS,
+                      default=Checksums.CHECKSUM_ALGORITHMS[0],
+                      help="Algorithm of checksums, xxh64 requires xxhash  (default: %(default)s)")
+  parser.add_argument('--verify',
+                      help="Instead of listing files, verify files of this checksum manifest, "
+                           "or the members of --archive, and exit with status 1 if any differs or is missing")
 
   args = parser.parse_args(argv)
 
+  if args.verify:
+    failures = Checksums.verify_checksums(manifest_file=args.verify, archive=args.archive, threads=args.threads)
+    if failures:
+      parser.exit(1, f"{failures} files differ or are missing\n")
+    return
+
   list_files(input_dir=args.input, output_file=args.output,
-             progress=args.progress)
+             progress=args.progress, metrics=args.metrics,
+             top_samples=args.top_samples, threads=args.threads,
+             null=args.null, since=args.since, archive=args.archive,
+             volume_size=args.volume_size * 1024 * 1024 if args.volume_size else None,
+             checksums=args.checksums, checksum_algorithm=args.checksum_algorithm)
 
 
-def list_files(input_dir: str, output_file: TextIO, progress: bool = False):
+def list_files(input_dir: str, output_file: TextIO, progress: bool = False,
+    metrics: list[str] = None, top_samples: int = None,
+    threads: int = 4, null: bool = False, since: str = None, archive: str = None,
+    volume_size: int = None, checksums: str = None,
+    checksum_algorithm: str = Checksums.CHECKSUM_ALGORITHMS[0]) -> tuple[int, int] | None:
   """
   List files from AlphaFold 3's output that need to be archived.
 
+  Output directories, the directories of input_dir containing a ranking file, are each read once
+  by a pool of threads. Files are written as soon as the files of the previous directories are written,
+  so the whole list is never held in memory.
+
+  If metrics is not None, only files needed to score these metrics are listed, see :func:`policy_files`,
+  and the number of bytes saved is written to standard error.
+
+  If since is not None, output directories present in the manifest that did not change are not listed,
+  see :func:`directory_files`. The manifest is replaced once all files are listed.
+
+  If archive is not None, listed files that exist are also written into archive as they are listed,
+  see :class:`Af3Archive.ArchiveWriter`.
+
+  If checksums is not None, checksums of listed files that exist are written to the checksums manifest,
+  see :func:`Checksums.checksum_line`. Files are read once: by the archive writer if archive is not None,
+  and by the pool of threads listing output directories otherwise.
+
   :param input_dir: directory containing one or many AlphaFold's output directories
   :param output_file: output file
   :param progress: show progress bar
+  :param metrics: if not None, only list files needed to score these metrics
+  :param top_samples: if not None, only list model confidence and structure files of the best samples
+  :param threads: number of output directories listed in parallel
+  :param null: if True, files are separated by a NUL character instead of a new line
+  :param since: manifest of output directories listed by previous runs, created if it does not exist
+  :param archive: if not None, tar archive where listed files are written, see Af3Archive.ARCHIVE_EXTENSIONS
+  :param volume_size: if not None, split archive into volumes of at most volume_size uncompressed bytes
+  :param checksums: if not None, checksum manifest where checksums of listed files are written
+  :param checksum_algorithm: algorithm of checksums, see Checksums.CHECKSUM_ALGORITHMS
+  :return: tuple containing (selected_bytes, total_bytes) if metrics is not None
+  """
+  if metrics is not None and [metric for metric in metrics if metric not in Af3Score.METRICS]:
+    raise AssertionError(f"metrics values must all be present in {Af3Score.METRICS}")
+  if top_samples is not None and metrics is None:
+    raise AssertionError("top_samples can only be used with metrics")
+  if top_samples is not None and top_samples < 0:
+    raise AssertionError("top_samples value must be at least 0")
+  if threads < 1:
+    raise AssertionError("threads value must be at least 1")
+  if volume_size is not None and archive is None:
+    raise AssertionError("volume_size can only be used with archive")
+  if checksum_algorithm not in Checksums.CHECKSUM_ALGORITHMS:
+    raise AssertionError(f"checksum_algorithm must be one of {Checksums.CHECKSUM_ALGORITHMS}")
+  if checksums and checksum_algorithm == "xxh64":
+    Checksums.import_xxhash()
+  separator = "\0" if null else "\n"
+  with os.scandir(input_dir if input_dir else ".") as entries:
+    directories = sorted(entry.name for entry in entries if entry.is_dir() and not entry.name.startswith("."))
+  manifest = read_manifest(since) if since else {}
+
+  def list_directory(name: str):
+    listed = directory_files(name, input_dir=input_dir, metrics=metrics, top_samples=top_samples,
+                             track=bool(since), previous=manifest.get(name))
+    digests = {}
+    if checksums and not archive:
+      digests = {file: Checksums.hash_file(file, checksum_algorithm) for file in listed[0] if os.path.isfile(file)}
+    return name, listed, digests
+
+  selected_bytes, total_bytes = 0, 0
+  with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor, \
+      Af3Archive.ArchiveWriter(archive, threads, volume_size) if archive else contextlib.nullcontext() as writer, \
+      open(checksums, "w") if checksums else contextlib.nullcontext() as checksums_out:
+    for name, (files_to_archive, directory_selected, directory_total, signature), digests in ordered_map(
+        executor, list_directory, tqdm.tqdm(directories) if progress else directories, 4 * threads):
+      selected_bytes += directory_selected
+      total_bytes += directory_total
+      for file in files_to_archive:
+        output_file.write(file)
+        output_file.write(separator)
+        if writer is not None and os.path.isfile(file):
+          digests[file] = writer.add(file, checksum_algorithm if checksums else None)
+        if checksums_out is not None and file in digests:
+          checksums_out.write(Checksums.checksum_line(digests[file], file))
+      if signature is not None:
+        manifest[name] = signature
+  if since:
+    write_manifest(since, manifest)
+  if metrics is not None:
+    print(f"Selected {selected_bytes} of {total_bytes} bytes, {total_bytes - selected_bytes} bytes saved",
+          file=sys.stderr)
+    return selected_bytes, total_bytes
+  return None
+
+
+def ordered_map(executor: concurrent.futures.Executor, function: Callable, items: Iterable,
+    window: int) -> Iterator:
+  """
+  Returns results of function for all items, in the order of items, computing at most window items ahead.
+
+  :param executor: executor used to call function
+  :param function: function called for each item
+  :param items: items
+  :param window: maximum number of items submitted to executor whose result was not returned
+  :return: results of function
+  """
+  pending = collections.deque()
+  for item in items:
+    pending.append(executor.submit(function, item))
+    if len(pending) >= window:
+      yield pending.popleft().result()
+  while pending:
+    yield pending.popleft().result()
+
+
+def directory_files(name: str, input_dir: str = "", metrics: list[str] = None,
+    top_samples: int = None, track: bool = False, previous: tuple[int, int, int] = None) \
+    -> tuple[list[str], int, int, tuple[int, int, int] | None]:
+  """
+  Returns files of an output directory that need to be archived.
+
+  The directory is read once, files are classified by name.
+
+  If track is True and previous is not None, the directory is not listed when it did not change. A directory whose mtime
+  did not change is not read, AlphaFold 3 creates new files when it writes outputs.
+  Otherwise, the directory did not change if the size and latest mtime of its files did not change.
+
+  :param name: name of output directory in input_dir
+  :param input_dir: directory containing one or many AlphaFold's output directories
+  :param metrics: if not None, only list files needed to score these metrics, see :func:`policy_files`
+  :param top_samples: if not None, only list model confidence and structure files of the best samples
+  :param track: if True, return signature of directory to write in manifest
+  :param previous: signature of directory in the manifest of a previous run, see :func:`read_manifest`
+  :return: tuple containing (files, selected_bytes, total_bytes, signature),
+           files is empty if directory does not contain a ranking file or did not change,
+           selected_bytes and total_bytes are 0 if metrics is None,
+           signature is a tuple containing (directory_mtime, size, mtime) of directory,
+           None if directory does not contain a ranking file or track is False
+  """
+  directory = os.path.join(input_dir, name)
+  directory_mtime = os.stat(directory).st_mtime_ns if track else None
+  if track and previous is not None and previous[0] == directory_mtime:
+    return [], 0, 0, previous
+  with os.scandir(directory) as entries:
+    files = {entry.name: entry for entry in entries if not entry.name.startswith(".") and entry.is_file()}
+  names = list(files)
+  ranking_files = sorted(ranking_file for ranking_file in RANKING_FILES if ranking_file in names)
+  if not ranking_files:
+    return [], 0, 0, None
+  signature = None
+  if track:
+    stats = [entry.stat() for entry in files.values()]
+    signature = (directory_mtime, sum(stat.st_size for stat in stats), max(stat.st_mtime_ns for stat in stats))
+    if previous is not None and previous[1:] == signature[1:]:
+      return [], 0, 0, signature
+  if metrics is not None:
+    files_to_archive = policy_files(directory, metrics, top_samples)
+    return (files_to_archive, sum(os.path.getsize(file) for file in files_to_archive),
+            directory_size(directory), signature)
+  files_to_archive = {file for file in names if file.endswith(".json") or file.endswith(".cif")}
+  files_to_archive.add(ranking_files[0])
+  files_to_archive.add("TERMS_OF_USE.md")
+  return sorted(os.path.join(directory, file) for file in files_to_archive), 0, 0, signature
+
+
+def read_manifest(manifest_file: str) -> dict[str, tuple[int, int, int]]:
+  """
+  Parse manifest of output directories listed by previous runs.
+
+  :param manifest_file: tab delimited manifest, see MANIFEST_HEADER
+  :return: signature of output directories, see :func:`directory_files`, empty if manifest does not exist
+  """
+  manifest = {}
+  if not os.path.exists(manifest_file):
+    return manifest
+  with open(manifest_file, "r") as manifest_in:
+    reader = csv.reader(manifest_in, delimiter="\t")
+    next(reader, None)
+    for row in reader:
+      manifest[row[0]] = (int(row[1]), int(row[2]), int(row[3]))
+  return manifest
+
+
+def write_manifest(manifest_file: str, manifest: dict[str, tuple[int, int, int]]):
+  """
+  Write manifest of listed output directories, replacing previous manifest atomically.
+
+  :param manifest_file: tab delimited manifest, see MANIFEST_HEADER
+  :param manifest: signature of output directories, see :func:`directory_files`
+  """
+  directory = os.path.dirname(manifest_file)
+  with tempfile.NamedTemporaryFile("w", dir=directory if directory else ".", prefix=".manifest-",
+                                   delete=False) as manifest_out:
+    try:
+      manifest_out.write("\t".join(MANIFEST_HEADER))
+      manifest_out.write("\n")
+      for name in sorted(manifest):
+        manifest_out.write("\t".join([name] + [str(value) for value in manifest[name]]))
+        manifest_out.write("\n")
+    except BaseException:
+      os.remove(manifest_out.name)
+      raise
+  os.replace(manifest_out.name, manifest_file)
+
+
+def policy_files(directory: str, metrics: list[str], top_samples: int = None) -> list[str]:
+  """
+  Returns files of a prediction needed to score metrics with af3-score.
+
+  Summary confidence files of the prediction and of every sample, the ranking file and the terms of use
+  are always listed. The *_data.json file, which contains MSAs, and the *_model.cif file are only listed
+  when a metric needs the index of sequences. Model confidence and structure files of samples are listed
+  for lis, or for the best top_samples samples by ranking score if top_samples is not None.
+
+  Compressed variants and compact containers are listed instead of files that only exist in these forms.
+
+  :param directory: prediction directory
+  :param metrics: metrics to score
+  :param top_samples: if not None, number of best samples whose model confidence and structure files are listed
+  :return: sorted files to archive
+  """
+  sequence_index = bool([metric for metric in metrics if metric in Af3Score.SEQUENCE_INDEX_METRICS])
+  files = [os.path.join(directory, ranking_file) for ranking_file in RANKING_FILES]
+  files.append(os.path.join(directory, "TERMS_OF_USE.md"))
+  for confidence_file in Af3Files.glob_files("*_summary_confidences.json", root_dir=directory):
+    confidence_file = os.path.join(directory, confidence_file)
+    files.append(confidence_file)
+    if sequence_index:
+      files.append(confidence_file.replace("_summary_confidences.json", "_data.json"))
+      files.append(confidence_file.replace("_summary_confidences.json", "_model.cif"))
+    if "best_lis" in metrics:
+      files.append(confidence_file.replace("_summary_confidences.json", "_confidences.json"))
+  samples = ranked_samples(directory)
+  files.extend(os.path.join(directory, sample, "summary_confidences.json") for sample in samples)
+  if top_samples is not None:
+    samples = samples[:top_samples]
+  elif "lis" not in metrics:
+    samples = []
+  for sample in samples:
+    files.append(os.path.join(directory, sample, "confidences.json"))
+    files.append(os.path.join(directory, sample, "model.cif"))
+  existing = []
+  for file in dict.fromkeys(files):
+    path = Af3Files.resolve(file)
+    if os.path.isfile(path):
+      existing.append(path)
+    elif Af3Files.compact_member(path) is not None:
+      existing.append(os.path.join(directory, CompactOutputs.COMPACT_FILE))
+  return sorted(set(existing))
+
+
+def ranked_samples(directory: str) -> list[str]:
+  """
+  Returns sample directories of a prediction, best ranking score first.
+
+  :param directory: prediction directory
+  :return: sample directories, relative to directory, samples missing from ranking file are last
+  """
+  samples = sorted(os.path.basename(sample) for sample in glob.glob(os.path.join(directory, "seed-*_sample-*"))
+                   if os.path.isdir(sample))
+  ranking_file = os.path.join(directory, RANKING_FILES[0])
+  ranking_scores = {}
+  if Af3Files.exists(ranking_file):
+    with Af3Files.open_file(ranking_file, "rt") as ranking_in:
+      for row in csv.DictReader(ranking_in):
+        ranking_scores[f"seed-{row['seed']}_sample-{row['sample']}"] = float(row["ranking_score"])
+  return sorted(samples, key=lambda sample: -ranking_scores.get(sample, float("-inf")))
+
+
+def directory_size(directory: str) -> int:
+  """
+  Returns size of all files in directory, recursively.
+
+  :param directory: directory
+  :return: size of all files in bytes
   """
-  ranking_files = []
-  [ranking_files.extend(
-      glob.glob(os.path.join(input_dir, f"**/{ranking_file}"))) for ranking_file
-    in RANKING_FILES]
-  directories = [os.path.dirname(ranking_file) for ranking_file in
-                 ranking_files]
-  directories = list(set(directories))
-  directories.sort()
-  for directory in (tqdm.tqdm(directories) if progress else directories):
-    ranking_files = []
-    [ranking_files.extend(glob.glob(os.path.join(directory, ranking_file))) for
-     ranking_file in RANKING_FILES]
-    ranking_files.sort()
-    files_to_archive = glob.glob(os.path.join(directory, "*.json"))
-    files_to_archive.extend(glob.glob(os.path.join(directory, "*.cif")))
-    files_to_archive.append(ranking_files[0])
-    files_to_archive.append(os.path.join(directory, "TERMS_OF_USE.md"))
-    files_to_archive = list(set(files_to_archive))
-    files_to_archive.sort()
-    for file in files_to_archive:
-      output_file.write(file)
-      output_file.write("\n")
+  size = 0
+  for root, directories, files in os.walk(directory):
+    size += sum(os.path.getsize(os.path.join(root, file)) for file in files)
+  return size
 
 
 if __name__ == '__main__':
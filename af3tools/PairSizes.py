@@ -1,10 +1,22 @@
 import argparse
+import contextlib
+import itertools
+import json
 import os
-from typing import TextIO
+from typing import Iterator, TextIO
 
+import numpy as np
 from Bio import SeqIO, SeqRecord
 
-from af3tools import FastaId
+from af3tools import FastaId, Pairs
+
+# Inference time in seconds of one seed on one NVIDIA A100 80 GB, by number of tokens, as published by AlphaFold 3.
+INFERENCE_SECONDS = {1024: 62, 2048: 275, 3072: 703, 4096: 1434, 5120: 2547}
+# GPU memory in GB used by the largest job that fits on a NVIDIA A100 80 GB, and its number of tokens.
+GPU_MEMORY = 80
+GPU_MEMORY_TOKENS = 5120
+# Power law fitted to INFERENCE_SECONDS, used to estimate the inference time of any number of tokens.
+_INFERENCE_FIT = np.polyfit(np.log(list(INFERENCE_SECONDS)), np.log(list(INFERENCE_SECONDS.values())), 1)
 
 
 def dir_path(string: str):
@@ -29,45 +41,258 @@ def main(argv: list[str] = None):
   parser.add_argument('-i', '--identity', action='store_true',
                       help="Don't save JSON file of a protein with itself "
                            "- same protein is present in both baits and targets.")
+  parser.add_argument('-p', '--pairs', type=argparse.FileType('r'),
+                      help="Tab delimited file of bait and target IDs, only the sizes of these pairs are written.  "
+                           "(default: all pairs)")
+  parser.add_argument('-a', '--sequence', type=argparse.FileType('r'),
+                      help="Additional sequence element added to each pair by json-pairs, in JSON format, "
+                           "its tokens are added to the size of pairs.  (default: None)")
+  parser.add_argument('-e', '--extra-tokens', type=int,
+                      help="Tokens added to the size of pairs, instead of the tokens of --sequence.")
+  parser.add_argument('-S', '--rseed', type=int, default=1,
+                      help="Number of seeds of each pair, used to estimate GPU hours.  (default: %(default)s)")
   parser.add_argument('-o', '--output', type=argparse.FileType('w'),
-                      default="pair_sizes.txt",
-                      help="Output file.  (default: %(default)s)")
+                      help="Output file.  (default: pair_sizes.txt, unless --table or --summary is used)")
+  parser.add_argument('-T', '--table', type=str,
+                      help="Compressed NumPy file (.npz) where the bait, target and size of all pairs are written.")
+  parser.add_argument('-y', '--summary', type=argparse.FileType('w'),
+                      help="File where the number of pairs, the estimated GPU hours and the estimated GPU memory "
+                           "of each token bucket are written.")
+  parser.add_argument('-z', '--size-buckets', action='store_true',
+                      help="Add the token bucket of each pair, like tokens-1024, as a third column.")
+  parser.add_argument('--buckets', type=int, nargs="+", default=Pairs.BUCKETS,
+                      help="Token counts of buckets.  (default: AlphaFold 3 buckets)")
+  parser.add_argument('-m', '--manifests', type=dir_path,
+                      help="Directory where a manifest of pairs is written for each token bucket, "
+                           "like tokens-1024.txt, implies --size-buckets.")
 
   args = parser.parse_args(argv)
 
-  pair_sizes(baits=args.baits, targets=args.targets, output=args.output,
-             unique=args.unique, skip_identity=args.identity)
+  output = args.output
+  if output is None and args.table is None and args.summary is None:
+    output = argparse.FileType('w')("pair_sizes.txt")
+
+  pair_sizes(baits=args.baits, targets=args.targets, output=output,
+             unique=args.unique, skip_identity=args.identity, pairs=args.pairs,
+             buckets=args.buckets if args.size_buckets or args.manifests else None,
+             manifests=args.manifests, sequence=args.sequence, extra_tokens=args.extra_tokens,
+             table=args.table, summary=args.summary, seeds=args.rseed)
 
 
-def pair_sizes(baits: TextIO, targets: TextIO, output: TextIO,
+def pair_sizes(baits: TextIO, targets: TextIO, output: TextIO = None,
     unique: bool = False,
-    skip_identity: bool = False):
+    skip_identity: bool = False, pairs: TextIO = None, buckets: list[int] = None,
+    manifests: str = None, sequence: TextIO = None, extra_tokens: int = None,
+    table: str = None, summary: TextIO = None, seeds: int = 1):
   """
   Creates a text file containing pair sizes.
 
+  The size of a pair is its number of tokens: the length of both sequences plus the tokens of the additional
+  sequence element, see :func:`Pairs.entity_tokens`.
+  Sizes are computed by NumPy for blocks of pairs, see :func:`size_blocks`, so memory does not depend on the
+  number of pairs, except for table.
+  If pairs is not None, only the sizes of listed pairs are written, in file order.
+
+  If buckets is not None, the token bucket of each pair is written as a third column, see :func:`Pairs.bucket_name`.
+  If manifests is not None, the pairs of each bucket are also written to a manifest named after the bucket,
+  like tokens-1024.txt, so that each bucket can be run with its own resources.
+
+  If table is not None, the pairs are also written to a compressed NumPy file containing the arrays
+  'baits' and 'targets' (IDs) and 'bait_index', 'target_index' and 'size' (one value per pair).
+  If summary is not None, the number of pairs, the estimated GPU hours and GPU memory of each bucket are
+  written to summary, see :func:`write_summary`.
+
   :param baits: baits
   :param targets: targets
-  :param output: output file
+  :param output: if not None, output file
   :param unique: save only one JSON file per unique pair -
                  do not save POLR2B-POLR2A pair if POLR2A-POLR2B is also present
   :param skip_identity: don't save JSON file of a protein with itself -
                         if the same protein is present in both baits and targets
+  :param pairs: if not None, tab delimited file of bait and target IDs, see :func:`Pairs.read_pairs`
+  :param buckets: if not None, sorted token counts of buckets, see Pairs.BUCKETS
+  :param manifests: if not None, directory where a manifest of pairs is written for each bucket
+  :param sequence: if not None, additional sequence element added to each pair, in JSON format
+  :param extra_tokens: if not None, tokens added to the size of pairs, instead of the tokens of sequence
+  :param table: if not None, compressed NumPy file (.npz) where pairs are written
+  :param summary: if not None, file where the estimated cost of each bucket is written
+  :param seeds: number of seeds of each pair, used to estimate GPU hours
+  """
+  if pairs is not None and unique:
+    raise AssertionError("unique cannot be used with pairs")
+  if manifests is not None and buckets is None:
+    raise AssertionError("manifests can only be used with buckets")
+  if buckets is not None:
+    Pairs.validate_buckets(buckets)
+  if seeds < 1:
+    raise AssertionError("seeds value must be at least 1")
+  if extra_tokens is None:
+    extra_tokens = Pairs.entity_tokens(json.load(sequence)) if sequence is not None else 0
+  bait_lengths = sequence_lengths(baits)
+  target_lengths = sequence_lengths(targets)
+  bait_names = list(bait_lengths)
+  target_names = list(target_lengths)
+  summary_buckets = buckets if buckets is not None else Pairs.BUCKETS
+  bucket_names = [Pairs.bucket_name(bucket, summary_buckets) for bucket in summary_buckets] + [
+    Pairs.bucket_name(summary_buckets[-1] + 1, summary_buckets)]
+  summary_buckets = np.array(summary_buckets)
+  # Number of pairs, size of largest pair and inference seconds, by bucket, the last bucket contains larger pairs.
+  counts = np.zeros(len(summary_buckets) + 1, dtype=np.int64)
+  max_sizes = np.zeros(len(summary_buckets) + 1, dtype=np.int64)
+  seconds = np.zeros(len(summary_buckets) + 1)
+  bucket_seconds = inference_seconds(summary_buckets)
+  table_blocks = []
+  with contextlib.ExitStack() as stack:
+    manifest_files = {}
+    for bait_indexes, target_indexes, block_sizes in size_blocks(bait_lengths, target_lengths, unique,
+                                                                 skip_identity, pairs, extra_tokens):
+      bucket_indexes = np.searchsorted(summary_buckets, block_sizes, side="left")
+      block_counts = np.bincount(bucket_indexes, minlength=len(counts))
+      counts += block_counts
+      np.maximum.at(max_sizes, bucket_indexes, block_sizes)
+      seconds[:-1] += block_counts[:-1] * bucket_seconds
+      seconds[-1] += inference_seconds(block_sizes[bucket_indexes == len(summary_buckets)]).sum()
+      if table is not None:
+        table_blocks.append((bait_indexes, target_indexes, block_sizes))
+      if output is None and manifests is None:
+        continue
+      names = [f"{bait_names[bait_index]}__{target_names[target_index]}"
+               for bait_index, target_index in zip(bait_indexes.tolist(), target_indexes.tolist())]
+      block_sizes = block_sizes.tolist()
+      if buckets is None:
+        output.write("".join(f"{name}\t{size}\n" for name, size in zip(names, block_sizes)))
+        continue
+      block_buckets = [bucket_names[bucket_index] for bucket_index in bucket_indexes.tolist()]
+      if output is not None:
+        output.write("".join(f"{name}\t{size}\t{bucket}\n"
+                             for name, size, bucket in zip(names, block_sizes, block_buckets)))
+      if manifests is not None:
+        for name, size, bucket in zip(names, block_sizes, block_buckets):
+          if bucket not in manifest_files:
+            manifest_files[bucket] = stack.enter_context(open(os.path.join(manifests, f"{bucket}.txt"), 'w'))
+          manifest_files[bucket].write(f"{name}\t{size}\n")
+  if table is not None:
+    write_table(table, bait_names, target_names, table_blocks)
+  if summary is not None:
+    write_summary(summary, bucket_names, summary_buckets, counts, max_sizes, seconds * seeds)
+
+
+def size_blocks(bait_lengths: dict[str, int], target_lengths: dict[str, int], unique: bool = False,
+    skip_identity: bool = False, pairs: TextIO = None,
+    extra_tokens: int = 0) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+  """
+  Returns size of pairs, the sum of the length of both sequences and of extra_tokens, a block of pairs at a time.
+
+  :param bait_lengths: length of baits, by ID, see :func:`sequence_lengths`
+  :param target_lengths: length of targets, by ID, see :func:`sequence_lengths`
+  :param unique: only return one pair per unique pair
+  :param skip_identity: don't return pair of a protein with itself
+  :param pairs: if not None, tab delimited file of bait and target IDs, see :func:`Pairs.read_pairs`
+  :param extra_tokens: tokens added to the size of each pair
+  :return: tuple containing (bait_indexes, target_indexes, sizes) arrays for each block of pairs,
+           indexes are in the order of bait_lengths and target_lengths
   """
-  baits = parse_fasta(baits)
-  targets = parse_fasta(targets)
+  bait_sizes = np.fromiter(bait_lengths.values(), dtype=np.int64, count=len(bait_lengths))
+  target_sizes = np.fromiter(target_lengths.values(), dtype=np.int64, count=len(target_lengths))
+  if pairs is None:
+    blocks = Pairs.enumerate_pair_blocks(bait_lengths, target_lengths, unique, skip_identity)
+  else:
+    blocks = listed_pair_blocks(Pairs.read_pairs(pairs), bait_lengths, target_lengths, skip_identity)
+  for bait_indexes, target_indexes in blocks:
+    yield bait_indexes, target_indexes, bait_sizes[bait_indexes] + target_sizes[target_indexes] + extra_tokens
+
+
+def listed_pair_blocks(pairs: Iterator[tuple[str, str]], baits: dict[str, int], targets: dict[str, int],
+    skip_identity: bool = False) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+  """
+  Returns indexes of listed pairs, a block of pairs at a time.
 
-  processed_ids = set()
-  for bait in baits:
-    for target in targets:
+  :param pairs: tuple containing (bait, target) for each pair, see :func:`Pairs.read_pairs`
+  :param baits: IDs of baits, in index order
+  :param targets: IDs of targets, in index order
+  :param skip_identity: don't return pair of a protein with itself
+  :return: tuple containing (bait_indexes, target_indexes) arrays for each block of pairs, in pairs order
+  """
+  bait_ids = {bait: index for index, bait in enumerate(baits)}
+  target_ids = {target: index for index, target in enumerate(targets)}
+  while block := list(itertools.islice(pairs, Pairs.BLOCK_PAIRS)):
+    bait_indexes = []
+    target_indexes = []
+    for bait, target in block:
       if skip_identity and bait == target:
         continue
-      reverse_id = f"{target}__{bait}"
-      if unique and reverse_id in processed_ids:
-        continue
-      merge_id = f"{bait}__{target}"
-      size = len(str(baits[bait].seq)) + len(str(targets[target].seq))
-      output.write(f"{merge_id}\t{str(size)}\n")
-      processed_ids.add(merge_id)
+      if bait not in bait_ids:
+        raise AssertionError(f"Bait {bait} is not present in baits file")
+      if target not in target_ids:
+        raise AssertionError(f"Target {target} is not present in targets file")
+      bait_indexes.append(bait_ids[bait])
+      target_indexes.append(target_ids[target])
+    yield np.array(bait_indexes, dtype=np.int64), np.array(target_indexes, dtype=np.int64)
+
+
+def inference_seconds(sizes: np.ndarray) -> np.ndarray:
+  """
+  Returns estimated inference time of one seed of jobs, see INFERENCE_SECONDS.
+
+  :param sizes: number of tokens of jobs
+  :return: estimated inference time in seconds of each job
+  """
+  return np.exp(np.polyval(_INFERENCE_FIT, np.log(np.asarray(sizes, dtype=float))))
+
+
+def gpu_memory(size: int) -> float:
+  """
+  Returns estimated GPU memory of a job, which grows with the square of its number of tokens like the
+  pair representation of AlphaFold 3, see GPU_MEMORY.
+
+  :param size: number of tokens of job
+  :return: estimated GPU memory in GB
+  """
+  return GPU_MEMORY * (size / GPU_MEMORY_TOKENS) ** 2
+
+
+def write_table(table: str, baits: list[str], targets: list[str],
+    blocks: list[tuple[np.ndarray, np.ndarray, np.ndarray]]):
+  """
+  Write pairs to a compressed NumPy file, indexes and sizes use the smallest integer type that fits.
+
+  :param table: compressed NumPy file (.npz)
+  :param baits: IDs of baits, in index order
+  :param targets: IDs of targets, in index order
+  :param blocks: tuple containing (bait_indexes, target_indexes, sizes) arrays for each block of pairs
+  """
+  columns = [np.concatenate(column) if column else np.zeros(0, dtype=np.int64) for column in zip(*blocks)] or [
+    np.zeros(0, dtype=np.int64)] * 3
+  columns = [column.astype(np.min_scalar_type(column.max(initial=0))) for column in columns]
+  np.savez_compressed(table, baits=np.array(baits, dtype=str), targets=np.array(targets, dtype=str),
+                      bait_index=columns[0], target_index=columns[1], size=columns[2])
+
+
+def write_summary(summary: TextIO, bucket_names: list[str], buckets: np.ndarray, counts: np.ndarray,
+    max_sizes: np.ndarray, seconds: np.ndarray):
+  """
+  Write number of pairs, estimated GPU hours and GPU memory of each bucket, as a tab delimited file.
+
+  Jobs are padded to the size of their bucket, jobs larger than the largest bucket are not padded.
+
+  :param summary: output file
+  :param bucket_names: names of buckets, followed by the name of pairs larger than the largest bucket
+  :param buckets: token counts of buckets
+  :param counts: number of pairs of each bucket
+  :param max_sizes: size of the largest pair of each bucket
+  :param seconds: estimated inference seconds of each bucket
+  """
+  summary.write("Bucket\tPairs\tLargest pair\tGPU hours\tGPU memory (GB)\n")
+  memory = 0.0
+  for index, bucket_name in enumerate(bucket_names):
+    if index == len(buckets) and not counts[index]:
+      continue
+    bucket_memory = gpu_memory(buckets[index] if index < len(buckets) else max_sizes[index])
+    if counts[index]:
+      memory = max(memory, bucket_memory)
+    summary.write(f"{bucket_name}\t{counts[index]}\t{max_sizes[index]}\t{seconds[index] / 3600:.1f}"
+                  f"\t{bucket_memory:.1f}\n")
+  summary.write(f"Total\t{counts.sum()}\t{max_sizes.max()}\t{seconds.sum() / 3600:.1f}\t{memory:.1f}\n")
 
 
 def parse_fasta(fasta: TextIO) -> dict[str, SeqRecord]:
@@ -86,5 +311,17 @@ def parse_fasta(fasta: TextIO) -> dict[str, SeqRecord]:
   return sequences
 
 
+def sequence_lengths(fasta: TextIO) -> dict[str, int]:
+  """
+  Parses FASTA and returns the length of all sequences found in file mapped by ID, sequences are not kept in memory.
+
+  The ID of each sequence is found using :func:`FastaId.fasta_id`
+
+  :param fasta: FASTA file
+  :return: length of all sequences found in file mapped by ID
+  """
+  return {FastaId.fasta_id(record.description): len(record.seq) for record in SeqIO.parse(fasta, "fasta")}
+
+
 if __name__ == '__main__':
   main()
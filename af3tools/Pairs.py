@@ -0,0 +1,183 @@
+import bisect
+import functools
+import itertools
+import logging
+import re
+from typing import Iterable, Iterator, TextIO
+
+import numpy as np
+
+# Token counts to which AlphaFold 3 pads inputs, each bucket is compiled once by JAX.
+BUCKETS = [256, 512, 768, 1024, 1280, 1536, 2048, 2560, 3072, 3584, 4096, 4608, 5120]
+# Number of pairs enumerated at a time by enumerate_pair_blocks.
+BLOCK_PAIRS = 1 << 22
+# Heavy atoms of common CCD ligands and ions, AlphaFold 3 uses one token per ligand atom.
+CCD_TOKENS = {
+  "ADP": 27, "AMP": 23, "ANP": 31, "ATP": 31, "COA": 48, "FAD": 53, "FMN": 31, "GDP": 28, "GTP": 32, "HEM": 43,
+  "NAD": 44, "NAP": 48, "PO4": 5, "SAH": 26, "SAM": 27, "SO4": 5,
+  "CA": 1, "CL": 1, "CO": 1, "CU": 1, "FE": 1, "FE2": 1, "K": 1, "MG": 1, "MN": 1, "NA": 1, "NI": 1, "ZN": 1,
+}
+# Atoms of a SMILES string: bracket atoms, two letter elements allowed outside brackets, then other atoms.
+SMILES_ATOM = re.compile(r"\[[0-9]*([A-Z][a-z]?|[a-z]+)[^\]]*\]|Br|Cl|[BCNOPSFI]|[bcnops]")
+
+logger = logging.getLogger("Pairs")
+
+
+def enumerate_pairs(baits: Iterable[str], targets: Iterable[str], unique: bool = False,
+    skip_identity: bool = False) -> Iterator[tuple[int, int]]:
+  """
+  Returns pairs of one protein from baits and one protein from targets, in the order of baits then targets.
+
+  With unique, a pair is skipped when its reverse pair was returned before, which is the case when the target
+  is also a bait that comes before the bait, and the bait is also a target.
+  This is decided from the index of proteins, so memory does not depend on the number of pairs.
+  Targets of a bait are only filtered when the bait is also a target.
+
+  :param baits: IDs of baits, without duplicates
+  :param targets: IDs of targets, without duplicates
+  :param unique: only return one pair per unique pair -
+                 do not return POLR2B-POLR2A pair if POLR2A-POLR2B is also present
+  :param skip_identity: don't return pair of a protein with itself
+  :return: tuple containing (bait_index, target_index) for each pair
+  """
+  baits = list(baits)
+  targets = list(targets)
+  bait_indexes = {bait: index for index, bait in enumerate(baits)}
+  target_ids = set(targets)
+  # For each target, index of target in baits, len(baits) if target is not a bait.
+  target_bait_indexes = [bait_indexes.get(target, len(baits)) for target in targets]
+  all_targets = range(len(targets))
+  for bait_index, bait in enumerate(baits):
+    target_indexes = all_targets
+    if bait in target_ids and unique:
+      target_indexes = [target_index for target_index, target_bait_index in enumerate(target_bait_indexes)
+                        if target_bait_index > bait_index or (target_bait_index == bait_index and not skip_identity)]
+    elif bait in target_ids and skip_identity:
+      target_indexes = [target_index for target_index, target_bait_index in enumerate(target_bait_indexes)
+                        if target_bait_index != bait_index]
+    yield from zip(itertools.repeat(bait_index), target_indexes)
+
+
+def enumerate_pair_blocks(baits: Iterable[str], targets: Iterable[str], unique: bool = False,
+    skip_identity: bool = False, block_pairs: int = BLOCK_PAIRS) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+  """
+  Returns the same pairs as :func:`enumerate_pairs`, in the same order, as arrays of indexes.
+
+  Pairs of several baits are selected at once by NumPy, so large screens are enumerated without a Python loop
+  per pair.
+
+  :param baits: IDs of baits, without duplicates
+  :param targets: IDs of targets, without duplicates
+  :param unique: only return one pair per unique pair -
+                 do not return POLR2B-POLR2A pair if POLR2A-POLR2B is also present
+  :param skip_identity: don't return pair of a protein with itself
+  :param block_pairs: approximate number of pairs of each block
+  :return: tuple containing (bait_indexes, target_indexes) arrays for each block of pairs
+  """
+  baits = list(baits)
+  targets = list(targets)
+  bait_indexes = {bait: index for index, bait in enumerate(baits)}
+  # For each target, index of target in baits, len(baits) if target is not a bait.
+  target_bait_indexes = np.array([bait_indexes.get(target, len(baits)) for target in targets], dtype=np.int64)
+  bait_is_target = np.zeros(len(baits) + 1, dtype=bool)
+  bait_is_target[target_bait_indexes] = True
+  rows = max(1, block_pairs // max(1, len(targets)))
+  for start in range(0, len(baits), rows):
+    block_baits = np.arange(start, min(start + rows, len(baits)))[:, None]
+    keep = np.ones((len(block_baits), len(targets)), dtype=bool)
+    if unique:
+      keep &= ~bait_is_target[block_baits] | (target_bait_indexes >= block_baits)
+    if skip_identity:
+      keep &= target_bait_indexes != block_baits
+    block_bait_indexes, block_target_indexes = np.nonzero(keep)
+    yield block_bait_indexes + start, block_target_indexes
+
+
+def read_pairs(pairs: TextIO) -> Iterator[tuple[str, str]]:
+  """
+  Returns pairs of a tab delimited file, one pair at a time.
+
+  Each line contains the bait ID and the target ID, other columns are ignored.
+  Empty lines and lines starting with '#' are skipped.
+
+  :param pairs: tab delimited file of bait and target IDs
+  :return: tuple containing (bait, target) for each pair, in file order
+  """
+  for line in pairs:
+    line = line.rstrip("\r\n")
+    if not line or line.startswith("#"):
+      continue
+    columns = line.split("\t")
+    if len(columns) < 2:
+      raise AssertionError(f"Line '{line}' of pairs file must contain a bait and a target separated by a tab")
+    yield columns[0], columns[1]
+
+
+def size_bucket(size: int, buckets: list[int] = None) -> int | None:
+  """
+  Returns bucket of a job, the smallest bucket containing size tokens, like AlphaFold 3 pads inputs.
+
+  :param size: number of tokens of job
+  :param buckets: sorted token counts of buckets, defaults to BUCKETS
+  :return: bucket of job, None if size is larger than the largest bucket
+  """
+  buckets = buckets if buckets else BUCKETS
+  index = bisect.bisect_left(buckets, size)
+  return buckets[index] if index < len(buckets) else None
+
+
+def bucket_name(size: int, buckets: list[int] = None) -> str:
+  """
+  Returns name of the bucket of a job, used as directory or file name.
+
+  :param size: number of tokens of job
+  :param buckets: sorted token counts of buckets, defaults to BUCKETS
+  :return: name of bucket, like 'tokens-1024', or 'tokens-over-5120' if size is larger than the largest bucket
+  """
+  buckets = buckets if buckets else BUCKETS
+  bucket = size_bucket(size, buckets)
+  return f"tokens-{bucket}" if bucket is not None else f"tokens-over-{buckets[-1]}"
+
+
+def entity_tokens(entity: dict) -> int:
+  """
+  Returns number of tokens of an element of the sequences of an AlphaFold 3 job.
+
+  Proteins, RNA and DNA have one token per residue, ligands have one token per heavy atom.
+  Atoms of CCD ligands are found in CCD_TOKENS and atoms of SMILES ligands are counted from the SMILES string.
+  CCD codes missing from CCD_TOKENS count as 0 tokens, a warning is logged once per code.
+  Tokens are multiplied by the number of copies of the element, when its ID is a list.
+
+  :param entity: element of sequences, like {"protein": {"id": "A", "sequence": "MKV"}}
+  :return: number of tokens of element
+  """
+  entity_type, data = next(iter(entity.items()))
+  if entity_type in ["protein", "rna", "dna"]:
+    tokens = len(data["sequence"])
+  elif "smiles" in data:
+    tokens = len([atom for atom in SMILES_ATOM.findall(data["smiles"]) if atom != "H"])
+  else:
+    for ccd_code in data["ccdCodes"]:
+      if ccd_code not in CCD_TOKENS:
+        _warn_unknown_ccd_code(ccd_code)
+    tokens = sum(CCD_TOKENS.get(ccd_code, 0) for ccd_code in data["ccdCodes"])
+  copies = len(data["id"]) if isinstance(data["id"], list) else 1
+  return tokens * copies
+
+
+@functools.cache
+def _warn_unknown_ccd_code(ccd_code: str):
+  logger.warning(f"Number of atoms of CCD code {ccd_code} is unknown, it counts as 0 tokens, "
+                 f"use a SMILES ligand to count its atoms")
+
+
+def validate_buckets(buckets: list[int]):
+  """
+  Checks that buckets are positive and sorted.
+
+  :param buckets: token counts of buckets
+  """
+  if not buckets or [bucket for bucket in buckets if bucket < 1]:
+    raise AssertionError("buckets values must all be at least 1")
+  if sorted(set(buckets)) != list(buckets):
+    raise AssertionError("buckets values must be sorted in increasing order")
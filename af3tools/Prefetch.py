@@ -0,0 +1,135 @@
+import concurrent.futures
+import logging
+import os
+import threading
+from typing import Callable
+
+# Size of reads used to load files in page cache.
+READ_SIZE = 1 << 20
+MEGABYTE = 1 << 20
+
+logger = logging.getLogger("Prefetch")
+
+
+def file_size(path: str) -> int:
+  """
+  Returns size of file in bytes.
+
+  :param path: file
+  :return: size of file in bytes, 0 if file does not exist
+  """
+  try:
+    return os.stat(path).st_size
+  except OSError:
+    return 0
+
+
+def read_file(path: str) -> int:
+  """
+  Reads file and discards its content, so the file is in page cache when a worker reads it.
+
+  :param path: file
+  :return: number of bytes read, 0 if file cannot be read
+  """
+  read = 0
+  buffer = bytearray(READ_SIZE)
+  try:
+    with open(path, "rb", buffering=0) as file_in:
+      while True:
+        count = file_in.readinto(buffer)
+        if not count:
+          break
+        read += count
+  except OSError as e:
+    # Worker reports the error when it reads the file.
+    logger.debug(f"Could not prefetch {path}: {e}")
+  return read
+
+
+class Prefetcher:
+  """
+  Reads files of upcoming tasks with a thread pool while workers compute scores of previous tasks.
+
+  Files are read in the order tasks were submitted. Bytes of tasks that are prefetched, but not completed,
+  are kept under a byte budget, so prefetched files are not evicted from page cache before workers read them.
+  """
+
+  def __init__(self, budget: int, threads: int = 4):
+    """
+    :param budget: maximum bytes of prefetched files of tasks that are not completed
+    :param threads: number of threads reading files
+    """
+    if budget < 1:
+      raise AssertionError("budget must be at least 1")
+    if threads < 1:
+      raise AssertionError("threads value must be at least 1")
+    self.budget = budget
+    self.threads = threads
+    self.held = 0
+    self.prefetched = 0
+    self._condition = threading.Condition()
+    self._stop = threading.Event()
+    self._schedulers = []
+    self._executor = None
+
+  def __enter__(self):
+    self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.threads,
+                                                           thread_name_prefix="prefetch")
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self._stop.set()
+    with self._condition:
+      self._condition.notify_all()
+    for scheduler in self._schedulers:
+      scheduler.join()
+    self._executor.shutdown(wait=True, cancel_futures=True)
+    logger.debug(f"Prefetched {self.prefetched} bytes")
+    return False
+
+  def prefetch(self, items: list[str], futures: list[concurrent.futures.Future],
+      files: Callable[[str], list[str]]):
+    """
+    Start reading files of items in background, in the order of items.
+
+    :param items: items processed by tasks, usually confidence files
+    :param futures: futures of tasks, one per item
+    :param files: function returning the files read by the task of an item, called in background
+    """
+    scheduler = threading.Thread(target=self._schedule, args=(items, futures, files), daemon=True)
+    self._schedulers.append(scheduler)
+    scheduler.start()
+
+  def _schedule(self, items: list[str], futures: list[concurrent.futures.Future],
+      files: Callable[[str], list[str]]):
+    for item, future in zip(items, futures):
+      if self._stop.is_set():
+        return
+      if future.running() or future.done():
+        # Worker already reads the files.
+        continue
+      try:
+        paths = files(item)
+      except OSError:
+        continue
+      size = sum(file_size(path) for path in paths)
+      with self._condition:
+        # A task larger than budget is prefetched alone.
+        while self.held > 0 and self.held + size > self.budget and not self._stop.is_set():
+          self._condition.wait()
+        if self._stop.is_set():
+          return
+        self.held += size
+      future.add_done_callback(lambda done, size=size: self._release(size))
+      for path in paths:
+        self._executor.submit(self._read, path)
+
+  def _read(self, path: str):
+    read = read_file(path)
+    with self._condition:
+      self.prefetched += read
+
+  def _release(self, size: int):
+    with self._condition:
+      self.held -= size
+      self._condition.notify_all()
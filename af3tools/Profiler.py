@@ -0,0 +1,187 @@
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import TextIO
+
+STAGES = ["discover", "load_summary", "load_data_json", "load_confidences",
+          "parse_cif", "contacts", "lis_reduce", "write"]
+# Stage covering a whole task, contains the other stages of a prediction.
+TASK = "task"
+REPORT_HEADER = ["Stage", "Worker", "Count", "Wall (s)", "CPU (s)", "Bytes read",
+                 "Mean wall (ms)", "Max wall (ms)", "Read rate (MB/s)"]
+
+enabled = False
+trace_dir = None
+# Bytes read by bytes_read itself, subtracted from bytes read by stages.
+read_overhead = 0
+events = []
+_local = threading.local()
+_lock = threading.Lock()
+
+
+def enable(directory: str = None):
+  """
+  Start recording stages of this process, used as initializer of process pools.
+
+  :param directory: directory where events are written at the end of each task, so the parent process can
+                    collect events of all workers, if None, events are only kept in memory
+  """
+  global enabled, trace_dir, read_overhead
+  enabled = True
+  trace_dir = directory
+  events.clear()
+  read_overhead = -bytes_read() + bytes_read()
+
+
+def disable():
+  """
+  Stop recording stages and discard recorded events.
+  """
+  global enabled, trace_dir
+  enabled = False
+  trace_dir = None
+  events.clear()
+
+
+def bytes_read() -> int:
+  """
+  Returns number of bytes read by this process, 0 if the operating system does not report it.
+
+  :return: number of bytes read by this process
+  """
+  try:
+    with open("/proc/self/io", "rb") as io_in:
+      for line in io_in:
+        if line.startswith(b"rchar:"):
+          return int(line.split()[1])
+  except OSError:
+    pass
+  return 0
+
+
+@contextmanager
+def stage(name: str, item: str = None):
+  """
+  Record wall time, CPU time and bytes read while in context.
+
+  Costs a single test when profiling is disabled.
+
+  :param name: stage name, usually one of STAGES
+  :param item: prediction processed by stage, defaults to prediction of enclosing :func:`task`
+  """
+  if not enabled:
+    yield
+    return
+  start = time.time()
+  wall = time.perf_counter()
+  cpu = time.process_time()
+  read = bytes_read()
+  try:
+    yield
+  finally:
+    event = {"stage": name, "item": item if item is not None else getattr(_local, "item", None),
+             "pid": os.getpid(), "tid": threading.get_native_id(), "start": start,
+             "wall": time.perf_counter() - wall, "cpu": time.process_time() - cpu,
+             "bytes": max(bytes_read() - read - read_overhead, 0)}
+    with _lock:
+      events.append(event)
+
+
+@contextmanager
+def task(item: str):
+  """
+  Record a task processing one prediction, stages inside the task are attributed to the prediction.
+
+  Events are written to trace directory when the task completes.
+
+  :param item: prediction processed by task
+  """
+  if not enabled:
+    yield
+    return
+  _local.item = item
+  try:
+    with stage(TASK, item):
+      yield
+  finally:
+    _local.item = None
+    flush()
+
+
+def flush():
+  """
+  Append recorded events to the file of this process in trace directory.
+  """
+  if not trace_dir:
+    return
+  with _lock:
+    pending = list(events)
+    events.clear()
+  if not pending:
+    return
+  with open(os.path.join(trace_dir, f"events-{os.getpid()}.jsonl"), "a") as events_out:
+    for event in pending:
+      events_out.write(json.dumps(event))
+      events_out.write("\n")
+
+
+def collect() -> list[dict]:
+  """
+  Returns events of this process and of all workers that wrote events in trace directory.
+
+  :return: events sorted by start time
+  """
+  flush()
+  collected = list(events)
+  if trace_dir:
+    for events_file in sorted(glob.glob(os.path.join(trace_dir, "events-*.jsonl"))):
+      with open(events_file, "r") as events_in:
+        collected.extend(json.loads(line) for line in events_in if line.strip())
+  return sorted(collected, key=lambda event: event["start"])
+
+
+def write_report(report_out: TextIO, collected: list[dict]):
+  """
+  Writes total and mean of each stage for all workers and for each worker in tab delimited output.
+
+  :param report_out: output file
+  :param collected: events, see :func:`collect`
+  """
+  report_out.write("\t".join(REPORT_HEADER))
+  report_out.write("\n")
+  groups = {}
+  for event in collected:
+    groups.setdefault((event["stage"], "all"), []).append(event)
+    groups.setdefault((event["stage"], str(event["pid"])), []).append(event)
+  order = {name: index for index, name in enumerate(STAGES + [TASK])}
+  for stage_name, worker in sorted(groups, key=lambda key: (order.get(key[0], len(order)), key[0],
+                                                            key[1] != "all", key[1])):
+    stage_events = groups[(stage_name, worker)]
+    wall = sum(event["wall"] for event in stage_events)
+    cpu = sum(event["cpu"] for event in stage_events)
+    read = sum(event["bytes"] for event in stage_events)
+    report_out.write("\t".join(str(value) for value in [
+      stage_name, worker, len(stage_events), round(wall, 6), round(cpu, 6), read,
+      round(wall / len(stage_events) * 1000, 3),
+      round(max(event["wall"] for event in stage_events) * 1000, 3),
+      round(read / wall / 1e6, 3) if wall > 0 else 0]))
+    report_out.write("\n")
+
+
+def write_trace(trace_out: TextIO, collected: list[dict]):
+  """
+  Writes events in Chrome trace event format, which can be loaded in Perfetto, chrome://tracing or speedscope.
+
+  :param trace_out: output file
+  :param collected: events, see :func:`collect`
+  """
+  trace_events = [{"name": event["stage"], "cat": "af3-score", "ph": "X",
+                   "ts": round(event["start"] * 1e6), "dur": round(event["wall"] * 1e6),
+                   "pid": event["pid"], "tid": event["tid"],
+                   "args": {"item": event["item"], "cpu_ms": round(event["cpu"] * 1000, 3),
+                            "bytes": event["bytes"]}}
+                  for event in collected]
+  json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, trace_out)
@@ -0,0 +1,161 @@
+import contextlib
+import json
+import sys
+from importlib import metadata as importlib_metadata
+
+FORMATS = ["tsv", "parquet", "arrow"]
+NA = "NA"
+# Number of rows buffered before a row group (or record batch) is written.
+ROW_GROUP_SIZE = 65536
+METADATA_KEY = b"af3tools"
+
+
+def tool_version() -> str:
+  """
+  Returns version of installed af3-tools package.
+
+  :return: version of af3-tools package, 'unknown' if package is not installed
+  """
+  try:
+    return importlib_metadata.version("af3-tools")
+  except importlib_metadata.PackageNotFoundError:
+    return "unknown"
+
+
+def import_pyarrow():
+  """
+  Returns pyarrow module, which is only needed for parquet and arrow formats.
+
+  :return: pyarrow module
+  """
+  try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+  except ImportError as e:
+    raise ImportError(
+        "pyarrow is required for parquet and arrow formats, install it using 'pip install af3-tools[columnar]'") from e
+  return pyarrow
+
+
+def to_float(value) -> float | None:
+  """
+  Converts score to a float, NA and None are converted to None.
+
+  :param value: score
+  :return: score as a float or None if score is missing
+  """
+  if value is None or value == NA:
+    return None
+  return float(value)
+
+
+class ScoreWriter:
+  """
+  Writes score tables as tab delimited text, parquet or arrow (IPC file) output.
+
+  The first text_columns columns are strings, other columns are scores stored as 64 bits floats.
+  For parquet and arrow, rows are buffered and written in row groups of row_group_size rows,
+  and metadata is stored in the schema under the 'af3tools' key as JSON.
+  """
+
+  def __init__(self, output_file: str, columns: list[str], output_format: str = "tsv",
+      metadata: dict = None, text_columns: int = 2,
+      row_group_size: int = ROW_GROUP_SIZE):
+    """
+    :param output_file: output file, '-' for standard output
+    :param columns: column names
+    :param output_format: output format, one of FORMATS
+    :param metadata: metadata written in parquet and arrow outputs, must be serializable to JSON
+    :param text_columns: number of leading columns containing strings
+    :param row_group_size: number of rows per row group for parquet and arrow outputs
+    """
+    if output_format not in FORMATS:
+      raise AssertionError(f"output_format must be one of {FORMATS}")
+    if row_group_size < 1:
+      raise AssertionError("row_group_size value must be at least 1")
+    self.output_file = output_file
+    self.columns = columns
+    self.output_format = output_format
+    self.metadata = metadata if metadata is not None else {}
+    self.text_columns = text_columns
+    self.row_group_size = row_group_size
+    self.rows = []
+    self._stack = contextlib.ExitStack()
+    self._output = None
+    self._writer = None
+
+  def __enter__(self):
+    if self.output_format == "tsv":
+      self._output = self._stack.enter_context(
+          open(self.output_file, "w") if self.output_file != "-" else contextlib.nullcontext(sys.stdout))
+      self._output.write("\t".join(self.columns))
+      self._output.write("\n")
+      return self
+    pa = import_pyarrow()
+    metadata = {"version": tool_version(), **self.metadata}
+    schema = pa.schema([pa.field(column, pa.string()) for column in self.columns[:self.text_columns]]
+                       + [pa.field(column, pa.float64()) for column in self.columns[self.text_columns:]],
+                       metadata={METADATA_KEY: json.dumps(metadata)})
+    sink = self.output_file if self.output_file != "-" else sys.stdout.buffer
+    if self.output_format == "parquet":
+      self._writer = pa.parquet.ParquetWriter(sink, schema)
+    else:
+      self._writer = pa.ipc.new_file(sink, schema)
+    self._stack.callback(self._writer.close)
+    self.schema = schema
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    try:
+      if exc_type is None:
+        self.flush()
+    finally:
+      self._stack.close()
+    return False
+
+  def write(self, row: list):
+    """
+    Writes a row, for parquet and arrow outputs, the row is buffered until row_group_size rows are buffered.
+
+    :param row: text columns followed by scores, missing scores are either NA or None
+    """
+    if self._output is not None:
+      self._output.write("\t".join(NA if value is None else str(value) for value in row))
+      self._output.write("\n")
+      return
+    self.rows.append(row)
+    if len(self.rows) >= self.row_group_size:
+      self.flush()
+
+  def flush(self):
+    """
+    Writes buffered rows as a row group.
+    """
+    if self._writer is None or not self.rows:
+      return
+    pa = import_pyarrow()
+    arrays = []
+    for index in range(len(self.columns)):
+      if index < self.text_columns:
+        arrays.append(pa.array([row[index] for row in self.rows], type=pa.string()))
+      else:
+        arrays.append(pa.array([to_float(row[index]) for row in self.rows], type=pa.float64()))
+    self._writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+    self.rows = []
+
+
+def read_metadata(output_file: str) -> dict:
+  """
+  Returns metadata of a parquet or arrow output written by :class:`ScoreWriter`.
+
+  :param output_file: parquet or arrow output
+  :return: metadata
+  """
+  pa = import_pyarrow()
+  try:
+    schema = pa.parquet.read_schema(output_file)
+  except pa.ArrowInvalid:
+    with pa.ipc.open_file(output_file) as reader:
+      schema = reader.schema
+  return json.loads(schema.metadata[METADATA_KEY])
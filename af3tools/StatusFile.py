@@ -0,0 +1,240 @@
+import concurrent.futures
+import json
+import os
+import tempfile
+import threading
+import time
+
+FORMATS = ["json", "prometheus"]
+PROMETHEUS_PREFIX = "af3score"
+# Name, type and help of metrics written in Prometheus textfile format.
+PROMETHEUS_METRICS = [
+  ("total", "gauge", "Scoring tasks submitted"),
+  ("done", "gauge", "Scoring tasks completed successfully"),
+  ("failed", "gauge", "Scoring tasks that failed"),
+  ("in_flight", "gauge", "Scoring tasks currently running in workers"),
+  ("throughput", "gauge", "Tasks completed per second since start"),
+  ("recent_throughput", "gauge", "Tasks completed per second since previous status"),
+  ("eta_seconds", "gauge", "Estimated seconds before all submitted tasks complete"),
+  ("workers", "gauge", "Worker processes"),
+  ("worker_rss_bytes", "gauge", "Resident memory of all worker processes"),
+  ("worker_rss_max_bytes", "gauge", "Resident memory of largest worker process"),
+  ("read_bytes_per_second", "gauge", "Bytes read per second by this process and its workers since previous status"),
+  ("elapsed_seconds", "gauge", "Seconds since start"),
+  ("finished", "gauge", "1 when scoring is finished"),
+]
+
+
+def status_format(status_file: str) -> str:
+  """
+  Returns format of status file based on its extension, '.prom' files use Prometheus textfile format.
+
+  :param status_file: status file
+  :return: format of status file, one of FORMATS
+  """
+  return "prometheus" if status_file.endswith(".prom") else "json"
+
+
+def child_pids(pid: int = None) -> list[int]:
+  """
+  Returns ids of child processes.
+
+  :param pid: parent process id, defaults to current process
+  :return: ids of child processes, empty if /proc is not available
+  """
+  pid = pid if pid is not None else os.getpid()
+  children = []
+  try:
+    entries = os.listdir("/proc")
+  except OSError:
+    return children
+  for entry in entries:
+    if not entry.isdigit():
+      continue
+    try:
+      with open(f"/proc/{entry}/stat", "rb") as stat_in:
+        stat = stat_in.read()
+    except OSError:
+      continue
+    # Command name is in parentheses and can contain spaces.
+    fields = stat[stat.rindex(b")") + 2:].split()
+    if int(fields[1]) == pid:
+      children.append(int(entry))
+  return children
+
+
+def process_rss(pid: int) -> int:
+  """
+  Returns resident memory of process in bytes.
+
+  :param pid: process id
+  :return: resident memory of process in bytes, 0 if process does not exist anymore
+  """
+  try:
+    with open(f"/proc/{pid}/status", "rb") as status_in:
+      for line in status_in:
+        if line.startswith(b"VmRSS:"):
+          return int(line.split()[1]) * 1024
+  except OSError:
+    pass
+  return 0
+
+
+def process_read_bytes(pid: int) -> int:
+  """
+  Returns bytes read by process, including reads served from page cache and network file systems.
+
+  :param pid: process id
+  :return: bytes read by process, 0 if process does not exist anymore
+  """
+  try:
+    with open(f"/proc/{pid}/io", "rb") as io_in:
+      for line in io_in:
+        if line.startswith(b"rchar:"):
+          return int(line.split()[1])
+  except OSError:
+    pass
+  return 0
+
+
+class StatusReporter:
+  """
+  Periodically writes progress and resource usage of scoring tasks to a status file.
+
+  The status file is replaced atomically, so readers never see a partial file.
+  """
+
+  def __init__(self, status_file: str, interval: float = 30, output_format: str = None):
+    """
+    :param status_file: status file
+    :param interval: seconds between writes of status file
+    :param output_format: one of FORMATS, defaults to format based on extension, see :func:`status_format`
+    """
+    output_format = output_format if output_format else status_format(status_file)
+    if output_format not in FORMATS:
+      raise AssertionError(f"output_format must be one of {FORMATS}")
+    if interval <= 0:
+      raise AssertionError("interval must be greater than 0")
+    self.status_file = status_file
+    self.interval = interval
+    self.output_format = output_format
+    self.total = 0
+    self.done = 0
+    self.failed = 0
+    self.futures = []
+    self.finished = False
+    self.start = time.monotonic()
+    self._previous = (self.start, 0)
+    self._read_bytes = {os.getpid(): process_read_bytes(os.getpid())}
+    self._lock = threading.Lock()
+    self._stop = threading.Event()
+    self._thread = None
+
+  def __enter__(self):
+    self._thread = threading.Thread(target=self._run, daemon=True)
+    self._thread.start()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self._stop.set()
+    self._thread.join()
+    self.finished = True
+    self.write()
+    return False
+
+  def _run(self):
+    while not self._stop.wait(self.interval):
+      self.write()
+
+  def track(self, futures: list[concurrent.futures.Future]):
+    """
+    Count futures in submitted tasks and update counts of done and failed tasks when they complete.
+
+    :param futures: futures of submitted tasks
+    """
+    with self._lock:
+      self.total += len(futures)
+      self.futures.extend(futures)
+    for future in futures:
+      future.add_done_callback(self._completed)
+
+  def _completed(self, future: concurrent.futures.Future):
+    failed = future.cancelled() or future.exception() is not None
+    with self._lock:
+      if failed:
+        self.failed += 1
+      else:
+        self.done += 1
+
+  def status(self) -> dict:
+    """
+    Returns current status.
+
+    :return: current status
+    """
+    now = time.monotonic()
+    with self._lock:
+      self.futures = [future for future in self.futures if not future.done()]
+      in_flight = len([future for future in self.futures if future.running()])
+      total, done, failed = self.total, self.done, self.failed
+    completed = done + failed
+    elapsed = now - self.start
+    previous_time, previous_completed = self._previous
+    self._previous = (now, completed)
+    throughput = completed / elapsed if elapsed > 0 else 0
+    recent_throughput = ((completed - previous_completed) / (now - previous_time)
+                         if now > previous_time else throughput)
+    rate = recent_throughput if recent_throughput > 0 else throughput
+    workers = child_pids()
+    rss = [process_rss(pid) for pid in workers]
+    read_bytes = {pid: process_read_bytes(pid) for pid in workers + [os.getpid()]}
+    read_delta = sum(max(read_bytes[pid] - self._read_bytes.get(pid, 0), 0) for pid in read_bytes)
+    self._read_bytes = read_bytes
+    return {
+      "time": time.time(),
+      "elapsed_seconds": round(elapsed, 3),
+      "total": total,
+      "done": done,
+      "failed": failed,
+      "in_flight": in_flight,
+      "throughput": round(throughput, 3),
+      "recent_throughput": round(recent_throughput, 3),
+      "eta_seconds": round((total - completed) / rate, 1) if rate > 0 else None,
+      "workers": len(workers),
+      "worker_rss_bytes": sum(rss),
+      "worker_rss_max_bytes": max(rss, default=0),
+      "read_bytes_per_second": round(read_delta / (now - previous_time), 1) if now > previous_time else 0,
+      "finished": self.finished,
+    }
+
+  def write(self):
+    """
+    Write current status to status file.
+    """
+    status = self.status()
+    directory = os.path.dirname(os.path.abspath(self.status_file))
+    with tempfile.NamedTemporaryFile("w", dir=directory, prefix=".status-", delete=False) as status_out:
+      if self.output_format == "json":
+        json.dump(status, status_out)
+        status_out.write("\n")
+      else:
+        write_prometheus(status_out, status)
+    os.replace(status_out.name, self.status_file)
+
+
+def write_prometheus(status_out, status: dict):
+  """
+  Writes status in Prometheus textfile format, for the node exporter textfile collector.
+
+  :param status_out: output file
+  :param status: status, see :meth:`StatusReporter.status`
+  """
+  for name, metric_type, description in PROMETHEUS_METRICS:
+    value = status[name]
+    if value is None:
+      value = "NaN"
+    elif isinstance(value, bool):
+      value = int(value)
+    status_out.write(f"# HELP {PROMETHEUS_PREFIX}_{name} {description}\n")
+    status_out.write(f"# TYPE {PROMETHEUS_PREFIX}_{name} {metric_type}\n")
+    status_out.write(f"{PROMETHEUS_PREFIX}_{name} {value}\n")
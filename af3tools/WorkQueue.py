@@ -0,0 +1,323 @@
+import json
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable
+
+PENDING = "pending"
+CLAIMED = "claimed"
+DONE = "done"
+RESULTS = "results"
+ERRORS = "errors"
+LOCK = "queue.lock"
+MERGE_LOCK = "merge.lock"
+QUEUE_INFO = "queue.json"
+
+logger = logging.getLogger("WorkQueue")
+
+
+class Batch:
+  def __init__(self, queue_dir: str, name: str, worker: str, items: list[str]):
+    self.queue_dir = queue_dir
+    self.name = name
+    self.worker = worker
+    self.items = items
+
+  @property
+  def path(self) -> str:
+    return os.path.join(self.queue_dir, CLAIMED, f"{self.name}@{self.worker}")
+
+
+def worker_id() -> str:
+  """
+  Returns an identifier for the current process that is unique across nodes.
+
+  :return: identifier of current process
+  """
+  return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def exists(queue_dir: str) -> bool:
+  """
+  Returns True if queue was initialized.
+
+  :param queue_dir: queue directory
+  :return: True if queue was initialized, False otherwise
+  """
+  return os.path.isdir(os.path.join(queue_dir, PENDING))
+
+
+def init_queue(queue_dir: str, items: Iterable[str], batch_size: int = 50,
+    wait: float = 1, parameters: dict = None) -> bool:
+  """
+  Initialize queue by splitting items into batches of batch_size items.
+
+  Only one process initializes the queue, other processes wait until the queue is initialized.
+
+  :param queue_dir: queue directory
+  :param items: items to process, usually confidence files
+  :param batch_size: number of items per batch
+  :param wait: seconds to wait between checks when another process is initializing the queue
+  :param parameters: parameters shared by all jobs using the queue, see :func:`check_parameters`
+  :return: True if this process initialized the queue, False otherwise
+  """
+  if batch_size < 1:
+    raise AssertionError("batch_size value must be at least 1")
+  os.makedirs(queue_dir, exist_ok=True)
+  try:
+    os.close(os.open(os.path.join(queue_dir, LOCK),
+                     os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+  except FileExistsError:
+    while not exists(queue_dir):
+      time.sleep(wait)
+    return False
+
+  for directory in [CLAIMED, DONE, RESULTS, ERRORS]:
+    os.makedirs(os.path.join(queue_dir, directory), exist_ok=True)
+  staging = tempfile.mkdtemp(prefix=".pending-", dir=queue_dir)
+  items = list(items)
+  batches = 0
+  for index, start in enumerate(range(0, len(items), batch_size)):
+    with open(os.path.join(staging, f"batch-{index:06d}.txt"), "w") as batch_out:
+      for item in items[start:start + batch_size]:
+        batch_out.write(item)
+        batch_out.write("\n")
+    batches += 1
+  with tempfile.NamedTemporaryFile("w", dir=queue_dir, prefix=".queue-", delete=False) as info_out:
+    json.dump({"batches": batches, "parameters": parameters if parameters else {}}, info_out)
+  os.replace(info_out.name, os.path.join(queue_dir, QUEUE_INFO))
+  # Rename is atomic, other processes never see a partially written queue.
+  os.rename(staging, os.path.join(queue_dir, PENDING))
+  logger.debug(f"Initialized queue {queue_dir} with {len(items)} items")
+  return True
+
+
+def reclaim_expired(queue_dir: str, lease: float) -> int:
+  """
+  Move batches whose lease expired back to pending batches.
+
+  :param queue_dir: queue directory
+  :param lease: lease duration in seconds
+  :return: number of reclaimed batches
+  """
+  reclaimed = 0
+  now = time.time()
+  claimed_dir = os.path.join(queue_dir, CLAIMED)
+  for claimed in os.listdir(claimed_dir):
+    claimed_path = os.path.join(claimed_dir, claimed)
+    try:
+      if now - os.stat(claimed_path).st_mtime <= lease:
+        continue
+      name = claimed.split("@")[0]
+      os.rename(claimed_path, os.path.join(queue_dir, PENDING, name))
+      logger.info(f"Reclaimed expired batch {claimed}")
+      reclaimed += 1
+    except FileNotFoundError:
+      # Batch completed or reclaimed by another process.
+      continue
+  return reclaimed
+
+
+def claim_batch(queue_dir: str, worker: str = None,
+    lease: float = 3600) -> Batch | None:
+  """
+  Claim the next pending batch.
+
+  :param queue_dir: queue directory
+  :param worker: worker identifier, defaults to :func:`worker_id`
+  :param lease: lease duration in seconds, batches claimed for longer than lease are reclaimed
+  :return: claimed batch or None if no batch is pending
+  """
+  worker = worker if worker else worker_id()
+  reclaim_expired(queue_dir, lease)
+  pending_dir = os.path.join(queue_dir, PENDING)
+  for name in sorted(os.listdir(pending_dir)):
+    batch = Batch(queue_dir, name, worker, [])
+    pending_path = os.path.join(pending_dir, name)
+    try:
+      # Rename keeps modification time, so the lease must start before the batch appears in claimed,
+      # otherwise another process could reclaim it immediately.
+      os.utime(pending_path)
+      os.rename(pending_path, batch.path)
+      with open(batch.path, "r") as batch_in:
+        batch.items = [line.rstrip("\r\n") for line in batch_in if line.strip()]
+    except FileNotFoundError:
+      # Claimed by another process.
+      continue
+    return batch
+  return None
+
+
+def renew_lease(batch: Batch) -> bool:
+  """
+  Renew lease on batch.
+
+  :param batch: batch
+  :return: True if lease was renewed, False if batch was reclaimed by another process
+  """
+  try:
+    os.utime(batch.path)
+    return True
+  except FileNotFoundError:
+    return False
+
+
+@contextmanager
+def heartbeat(batch: Batch, interval: float):
+  """
+  Renew lease on batch every interval seconds while in context.
+
+  :param batch: batch
+  :param interval: seconds between renewals
+  """
+  stop = threading.Event()
+
+  def renew():
+    while not stop.wait(interval):
+      if not renew_lease(batch):
+        logger.warning(f"Lost lease on batch {batch.name}")
+
+  thread = threading.Thread(target=renew, daemon=True)
+  thread.start()
+  try:
+    yield batch
+  finally:
+    stop.set()
+    thread.join()
+
+
+def result_path(queue_dir: str, name: str, directory: str = RESULTS) -> str:
+  """
+  Returns path of result file for batch.
+
+  :param queue_dir: queue directory
+  :param name: batch name
+  :param directory: directory containing result files, either RESULTS or ERRORS
+  :return: path of result file for batch
+  """
+  return os.path.join(queue_dir, directory, name)
+
+
+def complete_batch(batch: Batch, result_file: str = None,
+    error_file: str = None):
+  """
+  Mark batch as completed.
+
+  :param batch: batch
+  :param result_file: temporary file containing results of batch, moved to results directory
+  :param error_file: temporary file containing errors of batch, moved to errors directory
+  """
+  if result_file:
+    os.replace(result_file, result_path(batch.queue_dir, batch.name))
+  if error_file:
+    os.makedirs(os.path.join(batch.queue_dir, ERRORS), exist_ok=True)
+    os.replace(error_file, result_path(batch.queue_dir, batch.name, ERRORS))
+  try:
+    os.rename(batch.path, os.path.join(batch.queue_dir, DONE, batch.name))
+  except FileNotFoundError:
+    # Lease expired and batch was reclaimed, results are identical if both processes complete.
+    logger.warning(f"Batch {batch.name} was reclaimed before completion")
+
+
+def queue_info(queue_dir: str) -> dict:
+  """
+  Returns number of batches and parameters of queue.
+
+  :param queue_dir: queue directory
+  :return: dictionary with number of batches and parameters of queue
+  """
+  with open(os.path.join(queue_dir, QUEUE_INFO), "r") as info_in:
+    return json.load(info_in)
+
+
+def check_parameters(queue_dir: str, parameters: dict):
+  """
+  Check that parameters match the parameters used to create the queue.
+
+  Results of all batches are merged into a single output, so all jobs must compute the same scores.
+
+  :param queue_dir: queue directory
+  :param parameters: parameters of current job
+  """
+  queue_parameters = queue_info(queue_dir)["parameters"]
+  # Compare through JSON to ignore differences between tuples and lists.
+  parameters = json.loads(json.dumps(parameters))
+  mismatches = sorted(key for key in set(queue_parameters) | set(parameters)
+                      if queue_parameters.get(key) != parameters.get(key))
+  if mismatches:
+    raise AssertionError(f"parameters {', '.join(mismatches)} differ from parameters used to create queue "
+                         f"{queue_dir}: {', '.join(f'{key}={queue_parameters.get(key)}' for key in mismatches)}")
+
+
+def is_drained(queue_dir: str) -> bool:
+  """
+  Returns True if all batches are done.
+
+  Pending and claimed batches are not checked, because a batch can move between them at any time.
+
+  :param queue_dir: queue directory
+  :return: True if all batches are done
+  """
+  return len(os.listdir(os.path.join(queue_dir, DONE))) >= queue_info(queue_dir)["batches"]
+
+
+def is_merged(queue_dir: str) -> bool:
+  """
+  Returns True if a process claimed the right to merge results.
+
+  :param queue_dir: queue directory
+  :return: True if results were merged or are being merged
+  """
+  return os.path.exists(os.path.join(queue_dir, MERGE_LOCK))
+
+
+def claim_merge(queue_dir: str) -> bool:
+  """
+  Claim the right to merge results, only one process obtains it.
+
+  :param queue_dir: queue directory
+  :return: True if this process should merge results
+  """
+  try:
+    os.close(os.open(os.path.join(queue_dir, MERGE_LOCK),
+                     os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    return True
+  except FileExistsError:
+    return False
+
+
+def results(queue_dir: str, directory: str = RESULTS) -> list[str]:
+  """
+  Returns result files of completed batches, in batch order.
+
+  :param queue_dir: queue directory
+  :param directory: directory containing result files, either RESULTS or ERRORS
+  :return: result files of completed batches
+  """
+  results_dir = os.path.join(queue_dir, directory)
+  if not os.path.isdir(results_dir):
+    return []
+  return [os.path.join(results_dir, name) for name in
+          sorted(os.listdir(results_dir))]
+
+
+def merge_results(queue_dir: str, output, header: str = None,
+    directory: str = RESULTS):
+  """
+  Concatenate results of all batches into output.
+
+  :param queue_dir: queue directory
+  :param output: output file
+  :param header: header to write before results
+  :param directory: directory containing result files, either RESULTS or ERRORS
+  """
+  if header:
+    output.write(header)
+  for result_file in results(queue_dir, directory):
+    with open(result_file, "r") as result_in:
+      shutil.copyfileobj(result_in, output)
@@ -0,0 +1,87 @@
+import concurrent.futures
+import logging
+import logging.handlers
+import multiprocessing
+import sys
+from contextlib import contextmanager
+
+LOG_FORMAT = "%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s"
+LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+
+
+class ForwardHandler(logging.Handler):
+  """Handler used by the listener of the parent process to send worker records to the parent's handlers."""
+
+  def emit(self, record: logging.LogRecord):
+    logger = logging.getLogger(record.name)
+    if logger.isEnabledFor(record.levelno):
+      logger.handle(record)
+
+
+def configure(log_file: str = "-", level: str = "INFO"):
+  """
+  Configure logging of the parent process.
+
+  :param log_file: log file, '-' for standard error
+  :param level: minimum level of logged records, one of LEVELS
+  """
+  if level not in LEVELS:
+    raise AssertionError(f"level must be one of {LEVELS}")
+  if log_file and log_file != "-":
+    logging.basicConfig(filename=log_file, level=level, format=LOG_FORMAT)
+  else:
+    logging.basicConfig(stream=sys.stderr, level=level, format=LOG_FORMAT)
+
+
+def init_worker(queue, level: int, initializer=None, initargs: tuple = ()):
+  """
+  Send all records of a worker process to queue, used as initializer of process pools.
+
+  Records below level are dropped in the worker, so disabled log calls only cost a level check.
+
+  :param queue: queue read by the listener of the parent process
+  :param level: minimum level of records sent to the parent process
+  :param initializer: additional initializer called after logging is configured
+  :param initargs: arguments passed to initializer
+  """
+  root = logging.getLogger()
+  for handler in list(root.handlers):
+    root.removeHandler(handler)
+  root.addHandler(logging.handlers.QueueHandler(queue))
+  root.setLevel(level)
+  if initializer:
+    initializer(*initargs)
+
+
+@contextmanager
+def log_listener():
+  """
+  Start a listener that logs records received from worker processes using the handlers of this process.
+
+  :return: queue to give to :func:`init_worker`
+  """
+  queue = multiprocessing.Queue(-1)
+  listener = logging.handlers.QueueListener(queue, ForwardHandler())
+  listener.start()
+  try:
+    yield queue
+  finally:
+    listener.stop()
+    queue.close()
+    queue.join_thread()
+
+
+@contextmanager
+def process_pool(max_workers: int, initializer=None, initargs: tuple = ()):
+  """
+  Process pool whose workers log through the parent process.
+
+  :param max_workers: number of worker processes
+  :param initializer: additional initializer of worker processes
+  :param initargs: arguments passed to initializer
+  :return: process pool executor
+  """
+  with log_listener() as queue, concurrent.futures.ProcessPoolExecutor(
+      max_workers=max_workers, initializer=init_worker,
+      initargs=(queue, logging.getLogger().getEffectiveLevel(), initializer, initargs)) as executor:
+    yield executor
@@ -1,16 +1,16 @@
 import argparse
 import csv
-import glob
-import json
 import logging
 import os
 import re
 import statistics
 import sys
-from typing import Tuple
+from typing import Iterator, Tuple
 
 import tqdm
 
+from af3tools import Af3Archive, Af3Files, ScoreOutput
+
 
 class LIS:
   def __init__(self, name: str,
@@ -62,6 +62,12 @@ def dir_path(string: str):
     raise NotADirectoryError(string)
 
 
+def input_path(string: str):
+  if Af3Archive.is_archive(string) and os.path.isfile(string):
+    return string
+  return dir_path(string)
+
+
 logger = logging.getLogger("af3lis")
 METRICS = ["iptm", "ptm", "lis"]
 
@@ -72,10 +78,15 @@ def main(argv: list[str] = None):
 
   parser = argparse.ArgumentParser(
     description="Extract ipTM score (or other) from summary confidence JSON files generated by AlphaFold 3.")
-  parser.add_argument("-i", "--input", type=dir_path, default="",
-                      help="Base directory to look for summary confidence JSON files  (default: current directory)")
+  parser.add_argument("-i", "--input", type=input_path, default="",
+                      help="Base directory to look for summary confidence JSON files, or tar archive "
+                           "(.tar, .tar.gz, .tgz, .tar.zst or .tar.xz) read without extracting it "
+                           " (default: current directory)")
   parser.add_argument("-o", "--output", type=writable_path, default="-",
                       help="Tab delimited output file containing scores  (default: standard output '-')")
+  parser.add_argument("-f", "--format", choices=ScoreOutput.FORMATS, default=ScoreOutput.FORMATS[0],
+                      help="Format of output file, parquet and arrow outputs are typed and contain "
+                           "scoring parameters as metadata  (default: %(default)s)")
   parser.add_argument("-m", "--metrics", nargs="+", choices=METRICS,
                       default=[METRICS[0]],
                       help="Metrics to output  (default: %(default)s)")
@@ -100,6 +111,9 @@ def main(argv: list[str] = None):
   parser.add_argument("-C", "--converted_column", type=int, default="2",
                       help="Column index of converted names in mapping file - 1 means first column of file" +
                            "   (default: %(default)s)")
+  parser.add_argument("--json-backend", choices=Af3Files.JSON_BACKENDS, default="auto",
+                      help="Parser used to load JSON files, auto uses orjson when it is installed "
+                           " (default: %(default)s)")
 
   args = parser.parse_args(argv)
 
@@ -112,7 +126,9 @@ def main(argv: list[str] = None):
             progress=args.progress,
             mapping_file=args.mapping,
             source_column=args.source_column - 1,
-            converted_column=args.converted_column - 1)
+            converted_column=args.converted_column - 1,
+            output_format=args.format,
+            json_backend=args.json_backend)
 
 
 def af3_score(input_dir: str = "",
@@ -122,11 +138,13 @@ def af3_score(input_dir: str = "",
     lis_file: str = "structures/structures_lis_analysis.csv",
     progress: bool = False,
     mapping_file: str = None, source_column: int = 0,
-    converted_column: int = 1):
+    converted_column: int = 1,
+    output_format: str = "tsv", json_backend: str = "auto"):
   """
   Extract ipTM score (or other) from summary confidence JSON files generated by AlphaFold 3.
 
-  :param input_dir: input directory
+  :param input_dir: input directory, or tar archive read in a single sequential pass,
+                    see :func:`Af3Archive.iter_predictions`
   :param output_file: output file
   :param name: regular expression to obtain protein/gene names based on confidence filename
   :param metrics: metrics to output
@@ -137,6 +155,8 @@ def af3_score(input_dir: str = "",
   :param mapping_file: tab delimited text file used to convert names
   :param source_column: column index of source names in mapping file
   :param converted_column: column index of converted names in mapping file
+  :param output_format: format of output file, one of ScoreOutput.FORMATS
+  :param json_backend: parser used to load JSON files, one of Af3Files.JSON_BACKENDS
   """
   if metrics is None:
     metrics = [METRICS[0]]
@@ -147,16 +167,20 @@ def af3_score(input_dir: str = "",
       f"metrics values must all be present in {METRICS}")
   if not lis_file:
     raise AssertionError("lis_file parameter is required")
+  if output_format not in ScoreOutput.FORMATS:
+    raise AssertionError(f"output_format must be one of {ScoreOutput.FORMATS}")
+  Af3Files.set_json_backend(json_backend)
 
   # Find AlphaFold 3 confidence files.
-  confidence_files = sorted(
-    glob.glob("**/*_summary_confidences.json", root_dir=input_dir,
-              recursive=True))
-  seed_pattern = re.compile(r"seed-\d+_sample-\d+")
-  confidence_files = [confidence_file for confidence_file in confidence_files if
-                      not seed_pattern.search(confidence_file)]
-  confidence_files = [os.path.join(input_dir, confidence_file) for
-                      confidence_file in confidence_files]
+  if Af3Archive.is_archive(input_dir):
+    confidence_files = archive_confidence_files(input_dir)
+  else:
+    confidence_files = Af3Files.glob_files("**/*_summary_confidences.json", root_dir=input_dir)
+    seed_pattern = re.compile(r"seed-\d+_sample-\d+")
+    confidence_files = [confidence_file for confidence_file in confidence_files if
+                        not seed_pattern.search(confidence_file)]
+    confidence_files = [os.path.join(input_dir, confidence_file) for
+                        confidence_file in confidence_files]
 
   # Parse mapping.
   mappings = {}
@@ -175,19 +199,19 @@ def af3_score(input_dir: str = "",
                             sequence_two))
 
   # Write to output
-  with open(output_file,
-            "w") if output_file != "-" else sys.stdout as output_file_out:
-    output_file_out.write("Bait\tTarget")
-    for metric in metrics:
-      if "iptm" == metric:
-        output_file_out.write("\tipTM")
-      elif "ptm" == metric:
-        output_file_out.write("\tpTM")
-      elif "ranking_score" == metric:
-        output_file_out.write("\tRanking score")
-      elif "lis" == metric:
-        output_file_out.write("\tiLIS\tLIS\tLIA")
-    output_file_out.write("\n")
+  columns = ["Bait", "Target"]
+  for metric in metrics:
+    if "iptm" == metric:
+      columns.append("ipTM")
+    elif "ptm" == metric:
+      columns.append("pTM")
+    elif "lis" == metric:
+      columns.extend(["iLIS", "LIS", "LIA"])
+  metadata = {"tool": "af3-lis", "metrics": metrics,
+              "sequence1": sequence_one + 1, "sequence2": sequence_two + 1,
+              "name": name, "lis_file": lis_file}
+  with ScoreOutput.ScoreWriter(output_file, columns, output_format,
+                               metadata) as writer:
     for confidence_file, scores in all_scores:
       re_match = re.search(name, confidence_file)
       if not re_match:
@@ -196,10 +220,34 @@ def af3_score(input_dir: str = "",
       bait, target = re_match.group(1, 2)
       bait = mappings[bait] if bait in mappings else bait
       target = mappings[target] if target in mappings else target
-      output_file_out.write(f"{bait}\t{target}")
-      for score in scores:
-        output_file_out.write(f"\t{score}")
-      output_file_out.write("\n")
+      writer.write([bait, target, *scores])
+
+
+def archive_confidence_files(archive: str) -> Iterator[str]:
+  """
+  Returns summary confidence files of predictions present in archive, reading archive in a single sequential pass.
+
+  Files of a prediction are read from memory until the next summary confidence file is returned,
+  see :func:`Af3Files.memory_files`.
+
+  :param archive: tar archive, see :data:`Af3Archive.ARCHIVE_EXTENSIONS`
+  :return: summary confidence files of predictions, in archive order
+  """
+  for confidence_file, files in Af3Archive.iter_predictions(archive, archive_member_needed):
+    with Af3Files.memory_files(files):
+      yield confidence_file
+
+
+def archive_member_needed(name: str) -> bool:
+  """
+  Returns True if member of an archive is read by :func:`get_confidence_scores`.
+
+  :param name: name of member, without compression extension
+  :return: True if member must be read
+  """
+  if Af3Archive.SEED_PATTERN.search(name):
+    return False
+  return name.endswith("_summary_confidences.json") or name.endswith("_data.json")
 
 
 def get_confidence_scores(confidence_file: str, metrics: list[str] = None,
@@ -314,12 +362,7 @@ def parse_mapping(mapping_file: str, source_column: int = 0,
 
 
 def load_json(file) -> dict:
-  with open(file, "r") as file_in:
-    try:
-      return json.load(file_in)
-    except json.decoder.JSONDecodeError as e:
-      logger.error(f"Error loading JSON file {file}")
-      raise e
+  return Af3Files.load_json(file)
 
 
 if __name__ == "__main__":
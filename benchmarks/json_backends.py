@@ -0,0 +1,47 @@
+"""
+Compare time needed to load AlphaFold 3 JSON files using each JSON backend.
+
+Usage: python benchmarks/json_backends.py [-r REPEAT] FILE [FILE ...]
+
+Use *_confidences.json files, which contain the PAE and contact probabilities matrices and dominate loading time.
+Files are read once before timing, so timings measure parsing and not the file system.
+"""
+import argparse
+import os
+import sys
+import time
+
+from af3tools import Af3Files
+
+
+def main(argv: list[str] = None):
+  parser = argparse.ArgumentParser(description="Compare time needed to load JSON files using each JSON backend.")
+  parser.add_argument("files", nargs="+", help="JSON files generated by AlphaFold 3")
+  parser.add_argument("-r", "--repeat", type=int, default=5,
+                      help="Number of times each file is parsed by each backend (default: %(default)s)")
+  args = parser.parse_args(argv)
+
+  documents = []
+  for file in args.files:
+    with open(file, "rb") as file_in:
+      documents.append(file_in.read())
+  size = sum(len(document) for document in documents)
+  backends = ["json"] + (["orjson"] if Af3Files.import_orjson() is not None else [])
+  sys.stdout.write(f"{len(documents)} files, {size / 1e6:.1f} MB, {args.repeat} repeats\n")
+  sys.stdout.write("Backend\tSeconds per file\tMB/s\tSpeedup\n")
+  baseline = None
+  for backend in backends:
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+      for document in documents:
+        Af3Files.loads(document, backend)
+    elapsed = (time.perf_counter() - start) / args.repeat
+    baseline = baseline if baseline else elapsed
+    sys.stdout.write(f"{backend}\t{elapsed / len(documents):.4f}\t{size / elapsed / 1e6:.1f}"
+                     f"\t{baseline / elapsed:.2f}\n")
+  if len(backends) == 1:
+    sys.stdout.write("orjson is not installed, install it using 'pip install af3-tools[fastjson]'\n")
+
+
+if __name__ == "__main__":
+  main()
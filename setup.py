@@ -20,11 +20,19 @@ setup(
     "scipy>=1.16.2",
     "tqdm>=4.67.1"
   ],
+  extras_require={
+    "columnar": ["pyarrow>=17.0.0"],
+    "fastjson": ["orjson>=3.8.3"],
+    "xxhash": ["xxhash>=3.0.0"],
+    "zstd": ["zstandard>=0.22.0"],
+  },
   entry_points={
     "console_scripts": [
       "af3-lis = af3tools.af3lis:main",
       "af3-score = af3tools.Af3Score:main",
+      "compact-outputs = af3tools.CompactOutputs:main",
       "delete-fasta = af3tools.DeleteFasta:main",
+      "extract-bundle = af3tools.ExtractBundle:main",
       "fasta-id = af3tools.FastaId:main",
       "fasta-to-json-sequence = af3tools.FastaToJsonSequence:main",
       "id-convert = af3tools.IdConvert:main",
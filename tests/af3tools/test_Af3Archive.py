@@ -0,0 +1,130 @@
+import io
+import logging
+import os
+import tarfile
+
+import pytest
+
+from af3tools import Af3Archive
+
+
+def add_member(tar: tarfile.TarFile, name: str, content: bytes):
+  member = tarfile.TarInfo(name)
+  member.size = len(content)
+  tar.addfile(member, io.BytesIO(content))
+
+
+def create_archive(archive: str, names: list[str], mode: str = "w"):
+  with tarfile.open(archive, mode) as tar:
+    for name in names:
+      add_member(tar, name, name.encode())
+
+
+def test_is_archive():
+  assert Af3Archive.is_archive("predictions.tar")
+  assert Af3Archive.is_archive("predictions.tar.zst")
+  assert Af3Archive.is_archive("predictions.tgz")
+  assert not Af3Archive.is_archive("predictions")
+  assert not Af3Archive.is_archive("A__B_data.json.gz")
+  assert not Af3Archive.is_archive("")
+
+
+def test_prediction_directory():
+  assert Af3Archive.prediction_directory("A__B/A__B_model.cif") == "A__B"
+  assert Af3Archive.prediction_directory("out/A__B/seed-1_sample-0/model.cif") == "out/A__B"
+  assert Af3Archive.prediction_directory("A__B_data.json") == ""
+
+
+@pytest.mark.parametrize("archive,mode", [("predictions.tar", "w"), ("predictions.tar.gz", "w:gz"),
+                                          ("predictions.tar.xz", "w:xz")])
+def test_iter_predictions(testdir, archive, mode):
+  create_archive(archive, [
+    "A__B/A__B_summary_confidences.json", "A__B/A__B_data.json", "A__B/TERMS_OF_USE.md",
+    "A__B/seed-1_sample-0/confidences.json", "A__C/A__C_data.json.gz", "A__C/A__C_summary_confidences.json.gz",
+    "A__D/TERMS_OF_USE.md"], mode)
+  predictions = list(Af3Archive.iter_predictions(archive, lambda name: not name.endswith(".md")))
+  assert [confidence_file for confidence_file, files in predictions] == [
+    "A__B/A__B_summary_confidences.json", "A__C/A__C_summary_confidences.json"]
+  assert predictions[0][1] == {
+    "A__B/A__B_summary_confidences.json": b"A__B/A__B_summary_confidences.json",
+    "A__B/A__B_data.json": b"A__B/A__B_data.json",
+    "A__B/seed-1_sample-0/confidences.json": b"A__B/seed-1_sample-0/confidences.json"}
+  assert list(predictions[1][1]) == ["A__C/A__C_data.json.gz", "A__C/A__C_summary_confidences.json.gz"]
+
+
+def test_iter_predictions_zstd(testdir):
+  zstandard = pytest.importorskip("zstandard")
+  create_archive("predictions.tar", ["A__B/A__B_summary_confidences.json", "A__B/A__B_data.json"])
+  with open("predictions.tar", "rb") as tar_in, zstandard.open("predictions.tar.zst", "wb") as tar_out:
+    tar_out.write(tar_in.read())
+  predictions = list(Af3Archive.iter_predictions("predictions.tar.zst", lambda name: name.endswith("_data.json")
+                                                 or name.endswith("_summary_confidences.json")))
+  assert [confidence_file for confidence_file, files in predictions] == ["A__B/A__B_summary_confidences.json"]
+  assert predictions[0][1]["A__B/A__B_data.json"] == b"A__B/A__B_data.json"
+
+
+def test_iter_predictions_not_together(testdir, caplog):
+  create_archive("predictions.tar", ["A__B/A__B_data.json", "A__C/A__C_summary_confidences.json",
+                                     "A__B/A__B_summary_confidences.json"])
+  with caplog.at_level(logging.WARNING):
+    predictions = list(Af3Archive.iter_predictions("predictions.tar", lambda name: True))
+  assert [confidence_file for confidence_file, files in predictions] == [
+    "A__C/A__C_summary_confidences.json", "A__B/A__B_summary_confidences.json"]
+  assert "A__B/A__B_data.json" not in predictions[1][1]
+  assert "not stored together" in caplog.text
+
+
+def test_volume_path():
+  assert Af3Archive.volume_path("out.tar.zst", 1) == "out.001.tar.zst"
+  assert Af3Archive.volume_path("backup/out.tar", 12) == "backup/out.012.tar"
+  with pytest.raises(AssertionError):
+    Af3Archive.volume_path("out.zip", 0)
+
+
+@pytest.mark.parametrize("archive", ["out.tar", "out.tgz", "out.tar.xz", "out.tar.zst"])
+def test_archive_writer(testdir, archive):
+  if archive.endswith(".zst"):
+    pytest.importorskip("zstandard")
+  os.makedirs("A__B/seed-1_sample-0")
+  contents = {"A__B/A__B_summary_confidences.json": b'{"iptm": 0.76}',
+              "A__B/seed-1_sample-0/confidences.json": os.urandom(3000),
+              "A__B/A__B_data.json": b"{}" * 1500}
+  for name, content in contents.items():
+    with open(name, "wb") as file_out:
+      file_out.write(content)
+  # Small blocks so members span many compressed blocks.
+  with Af3Archive.ArchiveWriter(archive, threads=3, block_size=1024) as writer:
+    for name in contents:
+      writer.add(name)
+  predictions = list(Af3Archive.iter_predictions(archive, lambda name: True))
+  assert predictions == [("A__B/A__B_summary_confidences.json", contents)]
+  index = Af3Archive.read_index(f"{archive}.index")
+  assert list(index) == list(contents)
+  for name, content in contents.items():
+    assert index[name][0] == archive
+    assert Af3Archive.read_member(index[name]) == content
+
+
+def test_archive_writer_volumes(testdir):
+  for name in ["a", "b", "c"]:
+    with open(f"{name}.json", "wb") as file_out:
+      file_out.write(name.encode() * 4000)
+  with Af3Archive.ArchiveWriter("out.tar.gz", volume_size=10000) as writer:
+    for name in ["a", "b", "c"]:
+      writer.add(f"{name}.json")
+  assert sorted(name for name in os.listdir() if name.startswith("out.")) == [
+    "out.000.tar.gz", "out.001.tar.gz", "out.tar.gz.index"]
+  with Af3Archive.open_archive("out.001.tar.gz") as tar:
+    assert [member.name for member in Af3Archive.iter_members(tar)] == ["c.json"]
+  index = Af3Archive.read_index("out.tar.gz.index")
+  assert [index[name][0] for name in ["a.json", "b.json", "c.json"]] == [
+    "out.000.tar.gz", "out.000.tar.gz", "out.001.tar.gz"]
+  assert Af3Archive.read_member(index["c.json"]) == b"c" * 4000
+
+
+def test_archive_writer_empty(testdir):
+  with Af3Archive.ArchiveWriter("out.tar.gz"):
+    pass
+  with Af3Archive.open_archive("out.tar.gz") as tar:
+    assert list(Af3Archive.iter_members(tar)) == []
+  assert Af3Archive.read_index("out.tar.gz.index") == {}
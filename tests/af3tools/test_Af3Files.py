@@ -0,0 +1,134 @@
+import gzip
+import json
+import lzma
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from af3tools import Af3Files
+
+
+@pytest.fixture
+def mock_testclass():
+  _json_backend = Af3Files.json_backend
+  yield
+  Af3Files.json_backend = _json_backend
+
+
+def test_set_json_backend(mock_testclass):
+  Af3Files.set_json_backend("json")
+  assert Af3Files.json_backend == "json"
+  assert Af3Files.resolved_json_backend() == "json"
+  with pytest.raises(AssertionError):
+    Af3Files.set_json_backend("simdjson")
+
+
+def test_set_json_backend_orjson_missing(mock_testclass):
+  with patch.object(Af3Files, "import_orjson", return_value=None):
+    with pytest.raises(ImportError):
+      Af3Files.set_json_backend("orjson")
+    Af3Files.set_json_backend("auto")
+    assert Af3Files.resolved_json_backend() == "json"
+    assert Af3Files.loads(b'{"iptm": 0.76}') == {"iptm": 0.76}
+
+
+@pytest.mark.parametrize("backend", Af3Files.JSON_BACKENDS)
+def test_loads(backend, mock_testclass):
+  if backend == "orjson":
+    pytest.importorskip("orjson")
+  Af3Files.set_json_backend(backend)
+  assert Af3Files.loads(b'{"pae": [[0.1, 1.5], [2, 0]], "token_chain_ids": ["A", "B"]}') == {
+    "pae": [[0.1, 1.5], [2, 0]], "token_chain_ids": ["A", "B"]}
+
+
+def test_loads_nan(mock_testclass):
+  pytest.importorskip("orjson")
+  # orjson rejects NaN, auto backend falls back to json module.
+  assert Af3Files.loads(b'{"pae": [NaN]}', "auto")["pae"][0] != 0
+  with pytest.raises(json.JSONDecodeError):
+    Af3Files.loads(b'{"pae": [NaN]}', "orjson")
+
+
+@pytest.mark.parametrize("backend", Af3Files.JSON_BACKENDS)
+def test_load_json_invalid(testdir, backend, mock_testclass):
+  if backend == "orjson":
+    pytest.importorskip("orjson")
+  with open("truncated.json", "w") as json_out:
+    json_out.write('{"pae": [[0.1, ')
+  with pytest.raises(json.JSONDecodeError):
+    Af3Files.load_json("truncated.json", backend)
+
+
+def compress_file(path: str, extension: str, content: bytes):
+  if extension == ".gz":
+    with gzip.open(path + extension, "wb") as compressed_out:
+      compressed_out.write(content)
+  elif extension == ".xz":
+    with lzma.open(path + extension, "wb") as compressed_out:
+      compressed_out.write(content)
+  else:
+    zstandard = pytest.importorskip("zstandard")
+    with zstandard.open(path + extension, "wb") as compressed_out:
+      compressed_out.write(content)
+
+
+def test_compression():
+  assert Af3Files.compression("A__B_model.cif.gz") == ".gz"
+  assert Af3Files.compression("A__B_data.json.zst") == ".zst"
+  assert Af3Files.compression("A__B_data.json") is None
+  assert Af3Files.strip_compression("A__B_data.json.xz") == "A__B_data.json"
+  assert Af3Files.strip_compression("A__B_data.json") == "A__B_data.json"
+
+
+@pytest.mark.parametrize("extension", Af3Files.COMPRESSIONS)
+def test_open_file_compressed(testdir, extension, mock_testclass):
+  compress_file("A__B_summary_confidences.json", extension, b'{"iptm": 0.76}')
+  assert Af3Files.resolve("A__B_summary_confidences.json") == "A__B_summary_confidences.json" + extension
+  assert Af3Files.exists("A__B_summary_confidences.json")
+  assert Af3Files.load_json("A__B_summary_confidences.json") == {"iptm": 0.76}
+  with Af3Files.open_file("A__B_summary_confidences.json" + extension, "rt") as file_in:
+    assert file_in.read() == '{"iptm": 0.76}'
+
+
+def test_open_file_plain_first(testdir, mock_testclass):
+  with open("A__B_summary_confidences.json", "w") as json_out:
+    json_out.write('{"iptm": 0.5}')
+  compress_file("A__B_summary_confidences.json", ".gz", b'{"iptm": 0.76}')
+  assert Af3Files.load_json("A__B_summary_confidences.json") == {"iptm": 0.5}
+
+
+def test_open_file_missing(testdir):
+  assert not Af3Files.exists("A__B_model.cif")
+  with pytest.raises(FileNotFoundError):
+    Af3Files.open_file("A__B_model.cif")
+  with pytest.raises(AssertionError):
+    Af3Files.open_file("A__B_model.cif", "w")
+
+
+def test_glob_files(testdir):
+  os.makedirs("A__B/seed-1_sample-0")
+  Path("A__B/A__B_summary_confidences.json").touch()
+  compress_file("A__C_summary_confidences.json", ".gz", b"{}")
+  compress_file("A__B/seed-1_sample-0/summary_confidences.json", ".xz", b"{}")
+  assert Af3Files.glob_files("**/*summary_confidences.json") == [
+    "A__B/A__B_summary_confidences.json", "A__B/seed-1_sample-0/summary_confidences.json",
+    "A__C_summary_confidences.json"]
+
+
+def test_memory_files(testdir):
+  Path("A__B_summary_confidences.json").touch()
+  files = {"A__B/A__B_summary_confidences.json.gz": gzip.compress(b'{"iptm": 0.76}'),
+           "A__B/seed-1_sample-0/confidences.json": b'{"pae": []}'}
+  with Af3Files.memory_files(files):
+    assert not Af3Files.exists("A__B_summary_confidences.json")
+    assert Af3Files.exists("A__B/A__B_summary_confidences.json")
+    assert Af3Files.load_json("A__B/A__B_summary_confidences.json") == {"iptm": 0.76}
+    with Af3Files.open_file("A__B/seed-1_sample-0/confidences.json", "rt") as file_in:
+      assert file_in.read() == '{"pae": []}'
+    assert Af3Files.glob_files("**/confidences.json", root_dir="A__B") == ["seed-1_sample-0/confidences.json"]
+    assert Af3Files.glob_files("**/*_summary_confidences.json") == ["A__B/A__B_summary_confidences.json"]
+    with pytest.raises(FileNotFoundError):
+      Af3Files.open_file("A__B/A__B_model.cif")
+  assert Af3Files.exists("A__B_summary_confidences.json")
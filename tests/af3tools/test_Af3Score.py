@@ -1,14 +1,21 @@
 import concurrent.futures
+import gzip
 import shutil
 import io
+import json
+import lzma
 import os
+import pickle
+import re
 import statistics
+import tarfile
+import threading
 from pathlib import Path
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, create_autospec, patch
 
 import pytest
 
-from af3tools import Af3Score, Af3LocalInteractionScore
+from af3tools import Af3Score, Af3LocalInteractionScore, Prefetch, Profiler, ScoreOutput, WorkerLogging, WorkQueue
 
 
 @pytest.fixture
@@ -18,12 +25,14 @@ def mock_testclass():
   _get_sequence_index = Af3Score.get_sequence_index
   _parse_mapping = Af3Score.parse_mapping
   _local_interaction_score = Af3LocalInteractionScore.local_interaction_score
+  _configure = WorkerLogging.configure
   yield
   Af3Score.af3_score = _af3_score
   Af3Score.get_confidence_scores = _get_confidence_scores
   Af3Score.get_sequence_index = _get_sequence_index
   Af3Score.parse_mapping = _parse_mapping
   Af3LocalInteractionScore.local_interaction_score = _local_interaction_score
+  WorkerLogging.configure = _configure
 
 
 def create_alphafold3_files(alphafold_output, name):
@@ -51,11 +60,21 @@ def test_main(testdir, mock_testclass):
       metrics=["iptm"],
       sequence_one=0, sequence_two=1,
       progress=False,
-      mapping_file=None, source_column=0, converted_column=1, threads=1)
+      mapping_file=None, source_column=0, converted_column=1, threads=1,
+      queue_dir=None, batch_size=50, lease=3600,
+      errors_file=None, retry_failed=None, gate=None, top=None,
+      matrix_file=None, samples_file=None, aggregate_file=None,
+      output_format="tsv", profile=None,
+      status_file=None, status_interval=30, prefetch=0, json_backend="auto")
 
 
 def test_main_parameters(testdir, mock_testclass):
   output = "output.txt"
+  output_format = "parquet"
+  profile = "af3score"
+  status = "status.prom"
+  status_interval = 5
+  prefetch = 512
   metrics = ["iptm", "ranking_score"]
   name = r"(\w+)_(\w+)"
   mapping = "mapping.txt"
@@ -65,23 +84,41 @@ def test_main_parameters(testdir, mock_testclass):
   source_column = 2
   converted_column = 3
   threads = 2
+  errors = "errors.txt"
+  retry = "retry.txt"
+  Path(retry).touch()
+  gate = "iptm>=0.4"
+  top = 5
+  matrix = "matrix.txt"
+  samples = "samples.txt"
+  aggregate = "aggregate.txt"
   Af3Score.af3_score = MagicMock()
   Af3Score.main(
-      ["-i", str(testdir), "-o", output, "-m", metrics[0], metrics[1], "-n",
+      ["-i", str(testdir), "-o", output, "-f", output_format, "-P", profile, "--status", status, "--status-interval", str(status_interval), "--prefetch", str(prefetch), "--json-backend", "json", "-m", metrics[0], metrics[1], "-n",
        name, "-1", str(sequence_one), "-2", str(sequence_two), "-p",
        "-M", mapping, "-S", str(source_column + 1), "-C",
-       str(converted_column + 1), "-t", str(threads)])
+       str(converted_column + 1), "-t", str(threads), "-e", errors, "-r", retry,
+       "-g", gate, "-k", str(top), "-x", matrix, "-s", samples, "-a", aggregate])
   Af3Score.af3_score.assert_called_once_with(
       input_dir=str(testdir), output_file=output, name=name,
       metrics=metrics,
       sequence_one=sequence_one - 1, sequence_two=sequence_two - 1,
       progress=True,
       mapping_file=mapping, source_column=source_column, converted_column=converted_column,
-      threads=threads)
+      threads=threads, queue_dir=None, batch_size=50, lease=3600,
+      errors_file=errors, retry_failed=retry, gate=gate, top=top,
+      matrix_file=matrix, samples_file=samples, aggregate_file=aggregate,
+      output_format=output_format, profile=profile,
+      status_file=status, status_interval=status_interval, prefetch=prefetch, json_backend="json")
 
 
 def test_main_long_parameters(testdir, mock_testclass):
   output = "output.txt"
+  output_format = "parquet"
+  profile = "af3score"
+  status = "status.prom"
+  status_interval = 5
+  prefetch = 512
   metrics = ["iptm", "ranking_score"]
   name = r"(\w+)_(\w+)"
   mapping = "mapping.txt"
@@ -91,20 +128,74 @@ def test_main_long_parameters(testdir, mock_testclass):
   source_column = 2
   converted_column = 3
   threads = 2
+  errors = "errors.txt"
+  retry = "retry.txt"
+  Path(retry).touch()
+  gate = "iptm>=0.4"
+  top = 5
+  matrix = "matrix.txt"
+  samples = "samples.txt"
+  aggregate = "aggregate.txt"
   Af3Score.af3_score = MagicMock()
   Af3Score.main(
-      ["--input", str(testdir), "--output", output, "--metric", metrics[0],
+      ["--input", str(testdir), "--output", output, "--format", output_format, "--profile", profile, "--status", status, "--status-interval", str(status_interval), "--prefetch", str(prefetch), "--json-backend", "json", "--metric", metrics[0],
        metrics[1],
        "--name", name, "--sequence1", str(sequence_one), "--sequence2", str(sequence_two), "--progress",
        "--mapping", mapping, "--source_column", str(source_column + 1),
-       "--converted_column", str(converted_column + 1), "--threads", str(threads)])
+       "--converted_column", str(converted_column + 1), "--threads", str(threads),
+       "--errors", errors, "--retry-failed", retry, "--gate", gate, "--top", str(top),
+       "--matrix", matrix, "--samples", samples, "--aggregate", aggregate])
   Af3Score.af3_score.assert_called_once_with(
       input_dir=str(testdir), output_file=output, name=name,
       metrics=metrics,
       sequence_one=sequence_one - 1, sequence_two=sequence_two - 1,
       progress=True,
       mapping_file=mapping, source_column=source_column, converted_column=converted_column,
-      threads=threads)
+      threads=threads, queue_dir=None, batch_size=50, lease=3600,
+      errors_file=errors, retry_failed=retry, gate=gate, top=top,
+      matrix_file=matrix, samples_file=samples, aggregate_file=aggregate,
+      output_format=output_format, profile=profile,
+      status_file=status, status_interval=status_interval, prefetch=prefetch, json_backend="json")
+
+
+def test_main_log(testdir, mock_testclass):
+  Af3Score.af3_score = MagicMock()
+  WorkerLogging.configure = MagicMock()
+  Af3Score.main([])
+  WorkerLogging.configure.assert_called_once_with("af3score.log", "INFO")
+  WorkerLogging.configure.reset_mock()
+  Af3Score.main(["-l", "-", "--log-level", "DEBUG"])
+  WorkerLogging.configure.assert_called_once_with("-", "DEBUG")
+  WorkerLogging.configure.reset_mock()
+  Af3Score.main(["--log", "scores.log", "--log-level", "WARNING"])
+  WorkerLogging.configure.assert_called_once_with("scores.log", "WARNING")
+
+
+def test_main_queue(testdir, mock_testclass):
+  Af3Score.af3_score = MagicMock()
+  Af3Score.main(["-Q", "queue", "--batch-size", "10", "--lease", "60"])
+  Af3Score.af3_score.assert_called_once_with(
+      input_dir="", output_file="-",
+      name=r"([\w-]+)__([\w-]+)_summary_confidences",
+      metrics=["iptm"],
+      sequence_one=0, sequence_two=1,
+      progress=False,
+      mapping_file=None, source_column=0, converted_column=1, threads=1,
+      queue_dir="queue", batch_size=10, lease=60,
+      errors_file=None, retry_failed=None, gate=None, top=None,
+      matrix_file=None, samples_file=None, aggregate_file=None,
+      output_format="tsv", profile=None,
+      status_file=None, status_interval=30, prefetch=0, json_backend="auto")
+
+
+def test_main_strict(testdir, mock_testclass):
+  Af3Score.af3_score = MagicMock(return_value=2)
+  Af3Score.main([])
+  with pytest.raises(SystemExit) as exit_info:
+    Af3Score.main(["--strict"])
+  assert exit_info.value.code == 1
+  Af3Score.af3_score = MagicMock(return_value=0)
+  Af3Score.main(["--strict"])
 
 
 def test_main_no_metrics(testdir, mock_testclass):
@@ -132,10 +223,9 @@ def test_af3_score(testdir, mock_testclass):
   executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
   with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
     Af3Score.af3_score(output_file=output)
-  Af3Score.get_sequence_index.assert_any_call(confidence_file_1, 0, 1)
-  Af3Score.get_sequence_index.assert_any_call(confidence_file_2, 0, 1)
+  Af3Score.get_sequence_index.assert_not_called()
   Af3Score.get_confidence_scores.assert_any_call(confidence_file_1, ["iptm"], 0, 1)
-  Af3Score.get_confidence_scores.assert_any_call(confidence_file_2, ["iptm"], 3, 2)
+  Af3Score.get_confidence_scores.assert_any_call(confidence_file_2, ["iptm"], 0, 1)
   Af3Score.parse_mapping.assert_not_called()
   with open(output, "r") as output_in:
     assert output_in.readline() == "Bait\tTarget\tipTM\n"
@@ -170,10 +260,9 @@ def test_af3_score_parameters(testdir, mock_testclass):
                        r"([\w-]+)___([\w-]+)_summary_confidences",
                        metrics, 1, 2, False, mappings_file,
                        2, 3)
-  Af3Score.get_sequence_index.assert_any_call(confidence_file_1, 1, 2)
-  Af3Score.get_sequence_index.assert_any_call(confidence_file_2, 1, 2)
-  Af3Score.get_confidence_scores.assert_any_call(confidence_file_1, metrics, 0, 1)
-  Af3Score.get_confidence_scores.assert_any_call(confidence_file_2, metrics, 3, 2)
+  Af3Score.get_sequence_index.assert_not_called()
+  Af3Score.get_confidence_scores.assert_any_call(confidence_file_1, metrics, 1, 2)
+  Af3Score.get_confidence_scores.assert_any_call(confidence_file_2, metrics, 1, 2)
   Af3Score.parse_mapping.assert_called_once_with(mappings_file, 2, 3)
   with open(output, "r") as output_in:
     assert output_in.readline() == "Bait\tTarget\tipTM\tpTM\tRanking score\n"
@@ -202,18 +291,79 @@ def test_af3_score_failure(testdir, mock_testclass):
   Af3Score.get_confidence_scores = MagicMock(side_effect=[[0.7772, 0.7059, 0.8952],
                                                           AssertionError("error on second call")])
   Af3Score.parse_mapping = MagicMock(return_value=mappings)
+  errors = "errors.txt"
   executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
   with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
-    with pytest.raises(AssertionError):
-      Af3Score.af3_score("confidences", output,
-                       r"([\w-]+)___([\w-]+)_summary_confidences",
-                       metrics, 1, 2, False, mappings_file,
-                       2, 3)
-  Af3Score.get_sequence_index.assert_any_call(confidence_file_1, 1, 2)
-  Af3Score.get_sequence_index.assert_any_call(confidence_file_2, 1, 2)
-  Af3Score.get_confidence_scores.assert_any_call(confidence_file_1, metrics, 0, 1)
-  Af3Score.get_confidence_scores.assert_any_call(confidence_file_2, metrics, 3, 2)
+    assert Af3Score.af3_score("confidences", output,
+                              r"([\w-]+)___([\w-]+)_summary_confidences",
+                              metrics, 1, 2, False, mappings_file,
+                              2, 3, errors_file=errors) == 1
+  Af3Score.get_sequence_index.assert_not_called()
+  Af3Score.get_confidence_scores.assert_any_call(confidence_file_1, metrics, 1, 2)
+  Af3Score.get_confidence_scores.assert_any_call(confidence_file_2, metrics, 1, 2)
   Af3Score.parse_mapping.assert_called_once_with(mappings_file, 2, 3)
+  with open(output, "r") as output_in:
+    assert output_in.readline() == "Bait\tTarget\tipTM\tpTM\tRanking score\n"
+    assert output_in.readline() == "POLR2A\tPOLR2B\t0.7772\t0.7059\t0.8952\n"
+    assert output_in.readline() == ""
+  with open(errors, "r") as errors_in:
+    assert errors_in.readline() == "File\tStage\tError\n"
+    assert errors_in.readline() == f"{confidence_file_2}\tscores\tAssertionError: error on second call\n"
+    assert errors_in.readline() == ""
+
+
+def test_af3_score_failure_stderr(testdir, mock_testclass, capsys):
+  confidence_file = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  Path(confidence_file).parent.mkdir()
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__hvm62_mouse_summary_confidences.json"),
+      confidence_file)
+  output = "output.txt"
+  Af3Score.get_sequence_index = MagicMock(side_effect=ValueError("'A' is not in list"))
+  Af3Score.get_confidence_scores = MagicMock()
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file=output, metrics=["lis"])
+  Af3Score.get_confidence_scores.assert_not_called()
+  out, err = capsys.readouterr()
+  assert err == ("File\tStage\tError\n"
+                 f"{confidence_file}\tsequence_index\tValueError: 'A' is not in list\n")
+  with open(output, "r") as output_in:
+    assert output_in.readline() == "Bait\tTarget\tiLIS\tLIS\tLIA\n"
+    assert output_in.readline() == ""
+
+
+def test_af3_score_retry_failed(testdir, mock_testclass):
+  confidence_file_1 = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  confidence_file_2 = "POLR2A__POLR2C/POLR2A__POLR2C_summary_confidences.json"
+  Path(confidence_file_1).parent.mkdir()
+  Path(confidence_file_2).parent.mkdir()
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__hvm62_mouse_summary_confidences.json"),
+      confidence_file_1)
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__znrf1_mouse_summary_confidences.json"),
+      confidence_file_2)
+  retry = "retry.txt"
+  with open(retry, "w") as retry_out:
+    retry_out.write("File\tStage\tError\n")
+    retry_out.write(f"{confidence_file_2}\tscores\tJSONDecodeError: Expecting value\n")
+  output = "output.txt"
+  errors = "errors.txt"
+  Af3Score.get_sequence_index = MagicMock(return_value=[0, 1])
+  Af3Score.get_confidence_scores = MagicMock(return_value=[0.7601])
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file=output, errors_file=errors, retry_failed=retry)
+  Af3Score.get_sequence_index.assert_not_called()
+  Af3Score.get_confidence_scores.assert_called_once_with(confidence_file_2, ["iptm"], 0, 1)
+  with open(output, "r") as output_in:
+    assert output_in.readline() == "Bait\tTarget\tipTM\n"
+    assert output_in.readline() == "POLR2A\tPOLR2C\t0.7601\n"
+    assert output_in.readline() == ""
+  with open(errors, "r") as errors_in:
+    assert errors_in.readline() == "File\tStage\tError\n"
+    assert errors_in.readline() == ""
 
 
 def test_af3_score_progress(testdir, mock_testclass):
@@ -241,10 +391,9 @@ def test_af3_score_progress(testdir, mock_testclass):
     mock_tqdm.assert_called_once_with(total=len(confidence_files))
     assert tqdm_list.__enter__().update.call_count == 2
     tqdm_list.__enter__().update.assert_any_call(1)
-  Af3Score.get_sequence_index.assert_any_call(confidence_file_1, 0, 1)
-  Af3Score.get_sequence_index.assert_any_call(confidence_file_2, 0, 1)
+  Af3Score.get_sequence_index.assert_not_called()
   Af3Score.get_confidence_scores.assert_any_call(confidence_file_1, ["iptm"], 0, 1)
-  Af3Score.get_confidence_scores.assert_any_call(confidence_file_2, ["iptm"], 3, 2)
+  Af3Score.get_confidence_scores.assert_any_call(confidence_file_2, ["iptm"], 0, 1)
   Af3Score.parse_mapping.assert_not_called()
   with open(output, "r") as output_in:
     assert output_in.readline() == "Bait\tTarget\tipTM\n"
@@ -252,6 +401,616 @@ def test_af3_score_progress(testdir, mock_testclass):
     assert output_in.readline() == "POLR2A\tPOLR2C\t0.7601\n"
 
 
+def test_af3_score_queue(testdir, mock_testclass):
+  confidence_files = [f"POLR2A__POLR2{c}/POLR2A__POLR2{c}_summary_confidences.json" for c in "BCDE"]
+  for confidence_file in confidence_files:
+    Path(confidence_file).parent.mkdir()
+    shutil.copy(Path(__file__).parent.joinpath(
+        "fab53__hvm62_mouse_summary_confidences.json"),
+        confidence_file)
+  output = "output.txt"
+  Af3Score.get_sequence_index = MagicMock(return_value=[0, 1])
+  Af3Score.get_confidence_scores = MagicMock(side_effect=[[0.1], [0.2], [0.3], [0.4]])
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file=output, queue_dir="queue", batch_size=3)
+  assert sorted(os.listdir("queue/done")) == ["batch-000000.txt", "batch-000001.txt"]
+  assert os.listdir("queue/pending") == []
+  assert os.listdir("queue/claimed") == []
+  with open(output, "r") as output_in:
+    assert output_in.readline() == "Bait\tTarget\tipTM\n"
+    assert output_in.readline() == "POLR2A\tPOLR2B\t0.1\n"
+    assert output_in.readline() == "POLR2A\tPOLR2C\t0.2\n"
+    assert output_in.readline() == "POLR2A\tPOLR2D\t0.3\n"
+    assert output_in.readline() == "POLR2A\tPOLR2E\t0.4\n"
+    assert output_in.readline() == ""
+
+
+def test_af3_score_parquet(testdir, mock_testclass):
+  pq = pytest.importorskip("pyarrow.parquet")
+  confidence_file_1 = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  confidence_file_2 = "POLR2A__POLR2C/POLR2A__POLR2C_summary_confidences.json"
+  Path(confidence_file_1).parent.mkdir()
+  Path(confidence_file_2).parent.mkdir()
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__hvm62_mouse_summary_confidences.json"),
+      confidence_file_1)
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__znrf1_mouse_summary_confidences.json"),
+      confidence_file_2)
+  output = "output.parquet"
+  Af3Score.get_sequence_index = MagicMock(return_value=[0, 1])
+  Af3Score.get_confidence_scores = MagicMock(side_effect=[[0.7772, 0.2, 0.1, 300.0], [0.7601, 0.3, 0.2, 200.0]])
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file=output, metrics=["iptm", "lis"], output_format="parquet")
+  table = pq.read_table(output)
+  assert table.column_names == ["Bait", "Target", "ipTM", "iLIS", "LIS", "LIA"]
+  assert table.column("Target").to_pylist() == ["POLR2B", "POLR2C"]
+  assert table.column("ipTM").to_pylist() == [0.7772, 0.7601]
+  assert table.column("LIA").to_pylist() == [300.0, 200.0]
+  metadata = ScoreOutput.read_metadata(output)
+  assert metadata["tool"] == "af3-score"
+  assert metadata["metrics"] == ["iptm", "lis"]
+  assert metadata["pae_cutoff"] == 12
+  assert metadata["distance_cutoff"] == 8
+
+
+def test_af3_score_profile(testdir, mock_testclass):
+  confidence_file_1 = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  confidence_file_2 = "POLR2A__POLR2C/POLR2A__POLR2C_summary_confidences.json"
+  Path(confidence_file_1).parent.mkdir()
+  Path(confidence_file_2).parent.mkdir()
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__hvm62_mouse_summary_confidences.json"),
+      confidence_file_1)
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__znrf1_mouse_summary_confidences.json"),
+      confidence_file_2)
+  output = "output.txt"
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file=output, metrics=["iptm", "ptm"], profile="run")
+  assert not Profiler.enabled
+  with open("run-profile.txt", "r") as report_in:
+    stages = [line.split("\t")[0:2] for line in report_in.readlines()[1:]]
+  assert ["discover", "all"] in stages
+  assert ["load_summary", "all"] in stages
+  assert ["write", "all"] in stages
+  assert [Profiler.TASK, "all"] in stages
+  with open("run-trace.json", "r") as trace_in:
+    trace = json.load(trace_in)
+  items = [event["args"]["item"] for event in trace["traceEvents"] if event["name"] == "load_summary"]
+  assert sorted(items) == [confidence_file_1, confidence_file_2]
+
+
+def test_af3_score_profile_failure(testdir, mock_testclass):
+  with patch.object(Af3Score, "find_confidence_files", side_effect=OSError("error")), \
+      patch("tempfile.mkdtemp", return_value=os.path.abspath("trace")) as mkdtemp:
+    os.mkdir("trace")
+    with pytest.raises(OSError):
+      Af3Score.af3_score(output_file="output.txt", profile="run")
+  mkdtemp.assert_called_once()
+  assert not Profiler.enabled
+  assert not os.path.exists("trace")
+  assert not os.path.exists("run-profile.txt")
+
+
+def test_af3_score_prefetch(testdir, mock_testclass):
+  confidence_file_1 = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  confidence_file_2 = "POLR2A__POLR2C/POLR2A__POLR2C_summary_confidences.json"
+  Path(confidence_file_1).parent.mkdir()
+  Path(confidence_file_2).parent.mkdir()
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__hvm62_mouse_summary_confidences.json"),
+      confidence_file_1)
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__znrf1_mouse_summary_confidences.json"),
+      confidence_file_2)
+  output = "output.txt"
+  release = threading.Event()
+  get_confidence_scores = Af3Score.get_confidence_scores
+
+  def wait_confidence_scores(*args):
+    release.wait(5)
+    return get_confidence_scores(*args)
+
+  Af3Score.get_confidence_scores = MagicMock(side_effect=wait_confidence_scores)
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor), \
+      patch.object(Prefetch, "read_file",
+                   side_effect=lambda path: (path == confidence_file_2 and release.set()) or 0) as read_file:
+    Af3Score.af3_score(output_file=output, prefetch=1)
+  # Second prediction is prefetched while the first one is scored.
+  read_file.assert_any_call(confidence_file_2)
+  with open(output, "r") as output_in:
+    assert output_in.readline() == "Bait\tTarget\tipTM\n"
+    assert output_in.readline() == "POLR2A\tPOLR2B\t0.76\n"
+    assert output_in.readline() == "POLR2A\tPOLR2C\t0.13\n"
+
+
+def test_af3_score_compressed(testdir, mock_testclass):
+  confidence_file_1 = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  confidence_file_2 = "POLR2A__POLR2C/POLR2A__POLR2C_summary_confidences.json"
+  Path(confidence_file_1).parent.mkdir()
+  Path(confidence_file_2).parent.mkdir()
+  with open(Path(__file__).parent.joinpath("fab53__hvm62_mouse_summary_confidences.json"), "rb") as json_in, \
+      gzip.open(f"{confidence_file_1}.gz", "wb") as json_out:
+    shutil.copyfileobj(json_in, json_out)
+  with open(Path(__file__).parent.joinpath("fab53__znrf1_mouse_summary_confidences.json"), "rb") as json_in, \
+      lzma.open(f"{confidence_file_2}.xz", "wb") as json_out:
+    shutil.copyfileobj(json_in, json_out)
+  output = "output.txt"
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file=output)
+  with open(output, "r") as output_in:
+    assert output_in.readline() == "Bait\tTarget\tipTM\n"
+    assert output_in.readline() == "POLR2A\tPOLR2B\t0.76\n"
+    assert output_in.readline() == "POLR2A\tPOLR2C\t0.13\n"
+    assert output_in.readline() == ""
+
+
+def test_get_chain_ids_compressed(testdir, mock_testclass):
+  with open(Path(__file__).parent.joinpath("ha_h5n1__bmp2_human_model.cif"), "rb") as cif_in, \
+      gzip.open("ha_h5n1__bmp2_human_model.cif.gz", "wb") as cif_out:
+    shutil.copyfileobj(cif_in, cif_out)
+  assert Af3Score.get_chain_ids("ha_h5n1__bmp2_human_model.cif") == ["HA", "BMP"]
+
+
+@pytest.mark.parametrize("archive,mode", [("predictions.tar", "w"), ("predictions.tar.gz", "w:gz")])
+def test_af3_score_archive(testdir, mock_testclass, archive, mode):
+  for pair, summary in [("POLR2A__POLR2B", "fab53__hvm62_mouse"), ("POLR2A__POLR2C", "fab53__znrf1_mouse")]:
+    os.makedirs(f"predictions/{pair}")
+    create_alphafold3_files(f"predictions/{pair}", pair)
+    shutil.copy(Path(__file__).parent.joinpath(f"{summary}_summary_confidences.json"),
+                f"predictions/{pair}/{pair}_summary_confidences.json")
+    shutil.copy(Path(__file__).parent.joinpath("ha_h5n1__bmp2_human_data.json"),
+                f"predictions/{pair}/{pair}_data.json")
+    shutil.copy(Path(__file__).parent.joinpath("ha_h5n1__bmp2_human_model.cif"),
+                f"predictions/{pair}/{pair}_model.cif")
+  with tarfile.open(archive, mode) as tar:
+    tar.add("predictions")
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(input_dir="predictions", output_file="directory.txt", metrics=["iptm", "chain_iptm"],
+                       threads=2)
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(input_dir=archive, output_file="archive.txt", metrics=["iptm", "chain_iptm"],
+                       threads=2)
+  with open("directory.txt", "r") as directory_in, open("archive.txt", "r") as archive_in:
+    lines = archive_in.readlines()
+    assert lines == directory_in.readlines()
+  assert len(lines) == 3
+
+
+def test_af3_score_archive_order(testdir, mock_testclass):
+  pairs = ["POLR2A__POLR2B", "POLR2A__POLR2C", "POLR2B__POLR2C"]
+  for pair in pairs:
+    os.makedirs(f"predictions/{pair}")
+    shutil.copy(Path(__file__).parent.joinpath("fab53__hvm62_mouse_summary_confidences.json"),
+                f"predictions/{pair}/{pair}_summary_confidences.json")
+  with tarfile.open("predictions.tar", "w") as tar:
+    for pair in reversed(pairs):
+      tar.add(f"predictions/{pair}")
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(input_dir="predictions", output_file="directory.txt")
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(input_dir="predictions.tar", output_file="archive.txt")
+  with open("directory.txt", "r") as directory_in, open("archive.txt", "r") as archive_in:
+    lines = archive_in.readlines()
+    assert lines == directory_in.readlines()
+  assert [line.split("\t")[:2] for line in lines[1:]] == [["POLR2A", "POLR2B"], ["POLR2A", "POLR2C"],
+                                                          ["POLR2B", "POLR2C"]]
+
+
+def test_af3_score_archive_gate(testdir, mock_testclass):
+  create_cascade_files()
+  with tarfile.open("predictions.tar", "w") as tar:
+    for directory in sorted(os.listdir()):
+      if directory.startswith("POLR2"):
+        tar.add(directory)
+  output = "output.txt"
+  Af3Score.get_sequence_index = MagicMock(return_value=[0, 1])
+  Af3Score.get_confidence_scores = MagicMock(side_effect=cascade_scores)
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(input_dir="predictions.tar", output_file=output, metrics=["lis", "ptm"], gate="iptm>=0.5")
+  assert Af3Score.get_confidence_scores.call_count == 9
+  with open(output, "r") as output_in:
+    assert output_in.readline() == "Bait\tTarget\tiLIS\tLIS\tLIA\tpTM\n"
+    assert output_in.readline() == "POLR2A\tPOLR2C\tNA\tNA\tNA\t0.8\n"
+    assert output_in.readline() == "POLR2A\tPOLR2D\t0.3\t0.2\t100\t0.8\n"
+    assert output_in.readline() == "POLR2A\tPOLR2E\t0.3\t0.2\t100\t0.8\n"
+    assert output_in.readline() == "POLR2B\tPOLR2C\t0.3\t0.2\t100\t0.8\n"
+    assert output_in.readline() == "POLR2B\tPOLR2D\tNA\tNA\tNA\t0.8\n"
+    assert output_in.readline() == "POLR2B\tPOLR2E\tNA\tNA\tNA\t0.8\n"
+    assert output_in.readline() == ""
+
+
+def test_af3_score_archive_invalid(testdir, mock_testclass):
+  with pytest.raises(AssertionError):
+    Af3Score.af3_score(input_dir="predictions.tar", top=1)
+  with pytest.raises(AssertionError):
+    Af3Score.af3_score(input_dir="predictions.tar.zst", samples_file="samples.txt")
+
+
+def test_archive_member_needed():
+  assert Af3Score.archive_member_needed("A__B/A__B_summary_confidences.json", ["iptm"])
+  assert not Af3Score.archive_member_needed("A__B/A__B_data.json", ["iptm"])
+  assert Af3Score.archive_member_needed("A__B/A__B_data.json", ["chain_iptm"])
+  assert Af3Score.archive_member_needed("A__B/A__B_model.cif", ["chain_iptm"])
+  assert not Af3Score.archive_member_needed("A__B/A__B_confidences.json", ["lis"])
+  assert Af3Score.archive_member_needed("A__B/A__B_confidences.json", ["best_lis"])
+  assert Af3Score.archive_member_needed("A__B/seed-1_sample-0/model.cif", ["lis"])
+  assert not Af3Score.archive_member_needed("A__B/seed-1_sample-0/model.cif", ["best_lis"])
+  assert not Af3Score.archive_member_needed("A__B/seed-1_sample-0/summary_confidences.json", ["iptm"])
+  assert not Af3Score.archive_member_needed("A__B/TERMS_OF_USE.md", Af3Score.METRICS)
+
+
+def test_input_path(testdir):
+  Path("predictions.tar.gz").touch()
+  assert Af3Score.input_path("predictions.tar.gz") == "predictions.tar.gz"
+  assert Af3Score.input_path("") == ""
+  with pytest.raises(NotADirectoryError):
+    Af3Score.input_path("missing.tar")
+
+
+def test_af3_score_invalid_prefetch(testdir, mock_testclass):
+  with pytest.raises(AssertionError):
+    Af3Score.af3_score(prefetch=-1)
+
+
+def test_prediction_files(testdir, mock_testclass):
+  confidence_file = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  Path(confidence_file).parent.mkdir()
+  create_alphafold3_files("POLR2A__POLR2B", "POLR2A__POLR2B")
+  assert Af3Score.prediction_files(confidence_file, ["iptm", "fraction_disordered"]) == [confidence_file]
+  assert Af3Score.prediction_files(confidence_file, ["iptm", "chain_iptm", "best_lis"]) == [
+    confidence_file, "POLR2A__POLR2B/POLR2A__POLR2B_data.json",
+    "POLR2A__POLR2B/POLR2A__POLR2B_confidences.json", "POLR2A__POLR2B/POLR2A__POLR2B_model.cif"]
+  files = Af3Score.prediction_files(confidence_file, ["lis"])
+  assert files[0:2] == [confidence_file, "POLR2A__POLR2B/POLR2A__POLR2B_data.json"]
+  assert sorted(files[2:]) == sorted([f"POLR2A__POLR2B/seed-1_sample-{sample}/{file}" for sample in range(5)
+                                      for file in ["confidences.json", "model.cif"]])
+
+
+def test_af3_score_status(testdir, mock_testclass):
+  confidence_file_1 = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  confidence_file_2 = "POLR2A__POLR2C/POLR2A__POLR2C_summary_confidences.json"
+  Path(confidence_file_1).parent.mkdir()
+  Path(confidence_file_2).parent.mkdir()
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__hvm62_mouse_summary_confidences.json"),
+      confidence_file_1)
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__znrf1_mouse_summary_confidences.json"),
+      confidence_file_2)
+  output = "output.txt"
+  Af3Score.get_confidence_scores = MagicMock(side_effect=[[0.7772], AssertionError("error")])
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file=output, errors_file="errors.txt", status_file="status.json")
+  with open("status.json", "r") as status_in:
+    status = json.load(status_in)
+  assert status["total"] == 2
+  assert status["done"] == 1
+  assert status["failed"] == 1
+  assert status["finished"] is True
+
+
+def test_af3_score_queue_parquet(testdir, mock_testclass):
+  pq = pytest.importorskip("pyarrow.parquet")
+  confidence_files = [f"POLR2A__POLR2{c}/POLR2A__POLR2{c}_summary_confidences.json" for c in "BCD"]
+  for confidence_file in confidence_files:
+    Path(confidence_file).parent.mkdir()
+    shutil.copy(Path(__file__).parent.joinpath(
+        "fab53__hvm62_mouse_summary_confidences.json"),
+        confidence_file)
+  output = "output.parquet"
+  Af3Score.get_sequence_index = MagicMock(return_value=[0, 1])
+  Af3Score.get_confidence_scores = MagicMock(side_effect=[[0.1], [0.2], [0.3]])
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file=output, queue_dir="queue", batch_size=2, output_format="parquet")
+  table = pq.read_table(output)
+  assert table.column("Target").to_pylist() == ["POLR2B", "POLR2C", "POLR2D"]
+  assert table.column("ipTM").to_pylist() == [0.1, 0.2, 0.3]
+
+
+def test_af3_score_invalid_format(testdir, mock_testclass):
+  with pytest.raises(AssertionError):
+    Af3Score.af3_score(output_format="csv")
+
+
+def test_af3_score_queue_existing(testdir, mock_testclass):
+  confidence_file = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  Path(confidence_file).parent.mkdir()
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__hvm62_mouse_summary_confidences.json"),
+      confidence_file)
+  output = "output.txt"
+  os.makedirs("queue/pending")
+  os.makedirs("queue/claimed")
+  os.makedirs("queue/done")
+  os.makedirs("queue/results")
+  with open("queue/pending/batch-000000.txt", "w") as batch_out:
+    batch_out.write(f"{confidence_file}\n")
+  with open("queue/results/batch-000001.txt", "w") as result_out:
+    result_out.write("POLR2A\tPOLR2C\t0.2\n")
+  Path("queue/done/batch-000001.txt").touch()
+  with open("queue/queue.json", "w") as info_out:
+    json.dump({"batches": 2, "parameters": {"metrics": ["iptm"], "sequence_one": 0, "sequence_two": 1,
+                                            "name": r"([\w-]+)__([\w-]+)", "gate": None}}, info_out)
+  Af3Score.get_sequence_index = MagicMock(return_value=[0, 1])
+  Af3Score.get_confidence_scores = MagicMock(return_value=[0.1])
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(input_dir="unused", output_file=output, queue_dir="queue")
+  Af3Score.get_confidence_scores.assert_called_once_with(confidence_file, ["iptm"], 0, 1)
+  with open(output, "r") as output_in:
+    assert output_in.readline() == "Bait\tTarget\tipTM\n"
+    assert output_in.readline() == "POLR2A\tPOLR2B\t0.1\n"
+    assert output_in.readline() == "POLR2A\tPOLR2C\t0.2\n"
+
+
+def test_af3_score_queue_parameters_mismatch(testdir, mock_testclass):
+  confidence_file = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  Path(confidence_file).parent.mkdir()
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__hvm62_mouse_summary_confidences.json"),
+      confidence_file)
+  Af3Score.get_sequence_index = MagicMock(return_value=[0, 1])
+  Af3Score.get_confidence_scores = MagicMock(return_value=[0.1])
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file="output.txt", queue_dir="queue")
+  with pytest.raises(AssertionError, match="metrics"):
+    Af3Score.af3_score(output_file="output.txt", metrics=["iptm", "ptm"], queue_dir="queue")
+
+
+def test_af3_score_queue_mappings_mismatch(testdir, mock_testclass):
+  confidence_file = "polr2a__polr2b/polr2a__polr2b_summary_confidences.json"
+  Path(confidence_file).parent.mkdir()
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__hvm62_mouse_summary_confidences.json"),
+      confidence_file)
+  with open("mapping.txt", "w") as mapping_out:
+    mapping_out.write("POLR2A\tRPB1\n")
+  with open("other_mapping.txt", "w") as mapping_out:
+    mapping_out.write("POLR2A\tRPB2\n")
+  Af3Score.get_sequence_index = MagicMock(return_value=[0, 1])
+  Af3Score.get_confidence_scores = MagicMock(return_value=[0.1])
+  WorkQueue.init_queue("queue", [confidence_file], parameters={
+    "metrics": ["iptm"], "sequence_one": 0, "sequence_two": 1, "name": r"([\w-]+)__([\w-]+)", "gate": None,
+    "mappings": Af3Score.mappings_digest(Af3Score.parse_mapping("mapping.txt"))})
+  with pytest.raises(AssertionError, match="mappings"):
+    Af3Score.af3_score(output_file="output.txt", metrics=["iptm"], queue_dir="queue")
+  with pytest.raises(AssertionError, match="mappings"):
+    Af3Score.af3_score(output_file="output.txt", metrics=["iptm"], queue_dir="queue", mapping_file="other_mapping.txt")
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file="output.txt", metrics=["iptm"], queue_dir="queue", mapping_file="mapping.txt")
+  with open("output.txt", "r") as output_in:
+    assert output_in.read() == "Bait\tTarget\tipTM\nRPB1\tpolr2b\t0.1\n"
+
+
+def test_mappings_digest():
+  assert Af3Score.mappings_digest({}) is None
+  assert Af3Score.mappings_digest({"A": "B", "C": "D"}) == Af3Score.mappings_digest({"C": "D", "A": "B"})
+  assert Af3Score.mappings_digest({"A": "B"}) != Af3Score.mappings_digest({"A": "C"})
+
+
+def test_af3_score_queue_merged(testdir, mock_testclass):
+  confidence_file = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  Path(confidence_file).parent.mkdir()
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__hvm62_mouse_summary_confidences.json"),
+      confidence_file)
+  Af3Score.get_sequence_index = MagicMock(return_value=[0, 1])
+  Af3Score.get_confidence_scores = MagicMock(return_value=[0.1])
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file="output.txt", queue_dir="queue")
+  os.remove("output.txt")
+  with pytest.raises(AssertionError, match="already merged"):
+    Af3Score.af3_score(output_file="output.txt", queue_dir="queue")
+  assert not os.path.exists("output.txt")
+
+
+def test_af3_score_queue_failure(testdir, mock_testclass):
+  confidence_file_1 = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  confidence_file_2 = "POLR2A__POLR2C/POLR2A__POLR2C_summary_confidences.json"
+  Path(confidence_file_1).parent.mkdir()
+  Path(confidence_file_2).parent.mkdir()
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__hvm62_mouse_summary_confidences.json"),
+      confidence_file_1)
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__znrf1_mouse_summary_confidences.json"),
+      confidence_file_2)
+  output = "output.txt"
+  errors = "errors.txt"
+  Af3Score.get_sequence_index = MagicMock(return_value=[0, 1])
+  Af3Score.get_confidence_scores = MagicMock(side_effect=[[0.7772], AssertionError("error")])
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    assert Af3Score.af3_score(output_file=output, errors_file=errors, queue_dir="queue", batch_size=1) == 1
+  with open(output, "r") as output_in:
+    assert output_in.readline() == "Bait\tTarget\tipTM\n"
+    assert output_in.readline() == "POLR2A\tPOLR2B\t0.7772\n"
+    assert output_in.readline() == ""
+  with open(errors, "r") as errors_in:
+    assert errors_in.readline() == "File\tStage\tError\n"
+    assert errors_in.readline() == f"{confidence_file_2}\tscores\tAssertionError: error\n"
+    assert errors_in.readline() == ""
+
+
+def test_af3_score_lis(testdir, mock_testclass):
+  confidence_file_1 = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  confidence_file_2 = "POLR2A__POLR2C/POLR2A__POLR2C_summary_confidences.json"
+  Path(confidence_file_1).parent.mkdir()
+  Path(confidence_file_2).parent.mkdir()
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__hvm62_mouse_summary_confidences.json"),
+      confidence_file_1)
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__znrf1_mouse_summary_confidences.json"),
+      confidence_file_2)
+  output = "output.txt"
+  Af3Score.get_sequence_index = MagicMock(side_effect=[[0, 1], [3, 2]])
+  Af3Score.get_confidence_scores = MagicMock(side_effect=[[0.7772, 0.3, 0.2, 100], [0.7601, 0.4, 0.3, 200]])
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file=output, metrics=["iptm", "lis"])
+  Af3Score.get_sequence_index.assert_any_call(confidence_file_1, 0, 1)
+  Af3Score.get_sequence_index.assert_any_call(confidence_file_2, 0, 1)
+  Af3Score.get_confidence_scores.assert_any_call(confidence_file_1, ["iptm", "lis"], 0, 1)
+  Af3Score.get_confidence_scores.assert_any_call(confidence_file_2, ["iptm", "lis"], 3, 2)
+  with open(output, "r") as output_in:
+    assert output_in.readline() == "Bait\tTarget\tipTM\tiLIS\tLIS\tLIA\n"
+    assert output_in.readline() == "POLR2A\tPOLR2B\t0.7772\t0.3\t0.2\t100\n"
+    assert output_in.readline() == "POLR2A\tPOLR2C\t0.7601\t0.4\t0.3\t200\n"
+
+
+def create_cascade_files():
+  confidence_files = [f"POLR2{bait}__POLR2{target}/POLR2{bait}__POLR2{target}_summary_confidences.json"
+                      for bait in "AB" for target in "CDE"]
+  for confidence_file in confidence_files:
+    Path(confidence_file).parent.mkdir()
+    shutil.copy(Path(__file__).parent.joinpath(
+        "fab53__hvm62_mouse_summary_confidences.json"),
+        confidence_file)
+  return confidence_files
+
+
+def cascade_scores(confidence_file, metrics, sequence_one, sequence_two):
+  iptm = {"AC": 0.2, "AD": 0.5, "AE": 0.6, "BC": 0.9, "BD": 0.1, "BE": 0.45}
+  pair = re.search(r"POLR2(\w)__POLR2(\w)_", confidence_file).group(1, 2)
+  scores = []
+  for metric in metrics:
+    if metric == "iptm":
+      scores.append(iptm["".join(pair)])
+    elif metric == "ptm":
+      scores.append(0.8)
+    else:
+      scores.extend([0.3, 0.2, 100])
+  return scores
+
+
+def test_af3_score_gate(testdir, mock_testclass):
+  confidence_files = create_cascade_files()
+  output = "output.txt"
+  Af3Score.get_sequence_index = MagicMock(return_value=[0, 1])
+  Af3Score.get_confidence_scores = MagicMock(side_effect=cascade_scores)
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file=output, metrics=["lis", "ptm"], gate="iptm>=0.5")
+  assert Af3Score.get_sequence_index.call_count == 3
+  for confidence_file in confidence_files:
+    Af3Score.get_confidence_scores.assert_any_call(confidence_file, ["ptm", "iptm"], 0, 1)
+  for index in [1, 2, 3]:
+    Af3Score.get_confidence_scores.assert_any_call(confidence_files[index], ["lis"], 0, 1)
+  assert Af3Score.get_confidence_scores.call_count == 9
+  with open(output, "r") as output_in:
+    assert output_in.readline() == "Bait\tTarget\tiLIS\tLIS\tLIA\tpTM\n"
+    assert output_in.readline() == "POLR2A\tPOLR2C\tNA\tNA\tNA\t0.8\n"
+    assert output_in.readline() == "POLR2A\tPOLR2D\t0.3\t0.2\t100\t0.8\n"
+    assert output_in.readline() == "POLR2A\tPOLR2E\t0.3\t0.2\t100\t0.8\n"
+    assert output_in.readline() == "POLR2B\tPOLR2C\t0.3\t0.2\t100\t0.8\n"
+    assert output_in.readline() == "POLR2B\tPOLR2D\tNA\tNA\tNA\t0.8\n"
+    assert output_in.readline() == "POLR2B\tPOLR2E\tNA\tNA\tNA\t0.8\n"
+    assert output_in.readline() == ""
+
+
+def test_af3_score_top(testdir, mock_testclass):
+  confidence_files = create_cascade_files()
+  output = "output.txt"
+  Af3Score.get_sequence_index = MagicMock(return_value=[0, 1])
+  Af3Score.get_confidence_scores = MagicMock(side_effect=cascade_scores)
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file=output, metrics=["iptm", "best_lis"], top=1)
+  for confidence_file in confidence_files:
+    Af3Score.get_confidence_scores.assert_any_call(confidence_file, ["iptm"], 0, 1)
+  Af3Score.get_confidence_scores.assert_any_call(confidence_files[2], ["best_lis"], 0, 1)
+  Af3Score.get_confidence_scores.assert_any_call(confidence_files[3], ["best_lis"], 0, 1)
+  assert Af3Score.get_confidence_scores.call_count == 8
+  with open(output, "r") as output_in:
+    assert output_in.readline() == "Bait\tTarget\tipTM\tBest iLIS\tBest LIS\tBest LIA\n"
+    assert output_in.readline() == "POLR2A\tPOLR2C\t0.2\tNA\tNA\tNA\n"
+    assert output_in.readline() == "POLR2A\tPOLR2D\t0.5\tNA\tNA\tNA\n"
+    assert output_in.readline() == "POLR2A\tPOLR2E\t0.6\t0.3\t0.2\t100\n"
+    assert output_in.readline() == "POLR2B\tPOLR2C\t0.9\t0.3\t0.2\t100\n"
+    assert output_in.readline() == "POLR2B\tPOLR2D\t0.1\tNA\tNA\tNA\n"
+    assert output_in.readline() == "POLR2B\tPOLR2E\t0.45\tNA\tNA\tNA\n"
+
+
+def test_af3_score_gate_top(testdir, mock_testclass):
+  confidence_files = create_cascade_files()
+  output = "output.txt"
+  Af3Score.get_sequence_index = MagicMock(return_value=[0, 1])
+  Af3Score.get_confidence_scores = MagicMock(side_effect=cascade_scores)
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file=output, metrics=["iptm", "lis"], gate="iptm>0.4", top=1)
+  Af3Score.get_confidence_scores.assert_any_call(confidence_files[2], ["lis"], 0, 1)
+  Af3Score.get_confidence_scores.assert_any_call(confidence_files[3], ["lis"], 0, 1)
+  assert Af3Score.get_confidence_scores.call_count == 8
+
+
+def test_af3_score_gate_failure(testdir, mock_testclass):
+  confidence_files = create_cascade_files()
+  output = "output.txt"
+  errors = "errors.txt"
+  Af3Score.get_sequence_index = MagicMock(side_effect=[[0, 1], ValueError("error"), [0, 1]])
+  Af3Score.get_confidence_scores = MagicMock(side_effect=cascade_scores)
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file=output, metrics=["iptm", "lis"], gate="iptm>=0.5", errors_file=errors)
+  with open(output, "r") as output_in:
+    assert output_in.readline() == "Bait\tTarget\tipTM\tiLIS\tLIS\tLIA\n"
+    assert output_in.readline() == "POLR2A\tPOLR2C\t0.2\tNA\tNA\tNA\n"
+    assert output_in.readline() == "POLR2A\tPOLR2D\t0.5\t0.3\t0.2\t100\n"
+    assert output_in.readline() == "POLR2B\tPOLR2C\t0.9\t0.3\t0.2\t100\n"
+    assert output_in.readline() == "POLR2B\tPOLR2D\t0.1\tNA\tNA\tNA\n"
+    assert output_in.readline() == "POLR2B\tPOLR2E\t0.45\tNA\tNA\tNA\n"
+    assert output_in.readline() == ""
+  with open(errors, "r") as errors_in:
+    assert errors_in.readline() == "File\tStage\tError\n"
+    assert errors_in.readline() == f"{confidence_files[2]}\tsequence_index\tValueError: error\n"
+
+
+def test_af3_score_top_queue(testdir, mock_testclass):
+  with pytest.raises(AssertionError):
+    Af3Score.af3_score(metrics=["iptm", "lis"], top=1, queue_dir="queue")
+
+
+def test_af3_score_invalid_gate(testdir, mock_testclass):
+  with pytest.raises(AssertionError):
+    Af3Score.af3_score(metrics=["iptm", "lis"], gate="lis>0.4")
+
+
+def test_parse_gate():
+  assert Af3Score.parse_gate("iptm>=0.4") == ("iptm", ">=", 0.4)
+  assert Af3Score.parse_gate(" ranking_score < 1e-1 ") == ("ranking_score", "<", 0.1)
+  assert Af3Score.parse_gate("ptm") == ("ptm", None, None)
+  with pytest.raises(AssertionError):
+    Af3Score.parse_gate("iptm=>0.4")
+  with pytest.raises(AssertionError):
+    Af3Score.parse_gate("best_lis>0.4")
+
+
+def test_metric_offset():
+  assert Af3Score.metric_offset(["iptm", "lis", "ptm", "best_lis"], "iptm") == 0
+  assert Af3Score.metric_offset(["iptm", "lis", "ptm", "best_lis"], "lis") == 1
+  assert Af3Score.metric_offset(["iptm", "lis", "ptm", "best_lis"], "ptm") == 4
+  assert Af3Score.metric_offset(["iptm", "lis", "ptm", "best_lis"], "best_lis") == 5
+
+
 def test_af3_score_empty_metrics(testdir, mock_testclass):
   confidence_file_1 = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
   confidence_file_2 = "POLR2A__POLR2C/POLR2A__POLR2C_summary_confidences.json"
@@ -351,6 +1110,26 @@ def test_get_confidence_scores_lis(testdir, mock_testclass):
   assert scores[2] == pytest.approx(statistics.mean(s[2] for s in lis_scores))
 
 
+def test_get_confidence_scores_lis_no_samples(testdir, mock_testclass):
+  confidence_file = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  Path(confidence_file).parent.mkdir()
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__hvm62_mouse_summary_confidences.json"),
+      confidence_file)
+  with pytest.raises(Af3Score.ScoringError, match="no sample confidence files found in prediction directory "
+                                                  "POLR2A__POLR2B"):
+    Af3Score.get_confidence_scores(confidence_file, ["lis"])
+  Af3Score.get_sequence_index = MagicMock(return_value=[0, 1])
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    assert Af3Score.af3_score(output_file="output.txt", metrics=["iptm", "lis"], errors_file="errors.txt") == 1
+  with open("errors.txt", "r") as errors_in:
+    assert errors_in.readline() == "File\tStage\tError\n"
+    assert errors_in.readline() == (f"{confidence_file}\tscores\tno sample confidence files found in prediction "
+                                    f"directory POLR2A__POLR2B\n")
+    assert errors_in.readline() == ""
+
+
 def test_get_confidence_scores_best_lis(testdir, mock_testclass):
   confidence_file = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
   Path(confidence_file).parent.mkdir()
@@ -405,6 +1184,204 @@ def test_get_confidence_scores_invalid_metrics(testdir, mock_testclass):
     Af3Score.get_confidence_scores(confidence_file, ["test"])
 
 
+def test_get_confidence_scores_chain_pair(testdir, mock_testclass):
+  confidence_file = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  Path(confidence_file).parent.mkdir()
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__hvm62_mouse_summary_confidences.json"),
+      confidence_file)
+  scores = Af3Score.get_confidence_scores(
+      confidence_file, ["chain_pair_iptm", "chain_pair_pae_min", "chain_iptm", "fraction_disordered"], 0, 1)
+  assert scores == [0.76, 1.1, 1.2, 0.76, 0.76, 0.08]
+  scores = Af3Score.get_confidence_scores(
+      confidence_file, ["chain_pair_iptm", "chain_pair_pae_min"], 1, 0)
+  assert scores == [0.76, 1.2, 1.1]
+
+
+def test_af3_score_matrix(testdir, mock_testclass):
+  confidence_file = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  Path(confidence_file).parent.mkdir()
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__hvm62_mouse_summary_confidences.json"),
+      confidence_file)
+  shutil.copy(Path(__file__).parent.joinpath(
+      "ha_h5n1__bmp2_human_model.cif"),
+      "POLR2A__POLR2B/POLR2A__POLR2B_model.cif")
+  shutil.copy(Path(__file__).parent.joinpath(
+      "ha_h5n1__bmp2_human_data.json"),
+      "POLR2A__POLR2B/POLR2A__POLR2B_data.json")
+  output = "output.txt"
+  matrix = "matrix.txt"
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file=output, metrics=["chain_pair_iptm", "chain_pair_pae_min"],
+                       matrix_file=matrix)
+  with open(output, "r") as output_in:
+    assert output_in.readline() == "Bait\tTarget\tChain pair ipTM\tChain pair PAE min 1-2\tChain pair PAE min 2-1\n"
+    assert output_in.readline() == "POLR2A\tPOLR2B\t0.76\t1.2\t1.1\n"
+  with open(matrix, "r") as matrix_in:
+    assert matrix_in.readline() == "Bait\tTarget\tChain 1\tChain 2\tipTM\tPAE min\n"
+    assert matrix_in.readline() == "POLR2A\tPOLR2B\tHA\tHA\t0.79\t0.76\n"
+    assert matrix_in.readline() == "POLR2A\tPOLR2B\tHA\tBMP\t0.76\t1.1\n"
+    assert matrix_in.readline() == "POLR2A\tPOLR2B\tBMP\tHA\t0.76\t1.2\n"
+    assert matrix_in.readline() == "POLR2A\tPOLR2B\tBMP\tBMP\t0.69\t0.76\n"
+    assert matrix_in.readline() == ""
+
+
+def create_sample_files(directory):
+  with open(os.path.join(directory, "ranking_scores.csv"), "w") as ranking_out:
+    ranking_out.write("seed,sample,ranking_score\n")
+    ranking_out.write("1,0,0.5\n")
+    ranking_out.write("1,1,0.9\n")
+    ranking_out.write("2,0,0.7\n")
+  for seed, sample, iptm in [(1, 0, 0.2), (1, 1, 0.6), (2, 0, 0.4)]:
+    sample_dir = os.path.join(directory, f"seed-{seed}_sample-{sample}")
+    os.mkdir(sample_dir)
+    with open(os.path.join(sample_dir, "summary_confidences.json"), "w") as summary_out:
+      json.dump({"iptm": iptm, "ptm": 0.8, "ranking_score": 0.1, "chain_iptm": [iptm, iptm + 0.1]}, summary_out)
+
+
+def test_get_sample_scores(testdir, mock_testclass):
+  confidence_file = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  Path(confidence_file).parent.mkdir()
+  create_sample_files("POLR2A__POLR2B")
+  Af3LocalInteractionScore.local_interaction_score = MagicMock(side_effect=[[0.3, 0.2, 10], [0.4, 0.3, 20],
+                                                                            [0.5, 0.4, 30]])
+  scores = Af3Score.get_sample_scores(confidence_file, ["ranking_score", "iptm", "lis", "chain_iptm"], 1, 0)
+  Af3LocalInteractionScore.local_interaction_score.assert_any_call(
+      "POLR2A__POLR2B/seed-1_sample-0/confidences.json", "POLR2A__POLR2B/seed-1_sample-0/model.cif",
+      subunit_one=1, subunit_two=0)
+  Af3LocalInteractionScore.local_interaction_score.assert_any_call(
+      "POLR2A__POLR2B/seed-2_sample-0/confidences.json", "POLR2A__POLR2B/seed-2_sample-0/model.cif",
+      subunit_one=1, subunit_two=0)
+  assert scores[0] == (1, 0, 0.5, [0.5, 0.2, 0.3, 0.2, 10, pytest.approx(0.3), 0.2])
+  assert scores[1] == (1, 1, 0.9, [0.9, 0.6, 0.4, 0.3, 20, pytest.approx(0.7), 0.6])
+  assert scores[2] == (2, 0, 0.7, [0.7, 0.4, 0.5, 0.4, 30, pytest.approx(0.5), 0.4])
+
+
+def test_get_sample_scores_invalid_metrics(testdir, mock_testclass):
+  with pytest.raises(AssertionError):
+    Af3Score.get_sample_scores("POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json", ["best_lis"])
+
+
+def test_af3_score_samples(testdir, mock_testclass):
+  confidence_file_1 = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  confidence_file_2 = "POLR2A__POLR2C/POLR2A__POLR2C_summary_confidences.json"
+  Path(confidence_file_1).parent.mkdir()
+  Path(confidence_file_2).parent.mkdir()
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__hvm62_mouse_summary_confidences.json"),
+      confidence_file_1)
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__znrf1_mouse_summary_confidences.json"),
+      confidence_file_2)
+  create_sample_files("POLR2A__POLR2B")
+  with open("POLR2A__POLR2C/ranking_scores.csv", "w") as ranking_out:
+    ranking_out.write("seed,sample,ranking_score\n")
+    ranking_out.write("3,0,0.5\n")
+  os.mkdir("POLR2A__POLR2C/seed-3_sample-0")
+  with open("POLR2A__POLR2C/seed-3_sample-0/summary_confidences.json", "w") as summary_out:
+    json.dump({"iptm": 0.3, "ptm": 0.7}, summary_out)
+  output = "output.txt"
+  samples = "samples.txt"
+  aggregate = "aggregate.txt"
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file=output, metrics=["iptm", "ptm"],
+                       samples_file=samples, aggregate_file=aggregate)
+  with open(samples, "r") as samples_in:
+    assert samples_in.readline() == "Bait\tTarget\tSeed\tSample\tipTM\tpTM\n"
+    assert samples_in.readline() == "POLR2A\tPOLR2B\t1\t0\t0.2\t0.8\n"
+    assert samples_in.readline() == "POLR2A\tPOLR2B\t1\t1\t0.6\t0.8\n"
+    assert samples_in.readline() == "POLR2A\tPOLR2B\t2\t0\t0.4\t0.8\n"
+    assert samples_in.readline() == "POLR2A\tPOLR2C\t3\t0\t0.3\t0.7\n"
+    assert samples_in.readline() == ""
+  with open(aggregate, "r") as aggregate_in:
+    assert aggregate_in.readline() == ("Bait\tTarget\tMean ipTM\tMax ipTM\tSD ipTM\tBest ipTM"
+                                       "\tMean pTM\tMax pTM\tSD pTM\tBest pTM\n")
+    columns = aggregate_in.readline().rstrip("\n").split("\t")
+    assert columns[0:2] == ["POLR2A", "POLR2B"]
+    assert float(columns[2]) == pytest.approx(0.4)
+    assert float(columns[3]) == pytest.approx(0.6)
+    assert float(columns[4]) == pytest.approx(statistics.stdev([0.2, 0.6, 0.4]))
+    assert float(columns[5]) == pytest.approx(0.6)
+    assert float(columns[6]) == pytest.approx(0.8)
+    assert float(columns[8]) == pytest.approx(0)
+    assert aggregate_in.readline() == "POLR2A\tPOLR2C\t0.3\t0.3\tNA\t0.3\t0.7\t0.7\tNA\t0.7\n"
+    assert aggregate_in.readline() == ""
+
+
+def test_af3_score_samples_gate_lis(testdir, mock_testclass):
+  confidence_file_1 = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  confidence_file_2 = "POLR2A__POLR2C/POLR2A__POLR2C_summary_confidences.json"
+  Path(confidence_file_1).parent.mkdir()
+  Path(confidence_file_2).parent.mkdir()
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__hvm62_mouse_summary_confidences.json"),
+      confidence_file_1)
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__znrf1_mouse_summary_confidences.json"),
+      confidence_file_2)
+  create_sample_files("POLR2A__POLR2B")
+  create_sample_files("POLR2A__POLR2C")
+  Af3Score.get_sequence_index = MagicMock(return_value=[0, 1])
+  # Autospec keeps the signature, used to write LIS cutoffs in metadata.
+  Af3LocalInteractionScore.local_interaction_score = create_autospec(
+      Af3LocalInteractionScore.local_interaction_score, side_effect=[[0.3, 0.2, 10], [0.4, 0.3, 20], [0.5, 0.4, 30]])
+  output = "output.txt"
+  samples = "samples.txt"
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file=output, metrics=["iptm", "lis"], gate="iptm>=0.5", samples_file=samples)
+  # LIS of each sample of passing prediction is computed once.
+  assert Af3LocalInteractionScore.local_interaction_score.call_count == 3
+  with open(output, "r") as output_in:
+    assert output_in.readline() == "Bait\tTarget\tipTM\tiLIS\tLIS\tLIA\n"
+    columns = output_in.readline().rstrip("\n").split("\t")
+    assert columns[0:3] == ["POLR2A", "POLR2B", "0.76"]
+    assert [float(column) for column in columns[3:]] == pytest.approx([0.4, 0.3, 20])
+    assert output_in.readline() == "POLR2A\tPOLR2C\t0.13\tNA\tNA\tNA\n"
+    assert output_in.readline() == ""
+  with open(samples, "r") as samples_in:
+    assert samples_in.readline() == "Bait\tTarget\tSeed\tSample\tipTM\tiLIS\tLIS\tLIA\n"
+    assert [line.split("\t")[1] for line in samples_in] == ["POLR2B", "POLR2B", "POLR2B"]
+
+
+def test_af3_score_samples_failure(testdir, mock_testclass):
+  confidence_file = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  Path(confidence_file).parent.mkdir()
+  shutil.copy(Path(__file__).parent.joinpath(
+      "fab53__hvm62_mouse_summary_confidences.json"),
+      confidence_file)
+  output = "output.txt"
+  samples = "samples.txt"
+  errors = "errors.txt"
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    Af3Score.af3_score(output_file=output, samples_file=samples, errors_file=errors)
+  with open(output, "r") as output_in:
+    assert output_in.readline() == "Bait\tTarget\tipTM\n"
+    assert output_in.readline() == "POLR2A\tPOLR2B\t0.76\n"
+  with open(samples, "r") as samples_in:
+    assert samples_in.readline() == "Bait\tTarget\tSeed\tSample\tipTM\n"
+    assert samples_in.readline() == ""
+  with open(errors, "r") as errors_in:
+    assert errors_in.readline() == "File\tStage\tError\n"
+    assert errors_in.readline().startswith(f"{confidence_file}\tsamples\tFileNotFoundError")
+
+
+def test_get_chain_ids(testdir, mock_testclass):
+  chain_ids = Af3Score.get_chain_ids(str(Path(__file__).parent.joinpath("ha_h5n1__bmp2_human_model.cif")))
+  assert chain_ids == ["HA", "BMP"]
+
+
+def test_get_chain_ids_single_chain(testdir, mock_testclass):
+  with open("model.cif", "w") as model_out:
+    model_out.write("data_test\n#\n_struct_asym.entity_id 1\n_struct_asym.id A\n#\n"
+                    "loop_\n_atom_site.group_PDB\nATOM 1\n")
+  assert Af3Score.get_chain_ids("model.cif") == ["A"]
+
+
 def test_get_sequence_index(testdir, mock_testclass):
   confidence_file = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
   Path(confidence_file).parent.mkdir()
@@ -415,10 +1392,10 @@ def test_get_sequence_index(testdir, mock_testclass):
   shutil.copy(Path(__file__).parent.joinpath(
       "ha_h5n1__bmp2_human_data.json"),
       data_json)
-  confidences_json = Path(confidence_file).parent.joinpath("POLR2A__POLR2B_confidences.json")
+  model_cif = Path(confidence_file).parent.joinpath("POLR2A__POLR2B_model.cif")
   shutil.copy(Path(__file__).parent.joinpath(
-      "ha_h5n1__bmp2_human_confidences.json"),
-      confidences_json)
+      "ha_h5n1__bmp2_human_model.cif"),
+      model_cif)
   sequence_one, sequence_two = Af3Score.get_sequence_index(confidence_file, 0, 1)
   assert sequence_one == 1
   assert sequence_two == 0
@@ -427,6 +1404,35 @@ def test_get_sequence_index(testdir, mock_testclass):
   assert sequence_two == 1
 
 
+def test_executor_get_confidence_scores_failure(testdir, mock_testclass):
+  confidence_file = "POLR2A__POLR2B/POLR2A__POLR2B_summary_confidences.json"
+  Af3Score.get_sequence_index = MagicMock(return_value=[0, 1])
+  Af3Score.get_confidence_scores = MagicMock(side_effect=KeyError("iptm"))
+  with pytest.raises(Af3Score.ScoringError) as error:
+    Af3Score.executor_get_confidence_scores(confidence_file, ["iptm"])
+  assert error.value.confidence_file == confidence_file
+  assert error.value.stage == "scores"
+  assert error.value.error == "KeyError: 'iptm'"
+
+
+def test_scoring_error_pickle():
+  error = Af3Score.ScoringError("a_summary_confidences.json", "scores", "KeyError: 'iptm'")
+  unpickled = pickle.loads(pickle.dumps(error))
+  assert unpickled.confidence_file == error.confidence_file
+  assert unpickled.stage == error.stage
+  assert unpickled.error == error.error
+
+
+def test_parse_errors(testdir):
+  errors_file = "errors.txt"
+  with open(errors_file, "w") as errors_out:
+    errors_out.write("File\tStage\tError\n")
+    errors_out.write("a_summary_confidences.json\tscores\tKeyError: 'iptm'\n")
+    errors_out.write("b_summary_confidences.json\tsequence_index\tValueError\n")
+    errors_out.write("a_summary_confidences.json\tscores\tKeyError: 'iptm'\n")
+  assert Af3Score.parse_errors(errors_file) == ["a_summary_confidences.json", "b_summary_confidences.json"]
+
+
 def test_parse_mapping(testdir, mock_testclass):
   mapping_file = "mapping_file.txt"
   with open(mapping_file, "w") as mapping_out:
@@ -0,0 +1,87 @@
+import hashlib
+import io
+import logging
+import os
+
+import pytest
+
+from af3tools import Af3Archive, Checksums
+
+
+def test_new_hash():
+  digest = Checksums.new_hash("sha256")
+  digest.update(b"iptm")
+  assert digest.hexdigest() == hashlib.sha256(b"iptm").hexdigest()
+  with pytest.raises(AssertionError):
+    Checksums.new_hash("md5")
+
+
+def test_hash_file(testdir):
+  with open("data.json", "wb") as data_out:
+    data_out.write(b"{}" * Checksums.READ_SIZE)
+  assert Checksums.hash_file("data.json") == hashlib.blake2b(b"{}" * Checksums.READ_SIZE).hexdigest()
+
+
+def test_hash_file_xxh64(testdir):
+  xxhash = pytest.importorskip("xxhash")
+  with open("data.json", "wb") as data_out:
+    data_out.write(b"{}")
+  assert Checksums.hash_file("data.json", "xxh64") == xxhash.xxh64(b"{}").hexdigest()
+
+
+def test_hashing_reader():
+  reader = Checksums.HashingReader(io.BytesIO(b"confidences"), "sha256")
+  assert reader.read(4) == b"conf"
+  assert reader.read() == b"idences"
+  assert reader.hexdigest() == hashlib.sha256(b"confidences").hexdigest()
+
+
+def test_read_checksums(testdir):
+  with open("checksums.txt", "w") as checksums_out:
+    checksums_out.write(Checksums.checksum_line("ab" * 64, "A__B/A__B_data.json"))
+    checksums_out.write(Checksums.checksum_line("cd" * 32, "A__B/file  with spaces.json"))
+  assert list(Checksums.read_checksums("checksums.txt")) == [
+    ("A__B/A__B_data.json", "ab" * 64), ("A__B/file  with spaces.json", "cd" * 32)]
+
+
+def test_digest_algorithm():
+  assert Checksums.digest_algorithm(hashlib.blake2b().hexdigest()) == "blake2b"
+  assert Checksums.digest_algorithm(hashlib.sha256().hexdigest()) == "sha256"
+  with pytest.raises(AssertionError):
+    Checksums.digest_algorithm(hashlib.md5().hexdigest())
+
+
+def write_files(contents: dict[str, bytes]):
+  os.makedirs("A__B", exist_ok=True)
+  with open("checksums.txt", "w") as checksums_out:
+    for name, content in contents.items():
+      with open(name, "wb") as file_out:
+        file_out.write(content)
+      checksums_out.write(Checksums.checksum_line(Checksums.hash_file(name), name))
+
+
+def test_verify_checksums(testdir, caplog):
+  write_files({"A__B/A__B_data.json": b"{}", "A__B/A__B_model.cif": b"data_A__B",
+               "A__B/ranking_scores.csv": b"seed,sample,ranking_score"})
+  assert Checksums.verify_checksums("checksums.txt", threads=2) == 0
+  with open("A__B/A__B_model.cif", "wb") as model_out:
+    model_out.write(b"data_A__C")
+  os.remove("A__B/ranking_scores.csv")
+  with caplog.at_level(logging.ERROR):
+    assert Checksums.verify_checksums("checksums.txt") == 2
+  assert "A__B/A__B_model.cif: checksum differs" in caplog.text
+  assert "A__B/ranking_scores.csv: missing" in caplog.text
+
+
+def test_verify_checksums_archive(testdir):
+  write_files({"A__B/A__B_data.json": b"{}", "A__B/A__B_model.cif": b"data_A__B",
+               "A__B/ranking_scores.csv": b"seed,sample,ranking_score"})
+  with Af3Archive.ArchiveWriter("out.tar.gz", volume_size=1024) as writer:
+    for name in ["A__B/A__B_data.json", "A__B/A__B_model.cif"]:
+      writer.add(name)
+  assert Checksums.verify_checksums("checksums.txt", archive="out.tar.gz", threads=2) == 1
+  with Af3Archive.ArchiveWriter("out.tar.gz") as writer:
+    assert writer.add("A__B/A__B_data.json", "blake2b") == Checksums.hash_file("A__B/A__B_data.json")
+    writer.add("A__B/A__B_model.cif")
+    writer.add("A__B/ranking_scores.csv")
+  assert Checksums.verify_checksums("checksums.txt", archive="out.tar.gz") == 0
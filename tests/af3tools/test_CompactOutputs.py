@@ -0,0 +1,150 @@
+import concurrent.futures
+import json
+import os
+import shutil
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+from af3tools import Af3Files, Af3Score, CompactOutputs
+
+CONFIDENCES = {"atom_chain_ids": ["A", "A", "B"], "atom_plddts": [81.25, 90.5, 42.13],
+               "contact_probs": [[1.0, 0.25], [0.25, 1.0]], "pae": [[0.75, 12.5], [30.25, 0.5]],
+               "token_chain_ids": ["A", "B"], "token_res_ids": [1, 1]}
+
+
+@pytest.fixture
+def mock_testclass():
+  _compact_outputs = CompactOutputs.compact_outputs
+  yield
+  CompactOutputs.compact_outputs = _compact_outputs
+
+
+def create_prediction(directory: str, name: str):
+  os.makedirs(f"{directory}/seed-1_sample-0")
+  shutil.copy(Path(__file__).parent.joinpath("fab53__hvm62_mouse_summary_confidences.json"),
+              f"{directory}/{name}_summary_confidences.json")
+  shutil.copy(Path(__file__).parent.joinpath("ha_h5n1__bmp2_human_data.json"), f"{directory}/{name}_data.json")
+  shutil.copy(Path(__file__).parent.joinpath("ha_h5n1__bmp2_human_model.cif"), f"{directory}/{name}_model.cif")
+  shutil.copy(Path(__file__).parent.joinpath("ha_h5n1__bmp2_human_model.cif"),
+              f"{directory}/seed-1_sample-0/model.cif")
+  for confidence_file in [f"{directory}/{name}_confidences.json", f"{directory}/seed-1_sample-0/confidences.json"]:
+    with open(confidence_file, "w") as json_out:
+      json.dump(CONFIDENCES, json_out)
+
+
+def test_main(testdir, mock_testclass):
+  CompactOutputs.compact_outputs = MagicMock()
+  CompactOutputs.main([])
+  CompactOutputs.compact_outputs.assert_called_once_with(
+      input_dir="", restore=False, keep=False, dtype="float16", threads=1, progress=False)
+
+
+def test_main_parameters(testdir, mock_testclass):
+  os.mkdir("predictions")
+  CompactOutputs.compact_outputs = MagicMock()
+  CompactOutputs.main(["-r", "-k", "-d", "float32", "-t", "2", "-p", "predictions"])
+  CompactOutputs.compact_outputs.assert_called_once_with(
+      input_dir="predictions", restore=True, keep=True, dtype="float32", threads=2, progress=True)
+
+
+def test_encode_array():
+  assert CompactOutputs.encode_array([[0.5, 1.25]]).dtype == np.float16
+  assert CompactOutputs.encode_array([[0.5, 1.25]], "float32").dtype == np.float32
+  assert CompactOutputs.encode_array([[1e6, 1.25]]).dtype == np.float32
+  assert CompactOutputs.encode_array([[0.5, 17.24]]).dtype == np.float32
+  assert CompactOutputs.encode_array([[0.5, 0.123456789]]).dtype == np.float64
+  assert CompactOutputs.encode_array([81.25, 90.5]).dtype == np.float32
+  assert CompactOutputs.encode_array([1, 2]).dtype == np.int32
+  assert CompactOutputs.encode_array(["A", "B"]).dtype.kind == "U"
+  assert CompactOutputs.encode_array([]) is None
+  assert CompactOutputs.encode_array([[1, 2], [3]]) is None
+  assert CompactOutputs.encode_array([1, None]) is None
+  assert CompactOutputs.encode_array(0.5) is None
+
+
+def test_compact_outputs(testdir, mock_testclass):
+  create_prediction("predictions/A__B", "A__B")
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    bytes_before, bytes_after = CompactOutputs.compact_outputs("predictions")
+  assert 0 < bytes_after < bytes_before
+  assert sorted(os.listdir("predictions/A__B")) == [
+    "A__B_data.json", "A__B_summary_confidences.json", "compact.af3c", "seed-1_sample-0"]
+  assert os.listdir("predictions/A__B/seed-1_sample-0") == []
+  confidences = Af3Files.load_json("predictions/A__B/seed-1_sample-0/confidences.json")
+  assert isinstance(confidences["pae"], np.memmap)
+  assert confidences["pae"].dtype == np.float16
+  assert confidences["pae"].tolist() == CONFIDENCES["pae"]
+  assert confidences["token_chain_ids"].tolist() == ["A", "B"]
+  assert Af3Files.exists("predictions/A__B/A__B_confidences.json")
+  assert not Af3Files.exists("predictions/A__B/A__B_full_data_0.json")
+  assert Af3Files.glob_files("**/confidences.json", root_dir="predictions/A__B") == [
+    "seed-1_sample-0/confidences.json"]
+  assert Af3Score.get_chain_ids("predictions/A__B/A__B_model.cif") == ["HA", "BMP"]
+  assert Af3Score.get_sequence_index("predictions/A__B/A__B_summary_confidences.json", 0, 1) == (1, 0)
+
+
+def test_compact_outputs_restore(testdir, mock_testclass):
+  create_prediction("A__B", "A__B")
+  with open("A__B/A__B_model.cif", "rb") as model_in:
+    model = model_in.read()
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    CompactOutputs.compact_outputs(dtype="float32")
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    CompactOutputs.compact_outputs(restore=True)
+  assert not os.path.exists("A__B/compact.af3c")
+  for confidence_file in ["A__B/A__B_confidences.json", "A__B/seed-1_sample-0/confidences.json"]:
+    with open(confidence_file, "r") as json_in:
+      assert json.load(json_in) == CONFIDENCES
+  with open("A__B/A__B_model.cif", "rb") as model_in:
+    assert model_in.read() == model
+
+
+def test_compact_outputs_restore_pae(testdir, mock_testclass):
+  # PAE like AlphaFold 3 writes it, with 2 decimals up to 31.75, most values cannot be stored as float16.
+  random = np.random.default_rng(1)
+  pae = np.round(random.uniform(0, 31.75, (300, 300)), 2).tolist()
+  create_prediction("A__B", "A__B")
+  with open("A__B/A__B_confidences.json", "w") as json_out:
+    json.dump(dict(CONFIDENCES, pae=pae), json_out)
+  with open("A__B/A__B_confidences.json", "rb") as json_in:
+    original = json_in.read()
+  CompactOutputs.compact_directory("A__B")
+  assert not os.path.exists("A__B/A__B_confidences.json")
+  assert Af3Files.load_json("A__B/A__B_confidences.json")["pae"].dtype == np.float32
+  CompactOutputs.restore_directory("A__B")
+  with open("A__B/A__B_confidences.json", "rb") as json_in:
+    restored = json_in.read()
+  assert json.loads(restored)["pae"] == pae
+  assert restored == original
+
+
+def test_compact_outputs_keep(testdir, mock_testclass):
+  create_prediction("A__B", "A__B")
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  with patch("concurrent.futures.ProcessPoolExecutor", return_value=executor):
+    CompactOutputs.compact_outputs(keep=True)
+  assert os.path.exists("A__B/compact.af3c")
+  assert os.path.exists("A__B/A__B_confidences.json")
+  # Files are read from the file system when they exist.
+  assert isinstance(Af3Files.load_json("A__B/A__B_confidences.json")["pae"], list)
+  assert CompactOutputs.compact_directory("A__B") == (0, 0)
+
+
+def test_compact_outputs_invalid(testdir, mock_testclass):
+  with pytest.raises(AssertionError):
+    CompactOutputs.compact_outputs(dtype="float64")
+  with pytest.raises(AssertionError):
+    CompactOutputs.compact_outputs(threads=0)
+
+
+def test_compact_file_invalid(testdir):
+  with open("compact.af3c", "wb") as container_out:
+    container_out.write(b"not a container")
+  with pytest.raises(ValueError):
+    CompactOutputs.CompactFile("compact.af3c")
@@ -0,0 +1,51 @@
+import json
+import os
+from unittest.mock import MagicMock
+
+import pytest
+
+from af3tools import ExtractBundle, JsonPairs
+
+
+@pytest.fixture
+def mock_testclass():
+  _extract_bundle = ExtractBundle.extract_bundle
+  yield
+  ExtractBundle.extract_bundle = _extract_bundle
+
+
+def test_main(testdir, mock_testclass):
+  open("pairs-000000.jsonl", 'w').close()
+  ExtractBundle.extract_bundle = MagicMock()
+  ExtractBundle.main(["pairs-000000.jsonl"])
+  ExtractBundle.extract_bundle.assert_called_once_with(bundle="pairs-000000.jsonl", output="")
+
+
+def test_main_parameters(testdir, mock_testclass):
+  open("pairs-000000.tar", 'w').close()
+  os.mkdir("json")
+  ExtractBundle.extract_bundle = MagicMock()
+  ExtractBundle.main(["pairs-000000.tar", "-o", "json"])
+  ExtractBundle.extract_bundle.assert_called_once_with(bundle="pairs-000000.tar", output="json")
+
+
+def test_main_output_not_exists(testdir, mock_testclass):
+  open("pairs-000000.jsonl", 'w').close()
+  ExtractBundle.extract_bundle = MagicMock()
+  with pytest.raises(NotADirectoryError):
+    ExtractBundle.main(["pairs-000000.jsonl", "-o", "json"])
+  ExtractBundle.extract_bundle.assert_not_called()
+
+
+@pytest.mark.parametrize("bundle_format", JsonPairs.BUNDLE_FORMATS)
+def test_extract_bundle(testdir, mock_testclass, bundle_format):
+  jobs = [{"name": "A__B", "modelSeeds": [1], "dialect": "alphafold3", "version": 1,
+           "sequences": [{"protein": {"id": "A", "sequence": "MKV"}}, {"protein": {"id": "B", "sequence": "MLT"}}]},
+          {"name": "A__C", "modelSeeds": [1], "dialect": "alphafold3", "version": 1,
+           "sequences": [{"protein": {"id": "A", "sequence": "MKV"}}, {"protein": {"id": "C", "sequence": "MSS"}}]}]
+  bundles = JsonPairs.write_bundles(jobs, "", 10, bundle_format)
+  os.mkdir("json")
+  assert ExtractBundle.extract_bundle(bundles[0], "json") == [os.path.join("json", "A__B.json"),
+                                                              os.path.join("json", "A__C.json")]
+  with open(os.path.join("json", "A__C.json"), 'r') as json_file:
+    assert json_file.read() == json.dumps(jobs[1], indent=4)
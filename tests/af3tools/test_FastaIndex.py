@@ -0,0 +1,27 @@
+from pathlib import Path
+
+from Bio import SeqIO
+
+from af3tools import FastaIndex
+
+
+def test_fasta_index(testdir):
+  fasta = Path(__file__).parent.joinpath("P19388__P36954.fasta")
+  records = list(SeqIO.parse(fasta, "fasta"))
+  with FastaIndex.FastaIndex(str(fasta)) as index:
+    assert len(index) == 2
+    assert "RPAB1_HUMAN" in index
+    assert "RPB4_HUMAN" not in index
+    assert index.length("RPB9_HUMAN") == len(records[1].seq)
+    assert index.sequence("RPB9_HUMAN") == str(records[1].seq)
+    assert index.sequence("RPAB1_HUMAN") == str(records[0].seq)
+  assert index._fasta_in is None
+
+
+def test_fasta_index_line_endings(testdir):
+  with open("proteins.fasta", "wb") as fasta_out:
+    fasta_out.write(b">sp|P1|A_HUMAN\r\nMKV\r\nLT \r\n>sp|P2|B_HUMAN\r\n\r\nMSS\r\n")
+  with FastaIndex.FastaIndex("proteins.fasta") as index:
+    assert index.sequence("A_HUMAN") == "MKVLT"
+    assert index.length("A_HUMAN") == 5
+    assert index.sequence("B_HUMAN") == "MSS"
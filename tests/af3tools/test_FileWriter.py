@@ -0,0 +1,65 @@
+import os
+import threading
+
+import pytest
+
+from af3tools import FileWriter
+
+
+def test_fan_out_directory():
+  assert FileWriter.fan_out_directory("A__B.json", 100) == FileWriter.fan_out_directory("A__B.json", 100)
+  assert len(FileWriter.fan_out_directory("A__B.json", 100)) == 2
+  assert FileWriter.fan_out_directory("A__B.json", 1) == "0"
+  directories = {FileWriter.fan_out_directory(f"P{index}__Q.json", 16) for index in range(1000)}
+  assert directories == {f"{index:02d}" for index in range(16)}
+
+
+def test_file_writer_invalid():
+  with pytest.raises(AssertionError):
+    FileWriter.FileWriter(threads=0)
+  with pytest.raises(AssertionError):
+    FileWriter.FileWriter(fan_out=0)
+
+
+def test_file_writer(testdir):
+  os.mkdir("json")
+  with FileWriter.FileWriter("json", threads=3) as writer:
+    for index in range(50):
+      assert writer.write(f"P{index}.json", str(index)) == os.path.join("json", f"P{index}.json")
+  assert writer.written == 50
+  for index in range(50):
+    with open(os.path.join("json", f"P{index}.json"), 'r') as json_file:
+      assert json_file.read() == str(index)
+
+
+def test_file_writer_parallel(testdir):
+  # Each write waits until 3 writes are running, which only completes if files are written in parallel.
+  barrier = threading.Barrier(3, timeout=5)
+  write_file = FileWriter.write_file
+
+  def wait_write_file(path: str, content: str):
+    barrier.wait()
+    write_file(path, content)
+
+  FileWriter.write_file = wait_write_file
+  try:
+    with FileWriter.FileWriter(threads=3) as writer:
+      for index in range(6):
+        writer.write(f"P{index}.json", "{}")
+  finally:
+    FileWriter.write_file = write_file
+  assert sorted(name for name in os.listdir() if name.endswith(".json")) == [f"P{index}.json" for index in range(6)]
+
+
+def test_file_writer_fan_out(testdir):
+  with FileWriter.FileWriter(threads=2, fan_out=10) as writer:
+    path = writer.write("A__B.json", "{}")
+  assert sorted(os.listdir()) == [str(index) for index in range(10)]
+  assert path == os.path.join(FileWriter.fan_out_directory("A__B.json", 10), "A__B.json")
+  assert os.path.isfile(path)
+
+
+def test_file_writer_error(testdir):
+  with pytest.raises(FileNotFoundError):
+    with FileWriter.FileWriter("missing", threads=2) as writer:
+      writer.write("A__B.json", "{}")
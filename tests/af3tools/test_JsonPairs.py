@@ -8,7 +8,7 @@ from unittest.mock import MagicMock, ANY
 import pytest
 from Bio import SeqIO
 
-from af3tools import JsonPairs
+from af3tools import ExtractBundle, FileWriter, JsonPairs, Pairs
 
 
 @pytest.fixture
@@ -33,7 +33,13 @@ def test_main(testdir, mock_testclass):
                                                random_seeds=1,
                                                unique=False,
                                                skip_identity=False,
-                                               output="")
+                                               output="",
+                                               bundle_size=None,
+                                               bundle_format="jsonl",
+                                               writers=8,
+                                               fan_out=None,
+                                               pairs_file=None,
+                                               buckets=None)
   assert JsonPairs.json_pairs.call_args.kwargs["baits_file"] == baits
   assert JsonPairs.json_pairs.call_args.kwargs["targets_file"] == targets
 
@@ -60,7 +66,13 @@ def test_main_parameters(testdir, mock_testclass):
                                                random_seeds=random_seeds,
                                                unique=True,
                                                skip_identity=True,
-                                               output=output)
+                                               output=output,
+                                               bundle_size=None,
+                                               bundle_format="jsonl",
+                                               writers=8,
+                                               fan_out=None,
+                                               pairs_file=None,
+                                               buckets=None)
   assert JsonPairs.json_pairs.call_args.kwargs["baits_file"] == baits
   assert JsonPairs.json_pairs.call_args.kwargs["targets_file"] == targets
 
@@ -87,7 +99,13 @@ def test_main_long_parameters(testdir, mock_testclass):
                                                random_seeds=random_seeds,
                                                unique=True,
                                                skip_identity=True,
-                                               output=output)
+                                               output=output,
+                                               bundle_size=None,
+                                               bundle_format="jsonl",
+                                               writers=8,
+                                               fan_out=None,
+                                               pairs_file=None,
+                                               buckets=None)
   assert JsonPairs.json_pairs.call_args.kwargs["baits_file"] == baits
   assert JsonPairs.json_pairs.call_args.kwargs["targets_file"] == targets
 
@@ -1185,3 +1203,170 @@ def test_json_pairs_output(testdir, mock_testclass):
     assert json_data["sequences"][1]["protein"]["id"] == "RPBT"
     assert "sequence" in json_data["sequences"][1]["protein"]
     assert json_data["sequences"][1]["protein"]["sequence"] == polr2g.seq
+
+
+def write_baits_targets(baits: str, targets: str):
+  with open(baits, "wb") as output:
+    for fasta in ["P19388.fasta", "P36954.fasta"]:
+      with open(Path(__file__).parent.joinpath(fasta), "rb") as infile:
+        shutil.copyfileobj(infile, output)
+  with open(targets, "wb") as output:
+    for fasta in ["O15514.fasta", "P62487.fasta", "P19388.fasta"]:
+      with open(Path(__file__).parent.joinpath(fasta), "rb") as infile:
+        shutil.copyfileobj(infile, output)
+
+
+def test_main_bundle(testdir, mock_testclass):
+  open("baits.fasta", 'w').close()
+  open("targets.fasta", 'w').close()
+  JsonPairs.json_pairs = MagicMock()
+  JsonPairs.main(["-b", "baits.fasta", "-t", "targets.fasta", "-B", "100", "-f", "tar"])
+  JsonPairs.json_pairs.assert_called_once_with(baits_file="baits.fasta", targets_file="targets.fasta",
+                                               sequence_file=None, seeds=None, random_seeds=1,
+                                               unique=False, skip_identity=False, output="",
+                                               bundle_size=100, bundle_format="tar", writers=8, fan_out=None,
+                                               pairs_file=None,
+                                               buckets=None)
+
+
+@pytest.mark.parametrize("bundle_format", JsonPairs.BUNDLE_FORMATS)
+def test_json_pairs_bundle(testdir, mock_testclass, bundle_format):
+  write_baits_targets("baits.fasta", "targets.fasta")
+  JsonPairs.json_pairs(baits_file="baits.fasta", targets_file="targets.fasta", seeds=[12], skip_identity=True,
+                       bundle_size=2, bundle_format=bundle_format)
+  assert sorted(os.listdir()) == ["baits.fasta", f"pairs-000000.{bundle_format}", f"pairs-000001.{bundle_format}",
+                                  f"pairs-000002.{bundle_format}", "targets.fasta"]
+  os.mkdir("files")
+  JsonPairs.json_pairs(baits_file="baits.fasta", targets_file="targets.fasta", seeds=[12], skip_identity=True,
+                       output="files")
+  jobs = [json_data for index in range(3)
+          for json_data in ExtractBundle.bundle_jobs(f"pairs-00000{index}.{bundle_format}")]
+  assert [json_data["name"] for json_data in jobs] == [
+    "RPAB1_HUMAN__RPB4_HUMAN", "RPAB1_HUMAN__RPB7_HUMAN", "RPB9_HUMAN__RPB4_HUMAN", "RPB9_HUMAN__RPB7_HUMAN",
+    "RPB9_HUMAN__RPAB1_HUMAN"]
+  for json_data in jobs:
+    with open(os.path.join("files", f"{json_data['name']}.json"), 'r') as json_file:
+      assert json.load(json_file) == json_data
+
+
+def test_json_pairs_bundle_invalid(testdir, mock_testclass):
+  write_baits_targets("baits.fasta", "targets.fasta")
+  with pytest.raises(AssertionError):
+    JsonPairs.json_pairs(baits_file="baits.fasta", targets_file="targets.fasta", bundle_size=0)
+  with pytest.raises(AssertionError):
+    JsonPairs.json_pairs(baits_file="baits.fasta", targets_file="targets.fasta", bundle_size=2,
+                         bundle_format="zip")
+
+
+def test_write_bundles_stream(testdir):
+  def jobs():
+    for index in range(5):
+      yield {"name": f"job{index}"}
+
+  assert JsonPairs.write_bundles(jobs(), "", 2) == ["pairs-000000.jsonl", "pairs-000001.jsonl", "pairs-000002.jsonl"]
+  with open("pairs-000002.jsonl", 'r') as bundle_in:
+    assert bundle_in.read() == '{"name":"job4"}\n'
+
+
+def test_main_writers(testdir, mock_testclass):
+  open("baits.fasta", 'w').close()
+  open("targets.fasta", 'w').close()
+  JsonPairs.json_pairs = MagicMock()
+  JsonPairs.main(["-b", "baits.fasta", "-t", "targets.fasta", "-w", "32", "--fan-out", "256"])
+  JsonPairs.json_pairs.assert_called_once_with(baits_file="baits.fasta", targets_file="targets.fasta",
+                                               sequence_file=None, seeds=None, random_seeds=1,
+                                               unique=False, skip_identity=False, output="",
+                                               bundle_size=None, bundle_format="jsonl", writers=32, fan_out=256,
+                                               pairs_file=None,
+                                               buckets=None)
+
+
+def test_json_pairs_fan_out(testdir, mock_testclass):
+  write_baits_targets("baits.fasta", "targets.fasta")
+  os.mkdir("json")
+  JsonPairs.json_pairs(baits_file="baits.fasta", targets_file="targets.fasta", skip_identity=True,
+                       output="json", writers=2, fan_out=4)
+  assert sorted(os.listdir("json")) == ["0", "1", "2", "3"]
+  for name in ["RPAB1_HUMAN__RPB4_HUMAN", "RPB9_HUMAN__RPAB1_HUMAN"]:
+    with open(os.path.join("json", FileWriter.fan_out_directory(f"{name}.json", 4), f"{name}.json"), 'r') as json_file:
+      assert json.load(json_file)["name"] == name
+  with pytest.raises(AssertionError):
+    JsonPairs.json_pairs(baits_file="baits.fasta", targets_file="targets.fasta", bundle_size=2, fan_out=4)
+
+
+def test_json_pairs_pairs(testdir, mock_testclass):
+  write_baits_targets("baits.fasta", "targets.fasta")
+  with open("pairs.tsv", 'w') as pairs_out:
+    pairs_out.write("RPB9_HUMAN\tRPB7_HUMAN\tscore\nRPAB1_HUMAN\tRPAB1_HUMAN\n\nRPAB1_HUMAN\tRPB4_HUMAN\n")
+  os.mkdir("json")
+  JsonPairs.json_pairs(baits_file="baits.fasta", targets_file="targets.fasta", seeds=[12], skip_identity=True,
+                       output="json", pairs_file="pairs.tsv")
+  assert sorted(os.listdir("json")) == ["RPAB1_HUMAN__RPB4_HUMAN.json", "RPB9_HUMAN__RPB7_HUMAN.json"]
+  os.mkdir("all")
+  JsonPairs.json_pairs(baits_file="baits.fasta", targets_file="targets.fasta", seeds=[12], output="all")
+  for name in os.listdir("json"):
+    with open(os.path.join("json", name), 'r') as json_file, open(os.path.join("all", name), 'r') as all_file:
+      assert json_file.read() == all_file.read()
+
+
+def test_json_pairs_pairs_invalid(testdir, mock_testclass):
+  write_baits_targets("baits.fasta", "targets.fasta")
+  with open("pairs.tsv", 'w') as pairs_out:
+    pairs_out.write("RPB4_HUMAN\tRPB9_HUMAN\n")
+  with pytest.raises(AssertionError):
+    JsonPairs.json_pairs(baits_file="baits.fasta", targets_file="targets.fasta", pairs_file="pairs.tsv")
+  with pytest.raises(AssertionError):
+    JsonPairs.json_pairs(baits_file="baits.fasta", targets_file="targets.fasta", unique=True,
+                         pairs_file="pairs.tsv")
+
+
+def test_main_size_buckets(testdir, mock_testclass):
+  open("baits.fasta", 'w').close()
+  open("targets.fasta", 'w').close()
+  JsonPairs.json_pairs = MagicMock()
+  JsonPairs.main(["-b", "baits.fasta", "-t", "targets.fasta", "-z"])
+  assert JsonPairs.json_pairs.call_args.kwargs["buckets"] == Pairs.BUCKETS
+  JsonPairs.json_pairs = MagicMock()
+  JsonPairs.main(["-b", "baits.fasta", "-t", "targets.fasta", "-z", "--buckets", "300", "400"])
+  assert JsonPairs.json_pairs.call_args.kwargs["buckets"] == [300, 400]
+
+
+def test_json_pairs_size_buckets(testdir, mock_testclass):
+  write_baits_targets("baits.fasta", "targets.fasta")
+  JsonPairs.json_pairs(baits_file="baits.fasta", targets_file="targets.fasta", skip_identity=True,
+                       buckets=[300, 400], fan_out=2)
+  files = [os.path.join(root, file) for root, directories, files in os.walk(".") for file in files
+           if file.endswith(".json")]
+  assert sorted(os.path.join(os.path.dirname(os.path.dirname(file)), os.path.basename(file)) for file in files) == [
+    "./tokens-300/RPB9_HUMAN__RPB4_HUMAN.json", "./tokens-300/RPB9_HUMAN__RPB7_HUMAN.json",
+    "./tokens-400/RPAB1_HUMAN__RPB4_HUMAN.json", "./tokens-400/RPAB1_HUMAN__RPB7_HUMAN.json",
+    "./tokens-400/RPB9_HUMAN__RPAB1_HUMAN.json"]
+  with pytest.raises(AssertionError):
+    JsonPairs.json_pairs(baits_file="baits.fasta", targets_file="targets.fasta", buckets=[400, 300])
+
+
+def test_json_pairs_size_buckets_bundle(testdir, mock_testclass):
+  write_baits_targets("baits.fasta", "targets.fasta")
+  os.mkdir("bundles")
+  JsonPairs.json_pairs(baits_file="baits.fasta", targets_file="targets.fasta", skip_identity=True,
+                       output="bundles", bundle_size=2, buckets=[300, 400])
+  assert sorted(os.listdir("bundles")) == ["tokens-300", "tokens-400"]
+  assert sorted(os.listdir("bundles/tokens-400")) == ["pairs-000000.jsonl", "pairs-000001.jsonl"]
+  assert [json_data["name"] for json_data in ExtractBundle.bundle_jobs("bundles/tokens-300/pairs-000000.jsonl")] == [
+    "RPB9_HUMAN__RPB4_HUMAN", "RPB9_HUMAN__RPB7_HUMAN"]
+
+
+def test_json_pairs_size_buckets_unknown_ccd_code(testdir, mock_testclass):
+  write_baits_targets("baits.fasta", "targets.fasta")
+  with open("nag.json", 'w') as sequence_out:
+    sequence_out.write('{"ligand": {"id": "NG", "ccdCodes": ["NAG"]}}')
+  JsonPairs.json_pairs(baits_file="baits.fasta", targets_file="targets.fasta", sequence_file="nag.json",
+                       skip_identity=True, buckets=[300, 400])
+  assert sorted(os.listdir("tokens-300")) == ["RPB9_HUMAN__RPB4_HUMAN__NG.json",
+                                          "RPB9_HUMAN__RPB7_HUMAN__NG.json"]
+
+
+def test_job_size():
+  json_data = {"sequences": [{"protein": {"id": "A", "sequence": "MKV"}}, {"rna": {"id": "B", "sequence": "AUG"}},
+                             {"ligand": {"id": "C", "ccdCodes": ["ATP"]}}]}
+  assert JsonPairs.job_size(json_data) == 37
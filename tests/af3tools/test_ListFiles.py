@@ -1,3 +1,6 @@
+import concurrent.futures
+import hashlib
+import io
 import os
 import shutil
 import sys
@@ -7,7 +10,7 @@ from unittest.mock import MagicMock, ANY, patch
 
 import pytest
 
-from af3tools import ListFiles
+from af3tools import Af3Archive, Checksums, ListFiles
 
 
 @pytest.fixture
@@ -37,7 +40,8 @@ def test_main(testdir, mock_testclass):
   ListFiles.list_files = MagicMock()
   ListFiles.main([])
   ListFiles.list_files.assert_called_once_with(
-      input_dir="", output_file=ANY, progress=False)
+      input_dir="", output_file=ANY, progress=False, metrics=None, top_samples=None, threads=4, null=False, since=None,
+      archive=None, volume_size=None, checksums=None, checksum_algorithm="blake2b")
   output_file = ListFiles.list_files.call_args.kwargs["output_file"]
   assert isinstance(output_file, TextIOWrapper)
   assert output_file.mode in ["r+", "w"]
@@ -50,7 +54,8 @@ def test_main_parameters(testdir, mock_testclass):
   ListFiles.list_files = MagicMock()
   ListFiles.main(["-o", output_file, "-p", input_dir])
   ListFiles.list_files.assert_called_once_with(
-      input_dir=input_dir, output_file=ANY, progress=True)
+      input_dir=input_dir, output_file=ANY, progress=True, metrics=None, top_samples=None, threads=4, null=False, since=None,
+      archive=None, volume_size=None, checksums=None, checksum_algorithm="blake2b")
   output_file_arg = ListFiles.list_files.call_args.kwargs["output_file"]
   assert isinstance(output_file_arg, TextIOWrapper)
   assert output_file_arg.mode in ["r+", "w"]
@@ -65,13 +70,47 @@ def test_main_long_parameters(testdir, mock_testclass):
   ListFiles.main(
       ["--output", output_file, "--progress", input_dir])
   ListFiles.list_files.assert_called_once_with(
-      input_dir=input_dir, output_file=ANY, progress=True)
+      input_dir=input_dir, output_file=ANY, progress=True, metrics=None, top_samples=None, threads=4, null=False, since=None,
+      archive=None, volume_size=None, checksums=None, checksum_algorithm="blake2b")
   output_file_arg = ListFiles.list_files.call_args.kwargs["output_file"]
   assert isinstance(output_file_arg, TextIOWrapper)
   assert output_file_arg.mode in ["r+", "w"]
   assert output_file_arg.name == output_file
 
 
+def test_main_metrics(testdir, mock_testclass):
+  ListFiles.list_files = MagicMock()
+  ListFiles.main(["-m", "iptm", "lis", "-k", "2"])
+  ListFiles.list_files.assert_called_once_with(
+      input_dir="", output_file=ANY, progress=False, metrics=["iptm", "lis"], top_samples=2, threads=4, null=False, since=None,
+      archive=None, volume_size=None, checksums=None, checksum_algorithm="blake2b")
+
+
+def test_main_null(testdir, mock_testclass):
+  ListFiles.list_files = MagicMock()
+  ListFiles.main(["-0", "-t", "8", "--since", "manifest.txt"])
+  ListFiles.list_files.assert_called_once_with(
+      input_dir="", output_file=ANY, progress=False, metrics=None, top_samples=None, threads=8, null=True,
+      since="manifest.txt", archive=None, volume_size=None,
+      checksums=None, checksum_algorithm="blake2b")
+
+
+def test_main_archive(testdir, mock_testclass):
+  ListFiles.list_files = MagicMock()
+  ListFiles.main(["-a", "out.tar.zst", "--volume-size", "100"])
+  ListFiles.list_files.assert_called_once_with(
+      input_dir="", output_file=ANY, progress=False, metrics=None, top_samples=None, threads=4, null=False,
+      since=None, archive="out.tar.zst", volume_size=100 * 1024 * 1024, checksums=None,
+      checksum_algorithm="blake2b")
+
+
+def test_main_archive_invalid(testdir, mock_testclass):
+  ListFiles.list_files = MagicMock()
+  with pytest.raises(SystemExit):
+    ListFiles.main(["-a", "out.zip"])
+  ListFiles.list_files.assert_not_called()
+
+
 def test_main_input_not_exists(testdir, mock_testclass):
   input_dir = "alphafold"
   output_file = "output.txt"
@@ -148,3 +187,210 @@ def test_list_files_std_out(testdir, mock_testclass, capsys):
     assert f"{output}/{output}_summary_confidences.json" in files
     assert f"{output}/ranking_scores.csv" in files
     assert f"{output}/TERMS_OF_USE.md" in files
+
+
+def create_policy_files(output):
+  create_alphafold3_files(output, output)
+  with open(f"{output}/ranking_scores.csv", "w") as ranking_out:
+    ranking_out.write("seed,sample,ranking_score\n1,0,0.3\n1,1,0.9\n1,2,0.5\n1,3,0.1\n1,4,0.2\n")
+  with open(f"{output}/{output}_data.json", "w") as data_out:
+    data_out.write(" " * 1000)
+
+
+def list_policy_files(metrics, top_samples=None):
+  output_file = io.StringIO()
+  sizes = ListFiles.list_files("", output_file, metrics=metrics, top_samples=top_samples)
+  return output_file.getvalue().splitlines(), sizes
+
+
+def test_list_files_metrics_summary(testdir, mock_testclass, capsys):
+  os.mkdir("RPB1_RPB2")
+  create_policy_files("RPB1_RPB2")
+  files, (selected_bytes, total_bytes) = list_policy_files(["iptm"])
+  assert files == ["RPB1_RPB2/RPB1_RPB2_summary_confidences.json", "RPB1_RPB2/TERMS_OF_USE.md",
+                   "RPB1_RPB2/ranking_scores.csv"] + [
+                    f"RPB1_RPB2/seed-1_sample-{sample}/summary_confidences.json" for sample in range(5)]
+  assert selected_bytes == os.path.getsize("RPB1_RPB2/ranking_scores.csv")
+  assert total_bytes == selected_bytes + 1000
+  assert "1000 bytes saved" in capsys.readouterr().err
+
+
+def test_list_files_metrics_lis(testdir, mock_testclass):
+  os.mkdir("RPB1_RPB2")
+  create_policy_files("RPB1_RPB2")
+  files, sizes = list_policy_files(["iptm", "lis"])
+  assert "RPB1_RPB2/RPB1_RPB2_data.json" in files
+  assert "RPB1_RPB2/RPB1_RPB2_model.cif" in files
+  assert "RPB1_RPB2/RPB1_RPB2_confidences.json" not in files
+  for sample in range(5):
+    assert f"RPB1_RPB2/seed-1_sample-{sample}/confidences.json" in files
+    assert f"RPB1_RPB2/seed-1_sample-{sample}/model.cif" in files
+  files, sizes = list_policy_files(["best_lis"])
+  assert "RPB1_RPB2/RPB1_RPB2_confidences.json" in files
+  assert "RPB1_RPB2/seed-1_sample-0/confidences.json" not in files
+
+
+def test_list_files_metrics_top_samples(testdir, mock_testclass):
+  os.mkdir("RPB1_RPB2")
+  create_policy_files("RPB1_RPB2")
+  files, sizes = list_policy_files(["iptm", "lis"], top_samples=2)
+  assert [file for file in files if file.endswith("/confidences.json")] == [
+    "RPB1_RPB2/seed-1_sample-1/confidences.json", "RPB1_RPB2/seed-1_sample-2/confidences.json"]
+  assert [file for file in files if file.endswith("summary_confidences.json")] == [
+    "RPB1_RPB2/RPB1_RPB2_summary_confidences.json"] + [
+           f"RPB1_RPB2/seed-1_sample-{sample}/summary_confidences.json" for sample in range(5)]
+
+
+def test_list_files_metrics_compressed(testdir, mock_testclass):
+  os.mkdir("RPB1_RPB2")
+  create_policy_files("RPB1_RPB2")
+  os.rename("RPB1_RPB2/RPB1_RPB2_model.cif", "RPB1_RPB2/RPB1_RPB2_model.cif.gz")
+  files, sizes = list_policy_files(["chain_iptm"])
+  assert "RPB1_RPB2/RPB1_RPB2_model.cif.gz" in files
+
+
+def test_list_files_metrics_invalid(testdir, mock_testclass):
+  with pytest.raises(AssertionError):
+    ListFiles.list_files("", io.StringIO(), metrics=["pae"])
+  with pytest.raises(AssertionError):
+    ListFiles.list_files("", io.StringIO(), top_samples=2)
+  with pytest.raises(AssertionError):
+    ListFiles.list_files("", io.StringIO(), metrics=["lis"], top_samples=-1)
+
+
+def test_list_files_null(testdir, mock_testclass):
+  alphafold_outputs = ["RPB3_RPB4", "RPB1_RPB2", "RPB5_RPB6"]
+  for output in alphafold_outputs:
+    os.mkdir(output)
+    create_alphafold3_files(output, output)
+  os.mkdir("logs")
+  Path("logs/job.json").touch()
+  output_file = io.StringIO()
+  ListFiles.list_files("", output_file, threads=2, null=True)
+  files = output_file.getvalue().split("\0")
+  assert files[-1] == ""
+  assert files[:-1] == [f"{output}/{file}" for output in sorted(alphafold_outputs) for file in sorted([
+    "TERMS_OF_USE.md", f"{output}_confidences.json", f"{output}_data.json", f"{output}_model.cif",
+    f"{output}_summary_confidences.json", "ranking_scores.csv"])]
+
+
+def test_list_files_input_dir(testdir, mock_testclass):
+  os.makedirs("structures/RPB1_RPB2")
+  create_alphafold3_files("structures/RPB1_RPB2", "RPB1_RPB2")
+  output_file = io.StringIO()
+  ListFiles.list_files("structures", output_file, threads=1)
+  assert "structures/RPB1_RPB2/ranking_scores.csv\n" in output_file.getvalue()
+
+
+def test_list_files_invalid_threads(testdir, mock_testclass):
+  with pytest.raises(AssertionError):
+    ListFiles.list_files("", io.StringIO(), threads=0)
+
+
+def test_ordered_map():
+  with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+    assert list(ListFiles.ordered_map(executor, lambda item: item * 2, range(10), 2)) == [
+      item * 2 for item in range(10)]
+
+
+def test_list_files_since(testdir, mock_testclass):
+  for output in ["RPB1_RPB2", "RPB3_RPB4"]:
+    os.mkdir(output)
+    create_alphafold3_files(output, output)
+  output_file = io.StringIO()
+  ListFiles.list_files("", output_file, since="manifest.txt")
+  assert len(output_file.getvalue().splitlines()) == 12
+  manifest = ListFiles.read_manifest("manifest.txt")
+  assert sorted(manifest) == ["RPB1_RPB2", "RPB3_RPB4"]
+  with open("manifest.txt", "r") as manifest_in:
+    assert manifest_in.readline() == "Directory\tDirectory mtime\tSize\tMtime\n"
+
+  output_file = io.StringIO()
+  ListFiles.list_files("", output_file, since="manifest.txt")
+  assert output_file.getvalue() == ""
+
+  os.mkdir("RPB5_RPB6")
+  create_alphafold3_files("RPB5_RPB6", "RPB5_RPB6")
+  # Files written in place do not change the mtime of the directory, a new file does.
+  with open("RPB1_RPB2/RPB1_RPB2_data.json", "w") as data_out:
+    data_out.write("{}")
+  Path("RPB3_RPB4/RPB3_RPB4_new.json").touch()
+  os.remove("RPB3_RPB4/RPB3_RPB4_new.json")
+  output_file = io.StringIO()
+  ListFiles.list_files("", output_file, since="manifest.txt")
+  assert sorted({os.path.dirname(file) for file in output_file.getvalue().splitlines()}) == ["RPB5_RPB6"]
+  assert sorted(ListFiles.read_manifest("manifest.txt")) == ["RPB1_RPB2", "RPB3_RPB4", "RPB5_RPB6"]
+
+  Path("RPB1_RPB2/RPB1_RPB2_new.json").touch()
+  output_file = io.StringIO()
+  ListFiles.list_files("", output_file, since="manifest.txt")
+  files = output_file.getvalue().splitlines()
+  assert "RPB1_RPB2/RPB1_RPB2_new.json" in files
+  assert sorted({os.path.dirname(file) for file in files}) == ["RPB1_RPB2"]
+  assert [name for name in os.listdir() if name.startswith(".manifest-")] == []
+
+
+def test_list_files_since_in_progress(testdir, mock_testclass):
+  os.mkdir("RPB1_RPB2")
+  Path("RPB1_RPB2/RPB1_RPB2_data.json").touch()
+  output_file = io.StringIO()
+  ListFiles.list_files("", output_file, since="manifest.txt")
+  assert output_file.getvalue() == ""
+  assert ListFiles.read_manifest("manifest.txt") == {}
+
+
+@pytest.mark.parametrize("archive", ["out.tar", "out.tar.gz", "out.tar.zst"])
+def test_list_files_archive(testdir, mock_testclass, archive):
+  if archive.endswith(".zst"):
+    pytest.importorskip("zstandard")
+  os.mkdir("RPB1_RPB2")
+  create_alphafold3_files("RPB1_RPB2", "RPB1_RPB2")
+  with open("RPB1_RPB2/RPB1_RPB2_confidences.json", "w") as confidences_out:
+    confidences_out.write('{"pae": [[0.1, 1.5], [2, 0]]}')
+  os.remove("RPB1_RPB2/TERMS_OF_USE.md")
+  output_file = io.StringIO()
+  ListFiles.list_files("", output_file, archive=archive)
+  files = output_file.getvalue().splitlines()
+  assert "RPB1_RPB2/TERMS_OF_USE.md" in files
+  with Af3Archive.open_archive(archive) as tar:
+    assert [member.name for member in Af3Archive.iter_members(tar)] == [
+      file for file in files if file != "RPB1_RPB2/TERMS_OF_USE.md"]
+  index = Af3Archive.read_index(f"{archive}.index")
+  assert Af3Archive.read_member(index["RPB1_RPB2/RPB1_RPB2_confidences.json"]) == b'{"pae": [[0.1, 1.5], [2, 0]]}'
+
+
+def test_list_files_archive_volume_size(testdir, mock_testclass):
+  with pytest.raises(AssertionError):
+    ListFiles.list_files("", io.StringIO(), volume_size=1024)
+
+
+@pytest.mark.parametrize("archive", [None, "out.tar.gz"])
+def test_list_files_checksums(testdir, mock_testclass, archive):
+  for output in ["RPB1_RPB2", "RPB3_RPB4"]:
+    os.mkdir(output)
+    create_alphafold3_files(output, output)
+    with open(f"{output}/{output}_data.json", "w") as data_out:
+      data_out.write(output)
+  os.remove("RPB1_RPB2/TERMS_OF_USE.md")
+  output_file = io.StringIO()
+  ListFiles.list_files("", output_file, threads=2, archive=archive, checksums="checksums.txt",
+                       checksum_algorithm="sha256")
+  checksums = dict(Checksums.read_checksums("checksums.txt"))
+  assert list(checksums) == [file for file in output_file.getvalue().splitlines()
+                             if file != "RPB1_RPB2/TERMS_OF_USE.md"]
+  assert checksums["RPB3_RPB4/RPB3_RPB4_data.json"] == hashlib.sha256(b"RPB3_RPB4").hexdigest()
+  assert Checksums.verify_checksums("checksums.txt", archive=archive) == 0
+
+
+def test_main_verify(testdir, mock_testclass):
+  ListFiles.list_files = MagicMock()
+  Path("data.json").touch()
+  with open("checksums.txt", "w") as checksums_out:
+    checksums_out.write(Checksums.checksum_line(Checksums.hash_file("data.json"), "data.json"))
+  ListFiles.main(["--verify", "checksums.txt"])
+  with open("checksums.txt", "a") as checksums_out:
+    checksums_out.write(Checksums.checksum_line(Checksums.hash_file("data.json"), "missing.json"))
+  with pytest.raises(SystemExit) as exit_info:
+    ListFiles.main(["--verify", "checksums.txt"])
+  assert exit_info.value.code == 1
+  ListFiles.list_files.assert_not_called()
@@ -1,11 +1,13 @@
+import io
 import os
 import shutil
 from pathlib import Path
 from unittest.mock import MagicMock, ANY
 
+import numpy as np
 import pytest
 
-from af3tools import PairSizes
+from af3tools import PairSizes, Pairs
 
 
 @pytest.fixture
@@ -27,7 +29,15 @@ def test_main(testdir, mock_testclass):
   PairSizes.pair_sizes.assert_called_once_with(baits=ANY, targets=ANY,
                                                unique=False,
                                                skip_identity=False,
-                                               output=ANY)
+                                               output=ANY,
+                                               pairs=None,
+                                               buckets=None,
+                                               manifests=None,
+                                               sequence=None,
+                                               extra_tokens=None,
+                                               table=None,
+                                               summary=None,
+                                               seeds=1)
   assert PairSizes.pair_sizes.call_args.kwargs["baits"].name == baits
   assert PairSizes.pair_sizes.call_args.kwargs["targets"].name == targets
   assert PairSizes.pair_sizes.call_args.kwargs[
@@ -47,7 +57,15 @@ def test_main_parameters(testdir, mock_testclass):
   PairSizes.pair_sizes.assert_called_once_with(baits=ANY, targets=ANY,
                                                unique=True,
                                                skip_identity=True,
-                                               output=ANY)
+                                               output=ANY,
+                                               pairs=None,
+                                               buckets=None,
+                                               manifests=None,
+                                               sequence=None,
+                                               extra_tokens=None,
+                                               table=None,
+                                               summary=None,
+                                               seeds=1)
   assert PairSizes.pair_sizes.call_args.kwargs["baits"].name == baits
   assert PairSizes.pair_sizes.call_args.kwargs["targets"].name == targets
   assert PairSizes.pair_sizes.call_args.kwargs["output"].name == sizes
@@ -66,7 +84,15 @@ def test_main_long_parameters(testdir, mock_testclass):
   PairSizes.pair_sizes.assert_called_once_with(baits=ANY, targets=ANY,
                                                unique=True,
                                                skip_identity=True,
-                                               output=ANY)
+                                               output=ANY,
+                                               pairs=None,
+                                               buckets=None,
+                                               manifests=None,
+                                               sequence=None,
+                                               extra_tokens=None,
+                                               table=None,
+                                               summary=None,
+                                               seeds=1)
   assert PairSizes.pair_sizes.call_args.kwargs["baits"].name == baits
   assert PairSizes.pair_sizes.call_args.kwargs["targets"].name == targets
   assert PairSizes.pair_sizes.call_args.kwargs["output"].name == sizes
@@ -177,3 +203,140 @@ def test_pair_sizes_unique_skip_identity(testdir, mock_testclass):
   with open(sizes, 'r') as sizes_file:
     assert sizes_file.readline() == "RPAB1_HUMAN__RPB9_HUMAN\t335\n"
     assert sizes_file.readline() == ""
+
+
+def test_main_pairs(testdir, mock_testclass):
+  open("baits.fasta", 'w').close()
+  open("targets.fasta", 'w').close()
+  open("pairs.tsv", 'w').close()
+  PairSizes.pair_sizes = MagicMock()
+  PairSizes.main(["-b", "baits.fasta", "-t", "targets.fasta", "-p", "pairs.tsv"])
+  assert PairSizes.pair_sizes.call_args.kwargs["pairs"].name == "pairs.tsv"
+
+
+def test_pair_sizes_pairs(testdir, mock_testclass):
+  baits = str(Path(__file__).parent.joinpath("P19388__P36954.fasta"))
+  targets = "targets.fasta"
+  with open(targets, "wb") as output:
+    for fasta in ["O15514.fasta", "P62487.fasta", "P19388.fasta"]:
+      with open(Path(__file__).parent.joinpath(fasta), "rb") as infile:
+        shutil.copyfileobj(infile, output)
+  with open("pairs.tsv", 'w') as pairs_out:
+    pairs_out.write("# bait\ttarget\nRPB9_HUMAN\tRPB7_HUMAN\nRPAB1_HUMAN\tRPAB1_HUMAN\nRPAB1_HUMAN\tRPB4_HUMAN\n")
+  sizes = io.StringIO()
+  with open("pairs.tsv", 'r') as pairs_in:
+    PairSizes.pair_sizes(baits=baits, targets=targets, output=sizes, skip_identity=True, pairs=pairs_in)
+  assert sizes.getvalue() == "RPB9_HUMAN__RPB7_HUMAN\t297\nRPAB1_HUMAN__RPB4_HUMAN\t352\n"
+  with open("pairs.tsv", 'w') as pairs_out:
+    pairs_out.write("RPB9_HUMAN\tRPB1_HUMAN\n")
+  with pytest.raises(AssertionError):
+    with open("pairs.tsv", 'r') as pairs_in:
+      PairSizes.pair_sizes(baits=baits, targets=targets, output=io.StringIO(), pairs=pairs_in)
+  with pytest.raises(AssertionError):
+    with open("pairs.tsv", 'r') as pairs_in:
+      PairSizes.pair_sizes(baits=baits, targets=targets, output=io.StringIO(), unique=True, pairs=pairs_in)
+
+
+def test_main_manifests(testdir, mock_testclass):
+  open("baits.fasta", 'w').close()
+  open("targets.fasta", 'w').close()
+  os.mkdir("manifests")
+  PairSizes.pair_sizes = MagicMock()
+  PairSizes.main(["-b", "baits.fasta", "-t", "targets.fasta", "-m", "manifests"])
+  assert PairSizes.pair_sizes.call_args.kwargs["buckets"] == Pairs.BUCKETS
+  assert PairSizes.pair_sizes.call_args.kwargs["manifests"] == "manifests"
+  PairSizes.pair_sizes = MagicMock()
+  PairSizes.main(["-b", "baits.fasta", "-t", "targets.fasta", "-z", "--buckets", "300", "400"])
+  assert PairSizes.pair_sizes.call_args.kwargs["buckets"] == [300, 400]
+  assert PairSizes.pair_sizes.call_args.kwargs["manifests"] is None
+
+
+def test_pair_sizes_buckets(testdir, mock_testclass):
+  baits = str(Path(__file__).parent.joinpath("P19388__P36954.fasta"))
+  targets = "targets.fasta"
+  with open(targets, "wb") as output:
+    for fasta in ["O15514.fasta", "P62487.fasta"]:
+      with open(Path(__file__).parent.joinpath(fasta), "rb") as infile:
+        shutil.copyfileobj(infile, output)
+  os.mkdir("manifests")
+  sizes = io.StringIO()
+  PairSizes.pair_sizes(baits=baits, targets=targets, output=sizes, buckets=[300, 360], manifests="manifests")
+  assert sizes.getvalue() == ("RPAB1_HUMAN__RPB4_HUMAN\t352\ttokens-360\n"
+                              "RPAB1_HUMAN__RPB7_HUMAN\t382\ttokens-over-360\n"
+                              "RPB9_HUMAN__RPB4_HUMAN\t267\ttokens-300\n"
+                              "RPB9_HUMAN__RPB7_HUMAN\t297\ttokens-300\n")
+  assert sorted(os.listdir("manifests")) == ["tokens-300.txt", "tokens-360.txt", "tokens-over-360.txt"]
+  with open("manifests/tokens-300.txt", 'r') as manifest_in:
+    assert manifest_in.read() == "RPB9_HUMAN__RPB4_HUMAN\t267\nRPB9_HUMAN__RPB7_HUMAN\t297\n"
+  with pytest.raises(AssertionError):
+    PairSizes.pair_sizes(baits=baits, targets=targets, output=io.StringIO(), manifests="manifests")
+
+
+def test_main_summary(testdir, mock_testclass):
+  open("baits.fasta", 'w').close()
+  open("targets.fasta", 'w').close()
+  with open("atp.json", 'w') as sequence_out:
+    sequence_out.write('{"ligand": {"id": "AP", "ccdCodes": ["ATP"]}}')
+  PairSizes.pair_sizes = MagicMock()
+  PairSizes.main(["-b", "baits.fasta", "-t", "targets.fasta", "-a", "atp.json", "-e", "40", "-S", "5",
+                  "-T", "sizes.npz", "-y", "summary.txt"])
+  PairSizes.pair_sizes.assert_called_once_with(baits=ANY, targets=ANY,
+                                               unique=False,
+                                               skip_identity=False,
+                                               output=None,
+                                               pairs=None,
+                                               buckets=None,
+                                               manifests=None,
+                                               sequence=ANY,
+                                               extra_tokens=40,
+                                               table="sizes.npz",
+                                               summary=ANY,
+                                               seeds=5)
+  assert PairSizes.pair_sizes.call_args.kwargs["sequence"].name == "atp.json"
+  assert PairSizes.pair_sizes.call_args.kwargs["summary"].name == "summary.txt"
+  assert not os.path.exists("pair_sizes.txt")
+
+
+def test_pair_sizes_sequence(testdir, mock_testclass):
+  baits = str(Path(__file__).parent.joinpath("P19388__P36954.fasta"))
+  targets = str(Path(__file__).parent.joinpath("O15514.fasta"))
+  sizes = io.StringIO()
+  with open(Path(__file__).parent.joinpath("atp.json"), 'r') as sequence_in:
+    PairSizes.pair_sizes(baits=baits, targets=targets, output=sizes, sequence=sequence_in)
+  assert sizes.getvalue() == "RPAB1_HUMAN__RPB4_HUMAN\t383\nRPB9_HUMAN__RPB4_HUMAN\t298\n"
+  sizes = io.StringIO()
+  PairSizes.pair_sizes(baits=baits, targets=targets, output=sizes, extra_tokens=10)
+  assert sizes.getvalue() == "RPAB1_HUMAN__RPB4_HUMAN\t362\nRPB9_HUMAN__RPB4_HUMAN\t277\n"
+
+
+def test_pair_sizes_table_summary(testdir, mock_testclass):
+  baits = str(Path(__file__).parent.joinpath("P19388__P36954.fasta"))
+  targets = "targets.fasta"
+  with open(targets, "wb") as output:
+    for fasta in ["O15514.fasta", "P62487.fasta"]:
+      with open(Path(__file__).parent.joinpath(fasta), "rb") as infile:
+        shutil.copyfileobj(infile, output)
+  summary = io.StringIO()
+  PairSizes.pair_sizes(baits=baits, targets=targets, buckets=[300, 360], table="sizes.npz", summary=summary,
+                       seeds=2)
+  with np.load("sizes.npz") as table:
+    assert list(table["baits"]) == ["RPAB1_HUMAN", "RPB9_HUMAN"]
+    assert list(table["targets"]) == ["RPB4_HUMAN", "RPB7_HUMAN"]
+    assert list(table["bait_index"]) == [0, 0, 1, 1]
+    assert list(table["target_index"]) == [0, 1, 0, 1]
+    assert list(table["size"]) == [352, 382, 267, 297]
+    assert table["size"].dtype == np.uint16
+  hours = [2 * PairSizes.inference_seconds(300) * 2 / 3600, 2 * PairSizes.inference_seconds(360) / 3600,
+           2 * PairSizes.inference_seconds(382) / 3600]
+  assert summary.getvalue() == (
+    "Bucket\tPairs\tLargest pair\tGPU hours\tGPU memory (GB)\n"
+    f"tokens-300\t2\t297\t{hours[0]:.1f}\t{PairSizes.gpu_memory(300):.1f}\n"
+    f"tokens-360\t1\t352\t{hours[1]:.1f}\t{PairSizes.gpu_memory(360):.1f}\n"
+    f"tokens-over-360\t1\t382\t{hours[2]:.1f}\t{PairSizes.gpu_memory(382):.1f}\n"
+    f"Total\t4\t382\t{sum(hours):.1f}\t{PairSizes.gpu_memory(382):.1f}\n")
+
+
+def test_inference_seconds():
+  for size, seconds in PairSizes.INFERENCE_SECONDS.items():
+    assert PairSizes.inference_seconds(size) == pytest.approx(seconds, rel=0.15)
+  assert PairSizes.gpu_memory(PairSizes.GPU_MEMORY_TOKENS) == PairSizes.GPU_MEMORY
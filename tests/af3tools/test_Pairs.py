@@ -0,0 +1,100 @@
+import io
+import random
+
+import pytest
+
+from af3tools import Pairs
+
+
+def processed_ids_pairs(baits: list[str], targets: list[str], unique: bool, skip_identity: bool):
+  # Previous enumeration, keeping every returned pair.
+  processed_ids = set()
+  for bait in baits:
+    for target in targets:
+      if skip_identity and bait == target:
+        continue
+      if unique and f"{target}__{bait}" in processed_ids:
+        continue
+      processed_ids.add(f"{bait}__{target}")
+      yield bait, target
+
+
+def test_enumerate_pairs():
+  baits = ["RPB1", "RPB2", "RPB3"]
+  targets = ["RPB3", "RPB2", "RPB4"]
+  assert list(Pairs.enumerate_pairs(baits, targets)) == [(bait, target) for bait in range(3) for target in range(3)]
+  assert list(Pairs.enumerate_pairs(baits, targets, unique=True, skip_identity=True)) == [
+    (0, 0), (0, 1), (0, 2), (1, 0), (1, 2), (2, 2)]
+  assert list(Pairs.enumerate_pairs(baits, targets, unique=True)) == [
+    (0, 0), (0, 1), (0, 2), (1, 0), (1, 1), (1, 2), (2, 0), (2, 2)]
+
+
+@pytest.mark.parametrize("unique,skip_identity", [(False, False), (True, False), (False, True), (True, True)])
+def test_enumerate_pairs_processed_ids(unique, skip_identity):
+  proteins = [f"P{index}" for index in range(30)]
+  generator = random.Random(7)
+  for _ in range(20):
+    baits = generator.sample(proteins, generator.randint(0, 15))
+    targets = generator.sample(proteins, generator.randint(0, 15))
+    assert [(baits[bait], targets[target]) for bait, target in
+            Pairs.enumerate_pairs(baits, targets, unique, skip_identity)] == list(
+        processed_ids_pairs(baits, targets, unique, skip_identity))
+
+
+def test_read_pairs():
+  pairs = io.StringIO("# bait\ttarget\nRPB1_HUMAN\tRPB2_HUMAN\t0.9\r\n\nRPB3_HUMAN\tRPB1_HUMAN\n")
+  assert list(Pairs.read_pairs(pairs)) == [("RPB1_HUMAN", "RPB2_HUMAN"), ("RPB3_HUMAN", "RPB1_HUMAN")]
+  with pytest.raises(AssertionError):
+    list(Pairs.read_pairs(io.StringIO("RPB1_HUMAN RPB2_HUMAN\n")))
+
+
+def test_size_bucket():
+  assert Pairs.size_bucket(1) == 256
+  assert Pairs.size_bucket(256) == 256
+  assert Pairs.size_bucket(257) == 512
+  assert Pairs.size_bucket(1537) == 2048
+  assert Pairs.size_bucket(5121) is None
+  assert Pairs.size_bucket(700, [500, 1000]) == 1000
+
+
+def test_bucket_name():
+  assert Pairs.bucket_name(352) == "tokens-512"
+  assert Pairs.bucket_name(6000) == "tokens-over-5120"
+  assert Pairs.bucket_name(1200, [500, 1000]) == "tokens-over-1000"
+
+
+def test_validate_buckets():
+  Pairs.validate_buckets(Pairs.BUCKETS)
+  with pytest.raises(AssertionError):
+    Pairs.validate_buckets([])
+  with pytest.raises(AssertionError):
+    Pairs.validate_buckets([512, 256])
+  with pytest.raises(AssertionError):
+    Pairs.validate_buckets([0, 256])
+
+
+@pytest.mark.parametrize("unique,skip_identity", [(False, False), (True, False), (False, True), (True, True)])
+def test_enumerate_pair_blocks(unique, skip_identity):
+  baits = [f"P{index}" for index in range(30)]
+  targets = [f"P{index}" for index in range(10, 50)]
+  blocks = list(Pairs.enumerate_pair_blocks(baits, targets, unique, skip_identity, block_pairs=80))
+  assert len(blocks) == 15
+  assert [(bait_index, target_index) for bait_indexes, target_indexes in blocks
+          for bait_index, target_index in zip(bait_indexes.tolist(), target_indexes.tolist())] == list(
+      Pairs.enumerate_pairs(baits, targets, unique, skip_identity))
+
+
+def test_entity_tokens():
+  assert Pairs.entity_tokens({"protein": {"id": "A", "sequence": "MKV"}}) == 3
+  assert Pairs.entity_tokens({"dna": {"id": ["A", "B"], "sequence": "GATC"}}) == 8
+  assert Pairs.entity_tokens({"ligand": {"id": "C", "ccdCodes": ["ATP", "MG"]}}) == 32
+  assert Pairs.entity_tokens({"ligand": {"id": "C", "smiles": "CC(=O)[O-].[2H]C[Na+]"}}) == 6
+  assert Pairs.entity_tokens({"ligand": {"id": "C", "smiles": "c1ccccc1Cl"}}) == 7
+
+
+def test_entity_tokens_unknown_ccd_code(caplog):
+  Pairs._warn_unknown_ccd_code.cache_clear()
+  assert Pairs.entity_tokens({"ligand": {"id": "C", "ccdCodes": ["NAG", "MG"]}}) == 1
+  assert Pairs.entity_tokens({"ligand": {"id": "C", "ccdCodes": ["NAG"]}}) == 0
+  assert [record.message for record in caplog.records if "NAG" in record.message] == [
+    "Number of atoms of CCD code NAG is unknown, it counts as 0 tokens, use a SMILES ligand to count its atoms"]
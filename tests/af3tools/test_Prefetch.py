@@ -0,0 +1,76 @@
+import concurrent.futures
+import threading
+
+import pytest
+
+from af3tools import Prefetch
+
+
+def test_read_file(testdir):
+  with open("data.json", "w") as data_out:
+    data_out.write(" " * (Prefetch.READ_SIZE + 10))
+  assert Prefetch.read_file("data.json") == Prefetch.READ_SIZE + 10
+  assert Prefetch.read_file("missing.json") == 0
+
+
+def test_file_size(testdir):
+  with open("data.json", "w") as data_out:
+    data_out.write(" " * 100)
+  assert Prefetch.file_size("data.json") == 100
+  assert Prefetch.file_size("missing.json") == 0
+
+
+def test_prefetcher_invalid():
+  with pytest.raises(AssertionError):
+    Prefetch.Prefetcher(0)
+  with pytest.raises(AssertionError):
+    Prefetch.Prefetcher(100, threads=0)
+
+
+def test_prefetcher(testdir):
+  for name in ["a", "b", "c"]:
+    with open(f"{name}.json", "w") as data_out:
+      data_out.write(" " * 100)
+  futures = [concurrent.futures.Future() for _ in range(3)]
+  with Prefetch.Prefetcher(150) as prefetcher:
+    prefetcher.prefetch(["a", "b", "c"], futures, lambda item: [f"{item}.json"])
+    # Budget only allows one task to be prefetched until it completes.
+    while prefetcher.prefetched < 100:
+      threading.Event().wait(0.01)
+    threading.Event().wait(0.05)
+    assert prefetcher.held == 100
+    assert prefetcher.prefetched == 100
+    futures[0].set_result(None)
+    while prefetcher.prefetched < 200:
+      threading.Event().wait(0.01)
+    assert prefetcher.held == 100
+    futures[1].set_result(None)
+    futures[2].set_result(None)
+    while prefetcher.prefetched < 300:
+      threading.Event().wait(0.01)
+  assert prefetcher.held == 0
+  assert prefetcher.prefetched == 300
+
+
+def test_prefetcher_skip_running(testdir):
+  with open("a.json", "w") as data_out:
+    data_out.write(" " * 100)
+  future = concurrent.futures.Future()
+  future.set_running_or_notify_cancel()
+  with Prefetch.Prefetcher(150) as prefetcher:
+    prefetcher.prefetch(["a"], [future], lambda item: [f"{item}.json"])
+  assert prefetcher.prefetched == 0
+  assert prefetcher.held == 0
+
+
+def test_prefetcher_stop_waiting(testdir):
+  for name in ["a", "b"]:
+    with open(f"{name}.json", "w") as data_out:
+      data_out.write(" " * 100)
+  futures = [concurrent.futures.Future() for _ in range(2)]
+  with Prefetch.Prefetcher(150) as prefetcher:
+    prefetcher.prefetch(["a", "b"], futures, lambda item: [f"{item}.json"])
+    while prefetcher.held < 100:
+      threading.Event().wait(0.01)
+  # Leaving context stops prefetch of b, which waits for a to complete.
+  assert prefetcher.held == 100
@@ -0,0 +1,96 @@
+import io
+import json
+import os
+
+import pytest
+
+from af3tools import Profiler
+
+
+@pytest.fixture
+def mock_testclass():
+  yield
+  Profiler.disable()
+
+
+def test_stage_disabled(mock_testclass):
+  with Profiler.stage("load_summary"):
+    pass
+  assert Profiler.events == []
+
+
+def test_stage(mock_testclass):
+  Profiler.enable()
+  with Profiler.task("A__B_summary_confidences.json"):
+    with Profiler.stage("load_summary"):
+      pass
+  with Profiler.stage("write"):
+    pass
+  assert [event["stage"] for event in Profiler.events] == ["load_summary", Profiler.TASK, "write"]
+  assert [event["item"] for event in Profiler.events] == ["A__B_summary_confidences.json",
+                                                          "A__B_summary_confidences.json", None]
+  for event in Profiler.events:
+    assert event["pid"] == os.getpid()
+    assert event["wall"] >= 0
+    assert event["cpu"] >= 0
+    assert event["bytes"] >= 0
+
+
+def test_stage_bytes_read(testdir, mock_testclass):
+  with open("data.json", "w") as data_out:
+    data_out.write(" " * 100000)
+  Profiler.enable()
+  with Profiler.stage("load_data_json"):
+    with open("data.json", "r") as data_in:
+      data_in.read()
+  if Profiler.bytes_read() == 0:
+    pytest.skip("operating system does not report bytes read")
+  assert Profiler.events[0]["bytes"] >= 100000
+
+
+def test_collect(testdir, mock_testclass):
+  os.mkdir("trace")
+  with open("trace/events-1.jsonl", "w") as events_out:
+    events_out.write(json.dumps({"stage": "parse_cif", "item": "A__C", "pid": 1, "tid": 1, "start": 2.0,
+                                 "wall": 0.5, "cpu": 0.4, "bytes": 10}))
+    events_out.write("\n")
+  Profiler.enable("trace")
+  with Profiler.task("A__B"):
+    pass
+  Profiler.events.append({"stage": "write", "item": None, "pid": 2, "tid": 2, "start": 1.0,
+                          "wall": 0.1, "cpu": 0.1, "bytes": 0})
+  collected = Profiler.collect()
+  assert [event["stage"] for event in collected] == ["write", "parse_cif", Profiler.TASK]
+  assert os.path.isfile(f"trace/events-{os.getpid()}.jsonl")
+
+
+def test_write_report():
+  collected = [
+    {"stage": "parse_cif", "item": "A__B", "pid": 1, "tid": 1, "start": 1.0, "wall": 0.5, "cpu": 0.4,
+     "bytes": 1000000},
+    {"stage": "discover", "item": None, "pid": 3, "tid": 3, "start": 0.0, "wall": 0.2, "cpu": 0.1,
+     "bytes": 0},
+    {"stage": "parse_cif", "item": "A__C", "pid": 2, "tid": 2, "start": 1.0, "wall": 1.5, "cpu": 1.0,
+     "bytes": 3000000},
+  ]
+  report_out = io.StringIO()
+  Profiler.write_report(report_out, collected)
+  assert report_out.getvalue().splitlines() == [
+    "\t".join(Profiler.REPORT_HEADER),
+    "discover\tall\t1\t0.2\t0.1\t0\t200.0\t200.0\t0.0",
+    "discover\t3\t1\t0.2\t0.1\t0\t200.0\t200.0\t0.0",
+    "parse_cif\tall\t2\t2.0\t1.4\t4000000\t1000.0\t1500.0\t2.0",
+    "parse_cif\t1\t1\t0.5\t0.4\t1000000\t500.0\t500.0\t2.0",
+    "parse_cif\t2\t1\t1.5\t1.0\t3000000\t1500.0\t1500.0\t2.0",
+  ]
+
+
+def test_write_trace():
+  collected = [{"stage": "parse_cif", "item": "A__B", "pid": 1, "tid": 4, "start": 1.5, "wall": 0.25,
+                "cpu": 0.2, "bytes": 10}]
+  trace_out = io.StringIO()
+  Profiler.write_trace(trace_out, collected)
+  trace = json.loads(trace_out.getvalue())
+  assert trace["traceEvents"] == [
+    {"name": "parse_cif", "cat": "af3-score", "ph": "X", "ts": 1500000, "dur": 250000, "pid": 1, "tid": 4,
+     "args": {"item": "A__B", "cpu_ms": 200.0, "bytes": 10}}]
@@ -0,0 +1,68 @@
+import pytest
+
+from af3tools import ScoreOutput
+
+
+def test_score_writer_tsv(testdir):
+  output = "output.txt"
+  with ScoreOutput.ScoreWriter(output, ["Bait", "Target", "ipTM", "iLIS"]) as writer:
+    writer.write(["POLR2A", "POLR2B", 0.7772, "NA"])
+    writer.write(["POLR2A", "POLR2C", 0.7601, None])
+  with open(output, "r") as output_in:
+    assert output_in.readline() == "Bait\tTarget\tipTM\tiLIS\n"
+    assert output_in.readline() == "POLR2A\tPOLR2B\t0.7772\tNA\n"
+    assert output_in.readline() == "POLR2A\tPOLR2C\t0.7601\tNA\n"
+    assert output_in.readline() == ""
+
+
+def test_score_writer_invalid_format(testdir):
+  with pytest.raises(AssertionError):
+    ScoreOutput.ScoreWriter("output.txt", ["Bait", "Target"], "csv")
+
+
+def test_score_writer_invalid_row_group_size(testdir):
+  with pytest.raises(AssertionError):
+    ScoreOutput.ScoreWriter("output.txt", ["Bait", "Target"], row_group_size=0)
+
+
+def test_score_writer_parquet(testdir):
+  pq = pytest.importorskip("pyarrow.parquet")
+  output = "output.parquet"
+  with ScoreOutput.ScoreWriter(output, ["Bait", "Target", "ipTM", "iLIS"], "parquet",
+                               {"metrics": ["iptm", "lis"]}, row_group_size=2) as writer:
+    writer.write(["POLR2A", "POLR2B", 0.7772, 0.5])
+    writer.write(["POLR2A", "POLR2C", "0.7601", "NA"])
+    writer.write(["POLR2A", "POLR2D", 0.1, None])
+  parquet_file = pq.ParquetFile(output)
+  assert parquet_file.metadata.num_row_groups == 2
+  table = parquet_file.read()
+  assert table.column_names == ["Bait", "Target", "ipTM", "iLIS"]
+  assert str(table.schema.field("ipTM").type) == "double"
+  assert table.column("Target").to_pylist() == ["POLR2B", "POLR2C", "POLR2D"]
+  assert table.column("ipTM").to_pylist() == [0.7772, 0.7601, 0.1]
+  assert table.column("iLIS").to_pylist() == [0.5, None, None]
+  metadata = ScoreOutput.read_metadata(output)
+  assert metadata["metrics"] == ["iptm", "lis"]
+  assert metadata["version"] == ScoreOutput.tool_version()
+
+
+def test_score_writer_arrow(testdir):
+  pa = pytest.importorskip("pyarrow")
+  import pyarrow.ipc
+  output = "output.arrow"
+  with ScoreOutput.ScoreWriter(output, ["Bait", "Target", "ipTM"], "arrow",
+                               {"metrics": ["iptm"]}) as writer:
+    writer.write(["POLR2A", "POLR2B", 0.7772])
+    writer.write(["POLR2A", "POLR2C", 0.7601])
+  with pa.ipc.open_file(output) as reader:
+    table = reader.read_all()
+  assert table.column("Bait").to_pylist() == ["POLR2A", "POLR2A"]
+  assert table.column("ipTM").to_pylist() == [0.7772, 0.7601]
+  assert ScoreOutput.read_metadata(output)["metrics"] == ["iptm"]
+
+
+def test_to_float():
+  assert ScoreOutput.to_float("0.5") == 0.5
+  assert ScoreOutput.to_float(2) == 2.0
+  assert ScoreOutput.to_float("NA") is None
+  assert ScoreOutput.to_float(None) is None
@@ -0,0 +1,99 @@
+import concurrent.futures
+# Imported during collection, testdir removes modules first imported by a test from sys.modules.
+import concurrent.futures.process
+import io
+import json
+import os
+import threading
+
+import pytest
+
+from af3tools import StatusFile
+
+
+def test_status_format():
+  assert StatusFile.status_format("status.json") == "json"
+  assert StatusFile.status_format("af3score.prom") == "prometheus"
+
+
+def test_status_reporter_invalid(testdir):
+  with pytest.raises(AssertionError):
+    StatusFile.StatusReporter("status.json", output_format="xml")
+  with pytest.raises(AssertionError):
+    StatusFile.StatusReporter("status.json", interval=0)
+
+
+def test_status_reporter(testdir):
+  release = threading.Event()
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+  reporter = StatusFile.StatusReporter("status.json", interval=3600)
+  try:
+    with reporter:
+      futures = [executor.submit(lambda: None), executor.submit(lambda: 1 / 0),
+                 executor.submit(release.wait), executor.submit(lambda: None)]
+      reporter.track(futures)
+      # Single worker runs callbacks of previous tasks before starting the third task.
+      while not futures[2].running():
+        threading.Event().wait(0.01)
+      reporter.write()
+      with open("status.json", "r") as status_in:
+        status = json.load(status_in)
+      assert status["total"] == 4
+      assert status["done"] == 1
+      assert status["failed"] == 1
+      assert status["in_flight"] == 1
+      assert status["finished"] is False
+      assert status["throughput"] > 0
+      # Tasks completed in milliseconds, so ETA of remaining tasks can round to 0.
+      assert status["eta_seconds"] is not None
+      assert status["eta_seconds"] >= 0
+      release.set()
+      executor.shutdown(wait=True)
+  finally:
+    release.set()
+    executor.shutdown(wait=False, cancel_futures=True)
+  with open("status.json", "r") as status_in:
+    status = json.load(status_in)
+  assert status["done"] == 3
+  assert status["failed"] == 1
+  assert status["in_flight"] == 0
+  assert status["eta_seconds"] == 0
+  assert status["finished"] is True
+  assert [name for name in os.listdir() if name.startswith(".status-")] == []
+
+
+def test_status_reporter_periodic(testdir):
+  with StatusFile.StatusReporter("status.json", interval=0.01):
+    while not os.path.exists("status.json"):
+      threading.Event().wait(0.01)
+  with open("status.json", "r") as status_in:
+    assert json.load(status_in)["finished"] is True
+
+
+def test_status_reporter_workers(testdir):
+  if not os.path.exists("/proc/self/stat"):
+    pytest.skip("/proc is not available")
+  executor = concurrent.futures.ProcessPoolExecutor(max_workers=2)
+  try:
+    executor.submit(os.getpid).result()
+    status = StatusFile.StatusReporter("status.json").status()
+  finally:
+    executor.shutdown()
+  assert status["workers"] >= 1
+  assert status["worker_rss_bytes"] > 0
+  assert status["worker_rss_max_bytes"] > 0
+
+
+def test_write_prometheus():
+  status = {name: 0 for name, metric_type, description in StatusFile.PROMETHEUS_METRICS}
+  status["done"] = 10
+  status["eta_seconds"] = None
+  status["finished"] = True
+  status_out = io.StringIO()
+  StatusFile.write_prometheus(status_out, status)
+  lines = status_out.getvalue().splitlines()
+  assert "# TYPE af3score_done gauge" in lines
+  assert "af3score_done 10" in lines
+  assert "af3score_eta_seconds NaN" in lines
+  assert "af3score_finished 1" in lines
+  assert len(lines) == 3 * len(StatusFile.PROMETHEUS_METRICS)
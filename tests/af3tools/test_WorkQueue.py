@@ -0,0 +1,143 @@
+import io
+import json
+import os
+import time
+
+import pytest
+
+from af3tools import WorkQueue
+
+
+def test_init_queue(testdir):
+  items = [f"item{i}" for i in range(5)]
+  assert WorkQueue.init_queue("queue", items, batch_size=2)
+  assert WorkQueue.exists("queue")
+  assert sorted(os.listdir("queue/pending")) == ["batch-000000.txt", "batch-000001.txt", "batch-000002.txt"]
+  with open("queue/pending/batch-000002.txt", "r") as batch_in:
+    assert batch_in.read() == "item4\n"
+  assert os.path.isdir("queue/claimed")
+  assert os.path.isdir("queue/done")
+  assert os.path.isdir("queue/results")
+  assert WorkQueue.queue_info("queue") == {"batches": 3, "parameters": {}}
+
+
+def test_init_queue_already_initialized(testdir):
+  assert WorkQueue.init_queue("queue", ["item0", "item1"], batch_size=1)
+  assert not WorkQueue.init_queue("queue", ["item2"], batch_size=1)
+  assert sorted(os.listdir("queue/pending")) == ["batch-000000.txt", "batch-000001.txt"]
+
+
+def test_init_queue_invalid_batch_size(testdir):
+  with pytest.raises(AssertionError):
+    WorkQueue.init_queue("queue", ["item0"], batch_size=0)
+
+
+def test_claim_batch(testdir):
+  WorkQueue.init_queue("queue", ["item0", "item1", "item2"], batch_size=2)
+  batch = WorkQueue.claim_batch("queue", "worker1")
+  assert batch.name == "batch-000000.txt"
+  assert batch.items == ["item0", "item1"]
+  assert os.path.isfile("queue/claimed/batch-000000.txt@worker1")
+  batch = WorkQueue.claim_batch("queue", "worker2")
+  assert batch.name == "batch-000001.txt"
+  assert batch.items == ["item2"]
+  assert WorkQueue.claim_batch("queue", "worker3") is None
+  assert not WorkQueue.is_drained("queue")
+
+
+def test_claim_batch_expired_pending(testdir):
+  WorkQueue.init_queue("queue", ["item0"], batch_size=1)
+  expired = time.time() - 120
+  os.utime("queue/pending/batch-000000.txt", (expired, expired))
+  batch = WorkQueue.claim_batch("queue", "worker1", lease=60)
+  # Lease starts when batch is claimed, not when it was written.
+  assert WorkQueue.reclaim_expired("queue", lease=60) == 0
+  assert os.listdir("queue/claimed") == ["batch-000000.txt@worker1"]
+  assert time.time() - os.stat(batch.path).st_mtime < 60
+
+
+def test_claim_batch_reclaim_expired(testdir):
+  WorkQueue.init_queue("queue", ["item0"], batch_size=1)
+  batch = WorkQueue.claim_batch("queue", "worker1")
+  expired = time.time() - 120
+  os.utime(batch.path, (expired, expired))
+  assert WorkQueue.claim_batch("queue", "worker2", lease=300) is None
+  reclaimed = WorkQueue.claim_batch("queue", "worker2", lease=60)
+  assert reclaimed.name == batch.name
+  assert reclaimed.items == ["item0"]
+  assert os.listdir("queue/claimed") == ["batch-000000.txt@worker2"]
+
+
+def test_renew_lease(testdir):
+  WorkQueue.init_queue("queue", ["item0"], batch_size=1)
+  batch = WorkQueue.claim_batch("queue", "worker1")
+  expired = time.time() - 120
+  os.utime(batch.path, (expired, expired))
+  assert WorkQueue.renew_lease(batch)
+  assert time.time() - os.stat(batch.path).st_mtime < 60
+  os.remove(batch.path)
+  assert not WorkQueue.renew_lease(batch)
+
+
+def test_complete_batch(testdir):
+  WorkQueue.init_queue("queue", ["item0"], batch_size=1)
+  batch = WorkQueue.claim_batch("queue", "worker1")
+  with open("result.txt", "w") as result_out:
+    result_out.write("result0\n")
+  WorkQueue.complete_batch(batch, "result.txt")
+  assert not os.path.exists("result.txt")
+  assert os.listdir("queue/done") == ["batch-000000.txt"]
+  assert WorkQueue.results("queue") == [os.path.join("queue", "results", "batch-000000.txt")]
+  assert WorkQueue.is_drained("queue")
+
+
+def test_complete_batch_reclaimed(testdir):
+  WorkQueue.init_queue("queue", ["item0"], batch_size=1)
+  batch = WorkQueue.claim_batch("queue", "worker1")
+  os.rename(batch.path, "queue/pending/batch-000000.txt")
+  with open("result.txt", "w") as result_out:
+    result_out.write("result0\n")
+  WorkQueue.complete_batch(batch, "result.txt")
+  assert os.listdir("queue/done") == []
+  assert os.path.isfile("queue/results/batch-000000.txt")
+
+
+def test_is_drained_reclaimed(testdir):
+  WorkQueue.init_queue("queue", ["item0"], batch_size=1)
+  batch = WorkQueue.claim_batch("queue", "worker1")
+  os.rename(batch.path, "queue/pending/batch-000000.txt")
+  with open("result.txt", "w") as result_out:
+    result_out.write("result0\n")
+  WorkQueue.complete_batch(batch, "result.txt")
+  assert not WorkQueue.is_drained("queue")
+  WorkQueue.complete_batch(WorkQueue.claim_batch("queue", "worker2"))
+  assert WorkQueue.is_drained("queue")
+
+
+def test_check_parameters(testdir):
+  WorkQueue.init_queue("queue", ["item0"], parameters={"metrics": ["iptm"], "gate": None})
+  with open("queue/queue.json", "r") as info_in:
+    assert json.load(info_in)["parameters"] == {"metrics": ["iptm"], "gate": None}
+  WorkQueue.check_parameters("queue", {"metrics": ("iptm",), "gate": None})
+  with pytest.raises(AssertionError, match="gate, metrics"):
+    WorkQueue.check_parameters("queue", {"metrics": ["iptm", "lis"], "gate": "iptm>=0.4"})
+
+
+def test_claim_merge(testdir):
+  WorkQueue.init_queue("queue", ["item0"], batch_size=1)
+  assert not WorkQueue.is_merged("queue")
+  assert WorkQueue.claim_merge("queue")
+  assert WorkQueue.is_merged("queue")
+  assert not WorkQueue.claim_merge("queue")
+
+
+def test_merge_results(testdir):
+  WorkQueue.init_queue("queue", ["item0", "item1"], batch_size=1)
+  for _ in range(2):
+    batch = WorkQueue.claim_batch("queue", "worker1")
+    with open("result.txt", "w") as result_out:
+      result_out.write(f"{batch.items[0]}\n")
+    WorkQueue.complete_batch(batch, "result.txt")
+  output = io.StringIO()
+  WorkQueue.merge_results("queue", output, "header\n")
+  assert output.getvalue() == "header\nitem0\nitem1\n"
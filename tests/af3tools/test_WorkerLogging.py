@@ -0,0 +1,72 @@
+# Imported during collection, testdir removes modules first imported by a test from sys.modules.
+import concurrent.futures.process
+import logging
+import logging.handlers
+import queue
+from unittest.mock import MagicMock
+
+import pytest
+
+from af3tools import WorkerLogging
+
+
+@pytest.fixture
+def mock_testclass():
+  root = logging.getLogger()
+  _handlers = list(root.handlers)
+  _level = root.level
+  yield
+  for handler in list(root.handlers):
+    root.removeHandler(handler)
+  for handler in _handlers:
+    root.addHandler(handler)
+  root.setLevel(_level)
+
+
+def test_configure(testdir, mock_testclass):
+  root = logging.getLogger()
+  for handler in list(root.handlers):
+    root.removeHandler(handler)
+  WorkerLogging.configure("test.log", "WARNING")
+  logging.getLogger("Af3Score").info("hidden")
+  logging.getLogger("Af3Score").warning("shown")
+  for handler in root.handlers:
+    handler.flush()
+  with open("test.log", "r") as log_in:
+    lines = log_in.readlines()
+  assert len(lines) == 1
+  assert "Af3Score - WARNING - shown" in lines[0]
+
+
+def test_configure_invalid_level(testdir, mock_testclass):
+  with pytest.raises(AssertionError):
+    WorkerLogging.configure("test.log", "VERBOSE")
+
+
+def test_init_worker(mock_testclass):
+  log_queue = queue.Queue()
+  WorkerLogging.init_worker(log_queue, logging.WARNING)
+  root = logging.getLogger()
+  assert len(root.handlers) == 1
+  assert isinstance(root.handlers[0], logging.handlers.QueueHandler)
+  logging.getLogger("Af3Score").info("dropped")
+  logging.getLogger("Af3Score").warning("sent")
+  record = log_queue.get_nowait()
+  assert record.getMessage() == "sent"
+  assert log_queue.empty()
+
+
+def test_process_pool(caplog):
+  caplog.set_level(logging.INFO)
+  with WorkerLogging.process_pool(1) as executor:
+    executor.submit(logging.getLogger("Af3Score").debug, "dropped in worker").result()
+    executor.submit(logging.getLogger("Af3Score").warning, "from worker").result()
+  messages = [(record.name, record.getMessage()) for record in caplog.records]
+  assert ("Af3Score", "from worker") in messages
+  assert ("Af3Score", "dropped in worker") not in messages
+
+
+def test_init_worker_initializer(mock_testclass):
+  initializer = MagicMock()
+  WorkerLogging.init_worker(queue.Queue(), logging.WARNING, initializer, ("trace", 2))
+  initializer.assert_called_once_with("trace", 2)
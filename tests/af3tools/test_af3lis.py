@@ -1,6 +1,7 @@
 import io
 import os
 import shutil
+import tarfile
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
@@ -53,11 +54,13 @@ def test_main(testdir, mock_testclass):
     sequence_one=0, sequence_two=1,
     lis_file="structures/structures_lis_analysis.csv",
     progress=False,
-    mapping_file=None, source_column=0, converted_column=1)
+    mapping_file=None, source_column=0, converted_column=1,
+    output_format="tsv", json_backend="auto")
 
 
 def test_main_parameters(testdir, mock_testclass):
   output = "output.txt"
+  output_format = "parquet"
   metrics = ["iptm", "lis"]
   name = r"(\w+)_(\w+)"
   mapping = "mapping.txt"
@@ -70,7 +73,7 @@ def test_main_parameters(testdir, mock_testclass):
   converted_column = 3
   af3lis.af3_score = MagicMock()
   af3lis.main(
-    ["-i", str(testdir), "-o", output, "-m", metrics[0], metrics[1], "-n",
+    ["-i", str(testdir), "-o", output, "-f", output_format, "--json-backend", "json", "-m", metrics[0], metrics[1], "-n",
      name, "-1", str(sequence_one), "-2", str(sequence_two), "-l", lis_file,
      "-p", "-M", mapping, "-S", str(source_column + 1), "-C",
      str(converted_column + 1)])
@@ -81,11 +84,12 @@ def test_main_parameters(testdir, mock_testclass):
     lis_file=lis_file,
     progress=True,
     mapping_file=mapping, source_column=source_column,
-    converted_column=converted_column)
+    converted_column=converted_column, output_format=output_format, json_backend="json")
 
 
 def test_main_long_parameters(testdir, mock_testclass):
   output = "output.txt"
+  output_format = "parquet"
   metrics = ["iptm", "lis"]
   name = r"(\w+)_(\w+)"
   mapping = "mapping.txt"
@@ -98,7 +102,7 @@ def test_main_long_parameters(testdir, mock_testclass):
   converted_column = 3
   af3lis.af3_score = MagicMock()
   af3lis.main(
-    ["--input", str(testdir), "--output", output, "--metric", metrics[0],
+    ["--input", str(testdir), "--output", output, "--format", output_format, "--json-backend", "json", "--metric", metrics[0],
      metrics[1],
      "--name", name, "--sequence1", str(sequence_one), "--sequence2",
      str(sequence_two), "--lis", lis_file, "--progress",
@@ -111,7 +115,7 @@ def test_main_long_parameters(testdir, mock_testclass):
     lis_file=lis_file,
     progress=True,
     mapping_file=mapping, source_column=source_column,
-    converted_column=converted_column)
+    converted_column=converted_column, output_format=output_format, json_backend="json")
 
 
 def test_main_no_metrics(testdir, mock_testclass):
@@ -152,6 +156,29 @@ def test_af3_score(testdir, mock_testclass):
     assert output_in.readline() == "POLR2A\tPOLR2C\t0.7601\n"
 
 
+def test_af3_score_archive(testdir, mock_testclass):
+  with tarfile.open("predictions.tar.gz", "w:gz") as tar:
+    for pair in ["POLR2A__POLR2B", "POLR2A__POLR2C"]:
+      os.makedirs(f"predictions/{pair}")
+      create_alphafold3_files(f"predictions/{pair}", pair)
+      shutil.copy(Path(__file__).parent.joinpath("ha_h5n1__bmp2_human_data.json"),
+                  f"predictions/{pair}/{pair}_data.json")
+      tar.add(f"predictions/{pair}")
+  shutil.rmtree("predictions")
+  output = "output.txt"
+  all_lis = [
+    af3lis.LIS("POLR2A__POLR2B", "BMP", "HA", 0.2, 0.12, 12300, 0.6, 0.3),
+    af3lis.LIS("POLR2A__POLR2B", "HA", "BMP", 0.2, 0.12, 12300, 0.8, 0.3),
+    af3lis.LIS("POLR2A__POLR2C", "BMP", "HA", 0.2, 0.12, 12300, 0.5, 0.3)]
+  af3lis.parse_lis = MagicMock(return_value=all_lis)
+  af3lis.af3_score(input_dir="predictions.tar.gz", output_file=output)
+  with open(output, "r") as output_in:
+    assert output_in.readline() == "Bait\tTarget\tipTM\n"
+    assert output_in.readline() == "POLR2A\tPOLR2B\t0.7\n"
+    assert output_in.readline() == "POLR2A\tPOLR2C\t0.5\n"
+    assert output_in.readline() == ""
+
+
 def test_af3_score_parameters(testdir, mock_testclass):
   testdir.mkdir("confidences")
   confidence_file_1 = "confidences/RPB-1___RPB-2/RPB-1___RPB-2_summary_confidences.json"